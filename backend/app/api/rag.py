@@ -1,19 +1,41 @@
 """
 API Routes for Optimized Enhanced RAG Service
-Endpoints tốidef get_rag_service():
-    if rag_service is None:
-        raise HTTPException(status_code=503, detail="RAG service not initialized")
-    return rag_servicevới VRAM-optimized architecture
+Endpoints tối ưu với VRAM-optimized architecture
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
+import asyncio
+import hmac
 import logging
+import time
 from ..services.rag_engine import convert_numpy_types
+from ..services.tracing import tracer
+from ..services.metrics import registry as metrics_registry, OPENMETRICS_CONTENT_TYPE
+from ..services.embedding_cache import query_embedding_cache, reference_embedding_cache
+from ..services.structured_answers import structured_answers
+from ..services.profiling import profiler, PROFILE_KINDS
+from ..services.events import events
+from ..services.cancellation import CancellationToken, RequestCancelled, cancellation_scope, record_cancellation
+from ..services.generation_scheduler import GenerationQueueFull
+from ..services.deadline import resolve_deadline_ms, degradation_policy
+from ..services.search_k import search_k_controller
+from ..services.coalescing import single_flight
+from ..services.answer_cache import answer_cache
+from ..core.config import settings
 
 # This will be set by main.py
 rag_service = None
+startup_orchestrator = None
+
+# Giới hạn /query + /clarify chạy song song (tạo lazy trong event loop)
+_query_slots: Optional[asyncio.Semaphore] = None
+
+# Status code khi client đã đóng kết nối (nginx convention) - không ai nhận response này
+CLIENT_CLOSED_REQUEST = 499
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +65,7 @@ class QueryResponse(BaseModel):
     """Response model cho query"""
     type: str = Field(..., description="Loại response: answer, clarification_needed, no_results, error")
     answer: Optional[str] = Field(None, description="Câu trả lời (nếu type=answer)")
+    answer_source: Optional[str] = Field(None, description="Nguồn câu trả lời: llm, structured (từ metadata, không gọi LLM) hoặc cache (answer cache, không gọi LLM)")
     message: Optional[str] = Field(None, description="Thông báo (nếu type=no_results)")
     error: Optional[str] = Field(None, description="Lỗi (nếu type=error)")
     
@@ -62,16 +85,104 @@ class QueryResponse(BaseModel):
     session_cleared: Optional[bool] = Field(None, description="Session đã được clear hay chưa")  # 🔧 OLD: Manual input fix
     context_preserved: Optional[bool] = Field(None, description="Context có được preserve hay không")  # 🔧 NEW: Context preservation  
     preserved_collection: Optional[str] = Field(None, description="Collection được preserve")  # 🔧 NEW: Preserved collection info
+    stage_timings: Optional[Dict[str, float]] = Field(None, description="Thời gian từng stage của request (ms)")
+    profile_id: Optional[str] = Field(None, description="ID profile của request (khi gọi với X-Profile / ?profile=true)")
+    budget: Optional[Dict[str, Any]] = Field(None, description="Latency budget (X-Deadline-Ms / REQUEST_DEADLINE_MS) và các degradations đã áp dụng")
+    coalesced: Optional[bool] = Field(None, description="Kết quả dùng chung với request trùng câu hỏi đang chạy (single-flight)")
 
 # Dependency để kiểm tra service
 def get_rag_service():
     if rag_service is None:
+        if startup_orchestrator is not None and not startup_orchestrator.is_finished:
+            raise HTTPException(
+                status_code=503,
+                detail=f"RAG service is starting ({startup_orchestrator.get_status()['progress']} components loaded)"
+            )
         raise HTTPException(status_code=503, detail="RAG service not initialized")
     return rag_service
 
+# Dependency cho admin endpoints (reload / reindex / profiling / events)
+# Fail closed: ADMIN_TOKEN chưa cấu hình -> admin endpoints bị tắt (events chứa query + session_id của users)
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: set ADMIN_TOKEN")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode('utf-8'), settings.admin_token.encode('utf-8')):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _get_query_slots() -> asyncio.Semaphore:
+    global _query_slots
+    if _query_slots is None:
+        _query_slots = asyncio.Semaphore(max(1, settings.query_concurrency))
+    return _query_slots
+
+def _call_in_scope(token: CancellationToken, func: Callable, *args, **kwargs):
+    # Chạy trên thread của threadpool: token nằm trong context của thread này
+    with cancellation_scope(token):
+        return func(*args, **kwargs)
+
+async def _watch_disconnect(http_request: Request, token: CancellationToken):
+    while not token.cancelled:
+        if await http_request.is_disconnected():
+            token.cancel("client_disconnect")
+            return
+        await asyncio.sleep(settings.disconnect_poll_seconds)
+
+def _remaining_budget_ms(deadline_ms: Optional[float], received_at: float) -> float:
+    # Budget tính từ lúc nhận request: trừ thời gian chờ lượt chạy (0 = không giới hạn)
+    deadline_ms = resolve_deadline_ms(deadline_ms)
+    if deadline_ms <= 0:
+        return 0.0
+    return max(1.0, deadline_ms - (time.monotonic() - received_at) * 1000.0)
+
+async def run_cancellable(http_request: Request, func: Callable, *args, **kwargs):
+    """
+    Chạy pipeline trong threadpool (event loop rảnh để phát hiện client disconnect).
+    Client disconnect -> token bị cancel, pipeline dừng ở checkpoint kế tiếp (giữa stages, giữa batch rerank,
+    sau mỗi token LLM) và raise RequestCancelled. Request còn chờ lượt chạy thì bỏ luôn.
+    kwargs có deadline_ms: trừ đi thời gian chờ lượt chạy trước khi giao cho pipeline
+    """
+    received_at = time.monotonic()
+    token = CancellationToken()
+    watcher = asyncio.ensure_future(_watch_disconnect(http_request, token))
+    slots = _get_query_slots()
+    acquire = asyncio.ensure_future(slots.acquire())
+    try:
+        # Chờ lượt chạy hoặc client disconnect, cái nào tới trước
+        await asyncio.wait({acquire, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        token.raise_if_cancelled("queued")
+        await acquire
+        if 'deadline_ms' in kwargs:
+            kwargs['deadline_ms'] = _remaining_budget_ms(kwargs['deadline_ms'], received_at)
+        return await run_in_threadpool(_call_in_scope, token, func, *args, **kwargs)
+    except RequestCancelled as e:
+        record_cancellation(e, token)
+        raise
+    except asyncio.CancelledError:
+        # Handler bị hủy (server shutdown / middleware) - thread pipeline tự dừng ở checkpoint kế tiếp
+        token.cancel("handler_cancelled")
+        raise
+    finally:
+        watcher.cancel()
+        if acquire.done() and not acquire.cancelled():
+            slots.release()
+        else:
+            acquire.cancel()
+
+def _cancelled_response() -> Response:
+    return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+def _queue_full_error(e: GenerationQueueFull) -> HTTPException:
+    # Hàng đợi LLM đầy: client thử lại sau (load_test tính riêng tỷ lệ 429)
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(settings.llm_queue_retry_after)})
+
 @router.post("/query", response_model=QueryResponse)
 async def query_endpoint(
     request: QueryRequest,
+    http_request: Request,
+    profile: bool = Query(False, description="Admin: capture sampling profile của request này"),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+    x_deadline_ms: Optional[float] = Header(None),
     service = Depends(get_rag_service)
 ):
     """
@@ -83,18 +194,47 @@ async def query_endpoint(
     - Context expansion với nucleus strategy
     - Session management
     - VRAM-optimized model placement
+    - Header X-Deadline-Ms: latency budget, pipeline tự giảm chất lượng để kịp (response.budget)
     """
     try:
-        logger.info(f"Processing optimized query: {request.query[:50]}...")
+        logger.debug("Processing optimized query: %s...", request.query[:50])  # query đã có trong event record của request
         
-        result = service.process_query(
+        if profile or x_profile:
+            # Profiling on-demand chỉ dành cho admin
+            require_admin(x_admin_token)
+            
+            def profiled_query(deadline_ms: float):
+                # Profiler lấy mẫu thread hiện tại -> profile trên thread chạy pipeline
+                with profiler.profile_request(label=request.query[:80]) as request_profile:
+                    result = service.process_query(
+                        query=request.query,
+                        session_id=request.session_id,
+                        forced_collection=request.forced_collection,
+                        deadline_ms=deadline_ms
+                    )
+                result['profile_id'] = request_profile.profile_id
+                return result
+            
+            result = await run_cancellable(http_request, profiled_query, deadline_ms=x_deadline_ms)
+            return QueryResponse(**result)
+        
+        result = await run_cancellable(
+            http_request,
+            service.process_query,
             query=request.query,
             session_id=request.session_id,
-            forced_collection=request.forced_collection  # 🔧 NEW: Pass forced collection
+            forced_collection=request.forced_collection,  # 🔧 NEW: Pass forced collection
+            deadline_ms=x_deadline_ms
         )
         
         return QueryResponse(**result)
         
+    except RequestCancelled:
+        return _cancelled_response()
+    except GenerationQueueFull as e:
+        raise _queue_full_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in optimized query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -102,20 +242,29 @@ async def query_endpoint(
 @router.post("/clarify", response_model=QueryResponse)
 async def handle_clarification(
     request: ClarificationRequest,
+    http_request: Request,
+    x_deadline_ms: Optional[float] = Header(None),
     service = Depends(get_rag_service)
 ):
     """
     Xử lý phản hồi clarification từ người dùng
     """
     try:
-        result = service.handle_clarification(
+        result = await run_cancellable(
+            http_request,
+            service.handle_clarification,
             session_id=request.session_id,
             selected_option=request.selected_option,
-            original_query=request.original_query
+            original_query=request.original_query,
+            deadline_ms=x_deadline_ms
         )
         
         return QueryResponse(**result)
         
+    except RequestCancelled:
+        return _cancelled_response()
+    except GenerationQueueFull as e:
+        raise _queue_full_error(e)
     except Exception as e:
         logger.error(f"Error handling clarification: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -217,6 +366,25 @@ async def delete_session(
         logger.error(f"Error deleting session: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/live")
+async def liveness_check():
+    """Liveness: process đang chạy và event loop phản hồi (không phụ thuộc trạng thái load models)"""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 200 khi tất cả components đã load xong, 503 nếu đang load hoặc load lỗi
+    Trả về tiến độ + thời gian load từng component
+    """
+    if startup_orchestrator is None:
+        ready = rag_service is not None
+        return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "phase": "unknown"})
+    
+    status = startup_orchestrator.get_status()
+    ready = status["ready"] and rag_service is not None
+    return JSONResponse(status_code=200 if ready else 503, content=status)
+
 @router.get("/health")
 async def health_check(
     service = Depends(get_rag_service)
@@ -227,6 +395,8 @@ async def health_check(
     """
     try:
         health_status = service.get_health_status()
+        if startup_orchestrator is not None:
+            health_status["startup"] = startup_orchestrator.get_status()
         return health_status
         
     except Exception as e:
@@ -264,14 +434,147 @@ async def get_metrics(
         return {
             "performance_metrics": service.metrics,
             "active_sessions": len(service.chat_sessions),
-            "ambiguous_patterns_count": len(service.ambiguous_service.ambiguous_patterns),
-            "context_cache_size": len(service.context_expansion_service.document_metadata_cache)
+            "context_cache_size": len(service.context_expansion_service.document_metadata_cache),
+            "query_embedding_cache": query_embedding_cache.get_stats(),
+            "reference_embedding_cache": reference_embedding_cache.get_stats(),
+            "structured_answers": structured_answers.get_stats(),  # Tỷ lệ trả lời không cần LLM + latency gap
+            "degradation_policy": degradation_policy.get_stats(),  # Chi phí ước lượng từng stage / mode cho deadline
+            "search_k": search_k_controller.get_stats(),  # dynamic_k đã học theo confidence level + collection
+            "coalescing": single_flight.get_stats(),  # Requests trùng dùng chung pipeline đang chạy
+            "answer_cache": answer_cache.get_stats(),  # Câu trả lời theo câu hỏi + context hash (precompute + online)
+            "latency": tracer.get_stats()  # p50/p95/p99 theo stage và theo confidence level
         }
         
     except Exception as e:
         logger.error(f"Error getting metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/metrics/openmetrics")
+async def get_openmetrics():
+    """
+    Metrics dạng OpenMetrics text cho Prometheus scrape
+    Không phụ thuộc RAG service - scrape được cả trong lúc startup (model load counts / durations)
+    """
+    return Response(content=metrics_registry.render(), media_type=OPENMETRICS_CONTENT_TYPE)
+
+@router.get("/admin/events", dependencies=[Depends(require_admin)])
+async def recent_events(
+    limit: int = Query(50, ge=1, le=1000, description="Số requests gần nhất"),
+    session_id: Optional[str] = Query(None, description="Chỉ lấy requests của 1 session")
+):
+    """Structured events của các requests gần nhất (ring buffer) - debug routing / search / rerank"""
+    return {
+        "stats": events.get_stats(),
+        "requests": convert_numpy_types(events.recent(limit=limit, session_id=session_id))
+    }
+
+@router.get("/admin/structured-answers/audits", dependencies=[Depends(require_admin)])
+async def structured_answer_audits(
+    limit: int = Query(10, ge=1, le=1000, description="Số audit samples gần nhất")
+):
+    """Audit samples (template vs câu trả lời LLM) của structured answers - chứa query + answer của users"""
+    return {
+        "mode": structured_answers.mode,
+        "audits": convert_numpy_types(structured_answers.recent_audits(limit=limit))
+    }
+
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Trạng thái rolling profiler (thời gian theo stage) + danh sách request profiles có thể download"""
+    return profiler.get_status()
+
+@router.get("/admin/profiles/rolling", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def download_rolling_profile(
+    kind: str = Query("wall", description="wall hoặc cpu"),
+    stage: Optional[str] = Query(None, description="Chỉ lấy stacks của 1 stage (vd. rerank)")
+):
+    """Rolling profile của mọi requests dạng collapsed stacks (flamegraph.pl / speedscope)"""
+    if kind not in PROFILE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {PROFILE_KINDS}")
+    return PlainTextResponse(profiler.rolling.collapsed(kind, stage=stage))
+
+@router.post("/admin/profiles/rolling", dependencies=[Depends(require_admin)])
+async def configure_rolling_profile(enabled: bool = True, reset: bool = False):
+    """Bật / tắt rolling profiler lúc runtime, reset=true xóa samples đã gom"""
+    if reset:
+        profiler.rolling.reset()
+    if enabled:
+        profiler.start_rolling()
+    else:
+        profiler.stop_rolling()
+    return {"enabled": profiler.rolling_enabled, "samples": profiler.rolling.samples}
+
+@router.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def download_request_profile(
+    profile_id: str,
+    kind: str = Query("wall", description="wall hoặc cpu")
+):
+    """Profile của 1 request dạng collapsed stacks"""
+    if kind not in PROFILE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {PROFILE_KINDS}")
+    request_profile = profiler.get_profile(profile_id)
+    if request_profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(request_profile.profile.collapsed(kind))
+
+@router.post("/index/reindex", dependencies=[Depends(require_admin)])
+async def reindex_documents(
+    dry_run: bool = False,
+    service = Depends(get_rag_service)
+):
+    """
+    Incremental re-index data/documents theo content hash
+    Chỉ upsert chunks đã đổi, xóa chunks của file đã xóa, sau đó refresh context/router caches
+    """
+    try:
+        # Embedding + ghi Chroma là blocking -> chạy ngoài event loop
+        result = await run_in_threadpool(service.reindex_documents, dry_run)
+        
+        if result.get('status') == 'busy':
+            raise HTTPException(status_code=409, detail=result['message'])
+        if result.get('status') == 'error':
+            raise HTTPException(status_code=500, detail=result['error'])
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error re-indexing documents: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/index/refresh", dependencies=[Depends(require_admin)])
+async def refresh_indexes(
+    service = Depends(get_rag_service)
+):
+    """Build index snapshot mới và swap, chờ đến khi xong (sau khi build vector DB bằng tool bên ngoài)"""
+    try:
+        result = await run_in_threadpool(service.refresh_indexes)
+        
+        if result.get('status') == 'busy':
+            raise HTTPException(status_code=409, detail="Index reload is already running")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error refreshing indexes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/admin/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_indexes(
+    service = Depends(get_rag_service)
+):
+    """
+    Hot-reload router / vector DB / document metadata cache không downtime
+    Snapshot mới được build ở background và swap atomically; request đang chạy hoàn thành trên snapshot cũ.
+    Theo dõi tiến độ qua /health (index_snapshot).
+    """
+    result = service.reload_indexes()
+    
+    if result.get('status') == 'busy':
+        raise HTTPException(status_code=409, detail="Index reload is already running")
+    return result
+
 @router.get("/collections/stats")
 async def get_collections_stats(
     service = Depends(get_rag_service)
@@ -20,6 +20,23 @@ class Settings(BaseSettings):
     debug: bool = False  # Overridden by DEBUG in .env
     host: str = "0.0.0.0"  # Overridden by HOST in .env  
     port: int = 8000  # Overridden by PORT in .env
+    startup_workers: int = 4  # From STARTUP_WORKERS in .env (số components load song song lúc startup)
+    admin_token: str = ""  # From ADMIN_TOKEN in .env (header X-Admin-Token cho admin endpoints, rỗng = admin endpoints bị tắt)
+    query_concurrency: int = 1  # From QUERY_CONCURRENCY in .env (số /query, /clarify chạy song song trong threadpool; 1 = tuần tự như trước, an toàn cho VRAM swap)
+    disconnect_poll_seconds: float = 0.25  # From DISCONNECT_POLL_SECONDS in .env (chu kỳ kiểm tra client disconnect để hủy request đang chạy)
+    query_coalescing: bool = True  # From QUERY_COALESCING in .env (requests trùng câu hỏi + routing đang chạy song song dùng chung 1 lần pipeline; cần QUERY_CONCURRENCY > 1)
+    request_deadline_ms: float = 0  # From REQUEST_DEADLINE_MS in .env (latency budget mặc định / request, header X-Deadline-Ms ghi đè; 0 = không giới hạn)
+    deadline_cost_percentile: float = 90  # From DEADLINE_COST_PERCENTILE in .env (percentile latency đã đo dùng ước lượng chi phí từng stage)
+    latency_tracing_enabled: bool = True  # From LATENCY_TRACING_ENABLED in .env (per-stage latency histograms + stage_timings)
+    profiling_enabled: bool = False  # From PROFILING_ENABLED in .env (rolling sampled profile theo stage, cần latency tracing)
+    profiling_interval_ms: float = 100.0  # From PROFILING_INTERVAL_MS in .env (rolling sampler - tần suất thấp)
+    profiling_request_interval_ms: float = 5.0  # From PROFILING_REQUEST_INTERVAL_MS in .env (profile on-demand của 1 request)
+    profiling_max_profiles: int = 20  # From PROFILING_MAX_PROFILES in .env (số request profiles giữ lại để download)
+    event_log_enabled: bool = True  # From EVENT_LOG_ENABLED in .env (structured events của hot path thay cho INFO logs)
+    event_log_buffer_size: int = 200  # From EVENT_LOG_BUFFER_SIZE in .env (số requests gần nhất giữ trong ring buffer)
+    event_log_sample_rate: float = 0.05  # From EVENT_LOG_SAMPLE_RATE in .env (tỷ lệ requests ghi ra JSON lines, 0 = không ghi)
+    event_log_file: str = "logs/events.jsonl"  # From EVENT_LOG_FILE in .env
+    event_log_echo: bool = False  # From EVENT_LOG_ECHO in .env (in từng event ra logger - debug local)
     
     # Data Paths - Load from environment
     data_root_dir: str = "data"  # Overridden by DATA_ROOT_DIR in .env
@@ -29,9 +46,24 @@ class Settings(BaseSettings):
     
     # Model Configuration - Actual values từ .env file
     embedding_model_name: str = "AITeamVN/Vietnamese_Embedding_v2"  # From EMBEDDING_MODEL_NAME
+    embedding_backend: str = "torch"  # From EMBEDDING_BACKEND in .env (torch | onnx | onnx-int8, ONNX export bằng tools/export_embedding_onnx.py)
+    embedding_onnx_dir: str = "data/models/onnx/Vietnamese_Embedding_v2"  # From EMBEDDING_ONNX_DIR in .env
+    embedding_onnx_threads: int = 0  # From EMBEDDING_ONNX_THREADS in .env (intra-op threads, 0 = ONNX Runtime tự chọn)
+    query_embedding_cache_size: int = 2048  # From QUERY_EMBEDDING_CACHE_SIZE in .env (LRU query embeddings, 0 = tắt cache)
+    query_embedding_cache_seed: bool = True  # From QUERY_EMBEDDING_CACHE_SEED in .env (persistent tier từ router example questions)
+    reference_embedding_cache_size: int = 256  # From REFERENCE_EMBEDDING_CACHE_SIZE in .env (LRU reference query của similar-procedure lookup)
+    router_vector_index: str = "float32"  # From ROUTER_VECTOR_INDEX in .env (float32 | float16 | int8 | binary - nén + rescore exact shortlist)
+    router_vector_rescore_k: int = 32  # From ROUTER_VECTOR_RESCORE_K in .env (shortlist rescore bằng float32)
     reranker_model_name: str = "AITeamVN/Vietnamese_Reranker"  # From RERANKER_MODEL_NAME
     llm_model_path: str = "data/models/llm_dir/PhoGPT-4B-Chat-q4_k_m.gguf"  # From LLM_MODEL_PATH
     llm_model_url: str = ""  # From LLM_MODEL_URL
+    llm_speculative_mode: str = "off"  # From LLM_SPECULATIVE_MODE in .env (off | prompt_lookup - draft tokens từ n-gram trong prompt; bật logits_all của llama.cpp, tốn thêm RAM)
+    llm_draft_model_path: str = ""  # From LLM_DRAFT_MODEL_PATH in .env (GGUF nhỏ cùng tokenizer, draft khi n-gram không khớp)
+    llm_draft_num_pred_tokens: int = 10  # From LLM_DRAFT_NUM_PRED_TOKENS in .env (số draft tokens mỗi bước)
+    llm_draft_max_ngram: int = 3  # From LLM_DRAFT_MAX_NGRAM in .env (n-gram dài nhất để tìm trong prompt)
+    llm_slots: int = 1  # From LLM_SLOTS in .env (số llama contexts song song trên cùng GGUF mmap; mỗi slot thêm 1 KV cache + bản GPU layers, N_THREADS chia đều)
+    llm_queue_size: int = 32  # From LLM_QUEUE_SIZE in .env (requests chờ slot tối đa, vượt -> từ chối ngay)
+    llm_queue_retry_after: int = 5  # From LLM_QUEUE_RETRY_AFTER in .env (giây, header Retry-After của 429 khi hàng đợi LLM đầy)
     
     # HuggingFace Cache Configuration - For offline mode
     hf_cache_dir: str = "data/models/hf_cache"  # From HF_CACHE_DIR in .env
@@ -54,14 +86,36 @@ class Settings(BaseSettings):
     # Enhanced RAG Process Parameters - 4-step RAG: Search > Rerank > Expand > Synthesize
     broad_search_k: int = 20  # Giảm từ 30 để giảm initial search results (Performance Optimization)
     similarity_threshold: float = 0.3  # From SIMILARITY_THRESHOLD in .env (permissive)
+    adaptive_search_k: bool = True  # From ADAPTIVE_SEARCH_K in .env (dynamic_k học từ vị trí nucleus sau rerank theo confidence level + collection)
+    search_k_target_coverage: float = 0.99  # From SEARCH_K_TARGET_COVERAGE in .env (tỷ lệ nucleus phải nằm trong top k đã học)
+    search_k_min_samples: int = 50  # From SEARCH_K_MIN_SAMPLES in .env (số mẫu tối thiểu / bucket trước khi dùng k đã học)
+    search_k_explore_rate: float = 0.05  # From SEARCH_K_EXPLORE_RATE in .env (tỷ lệ queries vẫn chạy k tĩnh để tiếp tục học)
+    search_k_min: int = 5  # From SEARCH_K_MIN in .env (k nhỏ nhất controller được chọn, không dưới 5 = số candidates của consensus)
+    search_k_stats_file: str = "data/cache/search_k_stats.json"  # From SEARCH_K_STATS_FILE in .env
+    answer_cache: bool = True  # From ANSWER_CACHE in .env (câu trả lời LLM theo câu hỏi + context hash, lưu qua restart)
+    answer_cache_file: str = "data/cache/answer_cache.jsonl"  # From ANSWER_CACHE_FILE in .env (tools/precompute_answers.py warm file này)
+    answer_cache_max_entries: int = 20000  # From ANSWER_CACHE_MAX_ENTRIES in .env
     context_expansion_size: int = 1  # From CONTEXT_EXPANSION_SIZE in .env (adjacent chunks)
     use_routing: bool = True  # From USE_ROUTING in .env (smart collection routing)
     use_reranker: bool = True  # From USE_RERANKER in .env (Vietnamese reranking)
+    clarification_fast_path: bool = True  # From CLARIFICATION_FAST_PATH in .env (xác nhận câu hỏi gợi ý dùng lại document đã chọn, bỏ qua search + rerank)
+    clarification_pending_ttl: int = 900  # From CLARIFICATION_PENDING_TTL in .env (giây giữ pending resolution trong session)
+    structured_answer_mode: str = "shadow"  # From STRUCTURED_ANSWER_MODE in .env (on | shadow | off - trả lời phí/thời gian/cơ quan/biểu mẫu/điều kiện từ metadata; shadow = chỉ ghi template để đánh giá trước khi bật)
+    structured_answer_min_confidence: float = 0.7  # From STRUCTURED_ANSWER_MIN_CONFIDENCE in .env (router + reranker confidence tối thiểu)
+    structured_answer_audit_rate: float = 0.05  # From STRUCTURED_ANSWER_AUDIT_RATE in .env (tỷ lệ structured answers vẫn chạy LLM để đối chiếu)
     
     # ChromaDB Configuration
     chroma_collection_name: str = "legal_documents"  # From CHROMA_COLLECTION_NAME in .env
     chroma_persist_directory: str = "data/vectordb"  # From VECTORDB_DIR in .env
     
+    # Index Build Pipeline - Streaming build (parse -> embed -> write)
+    index_build_workers: int = 4  # From INDEX_BUILD_WORKERS in .env (process pool parse JSON)
+    index_embed_batch_size: int = 64  # From INDEX_EMBED_BATCH_SIZE in .env (chunks per embed/write batch)
+    index_queue_size: int = 4  # From INDEX_QUEUE_SIZE in .env (max batches chờ giữa các stage)
+    index_checkpoint_file: str = "data/cache/vectordb_build_checkpoint.json"  # From INDEX_CHECKPOINT_FILE in .env
+    index_manifest_file: str = "data/cache/vectordb_manifest.json"  # From INDEX_MANIFEST_FILE in .env (incremental re-index)
+    chunk_manifest_dir: str = "data/cache/chunk_manifest"  # From CHUNK_MANIFEST_DIR in .env (columnar chunk -> document map, mmap lúc startup)
+    
     # Search Configuration - Default values for methods (can be overridden)
     default_search_top_k: int = 5  # From DEFAULT_SEARCH_TOP_K in .env
     default_similarity_threshold: float = 0.5  # Tăng từ 0.3 để giảm số chunks cần rerank (Performance Optimization)
@@ -95,10 +149,42 @@ class Settings(BaseSettings):
     def hf_cache_path(self) -> Path:
         return self.base_dir / self.hf_cache_dir
     
+    @property
+    def embedding_onnx_path(self) -> Path:
+        return self.base_dir / self.embedding_onnx_dir
+    
     @property
     def llm_model_file_path(self) -> Path:
         return self.base_dir / self.llm_model_path
     
+    @property
+    def llm_draft_model_file_path(self) -> Optional[Path]:
+        return self.base_dir / self.llm_draft_model_path if self.llm_draft_model_path else None
+    
+    @property
+    def index_checkpoint_path(self) -> Path:
+        return self.base_dir / self.index_checkpoint_file
+    
+    @property
+    def index_manifest_path(self) -> Path:
+        return self.base_dir / self.index_manifest_file
+    
+    @property
+    def chunk_manifest_path(self) -> Path:
+        return self.base_dir / self.chunk_manifest_dir
+    
+    @property
+    def event_log_path(self) -> Path:
+        return self.base_dir / self.event_log_file
+    
+    @property
+    def search_k_stats_path(self) -> Path:
+        return self.base_dir / self.search_k_stats_file
+    
+    @property
+    def answer_cache_path(self) -> Path:
+        return self.base_dir / self.answer_cache_file
+    
     def setup_environment(self):
         """Setup environment variables for models"""
         hf_cache_abs = str(self.hf_cache_path.absolute())
@@ -0,0 +1,215 @@
+"""
+Persistent Answer Cache
+Câu trả lời LLM cho câu hỏi đầu tiên của session (prompt không có chat history), key theo câu hỏi + context:
+
+- Key = câu hỏi đã normalize (lowercase) + context hash (sha1 của context text sau expansion)
+  -> document sửa / re-index / expansion khác -> context khác -> tự miss, không cần invalidate
+- Fingerprint = LLM (class + model file) + temperature + max_tokens + system prompt: khác fingerprint hiện tại
+  -> entry bị bỏ qua lúc load (đổi model / prompt không trả câu trả lời cũ)
+- File JSONL append-only (ANSWER_CACHE_FILE): mỗi câu trả lời ghi 1 dòng ngay khi có -> precompute bị ngắt
+  giữa chừng không mất phần đã sinh; compact() ghi lại file chỉ với entries hợp lệ
+- Online: miss + generation đầy đủ (không cap max_tokens / truncate / lỗi) -> thêm vào cache,
+  tối đa ANSWER_CACHE_MAX_ENTRIES entries
+
+tools/precompute_answers.py warm cache từ example questions của router: retrieval chạy trong
+deferred_generation() (pipeline ghi lại context cần generate thay vì gọi LLM), generation chạy sau theo batch.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator
+
+from .embedding_cache import normalize_query_text
+from .metrics import registry, record_cache
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_deferred: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("deferred_generation", default=None)
+
+
+def context_hash(context_text: str) -> str:
+    return hashlib.sha1(context_text.encode('utf-8')).hexdigest()
+
+
+def answer_fingerprint(llm_service: Any, system_prompt: str) -> str:
+    """Những gì ngoài (câu hỏi, context) quyết định câu trả lời"""
+    payload = json.dumps(
+        [type(llm_service).__name__, Path(str(getattr(llm_service, 'model_path', '') or '')).name,
+         settings.temperature, settings.max_tokens, system_prompt],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def deferred_generation() -> Iterator[List[Dict[str, Any]]]:
+    """Pipeline chạy trong scope: miss -> ghi {key, query, context} vào list thay vì gọi LLM"""
+    pending: List[Dict[str, Any]] = []
+    reset_token = _deferred.set(pending)
+    try:
+        yield pending
+    finally:
+        _deferred.reset(reset_token)
+
+
+class AnswerCache:
+    """Answers theo (câu hỏi, context hash) - in-memory dict + JSONL append-only, thread-safe"""
+
+    def __init__(self, path: Optional[Path] = None, enabled: Optional[bool] = None, max_entries: Optional[int] = None):
+        self.path = Path(path) if path else settings.answer_cache_path
+        self.enabled = settings.answer_cache if enabled is None else enabled
+        self.max_entries = max_entries if max_entries is not None else settings.answer_cache_max_entries
+        self.fingerprint: Optional[str] = None
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'rejected': 0, 'deferred': 0, 'stale_on_load': 0}
+
+    @staticmethod
+    def key(query: str, context_text: str) -> str:
+        return f"{hashlib.sha1(normalize_query_text(query).lower().encode('utf-8')).hexdigest()}:{context_hash(context_text)}"
+
+    def bind(self, fingerprint: str):
+        """Gắn fingerprint của LLM + prompt hiện tại rồi load entries khớp từ file"""
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            self.fingerprint = fingerprint
+            self._entries.clear()
+        self.load()
+
+    # ---------------------------------------------------------------
+    # Lookup / store
+    # ---------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled or self.fingerprint is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            self._stats['hits' if entry is not None else 'misses'] += 1
+        record_cache("answers", hit=entry is not None)
+        return entry['answer'] if entry is not None else None
+
+    def put(self, key: str, query: str, answer: str, source: str = "online") -> bool:
+        """Thêm entry + append vào file; False khi cache tắt / đầy / đã có"""
+        if not self.enabled or self.fingerprint is None or not answer:
+            return False
+        entry = {
+            'key': key,
+            'fingerprint': self.fingerprint,
+            'query': query,
+            'answer': answer,
+            'source': source,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock:
+            if key in self._entries:
+                return False
+            if len(self._entries) >= self.max_entries:
+                self._stats['rejected'] += 1
+                return False
+            self._entries[key] = entry
+            self._stats['stores'] += 1
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not append to answer cache {self.path}: {e}")
+        return True
+
+    def defer(self, key: str, query: str, context_text: str) -> bool:
+        """Trong deferred_generation(): ghi lại generation cần chạy, pipeline trả answer rỗng"""
+        pending = _deferred.get()
+        if pending is None or not self.enabled or self.fingerprint is None:
+            return False
+        pending.append({'key': key, 'query': query, 'context': context_text})
+        with self._lock:
+            self._stats['deferred'] += 1
+        return True
+
+    # ---------------------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------------------
+    def load(self):
+        if not self.enabled or not self.path.exists():
+            return
+        entries, stale = {}, 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Dòng cuối ghi dở khi process bị kill
+                    if entry.get('fingerprint') != self.fingerprint or not entry.get('answer'):
+                        stale += 1
+                        continue
+                    entries.setdefault(entry['key'], entry)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load answer cache {self.path}: {e}")
+            return
+        with self._lock:
+            for key, entry in list(entries.items())[:self.max_entries]:
+                self._entries.setdefault(key, entry)
+            self._stats['stale_on_load'] = stale
+            loaded = len(self._entries)
+        logger.info(f"💾 Loaded {loaded} cached answers from {self.path}" + (f" ({stale} stale skipped)" if stale else ""))
+
+    def compact(self) -> int:
+        """Ghi lại file atomic chỉ với entries của fingerprint hiện tại (bỏ dòng stale / trùng)"""
+        with self._lock:
+            entries = list(self._entries.values())
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not compact answer cache {self.path}: {e}")
+        return len(entries)
+
+    # ---------------------------------------------------------------
+    # Stats
+    # ---------------------------------------------------------------
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            sources: Dict[str, int] = {}
+            for entry in self._entries.values():
+                sources[entry.get('source', 'online')] = sources.get(entry.get('source', 'online'), 0) + 1
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'enabled': self.enabled,
+            'max_entries': self.max_entries,
+            'sources': sources,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            'path': str(self.path),
+            'fingerprint': self.fingerprint[:12] if self.fingerprint else None
+        })
+        return stats
+
+    def collect_metrics(self):
+        entries = registry.family("answer_cache_entries", "gauge", "Số câu trả lời trong persistent answer cache theo nguồn")
+        for source, count in self.get_stats()['sources'].items():
+            entries.add(count, source=source)
+        return [entries]
+
+
+# Global instance - RAGService bind fingerprint (LLM + system prompt) lúc khởi tạo
+answer_cache = AnswerCache()
+registry.register_collector("answer_cache", answer_cache.collect_metrics)
@@ -0,0 +1,131 @@
+"""
+Request Cancellation
+Cooperative cancellation cho pipeline query / clarification:
+
+- API tạo CancellationToken cho mỗi request, set khi client disconnect (user refresh / hỏi lại)
+- Token nằm trong ContextVar của thread chạy pipeline (giống trace của LatencyTracer): rag_engine kiểm tra giữa
+  các stages, reranker giữa các batch pairs, LLMService sau mỗi token (stopping_criteria) và khi chờ slot
+- Dừng = raise RequestCancelled(stage); process_query đếm request cancelled và ước lượng compute tiết kiệm
+  (p50 của phần stage còn lại + các stages sau, theo stage histograms của tracer)
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Iterator, Callable, List
+
+from .metrics import record_cancelled_request
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự stages của pipeline query (tên span của tracer) - dùng để ước lượng phần việc được bỏ qua
+PIPELINE_STAGES = ("routing", "search", "rerank", "context_expansion", "generation")
+
+_current_token: ContextVar[Optional["CancellationToken"]] = ContextVar("cancellation_token", default=None)
+
+
+class RequestCancelled(Exception):
+    """Request bị hủy - stage: nơi pipeline dừng; reclaimed_seconds: ước lượng compute tiết kiệm (None = tự ước lượng)"""
+
+    def __init__(self, stage: str, reclaimed_seconds: Optional[float] = None):
+        super().__init__(f"Request cancelled during {stage}")
+        self.stage = stage
+        self.reclaimed_seconds = reclaimed_seconds
+        self.recorded = False
+
+
+class CancellationToken:
+    """Cancel flag của 1 request - event dùng chung với GenerationScheduler / LLMService"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason: Optional[str] = None
+        self.cancelled_at: Optional[float] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "client_disconnect"):
+        with self._lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.cancelled_at = time.perf_counter()
+            self.event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Gọi callback khi token bị cancel (ngay lập tức nếu đã cancel) - vd. single-flight đếm participants"""
+        with self._lock:
+            if not self.event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def raise_if_cancelled(self, stage: str, elapsed_in_stage: float = 0.0):
+        if self.event.is_set():
+            raise RequestCancelled(stage, estimate_remaining_seconds(stage, elapsed_in_stage))
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """Gắn token vào context hiện tại (thread chạy pipeline)"""
+    reset_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset_token)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    token = _current_token.get()
+    return token.event if token is not None else None
+
+
+def check_cancelled(stage: str, elapsed_in_stage: float = 0.0):
+    """Checkpoint: raise RequestCancelled nếu request hiện tại đã bị hủy (không có token -> no-op)"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled(stage, elapsed_in_stage)
+
+
+def estimate_remaining_seconds(stage: str, elapsed_in_stage: float = 0.0) -> float:
+    """p50 còn lại của stage hiện tại + p50 các stages sau (stage ngoài pipeline, vd. 'queued' -> toàn bộ)"""
+    p50_ms = {name: histogram.percentile(50) for name, histogram in tracer.stage_histograms()}
+    remaining = PIPELINE_STAGES[PIPELINE_STAGES.index(stage):] if stage in PIPELINE_STAGES else PIPELINE_STAGES
+    seconds = 0.0
+    for index, name in enumerate(remaining):
+        stage_seconds = (p50_ms.get(name) or 0.0) / 1000.0
+        if index == 0 and stage in PIPELINE_STAGES:
+            stage_seconds = max(0.0, stage_seconds - elapsed_in_stage)
+        seconds += stage_seconds
+    return seconds
+
+
+def record_cancellation(error: RequestCancelled, token: Optional[CancellationToken] = None):
+    """Metrics + log cho request bị hủy (1 lần / request)"""
+    if error.recorded:
+        return
+    error.recorded = True
+    token = token or _current_token.get()
+    if error.reclaimed_seconds is None:
+        error.reclaimed_seconds = estimate_remaining_seconds(error.stage)
+    stop_seconds = None
+    if token is not None and token.cancelled_at is not None:
+        stop_seconds = time.perf_counter() - token.cancelled_at
+    record_cancelled_request(error.stage, error.reclaimed_seconds, stop_seconds)
+    logger.info(f"🛑 Request cancelled during {error.stage} ({token.reason if token else 'unknown'}), "
+                f"~{error.reclaimed_seconds:.2f}s compute reclaimed"
+                + (f", stopped {stop_seconds * 1000:.0f}ms after cancel" if stop_seconds is not None else ""))
@@ -0,0 +1,257 @@
+"""
+Columnar Chunk Manifest
+Map chunk_id -> (collection, file path, chunk index) lưu dạng cột NumPy (.npy) để startup
+load bằng mmap thay vì collection.get() toàn bộ documents + metadata của mọi collection.
+
+Layout (thư mục data/cache/chunk_manifest/):
+- chunk_ids.npy        fixed-width unicode, 1 dòng / chunk
+- collection_codes.npy uint16 -> manifest.json["collections"]
+- file_codes.npy       uint32 -> manifest.json["files"]
+- chunk_indices.npy    int32 (chunk_index_num)
+- manifest.json        vocab + số chunks từng collection (dùng để kiểm tra manifest còn khớp DB)
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+_ARRAY_FILES = ('chunk_ids', 'collection_codes', 'file_codes', 'chunk_indices')
+
+
+class ChunkMetadataIndex:
+    """
+    Chunk metadata dạng cột + hash index id -> row
+
+    Dict-like cho context expansion: index[chunk_id] -> {"source_file", "collection", "chunk_index"}
+    """
+
+    def __init__(
+        self,
+        chunk_ids: np.ndarray,
+        collection_codes: np.ndarray,
+        file_codes: np.ndarray,
+        chunk_indices: np.ndarray,
+        collections: List[str],
+        files: List[str],
+        collection_counts: Dict[str, int],
+        source: str = "memory"
+    ):
+        self.chunk_ids = chunk_ids
+        self.collection_codes = collection_codes
+        self.file_codes = file_codes
+        self.chunk_indices = chunk_indices
+        self.collections = collections
+        self.files = files
+        self.collection_counts = collection_counts
+        self.source = source
+
+        self._row_by_id: Dict[str, int] = {chunk_id: row for row, chunk_id in enumerate(chunk_ids.tolist())}
+        self._code_by_file: Dict[str, int] = {path: code for code, path in enumerate(files)}
+
+    # ---------------------------------------------------------------
+    # Construction
+    # ---------------------------------------------------------------
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Tuple[str, str, str, int]],
+        collection_counts: Optional[Dict[str, int]] = None,
+        source: str = "memory"
+    ) -> "ChunkMetadataIndex":
+        """records: (chunk_id, collection, file_path, chunk_index)"""
+        collections: List[str] = []
+        files: List[str] = []
+        collection_lookup: Dict[str, int] = {}
+        file_lookup: Dict[str, int] = {}
+
+        ids, collection_codes, file_codes, chunk_indices = [], [], [], []
+        for chunk_id, collection, file_path, chunk_index in records:
+            if collection not in collection_lookup:
+                collection_lookup[collection] = len(collections)
+                collections.append(collection)
+            if file_path not in file_lookup:
+                file_lookup[file_path] = len(files)
+                files.append(file_path)
+            ids.append(chunk_id)
+            collection_codes.append(collection_lookup[collection])
+            file_codes.append(file_lookup[file_path])
+            chunk_indices.append(int(chunk_index or 0))
+
+        if collection_counts is None:
+            collection_counts = {}
+            for code in collection_codes:
+                name = collections[code]
+                collection_counts[name] = collection_counts.get(name, 0) + 1
+
+        return cls(
+            chunk_ids=np.array(ids, dtype=str) if ids else np.array([], dtype='<U1'),
+            collection_codes=np.array(collection_codes, dtype=np.uint16),
+            file_codes=np.array(file_codes, dtype=np.uint32),
+            chunk_indices=np.array(chunk_indices, dtype=np.int32),
+            collections=collections,
+            files=files,
+            collection_counts=collection_counts,
+            source=source
+        )
+
+    @classmethod
+    def from_vectordb(cls, vectordb_service) -> "ChunkMetadataIndex":
+        """Fallback: đọc metadata (không documents / embeddings) từ mọi collection"""
+        records = []
+        collection_counts = {}
+
+        for collection_info in vectordb_service.list_collections():
+            collection_name = collection_info["name"]
+            try:
+                collection = vectordb_service.get_collection(collection_name)
+                results = collection.get(include=['metadatas'])
+                ids = results.get('ids') or []
+                metadatas = results.get('metadatas') or []
+                collection_counts[collection_name] = len(ids)
+
+                for i, chunk_id in enumerate(ids):
+                    metadata = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+                    file_path = metadata.get('file_path') or metadata.get('source', '')
+                    if not file_path:
+                        continue
+                    records.append((chunk_id, collection_name, file_path, metadata.get('chunk_index_num', 0)))
+            except Exception as e:
+                logger.warning(f"Could not process collection {collection_name}: {e}")
+
+        return cls.from_records(records, collection_counts, source="vectordb")
+
+    # ---------------------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------------------
+    def save(self, directory: Path):
+        """Ghi manifest - arrays trước, manifest.json cuối cùng (atomic) để reader không thấy bản dở"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for name in _ARRAY_FILES:
+            tmp_path = directory / f"{name}.tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(getattr(self, name)))
+            os.replace(tmp_path, directory / f"{name}.npy")
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_chunks': len(self),
+            'collections': self.collections,
+            'files': self.files,
+            'collection_counts': self.collection_counts
+        }
+        tmp_path = directory / "manifest.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, directory / "manifest.json")
+        logger.info(f"💾 Chunk manifest saved: {len(self)} chunks, {len(self.files)} files -> {directory}")
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> Optional["ChunkMetadataIndex"]:
+        """Load manifest (mmap các cột) - None nếu chưa có hoặc không hợp lệ"""
+        directory = Path(directory)
+        manifest_file = directory / "manifest.json"
+        if not manifest_file.exists():
+            return None
+
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != MANIFEST_VERSION:
+                return None
+
+            arrays = {
+                name: np.load(directory / f"{name}.npy", mmap_mode='r' if mmap else None)
+                for name in _ARRAY_FILES
+            }
+            if any(len(array) != manifest['total_chunks'] for array in arrays.values()):
+                logger.warning("⚠️ Chunk manifest columns have inconsistent lengths")
+                return None
+
+            return cls(
+                collections=manifest['collections'],
+                files=manifest['files'],
+                collection_counts=manifest.get('collection_counts', {}),
+                source="manifest_mmap" if mmap else "manifest",
+                **arrays
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load chunk manifest from {directory}: {e}")
+            return None
+
+    def matches_vectordb(self, vectordb_service) -> bool:
+        """Manifest còn khớp DB nếu số chunks từng collection giống nhau (collection.count() rất rẻ)"""
+        try:
+            current_counts = {c['name']: c['document_count'] for c in vectordb_service.list_collections()}
+        except Exception as e:
+            logger.warning(f"⚠️ Could not verify chunk manifest against vector DB: {e}")
+            return False
+        expected = {name: count for name, count in self.collection_counts.items() if count}
+        return expected == {name: count for name, count in current_counts.items() if count}
+
+    # ---------------------------------------------------------------
+    # Dict-like access
+    # ---------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._row_by_id
+
+    def _entry(self, row: int) -> Dict[str, Any]:
+        return {
+            "source_file": self.files[int(self.file_codes[row])],
+            "collection": self.collections[int(self.collection_codes[row])],
+            "chunk_index": int(self.chunk_indices[row])
+        }
+
+    def __getitem__(self, chunk_id: str) -> Dict[str, Any]:
+        return self._entry(self._row_by_id[chunk_id])
+
+    def get(self, chunk_id: str, default: Any = None) -> Any:
+        row = self._row_by_id.get(chunk_id)
+        return default if row is None else self._entry(row)
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for chunk_id, row in self._row_by_id.items():
+            yield chunk_id, self._entry(row)
+
+    def rows_for_file(self, source_file: str) -> List[Tuple[str, str, int]]:
+        """(chunk_id, collection, chunk_index) của 1 file, sắp theo chunk_index - vectorized"""
+        code = self._code_by_file.get(source_file)
+        if code is None:
+            return []
+        rows = np.nonzero(self.file_codes == code)[0]
+        rows = rows[np.argsort(self.chunk_indices[rows], kind='stable')]
+        return [
+            (str(self.chunk_ids[row]), self.collections[int(self.collection_codes[row])], int(self.chunk_indices[row]))
+            for row in rows
+        ]
+
+    # ---------------------------------------------------------------
+    # Stats
+    # ---------------------------------------------------------------
+    def memory_usage(self) -> Dict[str, Any]:
+        """Ước lượng bộ nhớ: cột NumPy (mmap = page cache, không tính vào heap) + hash index Python"""
+        array_bytes = sum(getattr(self, name).nbytes for name in _ARRAY_FILES)
+        index_bytes = sys.getsizeof(self._row_by_id) + sum(sys.getsizeof(k) for k in self._row_by_id)
+        vocab_bytes = sum(sys.getsizeof(s) for s in self.files) + sum(sys.getsizeof(s) for s in self.collections)
+        is_mmap = isinstance(self.chunk_ids, np.memmap)
+        return {
+            'source': self.source,
+            'mmap': is_mmap,
+            'array_bytes': int(array_bytes),
+            'id_index_bytes': int(index_bytes),
+            'vocab_bytes': int(vocab_bytes),
+            'heap_mb': round((index_bytes + vocab_bytes + (0 if is_mmap else array_bytes)) / (1024 * 1024), 3)
+        }
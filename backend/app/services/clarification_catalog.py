@@ -0,0 +1,175 @@
+"""
+Clarification Catalog
+Dữ liệu tĩnh cho multi-turn clarification, build 1 lần từ router example questions (cùng router cache):
+
+- collection -> documents đã xếp hạng (số câu hỏi giảm dần): filename, title, description, question_count
+- document -> câu hỏi gợi ý đã xếp hạng (main question trước, rồi theo priority_score)
+- title aliases (filename, filename bỏ .json, title - chuẩn hóa NFC + lowercase) -> filename
+
+Các bước proceed_with_collection / proceed_with_document chỉ còn là dictionary lookups thay vì
+duyệt lại mọi example question của collection mỗi lượt. Catalog đổi khi router rebuild (snapshot mới).
+"""
+
+import logging
+from typing import Dict, List, Any, Optional
+
+from .embedding_cache import normalize_query_text
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+
+
+def document_title_from_source(source: str) -> str:
+    """Tên document hiển thị: bỏ thư mục, đuôi .json, số thứ tự ("01. ")"""
+    doc_name = source.replace('.json', '').split('/')[-1]
+    if '. ' in doc_name:
+        doc_name = doc_name.split('. ', 1)[1]  # Remove numbering
+    return doc_name
+
+
+def _alias_key(text: str) -> str:
+    return normalize_query_text(text).lower()
+
+
+def _question_rank(question: Dict[str, Any]) -> tuple:
+    # Main question (main / smart_main) trước, sau đó priority_score cao trước; sort stable giữ thứ tự file
+    return (not str(question.get('type', '')).endswith('main'), -float(question.get('priority_score', 0.0) or 0.0))
+
+
+def _ranked_questions(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Câu hỏi gợi ý của 1 document: đã xếp hạng, bỏ câu trùng (main question hay lặp lại trong variants)"""
+    ranked, seen = [], set()
+    for question in sorted(questions, key=_question_rank):
+        key = _alias_key(question.get('text', ''))
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        ranked.append({
+            'text': question.get('text', ''),
+            'source': question.get('source', ''),
+            'category': question.get('category', 'general')
+        })
+    return ranked
+
+
+class ClarificationCatalog:
+    """Catalog read-only - build xong không sửa, dùng chung giữa các requests của 1 snapshot"""
+
+    def __init__(self, collections: Dict[str, Dict[str, Any]], signature: Dict[str, int]):
+        self._collections = collections
+        self.signature = signature
+
+    @classmethod
+    def build(cls, example_questions: Dict[str, List[Dict[str, Any]]]) -> "ClarificationCatalog":
+        collections = {}
+        for collection_name, questions in example_questions.items():
+            documents: Dict[str, Dict[str, Any]] = {}
+            document_questions: Dict[str, List[Dict[str, Any]]] = {}
+            for question in questions:
+                if not isinstance(question, dict) or not question.get('source'):
+                    continue
+                source = question['source']
+                doc_name = document_title_from_source(source)
+                if doc_name not in documents:
+                    documents[doc_name] = {
+                        "filename": source,
+                        "title": doc_name,
+                        "description": f"Tài liệu về {doc_name}",
+                        "question_count": 0
+                    }
+                documents[doc_name]["question_count"] += 1
+                document_questions.setdefault(source, []).append(question)
+
+            aliases = {}
+            for doc in documents.values():
+                filename = doc['filename']
+                for alias in (filename, filename.replace('.json', ''), doc['title']):
+                    aliases.setdefault(_alias_key(alias), filename)
+
+            collections[collection_name] = {
+                'documents': sorted(documents.values(), key=lambda x: x["question_count"], reverse=True),
+                'questions': {filename: _ranked_questions(items) for filename, items in document_questions.items()},
+                'aliases': aliases,
+                'fallback_questions': [
+                    {
+                        'text': q.get('text', str(q)) if isinstance(q, dict) else str(q),
+                        'source': q.get('source', '') if isinstance(q, dict) else '',
+                        'category': q.get('category', 'general') if isinstance(q, dict) else 'general'
+                    }
+                    for q in questions[:5]
+                ]
+            }
+
+        signature = {name: len(questions) for name, questions in example_questions.items()}
+        return cls(collections, signature)
+
+    # ---------------------------------------------------------------
+    # Persistence (lưu trong router cache pickle)
+    # ---------------------------------------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': CATALOG_VERSION, 'signature': self.signature, 'collections': self._collections}
+
+    @classmethod
+    def from_dict(cls, data: Any, example_questions: Dict[str, List[Dict[str, Any]]]) -> Optional["ClarificationCatalog"]:
+        """None nếu catalog đã lưu không khớp version / số câu hỏi của router cache"""
+        if not isinstance(data, dict) or data.get('version') != CATALOG_VERSION:
+            return None
+        signature = {name: len(questions) for name, questions in example_questions.items()}
+        if data.get('signature') != signature:
+            return None
+        return cls(data['collections'], signature)
+
+    # ---------------------------------------------------------------
+    # Lookups
+    # ---------------------------------------------------------------
+    def documents(self, collection_name: str) -> List[Dict[str, Any]]:
+        """Documents của collection, xếp theo số câu hỏi (copy - caller được sửa)"""
+        entry = self._collections.get(collection_name)
+        return [dict(doc) for doc in entry['documents']] if entry else []
+
+    def resolve_document(
+        self,
+        collection_name: str,
+        document_filename: Optional[str] = None,
+        document_title: Optional[str] = None
+    ) -> Optional[str]:
+        """Filename của document theo filename / title user chọn (exact, alias, rồi substring như trước)"""
+        entry = self._collections.get(collection_name)
+        if not entry:
+            return None
+        if document_filename and document_filename in entry['questions']:
+            return document_filename
+        for candidate in (document_filename, document_title):
+            if candidate:
+                filename = entry['aliases'].get(_alias_key(candidate))
+                if filename:
+                    return filename
+        if document_filename:
+            for filename in entry['questions']:
+                if document_filename in filename:
+                    return filename
+        return None
+
+    def document_questions(
+        self,
+        collection_name: str,
+        document_filename: Optional[str] = None,
+        document_title: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Câu hỏi đã xếp hạng của document - không tìm thấy document thì trả 5 câu đầu của collection"""
+        entry = self._collections.get(collection_name)
+        if not entry:
+            return []
+        filename = self.resolve_document(collection_name, document_filename, document_title)
+        if filename is None:
+            logger.warning(f"⚠️ No questions found for document {document_title or document_filename}")
+            return list(entry['fallback_questions'])
+        return list(entry['questions'][filename]) or list(entry['fallback_questions'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'collections': len(self._collections),
+            'documents': sum(len(entry['documents']) for entry in self._collections.values()),
+            'questions': sum(self.signature.values())
+        }
@@ -0,0 +1,257 @@
+"""
+Request Coalescing (single-flight)
+Nhiều users hỏi cùng 1 câu trong vài giây (vd. sau tin tức về thay đổi thủ tục) -> chỉ 1 lần search + rerank +
+expansion + generation:
+
+- Key = câu hỏi đã normalize + kết quả routing (confidence level, collections, filters, document được chọn) +
+  lượt hỏi-đáp gần nhất của session (prompt có dùng) -> cùng key thì pipeline cho cùng câu trả lời
+- Request đầu tiên (leader) chạy pipeline; requests trùng key tới khi leader chưa xong (joiners) chờ và nhận
+  bản copy kết quả, rồi tự áp dụng session updates của mình (query history, stateful router, clarification context)
+  - pipeline ghi các updates qua record_session_update() khi chạy trong flight
+- Pipeline chạy với CancellationToken riêng của flight: chỉ bị hủy khi MỌI participant đã disconnect;
+  joiner disconnect thì chỉ rời flight
+- Streaming: flight có TokenStream append-only - LLM publish text sau mỗi token; consumer (leader hay joiner
+  attach muộn) đọc iter_text(): phát lại phần đã sinh rồi theo tiếp phần còn lại
+
+Flight chỉ tồn tại khi pipeline đang chạy - không phải cache kết quả. Requests chạy song song (QUERY_CONCURRENCY > 1)
+mới có thể gặp nhau trong flight.
+"""
+
+import codecs
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
+
+from .cancellation import CancellationToken, RequestCancelled, cancellation_scope, current_token
+from .embedding_cache import normalize_query_text
+from .metrics import registry, record_coalesced_request
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ joiner kiểm tra client disconnect của chính nó khi chờ leader
+JOIN_POLL_SECONDS = 0.05
+
+_current_stream: ContextVar[Optional["TokenStream"]] = ContextVar("token_stream", default=None)
+_current_flight: ContextVar[Optional["Flight"]] = ContextVar("flight", default=None)
+
+
+class TokenStream:
+    """Text sinh ra của 1 generation - append-only, nhiều consumers đọc độc lập (replay + live)"""
+
+    def __init__(self):
+        self._pieces: List[str] = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def publish(self, text: str):
+        if not text:
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._pieces.append(text)
+            self._condition.notify_all()
+
+    def publish_bytes(self, data: bytes):
+        """Bytes từ detokenize - 1 ký tự UTF-8 tiếng Việt có thể nằm trên 2 tokens"""
+        self.publish(self._decoder.decode(data))
+
+    def finish(self, final_text: Optional[str] = None):
+        """Đóng stream; final_text (câu trả lời cuối) bổ sung phần chưa publish nếu nối tiếp được"""
+        with self._condition:
+            if self._closed:
+                return
+            tail = self._decoder.decode(b'', final=True)
+            if tail:
+                self._pieces.append(tail)
+            if final_text:
+                published = ''.join(self._pieces)
+                if final_text.startswith(published) and len(final_text) > len(published):
+                    self._pieces.append(final_text[len(published):])
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def text(self) -> str:
+        with self._condition:
+            return ''.join(self._pieces)
+
+    def iter_text(self, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """Phần đã sinh rồi phần còn lại tới khi stream đóng (cancel_event set -> dừng)"""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._pieces) and not self._closed:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    self._condition.wait(JOIN_POLL_SECONDS if cancel_event is not None else None)
+                pieces = self._pieces[index:]
+                closed = self._closed
+            index += len(pieces)
+            for piece in pieces:
+                yield piece
+            if closed and not pieces:
+                return
+
+
+@contextmanager
+def stream_scope(stream: Optional[TokenStream]) -> Iterator[Optional[TokenStream]]:
+    reset_token = _current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(reset_token)
+
+
+def current_stream() -> Optional[TokenStream]:
+    return _current_stream.get()
+
+
+def record_session_update(update: str, details: Dict[str, Any]):
+    """Pipeline đang chạy trong flight: ghi session update để joiners áp dụng lên session của họ"""
+    flight = _current_flight.get()
+    if flight is not None:
+        flight.session_updates.append((update, details))
+
+
+def flight_key(
+    query: str,
+    confidence_level: str,
+    collections: List[str],
+    filters: Optional[Dict[str, Any]],
+    document_title: Optional[str],
+    last_turn: Optional[Tuple[str, str]]
+) -> str:
+    payload = json.dumps(
+        [normalize_query_text(query).lower(), confidence_level, collections, filters or {}, document_title, last_turn],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class Flight:
+    """1 lần chạy pipeline dùng chung cho mọi participants cùng key"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.token = CancellationToken()
+        self.stream = TokenStream()
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.session_updates: List[Tuple[str, Dict[str, Any]]] = []
+        self.participants = 1
+        self.cancelled_participants = 0
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def attach(self, token: Optional[CancellationToken]):
+        with self._lock:
+            self.participants += 1
+        if token is not None:
+            token.add_callback(self._participant_cancelled)
+
+    def _participant_cancelled(self):
+        with self._lock:
+            self.cancelled_participants += 1
+            abandoned = self.cancelled_participants >= self.participants
+        if abandoned:
+            self.token.cancel("all_clients_disconnected")
+
+
+class SingleFlight:
+    """Registry flights đang chạy theo key - thread-safe"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = settings.query_coalescing if enabled is None else enabled
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {'flights': 0, 'coalesced': 0, 'cancelled_joiners': 0, 'fallbacks': 0, 'max_participants': 1}
+
+    def execute(self, key: str, func: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[Flight]]:
+        """
+        (result, flight) - flight là None khi chính caller chạy pipeline (leader / flight lỗi),
+        không None khi caller là joiner: caller áp dụng flight.session_updates lên session của mình
+        """
+        token = current_token()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.token.cancelled:
+                flight.attach(token)
+                joined = True
+            else:
+                flight = self._flights[key] = Flight(key)
+                self._stats['flights'] += 1
+                joined = False
+        if joined:
+            return self._join(flight, token, func)
+        if token is not None:
+            token.add_callback(flight._participant_cancelled)
+        return self._lead(flight, func), None
+
+    def _lead(self, flight: Flight, func: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        flight_reset = _current_flight.set(flight)
+        try:
+            with cancellation_scope(flight.token), stream_scope(flight.stream):
+                flight.result = func()
+            return flight.result
+        finally:
+            _current_flight.reset(flight_reset)
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                self._stats['max_participants'] = max(self._stats['max_participants'], flight.participants)
+            answer = flight.result.get('answer') if flight.result else None
+            flight.stream.finish(answer if isinstance(answer, str) else None)
+            flight.done.set()
+            if flight.participants > 1:
+                logger.info(f"🔗 Flight {flight.key[:8]} served {flight.participants} requests "
+                            f"in {time.perf_counter() - flight.started_at:.2f}s")
+
+    def _join(self, flight: Flight, token: Optional[CancellationToken],
+              func: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[Flight]]:
+        while not flight.done.wait(JOIN_POLL_SECONDS if token is not None else None):
+            if token is not None and token.cancelled:
+                with self._lock:
+                    self._stats['cancelled_joiners'] += 1
+                record_coalesced_request("cancelled")
+                # Leader vẫn chạy cho participants còn lại - joiner không tiết kiệm thêm compute nào
+                raise RequestCancelled("coalesced", reclaimed_seconds=0.0)
+        if flight.result is None:
+            # Leader lỗi / bị hủy khi joiner còn chờ -> tự chạy pipeline của mình
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            record_coalesced_request("fallback")
+            return func(), None
+        with self._lock:
+            self._stats['coalesced'] += 1
+        record_coalesced_request("joined")
+        return copy.deepcopy(flight.result), flight
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        stats['enabled'] = self.enabled
+        return stats
+
+    def collect_metrics(self):
+        in_flight = registry.family("coalescing_in_flight", "gauge", "Pipeline executions đang chạy có thể nhận thêm requests trùng")
+        with self._lock:
+            in_flight.add(len(self._flights))
+        return [in_flight]
+
+
+# Global instance
+single_flight = SingleFlight()
+registry.register_collector("coalescing", single_flight.collect_metrics)
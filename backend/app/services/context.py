@@ -4,55 +4,59 @@ Sử dụng "Nucleus Chunk" strategy để mở rộng ngữ cảnh hiệu quả
 """
 
 import logging
+import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Set, Tuple
 import json
 
+from .chunk_manifest import ChunkMetadataIndex
+from .events import events
+from .metrics import record_cache
+from ..core.config import settings
+
 logger = logging.getLogger(__name__)
 
+DETAIL_SECTION_HEADER = "=== NỘI DUNG CHI TIẾT ==="
+# Số chunks mỗi bên nucleus trong nucleus section
+NUCLEUS_SECTION_WINDOW = 1
+
 class ContextExpander:
     """Service mở rộng ngữ cảnh với Nucleus Chunk strategy"""
     
-    def __init__(self, vectordb_service, documents_dir: str):
+    def __init__(self, vectordb_service, documents_dir: str, manifest_dir: Optional[Path] = None):
         self.vectordb_service = vectordb_service
         self.documents_dir = Path(documents_dir)
+        self.manifest_dir = Path(manifest_dir) if manifest_dir else settings.chunk_manifest_path
         
-        # Cache metadata của documents
-        self.document_metadata_cache = {}
+        # Cache metadata của documents: chunk_id -> (source_file, collection, chunk_index) dạng cột
+        self.document_metadata_cache = ChunkMetadataIndex.from_records([])
         self._build_document_metadata_cache()
     
     def _build_document_metadata_cache(self):
-        """Xây dựng cache metadata để map chunk -> document"""
+        """
+        Xây dựng cache metadata để map chunk -> document
+        
+        Ưu tiên columnar manifest do indexer ghi (mmap, không query Chroma);
+        fallback đọc metadatas từ Chroma rồi ghi manifest cho lần startup sau.
+        """
+        start_time = time.time()
         try:
-            # Lấy tất cả collections
-            collections = self.vectordb_service.list_collections()
+            index = ChunkMetadataIndex.load(self.manifest_dir)
+            if index is not None and not index.matches_vectordb(self.vectordb_service):
+                logger.info("🔄 Chunk manifest is stale (collection counts changed), rebuilding from vector DB")
+                index = None
+            record_cache("chunk_manifest", hit=index is not None)
             
-            for collection_info in collections:
-                collection_name = collection_info["name"]
-                collection = self.vectordb_service.get_collection(collection_name)
-                
-                # Lấy tất cả documents trong collection
+            if index is None:
+                index = ChunkMetadataIndex.from_vectordb(self.vectordb_service)
                 try:
-                    results = collection.get()
-                    
-                    for i, chunk_id in enumerate(results["ids"]):
-                        metadata = results.get("metadatas", [{}])[i] if i < len(results.get("metadatas", [])) else {}
-                        
-                        if metadata and "source" in metadata:
-                            source_file = metadata["source"]
-                            
-                            # Build cache entry
-                            self.document_metadata_cache[chunk_id] = {
-                                "source_file": source_file,
-                                "collection": collection_name,
-                                "metadata": metadata,
-                                "chunk_index": metadata.get("chunk_index", 0)
-                            }
-                            
+                    index.save(self.manifest_dir)
                 except Exception as e:
-                    logger.warning(f"Could not process collection {collection_name}: {e}")
-                    
-            logger.info(f"Built metadata cache for {len(self.document_metadata_cache)} chunks")
+                    logger.warning(f"⚠️ Could not save chunk manifest: {e}")
+            
+            # Swap 1 lần để query đang chạy không thấy cache rỗng khi rebuild
+            self.document_metadata_cache = index
+            logger.info(f"Built metadata cache for {len(index)} chunks from {index.source} in {time.time() - start_time:.2f}s")
             
         except Exception as e:
             logger.error(f"Error building document metadata cache: {e}")
@@ -75,7 +79,8 @@ class ContextExpander:
         Args:
             nucleus_chunks: List chunks đã rerank (thường chỉ 1 chunk cao nhất)
             max_context_length: Độ dài context tối đa (ký tự) - CHỈ để truncate nếu QUÁ dài
-            include_full_document: LUÔN True cho văn bản pháp luật
+            include_full_document: True cho văn bản pháp luật; False chỉ khi hết latency budget
+                (deadline.py) -> metadata + nucleus section (NUCLEUS_SECTION_WINDOW chunks mỗi bên)
             
         Returns:
             Expanded context với toàn bộ document content và metadata
@@ -95,7 +100,6 @@ class ContextExpander:
                 return expanded_context
                 
             nucleus_chunk = nucleus_chunks[0]  # Lấy chunk cao nhất sau rerank
-            logger.info(f"Processing nucleus chunk with ID: {nucleus_chunk.get('id', 'N/A')}")
             
             # Tìm source file JSON từ nucleus chunk metadata
             source_file = None
@@ -109,15 +113,19 @@ class ContextExpander:
             if not source_file:
                 logger.warning("Could not find source file for nucleus chunk")
                 return expanded_context
-                
-            logger.info(f"Found source file: {source_file}")
-            logger.info("Loading FULL DOCUMENT content để đảm bảo ngữ cảnh pháp luật đầy đủ")
             
             # TRIẾT LÝ THIẾT KẾ: Load toàn bộ document gốc từ file JSON
             # Không cắt ghép, không smart expansion - chỉ FULL DOCUMENT
             final_content, structured_metadata = self._load_full_document_and_metadata(source_file)
             expansion_strategy = "full_document_legal_context"
             
+            if not include_full_document and final_content:
+                # ⏳ Degradation (hết latency budget): metadata thủ tục + các chunks quanh nucleus -> prompt ngắn hơn
+                section_content = self._build_nucleus_section(source_file, nucleus_chunk, final_content)
+                if section_content:
+                    final_content = section_content
+                    expansion_strategy = "nucleus_section"
+            
             # Truncate CHỈ KHI document quá dài (giữ tối đa thông tin)
             if len(final_content) > max_context_length:
                 logger.warning(f"Document dài {len(final_content)} chars > max {max_context_length}, truncating...")
@@ -136,8 +144,14 @@ class ContextExpander:
                 expanded_context["expansion_strategy"] = expansion_strategy
                 expanded_context["structured_metadata"] = structured_metadata  # ✅ THÊM: Structured metadata
                 
-                logger.info(f"Final context: {len(final_content)} chars, strategy: {expansion_strategy}")
-                logger.info(f"Extracted metadata fields: {list(structured_metadata.keys()) if structured_metadata else 'None'}")
+                events.record(
+                    "context_expansion",
+                    nucleus_id=nucleus_chunk.get('id'),
+                    source_file=source_file,
+                    strategy=expansion_strategy,
+                    chars=len(final_content),
+                    metadata_fields=list(structured_metadata) if structured_metadata else []
+                )
             else:
                 logger.warning("Could not generate final content")
             
@@ -155,6 +169,18 @@ class ContextExpander:
                 "structured_metadata": {}  # ✅ THÊM: Empty metadata for fallback
             }
     
+    def _build_nucleus_section(self, source_file: str, nucleus_chunk: Dict[str, Any], full_content: str) -> str:
+        """Phần metadata của document + nucleus chunk và các chunks liền kề"""
+        metadata_section = full_content.split(DETAIL_SECTION_HEADER)[0].rstrip()
+        section = self._merge_document_chunks(
+            self._get_surrounding_chunks(source_file, [nucleus_chunk], window_size=NUCLEUS_SECTION_WINDOW),
+            source_file
+        )
+        section_text = section.get("text") or nucleus_chunk.get("content", "")
+        if not section_text:
+            return ""
+        return "\n".join(part for part in (metadata_section, DETAIL_SECTION_HEADER, section_text) if part)
+
     def _load_full_document_and_metadata(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """
         Load TOÀN BỘ nội dung document + metadata có cấu trúc
@@ -164,8 +190,6 @@ class ContextExpander:
             if not Path(file_path).exists():
                 logger.warning(f"Source file not found: {file_path}")
                 return "", {}
-                
-            logger.info(f"Loading COMPLETE document content and metadata from: {file_path}")
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 json_data = json.load(f)
@@ -200,7 +224,7 @@ class ContextExpander:
             # Join tất cả content
             complete_content = "\n".join(complete_parts)
             
-            logger.info(f"Loaded COMPLETE document: {len(complete_content)} characters + structured metadata")
+            events.record("document_loaded", file_path=file_path, chars=len(complete_content), metadata=True)
             return complete_content, metadata
             
         except Exception as e:
@@ -219,8 +243,6 @@ class ContextExpander:
             if not Path(file_path).exists():
                 logger.warning(f"Source file not found: {file_path}")
                 return ""
-                
-            logger.info(f"Loading COMPLETE document content from: {file_path}")
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 json_data = json.load(f)
@@ -255,50 +277,47 @@ class ContextExpander:
             # Join tất cả content
             complete_content = "\n".join(complete_parts)
             
-            logger.info(f"Loaded COMPLETE document: {len(complete_content)} characters (NO filtering, NO truncation)")
+            events.record("document_loaded", file_path=file_path, chars=len(complete_content), metadata=False)
             return complete_content
             
         except Exception as e:
             logger.error(f"Error loading document: {e}")
             return ""
     
-    def _get_all_chunks_from_document(self, source_file: str) -> List[Dict[str, Any]]:
-        """Lấy tất cả chunks từ một document"""
-        document_chunks = []
-        
-        for chunk_id, metadata in self.document_metadata_cache.items():
-            if metadata["source_file"] == source_file:
-                # Lấy chunk content từ vector database
-                try:
-                    collection = self.vectordb_service.get_collection(metadata["collection"])
-                    result = collection.get(ids=[chunk_id])
+    def _fetch_chunks(self, rows: List[Tuple[str, str, int]], source_file: str) -> List[Dict[str, Any]]:
+        """Lấy content các chunks (đã sắp theo chunk_index) từ vector database"""
+        chunks = []
+        for chunk_id, collection_name, chunk_index in rows:
+            try:
+                collection = self.vectordb_service.get_collection(collection_name)
+                result = collection.get(ids=[chunk_id], include=['documents'])
+                
+                if result["documents"]:
+                    chunks.append({
+                        "id": chunk_id,
+                        "content": result["documents"][0],
+                        "metadata": {"source_file": source_file, "collection": collection_name, "chunk_index": chunk_index},
+                        "chunk_index": chunk_index
+                    })
                     
-                    if result["documents"]:
-                        document_chunks.append({
-                            "id": chunk_id,
-                            "content": result["documents"][0],
-                            "metadata": metadata,
-                            "chunk_index": metadata["chunk_index"]
-                        })
-                        
-                except Exception as e:
-                    logger.warning(f"Could not retrieve chunk {chunk_id}: {e}")
+            except Exception as e:
+                logger.warning(f"Could not retrieve chunk {chunk_id}: {e}")
         
-        # Sắp xếp theo chunk_index
-        document_chunks.sort(key=lambda x: x["chunk_index"])
-        
-        return document_chunks
+        return chunks
+    
+    def _get_all_chunks_from_document(self, source_file: str) -> List[Dict[str, Any]]:
+        """Lấy tất cả chunks từ một document"""
+        return self._fetch_chunks(self.document_metadata_cache.rows_for_file(source_file), source_file)
     
     def _get_surrounding_chunks(self, source_file: str, nucleus_chunks: List[Dict[str, Any]], window_size: int = 2) -> List[Dict[str, Any]]:
         """Lấy các chunks xung quanh nucleus chunks"""
         # Tìm nucleus chunk indices trong document này
         nucleus_indices = set()
         for nucleus_chunk in nucleus_chunks:
-            chunk_id = nucleus_chunk.get("id", "")
-            if chunk_id in self.document_metadata_cache:
-                metadata = self.document_metadata_cache[chunk_id]
-                if metadata["source_file"] == source_file:
-                    nucleus_indices.add(metadata["chunk_index"])
+            metadata = self.document_metadata_cache.get(nucleus_chunk.get("id", ""))
+            record_cache("chunk_metadata", hit=metadata is not None)
+            if metadata and metadata["source_file"] == source_file:
+                nucleus_indices.add(metadata["chunk_index"])
         
         if not nucleus_indices:
             return []
@@ -307,31 +326,11 @@ class ContextExpander:
         min_index = min(nucleus_indices) - window_size
         max_index = max(nucleus_indices) + window_size
         
-        # Lấy chunks trong range
-        surrounding_chunks = []
-        for chunk_id, metadata in self.document_metadata_cache.items():
-            if metadata["source_file"] == source_file:
-                chunk_idx = metadata["chunk_index"]
-                if min_index <= chunk_idx <= max_index:
-                    try:
-                        collection = self.vectordb_service.get_collection(metadata["collection"])
-                        result = collection.get(ids=[chunk_id])
-                        
-                        if result["documents"]:
-                            surrounding_chunks.append({
-                                "id": chunk_id,
-                                "content": result["documents"][0],
-                                "metadata": metadata,
-                                "chunk_index": chunk_idx
-                            })
-                            
-                    except Exception as e:
-                        logger.warning(f"Could not retrieve chunk {chunk_id}: {e}")
-        
-        # Sắp xếp theo chunk_index
-        surrounding_chunks.sort(key=lambda x: x["chunk_index"])
-        
-        return surrounding_chunks
+        rows = [
+            row for row in self.document_metadata_cache.rows_for_file(source_file)
+            if min_index <= row[2] <= max_index
+        ]
+        return self._fetch_chunks(rows, source_file)
     
     def _merge_document_chunks(self, chunks: List[Dict[str, Any]], source_file: str) -> Dict[str, Any]:
         """Merge các chunks thành một document context"""
@@ -360,27 +359,22 @@ class ContextExpander:
             "total_chunks": len(chunks),
             "total_length": sum(len(chunk["content"]) for chunk in chunks),
             "chunk_indices": [chunk["chunk_index"] for chunk in chunks],
-            "collections": list(set(self.document_metadata_cache[chunk["id"]]["collection"] for chunk in chunks))
+            "collections": list(set(chunk["metadata"]["collection"] for chunk in chunks))
         }
     
     def rebuild_metadata_cache(self):
         """Rebuild metadata cache (sau khi có documents mới)"""
-        self.document_metadata_cache.clear()
         self._build_document_metadata_cache()
         
     def get_stats(self) -> Dict[str, Any]:
         """Thống kê context expansion service"""
-        source_files = set()
-        collections = set()
-        
-        for metadata in self.document_metadata_cache.values():
-            source_files.add(metadata["source_file"])
-            collections.add(metadata["collection"])
+        index = self.document_metadata_cache
         
         return {
-            "total_chunks": len(self.document_metadata_cache),
-            "total_documents": len(source_files),
-            "total_collections": len(collections),
-            "documents": list(source_files),
-            "collections": list(collections)
+            "total_chunks": len(index),
+            "total_documents": len(index.files),
+            "total_collections": len(index.collections),
+            "documents": list(index.files),
+            "collections": list(index.collections),
+            "memory": index.memory_usage()
         }
@@ -0,0 +1,243 @@
+"""
+Deadline-aware Degradation
+Latency budget cho mỗi request (header X-Deadline-Ms hoặc REQUEST_DEADLINE_MS) + policy quyết định ở từng
+stage nên làm gì với phần budget còn lại. Giảm chất lượng theo thứ tự ít ảnh hưởng tới câu trả lời nhất trước:
+
+1. search: giảm dynamic_k (ít candidates -> rerank nhanh hơn)
+2. rerank: bỏ consensus (1 lần rerank top 1), rồi bỏ hẳn reranker (chunk tốt nhất theo vector similarity)
+3. context_expansion: nucleus section (các chunks quanh nucleus) thay vì toàn bộ document -> prompt ngắn hơn
+4. generation: trả lời từ structured metadata nếu câu hỏi hỏi 1 trường; không thì giới hạn max_tokens theo
+   tokens/s đo được - LLM vẫn dừng ở deadline (truncated) nếu ước lượng sai
+
+Mỗi stage giữ lại đủ budget cho các stages sau ở mode đầy đủ -> stages đầu bị giảm trước, generation được
+ưu tiên. Khi budget không đủ cho generation đầy đủ dù search / rerank giảm hết cỡ (server bận, generation chờ slot),
+search + rerank vẫn được dùng tối đa UPSTREAM_SHARE budget còn lại: chọn đúng document quan trọng hơn vài tokens. Chi phí ước lượng từ latency đã đo của chính policy (cửa sổ COST_WINDOW lần gần nhất theo stage + mode,
+rerank tính theo ms / candidate, generation theo mode context), chưa có số đo thì dùng DEFAULT_COSTS_MS.
+
+Budget nằm trong ContextVar của thread chạy pipeline (giống CancellationToken); mọi degradation được ghi vào
+RequestBudget.degradations -> response, events và metrics.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Iterator, Deque
+
+from .events import events
+from .metrics import record_degradation, LLM_COMPLETION_TOKENS, LLM_GENERATION_SECONDS
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Chi phí mặc định (ms) khi chưa có số đo - rerank tính theo ms / candidate
+DEFAULT_COSTS_MS = {
+    ("search", "full"): 50.0,
+    ("rerank", "consensus"): 40.0,
+    ("rerank", "single"): 25.0,
+    ("context_expansion", "full_document"): 20.0,
+    ("context_expansion", "nucleus_section"): 20.0,
+    ("generation", "full_document"): 3000.0,
+    ("generation", "nucleus_section"): 2000.0,
+}
+COST_WINDOW = 200
+MIN_SEARCH_K = 4
+MIN_MAX_TOKENS = 64
+# Chỉ dùng 80% budget còn lại cho completion tokens (prefill + sai số ước lượng tokens/s)
+TOKEN_BUDGET_HEADROOM = 0.8
+# Phần budget còn lại search / rerank luôn được dùng, kể cả khi generation không còn vừa budget
+UPSTREAM_SHARE = 0.25
+# LLM dừng sớm hơn deadline một chút: còn build response + cập nhật session sau generation
+FINISH_MARGIN_MS = 30.0
+
+_current_budget: ContextVar[Optional["RequestBudget"]] = ContextVar("request_budget", default=None)
+
+
+class RequestBudget:
+    """Latency budget của 1 request + danh sách degradations đã áp dụng"""
+
+    def __init__(self, deadline_ms: float):
+        self.deadline_ms = float(deadline_ms)
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + self.deadline_ms / 1000.0  # time.monotonic() - dùng cho GenerationScheduler
+        self.degradations: List[Dict[str, Any]] = []
+
+    def remaining_ms(self) -> float:
+        return (self.deadline - time.monotonic()) * 1000.0
+
+    def generation_deadline(self) -> float:
+        """Deadline (time.monotonic()) truyền cho LLM - chừa FINISH_MARGIN_MS cho phần sau generation"""
+        return self.deadline - FINISH_MARGIN_MS / 1000.0
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started_at) * 1000.0
+
+    def degrade(self, stage: str, action: str, **details):
+        entry = {'stage': stage, 'action': action, 'remaining_ms': round(self.remaining_ms(), 1), **details}
+        self.degradations.append(entry)
+        record_degradation(stage, action)
+        events.record("degradation", **entry)
+        logger.info(f"⏳ Degradation {stage}/{action} ({entry['remaining_ms']}ms left): {details or ''}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed_ms()
+        return {
+            'deadline_ms': self.deadline_ms,
+            'elapsed_ms': round(elapsed, 1),
+            'exceeded': elapsed > self.deadline_ms,
+            'degradations': list(self.degradations)
+        }
+
+
+@contextmanager
+def budget_scope(budget: Optional[RequestBudget]) -> Iterator[Optional[RequestBudget]]:
+    """Gắn budget vào context hiện tại (None = không giới hạn)"""
+    reset_token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(reset_token)
+
+
+def current_budget() -> Optional[RequestBudget]:
+    return _current_budget.get()
+
+
+def resolve_deadline_ms(deadline_ms: Optional[float]) -> float:
+    """deadline của request (header) hoặc REQUEST_DEADLINE_MS; <= 0 = không giới hạn"""
+    value = deadline_ms if deadline_ms is not None else settings.request_deadline_ms
+    return float(value or 0.0)
+
+
+class DegradationPolicy:
+    """Quyết định mode của từng stage theo budget còn lại - thread-safe, dùng chung cho mọi request"""
+
+    def __init__(self, percentile: Optional[float] = None):
+        self.percentile = percentile if percentile is not None else settings.deadline_cost_percentile
+        self._samples: Dict[tuple, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------
+    # Chi phí đo được
+    # ---------------------------------------------------------------
+    def observe(self, stage: str, mode: str, elapsed_ms: float, units: int = 1):
+        """Latency thực tế của stage ở mode đã chọn (units: số candidates cho rerank)"""
+        if units <= 0:
+            return
+        with self._lock:
+            window = self._samples.setdefault((stage, mode), deque(maxlen=COST_WINDOW))
+            window.append(elapsed_ms / units)
+
+    @contextmanager
+    def measure(self, stage: str, mode: str, units: int = 1) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, mode, (time.perf_counter() - start) * 1000.0, units)
+
+    def cost_ms(self, stage: str, mode: str, units: int = 1) -> float:
+        """Percentile latency gần đây của stage + mode (x units), DEFAULT_COSTS_MS khi chưa có số đo"""
+        with self._lock:
+            values = sorted(self._samples.get((stage, mode), ()))
+        if values:
+            per_unit = values[min(len(values) - 1, int(round(self.percentile / 100.0 * (len(values) - 1))))]
+        else:
+            per_unit = DEFAULT_COSTS_MS.get((stage, mode), 0.0)
+        return per_unit * units
+
+    def _upstream_available_ms(self, budget: RequestBudget, after: str, own_ms: float = 0.0) -> float:
+        """Budget cho search / rerank: phần không cần giữ cho stages sau, tối thiểu UPSTREAM_SHARE budget còn lại"""
+        remaining = budget.remaining_ms()
+        return max(remaining - own_ms - self._reserve_ms(after), remaining * UPSTREAM_SHARE - own_ms)
+
+    def _reserve_ms(self, after: str) -> float:
+        """Budget giữ lại cho các stages sau `after` ở mode đầy đủ"""
+        reserve = 0.0
+        if after in ("search", "rerank"):
+            reserve += self.cost_ms("context_expansion", "full_document")
+        if after in ("search", "rerank", "context_expansion"):
+            reserve += self.cost_ms("generation", "full_document")
+        return reserve
+
+    @staticmethod
+    def tokens_per_second() -> Optional[float]:
+        """Throughput generation trung bình (completion tokens / thời gian generation, gồm prefill)"""
+        seconds = LLM_GENERATION_SECONDS.get()
+        tokens = LLM_COMPLETION_TOKENS.get()
+        return tokens / seconds if seconds > 0 and tokens > 0 else None
+
+    # ---------------------------------------------------------------
+    # Quyết định từng stage
+    # ---------------------------------------------------------------
+    def search_k(self, k: int, budget: Optional[RequestBudget]) -> int:
+        """Giảm dynamic_k khi budget không đủ rerank k candidates bằng consensus"""
+        if budget is None:
+            return k
+        available = self._upstream_available_ms(budget, "rerank", own_ms=self.cost_ms("search", "full"))
+        per_candidate = self.cost_ms("rerank", "consensus")
+        affordable = int(available // per_candidate) if per_candidate > 0 else k
+        if affordable >= k:
+            return k
+        reduced = max(MIN_SEARCH_K, affordable)
+        if reduced < k:
+            budget.degrade("search", "shrink_k", from_k=k, to_k=reduced)
+            return reduced
+        return k
+
+    def rerank_mode(self, candidates: int, consensus: bool, budget: Optional[RequestBudget]) -> str:
+        """'consensus' / 'single' / 'skip' - mode đắt nhất còn vừa budget"""
+        preferred = "consensus" if consensus else "single"
+        if budget is None:
+            return preferred
+        available = self._upstream_available_ms(budget, "rerank")
+        modes = ("consensus", "single") if consensus else ("single",)
+        for mode in modes:
+            if self.cost_ms("rerank", mode, candidates) <= available:
+                if mode != preferred:
+                    budget.degrade("rerank", "skip_consensus", candidates=candidates)
+                return mode
+        budget.degrade("rerank", "skip_reranker", candidates=candidates)
+        return "skip"
+
+    def expansion_mode(self, budget: Optional[RequestBudget]) -> str:
+        """'full_document' hoặc 'nucleus_section' (prompt ngắn -> generation nhanh hơn)"""
+        if budget is None:
+            return "full_document"
+        needed = self.cost_ms("context_expansion", "full_document") + self.cost_ms("generation", "full_document")
+        if needed <= budget.remaining_ms():
+            return "full_document"
+        budget.degrade("context_expansion", "nucleus_section")
+        return "nucleus_section"
+
+    def generation_plan(self, max_tokens: int, context_mode: str, budget: Optional[RequestBudget]) -> Dict[str, Any]:
+        """
+        {'structured': ưu tiên structured answer bất kể confidence, 'max_tokens': giới hạn mới}
+        - caller ghi degradation structured_answer khi thật sự trả lời từ metadata, cap_max_tokens qua cap_tokens()
+        """
+        plan = {'structured': False, 'max_tokens': max_tokens}
+        if budget is None:
+            return plan
+        remaining = budget.remaining_ms()
+        if self.cost_ms("generation", context_mode) <= remaining:
+            return plan
+        plan['structured'] = True
+        tokens_per_second = self.tokens_per_second()
+        if tokens_per_second:
+            affordable = int(tokens_per_second * max(0.0, remaining) / 1000.0 * TOKEN_BUDGET_HEADROOM)
+            plan['max_tokens'] = max(MIN_MAX_TOKENS, min(max_tokens, affordable))
+        return plan
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            'percentile': self.percentile,
+            'costs_ms': {f"{stage}:{mode}": round(self.cost_ms(stage, mode), 2) for stage, mode in sorted(keys)}
+        }
+
+
+# Global instance
+degradation_policy = DegradationPolicy()
@@ -0,0 +1,172 @@
+"""
+Embedding Backends
+Vietnamese_Embedding_v2 chạy trên CPU cho mọi query + ingest, nên backend encode() có thể chọn:
+
+- torch:     sentence-transformers PyTorch (mặc định, float32)
+- onnx:      ONNX Runtime, graph đã optimize (attention / LayerNorm / GELU fusion) lúc export
+- onnx-int8: như onnx nhưng weights quantize int8 dynamic (MatMul int8, activations quantize lúc chạy)
+
+Model ONNX được export offline bằng tools/export_embedding_onnx.py vào EMBEDDING_ONNX_DIR,
+kèm tokenizer + embedding_export.json (pooling, normalize, max_seq_length) để encode() cho
+ra đúng vector như SentenceTransformer. Chất lượng so với float model: tools/benchmark_embedding_backends.py
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Tên file trong export dir cho từng ONNX backend
+ONNX_MODEL_FILES = {
+    "onnx": "model_optimized.onnx",
+    "onnx-int8": "model_int8.onnx"
+}
+EXPORT_CONFIG_FILE = "embedding_export.json"
+
+
+def find_cached_snapshot(model_name: str) -> Path:
+    """Snapshot path của model trong HF cache local (data/models/hf_cache/hub)"""
+    cache_path = settings.hf_cache_path / "hub"
+    model_folders = list(cache_path.glob(f"models--{model_name.replace('/', '--')}"))
+
+    if not model_folders:
+        raise FileNotFoundError(f"No cached model found for {model_name}")
+
+    # Lấy folder đầu tiên (thường chỉ có 1)
+    model_folder = model_folders[0]
+    snapshots = list((model_folder / "snapshots").iterdir())
+
+    if not snapshots:
+        raise FileNotFoundError(f"No snapshots found in {model_folder}")
+
+    return snapshots[0]
+
+
+def read_export_config(export_dir: Path) -> Dict[str, Any]:
+    config_file = Path(export_dir) / EXPORT_CONFIG_FILE
+    if not config_file.exists():
+        raise FileNotFoundError(f"No ONNX export found in {export_dir} (run tools/export_embedding_onnx.py)")
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class OnnxEmbeddingModel:
+    """
+    ONNX Runtime embedding model tương thích SentenceTransformer.encode():
+    encode(str) -> vector 1D, encode(List[str]) -> np.ndarray (n, dim) float32
+    """
+
+    def __init__(self, export_dir: Path, backend: str = "onnx", num_threads: int = 0):
+        import onnxruntime as ort  # Heavy import - chỉ khi dùng ONNX backend
+        from transformers import AutoTokenizer
+
+        if backend not in ONNX_MODEL_FILES:
+            raise ValueError(f"Unknown ONNX embedding backend: {backend}")
+
+        self.export_dir = Path(export_dir)
+        self.backend = backend
+        self.config = read_export_config(self.export_dir)
+
+        model_file = self.export_dir / self.config.get('files', {}).get(backend, ONNX_MODEL_FILES[backend])
+        if not model_file.exists():
+            raise FileNotFoundError(f"ONNX model file not found: {model_file}")
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            session_options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_file), session_options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.export_dir))
+        self.max_seq_length = int(self.config.get('max_seq_length', 512))
+        self.pooling = self.config.get('pooling', 'cls')
+        self.normalize = bool(self.config.get('normalize', True))
+        self.dimension = int(self.config['dimension'])
+        self.model_file = model_file
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == 'cls':
+            return hidden[:, 0]
+        if self.pooling == 'lasttoken':
+            last = attention_mask.sum(axis=1) - 1
+            return hidden[np.arange(hidden.shape[0]), last]
+        # mean pooling (mặc định sentence-transformers)
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        hidden = self.session.run(None, feeds)[0]
+        return self._pool(hidden, encoded['attention_mask']).astype(np.float32)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        normalize_embeddings: Optional[bool] = None,
+        **kwargs
+    ) -> np.ndarray:
+        """show_progress_bar / convert_to_numpy / convert_to_tensor được chấp nhận nhưng bỏ qua (luôn trả numpy)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        # Sort theo độ dài như SentenceTransformer để mỗi batch ít padding
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_index = order[start:start + batch_size]
+            embeddings[batch_index] = self._encode_batch([texts[i] for i in batch_index])
+
+        if self.normalize or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def load_onnx_embedding_model(backend: str, export_dir: Optional[Path] = None, num_threads: Optional[int] = None) -> OnnxEmbeddingModel:
+    export_dir = Path(export_dir or settings.embedding_onnx_path)
+    num_threads = settings.embedding_onnx_threads if num_threads is None else num_threads
+
+    start = time.perf_counter()
+    model = OnnxEmbeddingModel(export_dir, backend=backend, num_threads=num_threads)
+    logger.info(f"✅ Embedding model loaded with {backend} backend ({model.model_file.name}) in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def load_torch_embedding_model(model_name: Optional[str] = None):
+    """PyTorch float model trên CPU (tools: export + parity baseline) - ưu tiên snapshot trong HF cache local"""
+    from sentence_transformers import SentenceTransformer  # Heavy import - chỉ khi load model
+
+    model_name = model_name or settings.embedding_model_name
+    if Path(model_name).exists():
+        return SentenceTransformer(model_name, device='cpu')
+    try:
+        return SentenceTransformer(str(find_cached_snapshot(model_name)), device='cpu')
+    except FileNotFoundError:
+        return SentenceTransformer(model_name, local_files_only=settings.hf_hub_offline == "1", device='cpu')
+
+
+def load_embedding_backend(backend: str, model_name: Optional[str] = None, export_dir: Optional[Path] = None, num_threads: Optional[int] = None):
+    """Load embedding model theo tên backend (torch | onnx | onnx-int8)"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (choose from {', '.join(EMBEDDING_BACKENDS)})")
+    if backend == "torch":
+        return load_torch_embedding_model(model_name)
+    return load_onnx_embedding_model(backend, export_dir, num_threads)
@@ -0,0 +1,235 @@
+"""
+Query Embedding Cache
+Cache vector của câu hỏi trước embedding model (router route_query + search_in_collection):
+
+- Key: text đã chuẩn hóa Unicode NFC + gộp whitespace -> cùng 1 câu gõ khác nhau vẫn hit
+- LRU tier: bounded (QUERY_EMBEDDING_CACHE_SIZE), evict entry ít dùng nhất
+- Persistent tier: seed từ router cache (vector của mọi example question đã có sẵn) - không bị evict,
+  nên câu hỏi sinh ra từ clarification (question_text lấy nguyên văn từ router examples) không phải encode
+
+Mỗi request route + search cùng 1 câu => search luôn hit vector mà router vừa encode.
+Cache gắn với 1 embedding model: đổi model (backend / override) thì cache tự xóa. Proxy DeferredValue
+(router lúc startup) được unwrap về model thật - router và vector search luôn dùng chung 1 cache.
+
+reference_embedding_cache: instance riêng (chỉ LRU) cho reference query của similar-procedure lookup,
+không chiếm chỗ của query cache.
+"""
+
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List
+
+import numpy as np
+
+from ..core.config import settings
+from .metrics import registry, record_cache
+from .startup import DeferredValue
+
+logger = logging.getLogger(__name__)
+
+# Seed chỉ khi vector trong router cache khớp model hiện tại (cùng text form, cùng backend)
+SEED_MIN_COSINE = 0.999
+SEED_VERIFY_SAMPLES = 3
+
+
+def normalize_query_text(text: str) -> str:
+    """Unicode NFC + gộp whitespace (tiếng Việt gõ dựng sẵn / tổ hợp cho cùng 1 key)"""
+    return unicodedata.normalize('NFC', ' '.join(str(text).split()))
+
+
+def _resolve_model(model):
+    """Model thật phía sau proxy startup - cache so sánh model theo identity"""
+    return model.resolve() if isinstance(model, DeferredValue) else model
+
+
+def _frozen(vector: np.ndarray) -> np.ndarray:
+    # Vector dùng chung giữa các requests - không cho caller sửa in-place
+    vector = np.asarray(vector, dtype=np.float32)
+    vector.flags.writeable = False
+    return vector
+
+
+class QueryEmbeddingCache:
+    """LRU + persistent tier cho query embeddings"""
+
+    def __init__(self, max_size: int = 2048, name: str = "query_embeddings"):
+        self.max_size = max_size
+        self.name = name
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._persistent: Dict[str, np.ndarray] = {}
+        self._model = None
+        self._lock = threading.Lock()
+        self._stats = {'lru_hits': 0, 'persistent_hits': 0, 'misses': 0, 'evictions': 0, 'encode_seconds': 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _bind(self, model):
+        """Gọi trong lock - cache chỉ hợp lệ với model đã encode ra nó"""
+        if model is self._model:
+            return
+        if self._model is not None:
+            logger.info(f"🔄 Embedding model changed, clearing {self.name} cache")
+        self._lru.clear()
+        self._persistent.clear()
+        self._model = model
+
+    def encode(self, model, text: str) -> np.ndarray:
+        """Vector 1D (float32, read-only) của text - encode bằng model nếu chưa có trong cache"""
+        model = _resolve_model(model)
+        if not self.enabled:
+            return np.asarray(model.encode([text])[0], dtype=np.float32)
+
+        key = normalize_query_text(text)
+        with self._lock:
+            self._bind(model)
+            vector = self._persistent.get(key)
+            if vector is not None:
+                self._stats['persistent_hits'] += 1
+            else:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self._stats['lru_hits'] += 1
+        if vector is not None:
+            record_cache(self.name, hit=True)
+            return vector
+
+        # Encode ngoài lock: request khác vẫn đọc cache được trong lúc model chạy
+        start = time.perf_counter()
+        vector = _frozen(model.encode([key])[0])
+        elapsed = time.perf_counter() - start
+        record_cache(self.name, hit=False)
+
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['encode_seconds'] += elapsed
+            if model is self._model:
+                self._lru[key] = vector
+                self._lru.move_to_end(key)
+                while len(self._lru) > self.max_size:
+                    self._lru.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return vector
+
+    def seed(self, model, texts: List[str], vectors: np.ndarray) -> int:
+        """
+        Thay persistent tier bằng (texts, vectors) có sẵn (router cache).
+        Kiểm tra vài mẫu bằng model hiện tại trước - vector không khớp (cache build bằng text form
+        hay backend khác) thì không seed, tránh trả về vector sai.
+        """
+        if not self.enabled or not settings.query_embedding_cache_seed or len(texts) == 0:
+            return 0
+        model = _resolve_model(model)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            logger.warning(f"⚠️ Query embedding cache seed skipped: {len(texts)} texts vs vectors {vectors.shape}")
+            return 0
+
+        sample = np.linspace(0, len(texts) - 1, num=min(SEED_VERIFY_SAMPLES, len(texts)), dtype=int)
+        live = np.asarray(model.encode([normalize_query_text(texts[i]) for i in sample]), dtype=np.float32)
+        cached = vectors[sample]
+        cosines = np.sum(live * cached, axis=1) / np.clip(
+            np.linalg.norm(live, axis=1) * np.linalg.norm(cached, axis=1), 1e-12, None
+        )
+        if cosines.min() < SEED_MIN_COSINE:
+            logger.warning(
+                f"⚠️ Query embedding cache seed skipped: cached vectors don't match the current model "
+                f"(min cosine {cosines.min():.4f})"
+            )
+            return 0
+
+        # View read-only: dùng chung memory với router.question_vectors, không copy
+        frozen = vectors.view()
+        frozen.flags.writeable = False
+        persistent = {normalize_query_text(text): frozen[i] for i, text in enumerate(texts)}
+        with self._lock:
+            self._bind(model)
+            self._persistent = persistent
+        logger.info(f"📦 Query embedding cache seeded with {len(persistent)} router example questions")
+        return len(persistent)
+
+    def prefill(self, model, texts: List[str], batch_size: int = 32) -> int:
+        """
+        Encode batch các texts chưa có trong cache rồi thêm vào persistent tier (bulk jobs, vd.
+        tools/precompute_answers.py) - request sau đó của cùng câu hỏi không encode lại. Trả về số texts đã encode
+        """
+        if not self.enabled:
+            return 0
+        model = _resolve_model(model)
+        with self._lock:
+            self._bind(model)
+            missing = list(dict.fromkeys(
+                key for key in (normalize_query_text(text) for text in texts)
+                if key not in self._persistent and key not in self._lru
+            ))
+        if not missing:
+            return 0
+
+        start = time.perf_counter()
+        vectors = np.asarray(model.encode(missing, batch_size=batch_size), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats['encode_seconds'] += elapsed
+            if model is self._model:
+                for key, vector in zip(missing, vectors):
+                    self._persistent[key] = _frozen(vector)
+        logger.info(f"📦 Prefilled {self.name} cache with {len(missing)} texts in {elapsed:.2f}s")
+        return len(missing)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._persistent.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            lru_size, persistent_size = len(self._lru), len(self._persistent)
+
+        hits = stats['lru_hits'] + stats['persistent_hits']
+        lookups = hits + stats['misses']
+        avg_encode_ms = stats['encode_seconds'] / stats['misses'] * 1000.0 if stats['misses'] else 0.0
+        return {
+            'enabled': self.enabled,
+            'max_size': self.max_size,
+            'lru_size': lru_size,
+            'persistent_size': persistent_size,
+            'lru_hits': stats['lru_hits'],
+            'persistent_hits': stats['persistent_hits'],
+            'misses': stats['misses'],
+            'evictions': stats['evictions'],
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'avg_encode_ms': round(avg_encode_ms, 2),
+            # Ước lượng: mỗi hit tiết kiệm 1 lần encode trung bình
+            'saved_encode_seconds': round(hits * avg_encode_ms / 1000.0, 3)
+        }
+
+
+# Global caches (giống tracer / events):
+# - query_embedding_cache: router route_query + vector search dùng chung
+# - reference_embedding_cache: reference query của similar-procedure lookup (clarification), LRU riêng
+query_embedding_cache = QueryEmbeddingCache(max_size=settings.query_embedding_cache_size)
+reference_embedding_cache = QueryEmbeddingCache(
+    max_size=settings.reference_embedding_cache_size, name="reference_embeddings"
+)
+
+
+def _collect_metrics():
+    entries = registry.family("embedding_cache_entries", "gauge", "Số embeddings trong cache theo tier")
+    saved = registry.family(
+        "embedding_cache_saved_seconds", "counter", "Ước lượng thời gian encode tiết kiệm nhờ embedding cache"
+    )
+    for cache in (query_embedding_cache, reference_embedding_cache):
+        stats = cache.get_stats()
+        entries.add(stats['lru_size'], cache=cache.name, tier="lru")
+        entries.add(stats['persistent_size'], cache=cache.name, tier="persistent")
+        saved.add(stats['saved_encode_seconds'], suffix="_total", cache=cache.name)
+    return [entries, saved]
+
+
+registry.register_collector("embedding_caches", _collect_metrics)
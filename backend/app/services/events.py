@@ -0,0 +1,242 @@
+"""
+Hot-path Event Log
+Structured events thay cho logger.info f-strings trên hot path (process_query, route_query, rerank_documents):
+
+- record() chỉ append (t_ms, name, fields) vào request hiện tại - không format string, không I/O
+- Request xong -> ring buffer N requests gần nhất (admin endpoint /admin/events để debug)
+- Sampled requests được ghi ra file JSON lines bởi writer thread riêng (queue bounded, đầy thì drop)
+
+Request lồng nhau (handle_clarification -> process_query) ghi vào cùng 1 record, giống RequestTrace.
+"""
+
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_request: ContextVar[Optional["RequestEvents"]] = ContextVar("current_request_events", default=None)
+
+
+def _json_default(value: Any) -> Any:
+    # numpy scalars / arrays, Path, set...
+    if hasattr(value, 'item'):
+        try:
+            return value.item()
+        except (ValueError, TypeError):
+            pass
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+class RequestEvents:
+    """Events của 1 request"""
+
+    __slots__ = ('request_id', 'kind', 'timestamp', 'fields', 'events', 'dropped', 'duration_ms', '_start')
+
+    def __init__(self, kind: str, fields: Dict[str, Any]):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.timestamp = time.time()
+        self.fields = fields
+        self.events: List[tuple] = []
+        self.dropped = 0
+        self.duration_ms: Optional[float] = None
+        self._start = time.perf_counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'request_id': self.request_id,
+            'kind': self.kind,
+            'timestamp': self.timestamp,
+            'duration_ms': round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            **self.fields,
+            'events': [{'t_ms': round(t_ms, 2), 'event': name, **fields} for t_ms, name, fields in self.events],
+            'dropped_events': self.dropped
+        }
+
+
+class EventLog:
+    """Ring buffer các requests gần nhất + async JSON-lines writer có sampling"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        buffer_size: int = 200,
+        sample_rate: float = 0.0,
+        path: Optional[Path] = None,
+        max_events_per_request: int = 256,
+        queue_size: int = 1000,
+        echo: bool = False
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.path = Path(path) if path else None
+        self.max_events_per_request = max_events_per_request
+        self.echo = echo
+
+        self._recent: deque = deque(maxlen=buffer_size)
+        self._queue: "queue.Queue[Optional[RequestEvents]]" = queue.Queue(maxsize=queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'sampled': 0, 'written': 0, 'dropped_flush': 0, 'write_errors': 0}
+
+    # ---------------------------------------------------------------
+    # Hot path
+    # ---------------------------------------------------------------
+    @contextmanager
+    def request(self, kind: str, **fields) -> Iterator[Optional[RequestEvents]]:
+        """Mở event record cho request - reentrant: nested call dùng lại record ngoài cùng"""
+        current = _current_request.get()
+        if current is not None or not self.enabled:
+            yield current
+            return
+
+        request_events = RequestEvents(kind, fields)
+        token = _current_request.set(request_events)
+        try:
+            yield request_events
+        finally:
+            _current_request.reset(token)
+            request_events.duration_ms = (time.perf_counter() - request_events._start) * 1000.0
+            self._finish(request_events)
+
+    def record(self, name: str, **fields):
+        """Ghi 1 event vào request hiện tại (no-op ngoài request)"""
+        request_events = _current_request.get()
+        if request_events is None:
+            return
+        if len(request_events.events) < self.max_events_per_request:
+            request_events.events.append(((time.perf_counter() - request_events._start) * 1000.0, name, fields))
+        else:
+            request_events.dropped += 1
+        if self.echo:
+            logger.info(f"[{request_events.request_id}] {name} {fields}")
+
+    def annotate(self, **fields):
+        """Gắn fields cấp request (session_id, outcome...)"""
+        request_events = _current_request.get()
+        if request_events is not None:
+            request_events.fields.update(fields)
+
+    # ---------------------------------------------------------------
+    # Buffer + flush
+    # ---------------------------------------------------------------
+    def _finish(self, request_events: RequestEvents):
+        self._recent.append(request_events)
+        with self._lock:
+            self._stats['requests'] += 1
+        if not self.path or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(request_events)
+            with self._lock:
+                self._stats['sampled'] += 1
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped_flush'] += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="event-log-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Gom những gì đang chờ để ghi 1 lần
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [r for r in batch if r is not None]
+            if records:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        for request_events in records:
+                            f.write(json.dumps(request_events.to_dict(), ensure_ascii=False, default=_json_default))
+                            f.write("\n")
+                    with self._lock:
+                        self._stats['written'] += len(records)
+                except Exception as e:
+                    with self._lock:
+                        self._stats['write_errors'] += 1
+                    logger.warning(f"⚠️ Event log write failed ({self.path}): {e}")
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Chờ writer ghi hết queue (tools / shutdown)"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        writer = self._writer
+        if writer is None:
+            return
+        self._queue.put(None)
+        writer.join(timeout=10)
+        self._writer = None
+
+    # ---------------------------------------------------------------
+    # Debug / admin
+    # ---------------------------------------------------------------
+    def recent(self, limit: int = 50, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Requests gần nhất (mới nhất trước)"""
+        results = []
+        for request_events in reversed(list(self._recent)):
+            if session_id and request_events.fields.get('session_id') != session_id:
+                continue
+            results.append(request_events.to_dict())
+            if len(results) >= limit:
+                break
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            'enabled': self.enabled,
+            'buffered_requests': len(self._recent),
+            'buffer_size': self._recent.maxlen,
+            'sample_rate': self.sample_rate,
+            'path': str(self.path) if self.path else None,
+            'queue_depth': self._queue.qsize(),
+            **stats
+        }
+
+
+# Global event log (giống tracer) - RAGService, router, reranker dùng chung
+events = EventLog(
+    enabled=settings.event_log_enabled,
+    buffer_size=settings.event_log_buffer_size,
+    sample_rate=settings.event_log_sample_rate,
+    path=settings.event_log_path,
+    echo=settings.event_log_echo
+)
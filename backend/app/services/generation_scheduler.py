@@ -0,0 +1,241 @@
+"""
+Generation Scheduler
+N generation slots (mỗi slot 1 llama context riêng trên cùng file GGUF memory-mapped) cho LLMService:
+
+- Request lấy slot trống; hết slot thì xếp hàng theo priority (cao trước), cùng priority thì deadline sớm trước
+- Deadline: hết hạn khi còn trong hàng đợi -> GenerationTimeout; đang generate -> dừng sớm (truncated)
+- Cancel (threading.Event của request): bỏ khỏi hàng đợi hoặc dừng generation ở token kế tiếp
+- Hàng đợi đầy (LLM_QUEUE_SIZE) -> GenerationQueueFull ngay, không chờ
+- Utilisation từng slot (thời gian bận / thời gian tồn tại), queue depth, thời gian chờ -> get_stats + OpenMetrics
+
+Scheduler không biết gì về llama.cpp: resources là object bất kỳ (Llama, stub), caller tự chạy generation
+trên ticket.slot.resource và gọi ticket.should_stop() giữa các tokens.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator
+
+from .cancellation import RequestCancelled
+from .metrics import registry
+from .tracing import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationQueueFull(Exception):
+    """Hàng đợi generation đầy"""
+
+
+class GenerationTimeout(Exception):
+    """Deadline của request hết trước khi có slot"""
+
+
+class GenerationCancelled(RequestCancelled):
+    """Request bị cancel (client disconnect / caller) khi chờ slot hoặc đang generate"""
+
+    def __init__(self, reclaimed_seconds: Optional[float] = None):
+        super().__init__("generation", reclaimed_seconds)
+
+
+class GenerationSlot:
+    """1 context generation - chỉ 1 request dùng tại 1 thời điểm"""
+
+    def __init__(self, index: int, resource: Any):
+        self.index = index
+        self.resource = resource
+        self.created_at = time.perf_counter()
+        self.busy_since: Optional[float] = None
+        self.busy_seconds = 0.0
+        self.requests = 0
+
+    def utilization(self, now: float) -> float:
+        busy = self.busy_seconds + (now - self.busy_since if self.busy_since is not None else 0.0)
+        elapsed = now - self.created_at
+        return busy / elapsed if elapsed > 0 else 0.0
+
+
+class GenerationTicket:
+    """Request trong scheduler: chờ slot, rồi giữ slot cho tới khi generation xong"""
+
+    __slots__ = ('priority', 'deadline', 'cancel_event', 'enqueued_at', 'slot', 'removed', 'outcome')
+
+    def __init__(self, priority: int, deadline: Optional[float], cancel_event: Optional[threading.Event]):
+        self.priority = priority
+        self.deadline = deadline  # time.monotonic()
+        self.cancel_event = cancel_event
+        self.enqueued_at = time.perf_counter()
+        self.slot: Optional[GenerationSlot] = None
+        self.removed = False
+        self.outcome: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def should_stop(self) -> Optional[str]:
+        """Lý do dừng generation ('cancelled' / 'deadline') hoặc None - gọi giữa các tokens"""
+        if self.cancelled:
+            return 'cancelled'
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return 'deadline'
+        return None
+
+
+class GenerationScheduler:
+    """Priority queue + N slots, thread-safe (mỗi request chạy trên thread của nó)"""
+
+    # Chu kỳ kiểm tra cancel event khi đang chờ trong hàng đợi
+    CANCEL_POLL_SECONDS = 0.05
+
+    def __init__(self, resources: List[Any], max_queue: int = 32, name: str = "llm"):
+        self.name = name
+        self.max_queue = max_queue
+        self.slots = [GenerationSlot(index, resource) for index, resource in enumerate(resources)]
+        self._free = list(self.slots)
+        self._heap: List[Any] = []
+        self._sequence = itertools.count()
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._wait_ms = LatencyHistogram()
+        self._outcomes = {'served': 0, 'cancelled': 0, 'expired': 0, 'rejected': 0}
+
+    # ---------------------------------------------------------------
+    # Acquire / release
+    # ---------------------------------------------------------------
+    @contextmanager
+    def acquire(
+        self,
+        priority: int = 0,
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Iterator[GenerationTicket]:
+        """
+        Giữ 1 slot trong suốt block.
+        deadline: time.monotonic() tuyệt đối; cancel_event: set() để hủy request
+        """
+        ticket = GenerationTicket(priority, deadline, cancel_event)
+        self._wait_for_slot(ticket)
+        slot = ticket.slot
+        try:
+            yield ticket
+        finally:
+            self._release(slot)
+
+    def _wait_for_slot(self, ticket: GenerationTicket):
+        with self._condition:
+            if self._free and self._waiting == 0:
+                self._assign(ticket, self._free.pop(0))
+                return
+            if self._waiting >= self.max_queue:
+                self._outcomes['rejected'] += 1
+                raise GenerationQueueFull(f"Generation queue full ({self._waiting} waiting)")
+
+            deadline_key = ticket.deadline if ticket.deadline is not None else float('inf')
+            heapq.heappush(self._heap, (-ticket.priority, deadline_key, next(self._sequence), ticket))
+            self._waiting += 1
+            while ticket.slot is None:
+                if not ticket.removed:
+                    self._withdraw_if_stale(ticket)
+                if ticket.removed:  # Có thể đã bị _release bỏ qua
+                    if ticket.outcome == 'cancelled':
+                        raise GenerationCancelled()
+                    raise GenerationTimeout("Generation deadline passed while queued")
+                timeout = ticket.remaining()
+                if ticket.cancel_event is not None:
+                    timeout = min(timeout, self.CANCEL_POLL_SECONDS) if timeout is not None else self.CANCEL_POLL_SECONDS
+                self._condition.wait(timeout)
+
+    def _assign(self, ticket: GenerationTicket, slot: GenerationSlot):
+        """Gọi trong lock"""
+        ticket.slot = slot
+        slot.busy_since = time.perf_counter()
+        slot.requests += 1
+        self._outcomes['served'] += 1
+        self._wait_ms.observe((slot.busy_since - ticket.enqueued_at) * 1000.0)
+
+    def _withdraw_if_stale(self, ticket: GenerationTicket) -> bool:
+        """Gọi trong lock - bỏ ticket đã cancel / hết deadline khỏi hàng đợi (heap entry xóa lazy khi pop)"""
+        reason = ticket.should_stop()
+        if reason is None:
+            return False
+        ticket.removed = True
+        ticket.outcome = 'cancelled' if reason == 'cancelled' else 'expired'
+        self._waiting -= 1
+        self._outcomes[ticket.outcome] += 1
+        return True
+
+    def _release(self, slot: GenerationSlot):
+        with self._condition:
+            now = time.perf_counter()
+            slot.busy_seconds += now - slot.busy_since
+            slot.busy_since = None
+            # Trao slot thẳng cho waiter ưu tiên cao nhất (không để request mới chen ngang)
+            while self._heap:
+                *_, ticket = heapq.heappop(self._heap)
+                if ticket.removed or self._withdraw_if_stale(ticket):
+                    continue
+                self._waiting -= 1
+                self._assign(ticket, slot)
+                break
+            else:
+                self._free.append(slot)
+            self._condition.notify_all()
+
+    # ---------------------------------------------------------------
+    # Status
+    # ---------------------------------------------------------------
+    def busy(self) -> bool:
+        """Có request đang generate hoặc đang chờ"""
+        with self._condition:
+            return self._waiting > 0 or len(self._free) < len(self.slots)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        with self._condition:
+            slots = [
+                {
+                    'slot': slot.index,
+                    'busy': slot.busy_since is not None,
+                    'requests': slot.requests,
+                    'busy_seconds': round(slot.busy_seconds + (now - slot.busy_since if slot.busy_since is not None else 0.0), 3),
+                    'utilization': round(slot.utilization(now), 4)
+                }
+                for slot in self.slots
+            ]
+            waiting = self._waiting
+            outcomes = dict(self._outcomes)
+        wait = self._wait_ms.to_dict()
+        wait.pop('buckets', None)
+        return {
+            'slots': slots,
+            'queue_depth': waiting,
+            'max_queue': self.max_queue,
+            'outcomes': outcomes,
+            'wait': wait
+        }
+
+    def collect_metrics(self):
+        stats = self.get_stats()
+        utilization = registry.family(
+            f"{self.name}_slot_utilization", "gauge", "Tỷ lệ thời gian bận của từng generation slot từ lúc load"
+        )
+        requests = registry.family(f"{self.name}_slot_requests", "counter", "Số requests đã chạy trên từng generation slot")
+        for slot in stats['slots']:
+            utilization.add(slot['utilization'], slot=slot['slot'])
+            requests.add(slot['requests'], suffix="_total", slot=slot['slot'])
+        queue_depth = registry.family(f"{self.name}_queue_depth", "gauge", "Requests đang chờ generation slot")
+        queue_depth.add(stats['queue_depth'])
+        outcomes = registry.family(
+            f"{self.name}_queue_outcomes", "counter", "Requests vào scheduler theo kết quả (served, cancelled, expired, rejected)"
+        )
+        for outcome, count in stats['outcomes'].items():
+            outcomes.add(count, suffix="_total", outcome=outcome)
+        return [utilization, requests, queue_depth, outcomes]
@@ -0,0 +1,861 @@
+"""
+Streaming Index Build Pipeline
+Xây dựng vector database theo dạng streaming thay vì giữ toàn bộ chunks trong RAM:
+
+1. Parse JSON documents song song (process pool)
+2. Embed theo batch cố định (bounded queue giữa các stage)
+3. Ghi vào ChromaDB theo batch (upsert - idempotent)
+4. Checkpoint sau mỗi file đã ghi xong để build bị ngắt có thể resume
+
+Và incremental re-index theo content hash (chỉ upsert/xóa chunks đã thay đổi).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from .chunk_manifest import ChunkMetadataIndex
+
+logger = logging.getLogger(__name__)
+
+# Mapping thư mục tài liệu -> collection (dùng chung cho builder và indexer)
+COLLECTION_MAPPINGS = {
+    'quy_trinh_cap_ho_tich_cap_xa': 'ho_tich_cap_xa',
+    'ho_tich_cap_xa_moi_nhat': 'ho_tich_cap_xa',
+    'quy_trinh_chung_thuc': 'chung_thuc',
+    'quy_trinh_nb_chung_thuc_dung_chung': 'chung_thuc',
+    'quy_trinh_nuoi_con_nuoi': 'nuoi_con_nuoi',
+    'iso_ncn_moi': 'nuoi_con_nuoi',
+}
+
+# =====================================================================
+# JSON DOCUMENT PARSING (module-level để chạy được trong process pool)
+# =====================================================================
+
+def detect_collection_from_path(file_path: str, collection_mappings: Optional[Dict[str, str]] = None) -> str:
+    """Xác định collection dựa trên đường dẫn file"""
+    mappings = collection_mappings or COLLECTION_MAPPINGS
+    for part in Path(file_path).parts:
+        for pattern, collection in mappings.items():
+            if pattern in part.lower():
+                return collection
+    return 'general'
+
+
+def load_json_document(file_path: str) -> Optional[Dict[str, Any]]:
+    """Load và validate JSON document"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        # Validate cấu trúc cơ bản
+        if not isinstance(data, dict):
+            logger.error(f"Invalid JSON structure in {file_path}: not a dict")
+            return None
+
+        if 'metadata' not in data or 'content_chunks' not in data:
+            logger.error(f"Invalid JSON structure in {file_path}: missing required fields")
+            return None
+
+        return data
+
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error in {file_path}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error reading JSON file {file_path}: {e}")
+        return None
+
+
+def process_json_chunks(json_data: Dict[str, Any], file_path: str) -> List[Dict[str, Any]]:
+    """Chuyển đổi content_chunks từ JSON thành format phù hợp với vector database"""
+    metadata = json_data.get('metadata', {})
+    content_chunks = json_data.get('content_chunks', [])
+
+    processed_chunks = []
+
+    # Lấy thông tin metadata quan trọng để thêm context
+    document_title = metadata.get('title', '')
+    executing_agency = metadata.get('executing_agency', '')
+    applicant_type = metadata.get('applicant_type', [])
+    processing_time = metadata.get('processing_time_text', '')
+    fee_text = metadata.get('fee_text', '')
+    has_form = metadata.get('has_form', False)
+    requirements_conditions = metadata.get('requirements_conditions', '')
+
+    for i, chunk in enumerate(content_chunks):
+        # Lấy thông tin từ chunk
+        chunk_id = chunk.get('chunk_id', i + 1)
+        chunk_index_num = i  # chunk_index_num (0-based index)
+        section_title = chunk.get('section_title', '')
+        content = chunk.get('content', '')
+        source_reference = chunk.get('source_reference', '')
+        keywords = chunk.get('keywords', [])
+
+        # Tăng cường ngữ cảnh cho mỗi chunk với metadata phong phú
+        context_parts = []
+
+        # 1. Tiêu đề tài liệu (quan trọng nhất)
+        if document_title:
+            context_parts.append(f"Tiêu đề tài liệu: {document_title}")
+
+        # 2. Cơ quan thực hiện
+        if executing_agency:
+            context_parts.append(f"Cơ quan thực hiện: {executing_agency}")
+
+        # 3. Đối tượng thực hiện
+        if applicant_type and len(applicant_type) > 0:
+            context_parts.append(f"Đối tượng thực hiện: {', '.join(applicant_type)}")
+
+        # 4. Có biểu mẫu hay không
+        if has_form:
+            context_parts.append("Có biểu mẫu: Có")
+
+        # 5. Điều kiện yêu cầu (nếu có)
+        if requirements_conditions:
+            context_parts.append(f"Điều kiện: {requirements_conditions}")
+
+        # 6. Thời gian xử lý (rút gọn để không quá dài)
+        if processing_time and len(processing_time) < 150:
+            context_parts.append(f"Thời gian xử lý: {processing_time}")
+
+        # 7. Thông tin lệ phí (rút gọn)
+        if fee_text:
+            fee_summary = fee_text.split('.')[0] if fee_text else fee_text
+            if len(fee_summary) < 100:
+                context_parts.append(f"Lệ phí: {fee_summary}")
+
+        # 8. Tiêu đề mục (section)
+        if section_title:
+            context_parts.append(f"Mục: {section_title}")
+
+        # 9. Phần "Nội dung:" để phân tách rõ ràng
+        if context_parts and content.strip():
+            context_parts.append("Nội dung:")
+
+        # Ghép tất cả lại với nội dung chính
+        if context_parts:
+            full_content = "\n".join(context_parts) + "\n" + content
+        else:
+            full_content = content
+
+        # Tạo source information để frontend có thể truy vết
+        source_info = {
+            'file_path': file_path,
+            'document_title': metadata.get('title', ''),
+            'document_code': metadata.get('code', ''),
+            'issuing_authority': metadata.get('issuing_authority', ''),
+            'effective_date': metadata.get('effective_date', ''),
+            'executing_agency': metadata.get('executing_agency', ''),
+            'source_reference': source_reference,
+            'section_title': section_title,
+            'chunk_id': f"{Path(file_path).stem}_chunk_{chunk_id}",  # ID unique
+            'chunk_index_num': chunk_index_num,  # Cho context expansion
+            'document_id': Path(file_path).stem  # Group chunks theo document
+        }
+
+        processed_chunks.append({
+            'content': full_content.strip(),
+            'chunk_id': f"{Path(file_path).stem}_chunk_{chunk_id}",
+            'type': 'json_section',
+            'char_start': 0,
+            'char_end': len(full_content),
+            'keywords': keywords,
+            'source': source_info,
+            'metadata': {
+                'document_metadata': metadata,
+                'section_title': section_title,
+                'source_reference': source_reference,
+                'processing_time': metadata.get('processing_time_text', ''),
+                'fee_info': metadata.get('fee_text', ''),
+                'legal_basis': metadata.get('legal_basis_references', [])
+            }
+        })
+
+    return processed_chunks
+
+
+def parse_document_file(file_path: str) -> Dict[str, Any]:
+    """
+    Parse 1 JSON document thành chunks - worker function cho process pool
+
+    Returns:
+        {"file_path", "collection", "chunks", "document_metadata", "status"} hoặc {"file_path", "error"}
+    """
+    try:
+        json_data = load_json_document(file_path)
+        if not json_data:
+            return {"file_path": file_path, "error": "Failed to load JSON document"}
+
+        processed_chunks = process_json_chunks(json_data, file_path)
+        if not processed_chunks:
+            return {"file_path": file_path, "error": "No chunks processed"}
+
+        return {
+            "file_path": file_path,
+            "collection": detect_collection_from_path(file_path),
+            "chunks": processed_chunks,
+            "total_chunks": len(processed_chunks),
+            "total_characters": sum(len(chunk['content']) for chunk in processed_chunks),
+            "document_metadata": json_data.get('metadata', {}),
+            "status": "success"
+        }
+
+    except Exception as e:
+        return {"file_path": file_path, "error": str(e)}
+
+
+# =====================================================================
+# CHECKPOINT
+# =====================================================================
+
+def write_chunk_manifest(vectordb_service, manifest_dir: Path):
+    """Ghi columnar chunk manifest (chunk id, collection, file, chunk index) cho startup của ContextExpander"""
+    try:
+        ChunkMetadataIndex.from_vectordb(vectordb_service).save(manifest_dir)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not write chunk manifest: {e}")
+
+
+class BuildCheckpoint:
+    """Lưu tiến độ build (file nào đã ghi xong) để resume khi bị ngắt"""
+
+    def __init__(self, checkpoint_path: Path):
+        self.checkpoint_path = Path(checkpoint_path)
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        if self.checkpoint_path.exists():
+            try:
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and 'completed_files' in data:
+                    return data
+            except Exception as e:
+                logger.warning(f"⚠️ Invalid build checkpoint, starting fresh: {e}")
+        return self._empty()
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            'version': 1,
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'completed': False,
+            'completed_files': {}
+        }
+
+    @property
+    def is_completed(self) -> bool:
+        return bool(self.data.get('completed'))
+
+    def is_done(self, file_path: str, content_hash: Optional[str] = None) -> bool:
+        """File đã ghi xong và (nếu có content_hash) chưa bị sửa kể từ lúc ghi"""
+        entry = self.data['completed_files'].get(file_path)
+        if entry is None:
+            return False
+        # Checkpoint cũ không lưu hash -> tin là đã xong (giống resume trước đây)
+        recorded = entry.get('content_hash')
+        return content_hash is None or recorded is None or recorded == content_hash
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        return self.data['completed_files'].get(file_path)
+
+    def mark_done(self, file_path: str, collection: str, chunk_count: int, content_hash: Optional[str] = None):
+        with self._lock:
+            self.data['completed_files'][file_path] = {
+                'collection': collection,
+                'chunks': chunk_count,
+                'content_hash': content_hash,
+                'finished_at': time.time()
+            }
+            self._save_locked()
+
+    def mark_completed(self):
+        with self._lock:
+            self.data['completed'] = True
+            self.data['finished_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            self._save_locked()
+
+    def reset(self):
+        with self._lock:
+            self.data = self._empty()
+            if self.checkpoint_path.exists():
+                self.checkpoint_path.unlink()
+
+    def _save_locked(self):
+        # Ghi atomic: tmp file rồi replace để checkpoint không bao giờ bị hỏng giữa chừng
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+# =====================================================================
+# PIPELINE
+# =====================================================================
+
+@dataclass
+class ChunkBatch:
+    """Batch chunks của 1 collection đi qua các stage embed -> write"""
+    collection: str
+    ids: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+    file_paths: List[str] = field(default_factory=list)
+    embeddings: Optional[List[List[float]]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+@dataclass
+class PipelineStats:
+    """Thống kê throughput theo stage + peak memory"""
+    docs_total: int = 0
+    docs_skipped: int = 0
+    docs_parsed: int = 0
+    docs_failed: int = 0
+    chunks_parsed: int = 0
+    embeddings_created: int = 0
+    chunks_written: int = 0
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    peak_memory_mb: Optional[float] = None
+    collections: Dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def _rate(count: int, seconds: float) -> float:
+        return count / seconds if seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'docs_total': self.docs_total,
+            'docs_skipped': self.docs_skipped,
+            'docs_parsed': self.docs_parsed,
+            'docs_failed': self.docs_failed,
+            'chunks_parsed': self.chunks_parsed,
+            'embeddings_created': self.embeddings_created,
+            'chunks_written': self.chunks_written,
+            'collections': dict(self.collections),
+            'wall_seconds': round(self.wall_seconds, 3),
+            'throughput': {
+                # Parse: theo wall time của stage; embed/write: theo thời gian stage thực sự bận
+                'parse_docs_per_s': round(self._rate(self.docs_parsed, self.parse_seconds), 2),
+                'parse_chunks_per_s': round(self._rate(self.chunks_parsed, self.parse_seconds), 2),
+                'embed_embeddings_per_s': round(self._rate(self.embeddings_created, self.embed_seconds), 2),
+                'write_chunks_per_s': round(self._rate(self.chunks_written, self.write_seconds), 2),
+                # End-to-end throughput theo wall clock
+                'overall_docs_per_s': round(self._rate(self.docs_parsed, self.wall_seconds), 2),
+                'overall_chunks_per_s': round(self._rate(self.chunks_written, self.wall_seconds), 2),
+            },
+            'peak_memory_mb': round(self.peak_memory_mb, 1) if self.peak_memory_mb is not None else None
+        }
+
+
+def get_peak_memory_mb() -> Optional[float]:
+    """Peak RSS của process hiện tại (MB) - None nếu platform không hỗ trợ"""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except Exception:
+        return None
+
+
+_STOP = object()  # Sentinel kết thúc stage
+
+
+class StreamingIndexPipeline:
+    """
+    Pipeline streaming: parse (process pool) -> embed (thread) -> write (thread)
+
+    - Bounded queues giữa các stage để RAM không phụ thuộc kích thước corpus
+    - Checkpoint từng file khi toàn bộ chunks của file đã ghi vào Chroma
+    - Upsert thay vì add để re-run một file đang ghi dở không sinh duplicate
+    """
+
+    def __init__(
+        self,
+        vectordb_service,
+        documents_dir: Path,
+        checkpoint_path: Path,
+        workers: int = 4,
+        batch_size: int = 64,
+        queue_size: int = 4,
+        chunk_manifest_dir: Optional[Path] = None
+    ):
+        self.vectordb_service = vectordb_service
+        self.chunk_manifest_dir = chunk_manifest_dir
+        self.documents_dir = Path(documents_dir)
+        self.checkpoint = BuildCheckpoint(checkpoint_path)
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+
+        self.stats = PipelineStats()
+        self._embed_queue: "queue.Queue[Any]" = queue.Queue(maxsize=self.queue_size)
+        self._write_queue: "queue.Queue[Any]" = queue.Queue(maxsize=self.queue_size)
+
+        # file_path -> số chunks chưa ghi; file chỉ được checkpoint khi về 0
+        self._pending_chunks: Dict[str, int] = {}
+        self._file_chunk_totals: Dict[str, int] = {}
+        self._file_collections: Dict[str, str] = {}
+        self._file_hashes: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        self._errors: List[str] = []
+
+    def list_document_files(self) -> List[str]:
+        return sorted(str(p) for p in self.documents_dir.rglob("*.json"))
+
+    def run(self, resume: bool = True) -> Dict[str, Any]:
+        """Chạy toàn bộ pipeline, trả về stats dict"""
+        wall_start = time.perf_counter()
+
+        if not resume:
+            self.checkpoint.reset()
+
+        all_files = self.list_document_files()
+        # Hash từng file: checkpoint đã xong nhưng file bị sửa sau đó -> index lại, file mới -> index
+        self._file_hashes = {f: compute_file_hash(f) for f in all_files}
+        pending_files = [f for f in all_files if not self.checkpoint.is_done(f, self._file_hashes[f])]
+        self.stats.docs_total = len(all_files)
+        self.stats.docs_skipped = len(all_files) - len(pending_files)
+
+        if self.stats.docs_skipped:
+            logger.info(f"♻️ Resuming build: {self.stats.docs_skipped}/{len(all_files)} files already indexed")
+        self._drop_stale_chunks([f for f in pending_files if self.checkpoint.get(f)])
+        logger.info(f"📊 Streaming build: {len(pending_files)} files, workers={self.workers}, "
+                    f"batch_size={self.batch_size}, queue_size={self.queue_size}")
+
+        embed_thread = threading.Thread(target=self._embed_stage, name="index-embed", daemon=True)
+        write_thread = threading.Thread(target=self._write_stage, name="index-write", daemon=True)
+        embed_thread.start()
+        write_thread.start()
+
+        try:
+            self._parse_stage(pending_files)
+        finally:
+            # Luôn đẩy sentinel để các stage phía sau kết thúc
+            self._embed_queue.put(_STOP)
+            embed_thread.join()
+            write_thread.join()
+
+        self.stats.wall_seconds = time.perf_counter() - wall_start
+        self.stats.peak_memory_mb = get_peak_memory_mb()
+
+        if not self._errors and self.stats.docs_failed == 0:
+            self.checkpoint.mark_completed()
+        
+        if self.chunk_manifest_dir and not self._errors and pending_files:
+            write_chunk_manifest(self.vectordb_service, self.chunk_manifest_dir)
+
+        result = self.stats.to_dict()
+        result['errors'] = list(self._errors)
+        result['success'] = not self._errors
+        return result
+
+    def _drop_stale_chunks(self, changed_files: List[str]):
+        """File đã ghi xong rồi bị sửa: xóa chunks cũ trước (upsert không xóa chunk id không còn trong file)"""
+        for file_path in changed_files:
+            collection_name = self.checkpoint.get(file_path).get('collection')
+            chunk_ids = [chunk['id'] for chunk in self.vectordb_service.get_chunks_for_file(collection_name, file_path)]
+            if chunk_ids:
+                self.vectordb_service.delete_chunks(collection_name, chunk_ids)
+                logger.info(f"🔄 {file_path} changed since last build: dropped {len(chunk_ids)} old chunks")
+
+    # ---------------------------------------------------------------
+    # Stage 1: Parse (process pool, sliding window để không parse trước quá xa)
+    # ---------------------------------------------------------------
+    def _parse_stage(self, files: List[str]):
+        parse_start = time.perf_counter()
+        buffers: Dict[str, ChunkBatch] = {}
+        max_in_flight = self.workers * 2
+        file_iter = iter(files)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = set()
+
+            def submit_next() -> bool:
+                try:
+                    next_file = next(file_iter)
+                except StopIteration:
+                    return False
+                in_flight.add(executor.submit(parse_document_file, next_file))
+                return True
+
+            for _ in range(max_in_flight):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                if self._errors:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    in_flight.discard(future)
+                    submit_next()
+                    self._handle_parsed_document(future.result(), buffers)
+
+            # Parse stage kết thúc khi document cuối cùng đã parse xong
+            self.stats.parse_seconds = time.perf_counter() - parse_start
+
+        # Flush các batch còn lại
+        for batch in buffers.values():
+            if len(batch):
+                self._embed_queue.put(batch)
+
+    def _handle_parsed_document(self, doc_data: Dict[str, Any], buffers: Dict[str, ChunkBatch]):
+        file_path = doc_data.get("file_path", "")
+        if "error" in doc_data:
+            self.stats.docs_failed += 1
+            logger.error(f"Failed to process {file_path}: {doc_data['error']}")
+            return
+
+        collection_name = doc_data["collection"]
+        chunks = doc_data["chunks"]
+        self.stats.docs_parsed += 1
+        self.stats.chunks_parsed += len(chunks)
+
+        records = []
+        for index, chunk in enumerate(chunks):
+            record = self.vectordb_service.build_chunk_record(chunk, collection_name, index)
+            if record:
+                records.append(record)
+
+        if not records:
+            self.checkpoint.mark_done(file_path, collection_name, 0, self._file_hashes.get(file_path))
+            return
+
+        with self._pending_lock:
+            self._pending_chunks[file_path] = len(records)
+            self._file_chunk_totals[file_path] = len(records)
+            self._file_collections[file_path] = collection_name
+
+        batch = buffers.setdefault(collection_name, ChunkBatch(collection=collection_name))
+        for chunk_id, text, metadata in records:
+            batch.ids.append(chunk_id)
+            batch.texts.append(text)
+            batch.metadatas.append(metadata)
+            batch.file_paths.append(file_path)
+            if len(batch) >= self.batch_size:
+                self._embed_queue.put(batch)  # Block khi queue đầy -> backpressure
+                batch = ChunkBatch(collection=collection_name)
+                buffers[collection_name] = batch
+
+    # ---------------------------------------------------------------
+    # Stage 2: Embed
+    # ---------------------------------------------------------------
+    def _embed_stage(self):
+        while True:
+            batch = self._embed_queue.get()
+            if batch is _STOP:
+                self._write_queue.put(_STOP)
+                return
+            if self._errors:
+                continue  # Drain queue để parse stage không bị block
+            try:
+                start = time.perf_counter()
+                batch.embeddings = self.vectordb_service.embed_text(batch.texts, batch_size=self.batch_size)
+                self.stats.embed_seconds += time.perf_counter() - start
+                self.stats.embeddings_created += len(batch)
+                self._write_queue.put(batch)
+            except Exception as e:
+                self._errors.append(f"embed[{batch.collection}]: {e}")
+                logger.error(f"❌ Embedding batch failed for {batch.collection}: {e}")
+
+    # ---------------------------------------------------------------
+    # Stage 3: Write + checkpoint
+    # ---------------------------------------------------------------
+    def _write_stage(self):
+        while True:
+            batch = self._write_queue.get()
+            if batch is _STOP:
+                return
+            if self._errors:
+                continue
+            try:
+                start = time.perf_counter()
+                self.vectordb_service.upsert_chunk_batch(
+                    collection_name=batch.collection,
+                    ids=batch.ids,
+                    documents=batch.texts,
+                    metadatas=batch.metadatas,
+                    embeddings=batch.embeddings
+                )
+                self.stats.write_seconds += time.perf_counter() - start
+                self.stats.chunks_written += len(batch)
+                self.stats.collections[batch.collection] = self.stats.collections.get(batch.collection, 0) + len(batch)
+                self._mark_written(batch.file_paths)
+            except Exception as e:
+                self._errors.append(f"write[{batch.collection}]: {e}")
+                logger.error(f"❌ Writing batch failed for {batch.collection}: {e}")
+
+    def _mark_written(self, file_paths: List[str]):
+        finished: List[Tuple[str, str, int]] = []
+        with self._pending_lock:
+            for file_path in file_paths:
+                remaining = self._pending_chunks.get(file_path, 0) - 1
+                self._pending_chunks[file_path] = remaining
+                if remaining == 0:
+                    finished.append((
+                        file_path,
+                        self._file_collections.pop(file_path, 'general'),
+                        self._file_chunk_totals.pop(file_path, 0)
+                    ))
+                    del self._pending_chunks[file_path]
+
+        for file_path, collection_name, chunk_total in finished:
+            self.checkpoint.mark_done(file_path, collection_name, chunk_total, self._file_hashes.get(file_path))
+
+
+# =====================================================================
+# INCREMENTAL RE-INDEXING
+# =====================================================================
+
+def compute_file_hash(file_path: str) -> str:
+    """SHA-256 của nội dung file (bytes) - đổi khi JSON document thay đổi"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def compute_chunk_hash(content: str, metadata: Dict[str, Any]) -> str:
+    """Hash của content + metadata đã ghi vào Chroma cho 1 chunk"""
+    payload = json.dumps({'content': content, 'metadata': metadata}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class IndexManifest:
+    """
+    Manifest file_path -> content hash -> chunk ids (+ hash từng chunk)
+
+    Cho phép biết file nào mới / đã sửa / đã xóa mà không phải đọc lại Chroma
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+        except Exception as e:
+            logger.warning(f"⚠️ Invalid index manifest, re-checking all files against Chroma: {e}")
+            self.files = {}
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(file_path)
+
+    def set(self, file_path: str, content_hash: str, collection: str, chunk_hashes: Dict[str, str]):
+        self.files[file_path] = {
+            'content_hash': content_hash,
+            'collection': collection,
+            'chunks': chunk_hashes,
+            'indexed_at': time.time()
+        }
+
+    def remove(self, file_path: str):
+        self.files.pop(file_path, None)
+
+    def save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def reset(self):
+        self.files = {}
+        if self.manifest_path.exists():
+            self.manifest_path.unlink()
+
+
+class IncrementalIndexer:
+    """
+    Re-index chỉ những gì đã thay đổi trong data/documents
+
+    - File không đổi hash: bỏ qua hoàn toàn (không parse, không embed)
+    - File mới / đã sửa: chỉ embed + upsert các chunk có hash thay đổi,
+      xóa các chunk id không còn trong file
+    - File đã xóa: xóa toàn bộ chunk ids của file khỏi collection (tìm theo metadata file_path
+      trong Chroma, nên cả file chỉ có từ full build cũng được dọn)
+
+    Khi manifest chưa có entry cho 1 file (vd. sau full build), hash của các chunk
+    đang có trong Chroma được dùng làm baseline để không re-embed chunk giống hệt.
+    """
+
+    def __init__(self, vectordb_service, documents_dir: Path, manifest_path: Path, batch_size: int = 64, chunk_manifest_dir: Optional[Path] = None):
+        self.vectordb_service = vectordb_service
+        self.documents_dir = Path(documents_dir)
+        self.manifest = IndexManifest(manifest_path)
+        self.batch_size = max(1, batch_size)
+        self.chunk_manifest_dir = chunk_manifest_dir
+
+    def run(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Đồng bộ vector database với data/documents, trả về stats dict"""
+        start_time = time.time()
+        stats = {
+            'added_files': [],
+            'changed_files': [],
+            'removed_files': [],
+            'unchanged_files': 0,
+            'failed_files': [],
+            'chunks_upserted': 0,
+            'chunks_deleted': 0,
+            'chunks_unchanged': 0,
+            'affected_collections': set(),
+            'dry_run': dry_run
+        }
+
+        current_files = sorted(str(p) for p in self.documents_dir.rglob("*.json"))
+        current_set = set(current_files)
+
+        for file_path in current_files:
+            try:
+                self._sync_file(file_path, stats, dry_run)
+            except Exception as e:
+                stats['failed_files'].append(file_path)
+                logger.error(f"❌ Incremental index failed for {file_path}: {e}")
+
+        for file_path, collection_name, chunk_ids in self._find_deleted(current_set):
+            if file_path not in stats['removed_files']:
+                stats['removed_files'].append(file_path)
+            stats['chunks_deleted'] += len(chunk_ids)
+            stats['affected_collections'].add(collection_name)
+            if not dry_run:
+                self.vectordb_service.delete_chunks(collection_name, chunk_ids)
+                self.manifest.remove(file_path)
+            logger.info(f"🗑️ Removed {len(chunk_ids)} chunks of deleted file: {file_path} ({collection_name})")
+
+        if not dry_run:
+            self.manifest.save()
+
+        stats['has_changes'] = bool(stats['chunks_upserted'] or stats['chunks_deleted'])
+        if stats['has_changes'] and not dry_run and self.chunk_manifest_dir:
+            write_chunk_manifest(self.vectordb_service, self.chunk_manifest_dir)
+
+        stats['affected_collections'] = sorted(stats['affected_collections'])
+        stats['processing_time'] = round(time.time() - start_time, 3)
+
+        logger.info(f"📊 Incremental index: +{len(stats['added_files'])} ~{len(stats['changed_files'])} "
+                    f"-{len(stats['removed_files'])} files, {stats['unchanged_files']} unchanged | "
+                    f"chunks upserted={stats['chunks_upserted']}, deleted={stats['chunks_deleted']}, "
+                    f"unchanged={stats['chunks_unchanged']} ({stats['processing_time']}s)")
+        return stats
+
+    def _find_deleted(self, current_set: Set[str]) -> List[Tuple[str, str, List[str]]]:
+        """
+        (file_path, collection, chunk_ids) của các file không còn trên disk.
+        Manifest chỉ biết file đã qua incremental index - full build / --force không ghi manifest,
+        nên chunk ids lấy từ metadata file_path trong Chroma (nguồn chính xác), manifest bổ sung phần còn lại
+        """
+        current_resolved = {str(Path(f).resolve()) for f in current_set}
+
+        def is_deleted(file_path: str) -> bool:
+            return (file_path not in current_set
+                    and str(Path(file_path).resolve()) not in current_resolved
+                    and not Path(file_path).exists())
+
+        deleted: Dict[Tuple[str, str], Set[str]] = {}
+        for collection_name, files in self.vectordb_service.get_indexed_files().items():
+            for file_path, chunk_ids in files.items():
+                if is_deleted(file_path):
+                    deleted.setdefault((file_path, collection_name), set()).update(chunk_ids)
+
+        for file_path in self.manifest.files:
+            if is_deleted(file_path):
+                entry = self.manifest.get(file_path)
+                deleted.setdefault((file_path, entry['collection']), set()).update(entry.get('chunks', {}).keys())
+
+        return [(file_path, collection_name, sorted(chunk_ids))
+                for (file_path, collection_name), chunk_ids in sorted(deleted.items())]
+
+    def _sync_file(self, file_path: str, stats: Dict[str, Any], dry_run: bool):
+        content_hash = compute_file_hash(file_path)
+        entry = self.manifest.get(file_path)
+
+        if entry and entry.get('content_hash') == content_hash:
+            stats['unchanged_files'] += 1
+            stats['chunks_unchanged'] += len(entry.get('chunks', {}))
+            return
+
+        doc_data = parse_document_file(file_path)
+        if "error" in doc_data:
+            raise ValueError(doc_data['error'])
+
+        collection_name = doc_data['collection']
+        records = []
+        for index, chunk in enumerate(doc_data['chunks']):
+            record = self.vectordb_service.build_chunk_record(chunk, collection_name, index)
+            if record:
+                records.append(record)
+        new_hashes = {chunk_id: compute_chunk_hash(text, metadata) for chunk_id, text, metadata in records}
+
+        # Baseline: manifest entry, hoặc chunks đang nằm trong Chroma nếu file chưa có trong manifest
+        if entry:
+            old_collection = entry['collection']
+            old_hashes = entry.get('chunks', {})
+            stats['changed_files'].append(file_path)
+        else:
+            old_collection = collection_name
+            old_hashes = {
+                chunk['id']: compute_chunk_hash(chunk['content'], chunk['metadata'])
+                for chunk in self.vectordb_service.get_chunks_for_file(collection_name, file_path)
+            }
+            stats['changed_files' if old_hashes else 'added_files'].append(file_path)
+
+        moved = old_collection != collection_name
+        to_upsert = [r for r in records if moved or old_hashes.get(r[0]) != new_hashes[r[0]]]
+        to_delete = [chunk_id for chunk_id in old_hashes if moved or chunk_id not in new_hashes]
+
+        stats['chunks_upserted'] += len(to_upsert)
+        stats['chunks_deleted'] += len(to_delete)
+        stats['chunks_unchanged'] += len(records) - len(to_upsert)
+        if to_upsert:
+            stats['affected_collections'].add(collection_name)
+        if to_delete:
+            stats['affected_collections'].add(old_collection)
+
+        if dry_run:
+            return
+
+        if to_delete:
+            self.vectordb_service.delete_chunks(old_collection, to_delete)
+
+        for i in range(0, len(to_upsert), self.batch_size):
+            batch = to_upsert[i:i + self.batch_size]
+            texts = [text for _, text, _ in batch]
+            self.vectordb_service.upsert_chunk_batch(
+                collection_name=collection_name,
+                ids=[chunk_id for chunk_id, _, _ in batch],
+                documents=texts,
+                metadatas=[metadata for _, _, metadata in batch],
+                embeddings=self.vectordb_service.embed_text(texts, batch_size=self.batch_size)
+            )
+
+        # Chỉ ghi manifest sau khi Chroma đã cập nhật xong file này
+        self.manifest.set(file_path, content_hash, collection_name, new_hashes)
+        logger.info(f"🔄 Re-indexed {file_path}: {len(to_upsert)} upserted, {len(to_delete)} deleted, "
+                    f"{len(records) - len(to_upsert)} unchanged")
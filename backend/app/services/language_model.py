@@ -1,11 +1,16 @@
 import logging
 import os
-import requests
 from pathlib import Path
 from typing import Optional, List, Dict, Any
-from llama_cpp import Llama
+import threading
 import time
 from ..core.config import settings
+from .metrics import registry, track_model_load, record_model_unload, record_generation
+from .speculative import build_drafter, draft_stats
+from .generation_scheduler import GenerationScheduler, GenerationCancelled
+from .cancellation import estimate_remaining_seconds
+from .coalescing import current_stream
+from .events import events
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +29,14 @@ class LLMService:
         self.model = None
         self.model_loaded = False
         
+        # Speculative decoding (prompt lookup + draft GGUF tùy chọn) - drafter tạo cùng lúc load model
+        self.speculative_mode = (kwargs.get('speculative_mode') or settings.llm_speculative_mode).lower()
+        draft_model_path = kwargs.get('draft_model_path', settings.llm_draft_model_file_path)
+        self.draft_model_path = Path(draft_model_path) if draft_model_path else None
+        self.drafters = []  # 1 drafter / slot (drafter giữ state của lần generate đang chạy)
+        self.speculative_totals = {'calls': 0, 'proposed': 0, 'accepted': 0}  # Cộng dồn qua các lần load / unload
+        self._stats_lock = threading.Lock()
+        
         # Cấu hình GPU + CPU hybrid cho tối ưu performance
         self.model_kwargs = {
             'n_ctx': kwargs.get('n_ctx', settings.n_ctx),
@@ -37,6 +50,14 @@ class LLMService:
             'f16_kv': True,    # Use half precision for key/value cache
         }
         
+        # Generation slots: N llama contexts trên cùng file GGUF (use_mmap -> weights trên CPU dùng chung page cache),
+        # scheduler giữ qua các lần load / unload (slot.resource = Llama khi đã load)
+        self.num_slots = max(1, kwargs.get('slots', settings.llm_slots))
+        self.scheduler = GenerationScheduler([None] * self.num_slots, max_queue=settings.llm_queue_size, name="llm")
+        registry.register_collector("llm_scheduler", self.scheduler.collect_metrics)
+        self._load_lock = threading.RLock()
+        self._active_requests = 0  # Requests từ lúc ensure_loaded tới khi trả slot - unload phải chờ
+        
         # Tải model nếu chưa có
         logger.info(f"Checking model path: {self.model_path}")
         logger.info(f"Model exists: {self.model_path.exists()}")
@@ -58,6 +79,7 @@ class LLMService:
             # Tạo thư mục nếu chưa có
             self.model_path.parent.mkdir(parents=True, exist_ok=True)
             
+            import requests  # Chỉ cần khi download model
             response = requests.get(self.model_url, stream=True)
             response.raise_for_status()
             
@@ -83,33 +105,84 @@ class LLMService:
                 self.model_path.unlink()  # Xóa file bị lỗi
             raise
     
+    def _slot_model_kwargs(self) -> Dict[str, Any]:
+        """Llama kwargs cho 1 slot: N_THREADS chia đều giữa các slots (decode song song không tranh cores)"""
+        model_kwargs = dict(self.model_kwargs)
+        if self.num_slots > 1:
+            model_kwargs['n_threads'] = max(1, self.model_kwargs['n_threads'] // self.num_slots)
+        return model_kwargs
+    
     def _load_model(self):
-        """Load model vào memory"""
-        if self.model_loaded:
-            return
-            
-        try:
-            logger.info(f"Loading LLM model from {self.model_path}")
-            self.model = Llama(model_path=str(self.model_path), **self.model_kwargs)
-            self.model_loaded = True
-            logger.info("✅ LLM model loaded successfully")
-        except Exception as e:
-            logger.error(f"Failed to load LLM model: {e}")
-            self.model = None
-            self.model_loaded = False
-            raise
+        """Load model vào memory (1 Llama context / slot)"""
+        with self._load_lock:
+            if self.model_loaded:
+                return
+                
+            try:
+                logger.info(f"Loading LLM model from {self.model_path} ({self.num_slots} slot(s))")
+                from llama_cpp import Llama  # Heavy import - chỉ khi thực sự load model
+                with track_model_load("llm"):
+                    for slot in self.scheduler.slots:
+                        drafter = self._build_drafter()
+                        self.drafters.append(drafter)
+                        model_kwargs = self._slot_model_kwargs()
+                        if drafter is not None:
+                            # llama.cpp tự bật logits_all khi có draft model (verify cả batch draft tokens)
+                            model_kwargs['draft_model'] = drafter
+                        slot.resource = Llama(model_path=str(self.model_path), **model_kwargs)
+                self.model = self.scheduler.slots[0].resource
+                self.model_loaded = True
+                logger.info(f"✅ LLM model loaded successfully (slots: {self.num_slots}, "
+                            f"speculative decoding: {self.speculative_mode if self.drafters[0] else 'off'})")
+            except Exception as e:
+                logger.error(f"Failed to load LLM model: {e}")
+                self._release_slots()
+                raise
+    
+    def _build_drafter(self):
+        draft_path = None
+        if self.draft_model_path is not None:
+            if self.draft_model_path.exists():
+                draft_path = str(self.draft_model_path)
+            else:
+                logger.warning(f"⚠️ Draft model not found: {self.draft_model_path}, using prompt lookup only")
+        return build_drafter(
+            self.speculative_mode,
+            max_ngram_size=settings.llm_draft_max_ngram,
+            num_pred_tokens=settings.llm_draft_num_pred_tokens,
+            draft_model_path=draft_path,
+            n_ctx=self.model_kwargs['n_ctx'],
+            n_threads=self._slot_model_kwargs()['n_threads'],
+            n_gpu_layers=self.model_kwargs['n_gpu_layers'],
+            n_batch=self.model_kwargs['n_batch'],
+            verbose=False
+        )
+    
+    def _release_slots(self):
+        for slot in self.scheduler.slots:
+            slot.resource = None
+        for drafter in self.drafters:
+            if drafter is not None and drafter.fallback is not None:
+                drafter.fallback.close()
+        self.drafters = []
+        self.model = None
+        self.model_loaded = False
     
     def unload_model(self):
-        """Unload model để giải phóng VRAM"""
-        if self.model is not None:
+        """Unload model để giải phóng VRAM (bỏ qua khi còn request đang generate / chờ slot)"""
+        with self._load_lock:
+            if self.model is None:
+                return
+            if self._active_requests:
+                logger.info(f"⏭️ Skip LLM unload: {self._active_requests} generation request(s) in flight")
+                return
             logger.info("🔄 Unloading LLM model to free VRAM...")
-            del self.model
-            self.model = None
-            self.model_loaded = False
+            self._release_slots()
             
             # Force garbage collection
             import gc
             gc.collect()
+            record_model_unload("llm")
             logger.info("✅ LLM model unloaded, VRAM freed")
     
     def ensure_loaded(self):
@@ -178,14 +251,44 @@ class LLMService:
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
         system_prompt: Optional[str] = None,
-        chat_history: Optional[List[Dict[str, str]]] = None  # THAM SỐ MỚI cho ChatML
+        chat_history: Optional[List[Dict[str, str]]] = None,  # THAM SỐ MỚI cho ChatML
+        priority: int = 0,
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None
     ) -> Dict[str, Any]:
-        """Sinh response từ model - VRAM optimized với on-demand loading"""
-        
-        # VRAM Optimization: Ensure model is loaded
-        self.ensure_loaded()
+        """
+        Sinh response từ model - VRAM optimized với on-demand loading.
+        Chạy trên 1 generation slot: priority cao được slot trước; deadline (time.monotonic()) hết khi đang chờ
+        -> GenerationTimeout, khi đang sinh -> trả phần đã sinh (truncated='deadline'); cancel_event.set()
+        -> GenerationCancelled. Hàng đợi đầy -> GenerationQueueFull.
+        """
         
-        if not self.model:
+        # VRAM Optimization: Ensure model is loaded - giữ model tới khi trả slot (unload_model chờ)
+        with self._load_lock:
+            self.ensure_loaded()
+            self._active_requests += 1
+        try:
+            with self.scheduler.acquire(priority=priority, deadline=deadline, cancel_event=cancel_event) as ticket:
+                return self._generate_on_slot(
+                    ticket, user_query, context, max_tokens, temperature, system_prompt, chat_history
+                )
+        finally:
+            with self._load_lock:
+                self._active_requests -= 1
+    
+    def _generate_on_slot(
+        self,
+        ticket,
+        user_query: str,
+        context: str,
+        max_tokens: Optional[int],
+        temperature: Optional[float],
+        system_prompt: Optional[str],
+        chat_history: Optional[List[Dict[str, str]]]
+    ) -> Dict[str, Any]:
+        model = ticket.slot.resource
+        drafter = self.drafters[ticket.slot.index]
+        if not model:
             raise Exception("Model not loaded")
         
         # Sử dụng values từ config - LOẠI BỎ HARDCODE
@@ -276,19 +379,38 @@ Trả lời chính xác, ngắn gọn."""
             logger.warning(f"⚠️ Dynamic max_tokens ({dynamic_max_tokens}) quá nhỏ, đặt về minimum {MINIMUM_RESPONSE_TOKENS}")
             dynamic_max_tokens = MINIMUM_RESPONSE_TOKENS
         
-        logger.info(f"📏 Context Info: Total={total_context_window}, Prompt≈{prompt_tokens_estimated}, Available={available_space_for_response}")
+        events.record(
+            "generation_budget",
+            context_window=total_context_window,
+            prompt_tokens_estimated=prompt_tokens_estimated,
+            available=available_space_for_response,
+            max_tokens=dynamic_max_tokens
+        )
         if dynamic_max_tokens != original_max_tokens:
             logger.warning(f"⚠️ Max Tokens adjusted: {original_max_tokens} → {dynamic_max_tokens} (to prevent overflow)")
-        else:
-            logger.info(f"✅ Max Tokens: {dynamic_max_tokens} (no adjustment needed)")
         
         # ======================================================================
         
+        stop_reason = []
+        stream = current_stream()
+        streamed = {'prompt': None, 'tokens': 0}
+        
+        def should_stop(input_ids, logits) -> bool:
+            # llama.cpp gọi sau mỗi token: dừng khi request bị cancel / hết deadline
+            if stream is not None:
+                self._publish_new_tokens(model, stream, input_ids, streamed)
+            reason = ticket.should_stop()
+            if reason:
+                stop_reason.append(reason)
+            return reason is not None
+        
         try:
             start_time = time.time()
+            if drafter is not None:
+                drafter.begin()
             
             # Generate với parameters tối ưu để tránh lặp - SỬ DỤNG DYNAMIC MAX_TOKENS
-            response = self.model(
+            response = model(
                 formatted_prompt,
                 max_tokens=dynamic_max_tokens,  # ✨ SỬ DỤNG GIÁ TRỊ ĐÃ ĐIỀU CHỈNH
                 temperature=temperature,
@@ -297,10 +419,16 @@ Trả lời chính xác, ngắn gọn."""
                 repeat_penalty=1.1,  # Penalty cho từ lặp
                 stop=["### Câu hỏi:", "\n### Câu hỏi:", "### Trả lời:", "\n### Trả lời:"],  # 🔥 STOP TOKENS CHO FORMAT CHÍNH THỨC
                 echo=False,
-                stream=False  # Ensure non-streaming response
+                stream=False,  # Ensure non-streaming response
+                stopping_criteria=should_stop
             )
             
             processing_time = time.time() - start_time
+            if stop_reason and stop_reason[0] == 'cancelled':
+                if drafter is not None:
+                    drafter.finish()
+                logger.info(f"🛑 Generation cancelled after {processing_time:.2f}s (slot {ticket.slot.index})")
+                raise GenerationCancelled(estimate_remaining_seconds("generation", processing_time))
             
             # Safely extract text from response
             if isinstance(response, dict) and 'choices' in response:
@@ -314,6 +442,13 @@ Trả lời chính xác, ngắn gọn."""
             else:
                 raise Exception("Invalid response format from model")
             
+            record_generation(prompt_tokens, completion_tokens, processing_time)
+            speculative = drafter.finish() if drafter is not None else None
+            if speculative is not None:
+                with self._stats_lock:
+                    for key in self.speculative_totals:
+                        self.speculative_totals[key] += speculative[key]
+            
             # Clean up response - remove repetitive patterns
             generated_text = self._clean_repetitive_response(generated_text)
             
@@ -333,17 +468,42 @@ Trả lời chính xác, ngắn gọn."""
                     'was_adjusted': dynamic_max_tokens != original_max_tokens
                 }
             }
+            if speculative is not None:
+                result['speculative'] = speculative  # Draft tokens proposed / accepted của request
+            if stop_reason:
+                result['truncated'] = stop_reason[0]  # Hết deadline giữa chừng: phần đã sinh
             
-            logger.info(f"✅ Generated response in {processing_time:.2f}s, "
-                       f"tokens: {result['total_tokens']} "
-                       f"(prompt: {prompt_tokens}, completion: {completion_tokens})")
+            events.record(
+                "generation",
+                seconds=round(processing_time, 4),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                slot=ticket.slot.index,
+                truncated=stop_reason[0] if stop_reason else None
+            )
             
             return result
             
+        except GenerationCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             raise
     
+    @staticmethod
+    def _publish_new_tokens(model, stream, input_ids, streamed: Dict[str, Any]):
+        """
+        Publish tokens mới vào TokenStream của single-flight. input_ids chưa chứa token vừa sample
+        (lần gọi đầu = prompt) -> token cuối được bù bằng câu trả lời hoàn chỉnh khi flight đóng stream
+        """
+        if streamed['prompt'] is None:
+            streamed['prompt'] = len(input_ids)
+            return
+        new_tokens = input_ids[streamed['prompt'] + streamed['tokens']:]
+        if len(new_tokens):
+            streamed['tokens'] += len(new_tokens)
+            stream.publish_bytes(model.detokenize([int(token) for token in new_tokens]))
+    
     def _clean_repetitive_response(self, text: str) -> str:
         """Dọn dẹp response để loại bỏ patterns lặp lại và official format artifacts"""
         import re
@@ -408,5 +568,10 @@ Trả lời chính xác, ngắn gọn."""
             'model_url': self.model_url,
             'is_loaded': self.is_loaded(),
             'model_size_mb': self.model_path.stat().st_size / (1024**2) if self.model_path.exists() else 0,
-            'model_kwargs': self.model_kwargs
+            'model_kwargs': self.model_kwargs,
+            'speculative_mode': self.speculative_mode,
+            'draft_model_path': str(self.draft_model_path) if self.draft_model_path else None,
+            'speculative_stats': draft_stats(self.speculative_totals) if self.speculative_mode != "off" else None,
+            'slots': self.num_slots,
+            'scheduler': self.scheduler.get_stats()
         }
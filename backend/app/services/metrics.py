@@ -0,0 +1,445 @@
+"""
+Metrics Registry + OpenMetrics Exporter
+Counters / gauges / histograms in-process, render ra OpenMetrics text format để Prometheus scrape
+trực tiếp từ API (không cần pushgateway hay service ngoài).
+
+Metrics chuẩn của pipeline được khai báo sẵn ở cuối module (REQUESTS, ROUTING_CONFIDENCE, MODEL_LOADS, ...),
+stage latency lấy từ LatencyTracer (tracing.py) lúc render.
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable, Iterable, Iterator, Optional
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_SECONDS_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# (suffix, labels, value) - 1 sample của 1 metric family
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Metric:
+    """Base cho metric có labels - values lưu theo tuple label values"""
+
+    metric_type = "unknown"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = dict(self._values)
+        return [("_total", self._labels(key), value) for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = dict(self._values)
+        return [("", self._labels(key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_SECONDS_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts (không cộng dồn, + overflow), count, sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+
+        samples: List[Sample] = []
+        for key, (counts, count, total) in sorted(values.items()):
+            samples.extend(histogram_samples(self._labels(key), self.buckets, counts, count, total))
+        return samples
+
+
+def histogram_samples(
+    labels: Dict[str, str],
+    buckets: Iterable[float],
+    counts: List[int],
+    count: int,
+    total: float
+) -> List[Sample]:
+    """Samples OpenMetrics cho 1 histogram: _bucket cộng dồn theo le, _count, _sum"""
+    samples: List[Sample] = []
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+    samples.append(("_bucket", {**labels, "le": "+Inf"}, count))
+    samples.append(("_count", labels, count))
+    samples.append(("_sum", labels, total))
+    return samples
+
+
+class MetricFamily:
+    """Family do collector tạo lúc render (giá trị tính từ state hiện tại của service)"""
+
+    def __init__(self, name: str, metric_type: str, documentation: str, samples: Optional[List[Sample]] = None):
+        self.name = name
+        self.metric_type = metric_type
+        self.documentation = documentation
+        self._samples = samples or []
+
+    def add(self, value: float, suffix: str = "", **labels):
+        self._samples.append((suffix, {k: str(v) for k, v in labels.items()}, value))
+        return self
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+
+class MetricsRegistry:
+    """Registry metrics + collectors, render OpenMetrics text"""
+
+    def __init__(self, prefix: str = "legalrag"):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[MetricFamily]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_SECONDS_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+
+    def register_collector(self, name: str, collector: Callable[[], Iterable[MetricFamily]]):
+        """Collector gọi lúc render - đăng ký lại cùng name sẽ thay collector cũ (vd. service được tạo lại)"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def family(self, name: str, metric_type: str, documentation: str) -> MetricFamily:
+        return MetricFamily(f"{self.prefix}_{name}", metric_type, documentation)
+
+    def collect(self) -> List[Any]:
+        with self._lock:
+            families: List[Any] = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        for name, collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.warning(f"⚠️ Metrics collector '{name}' failed: {e}")
+        return families
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self.collect():
+            samples = family.samples()
+            lines.append(f"# TYPE {family.name} {family.metric_type}")
+            lines.append(f"# HELP {family.name} {_escape(family.documentation)}")
+            for suffix, labels, value in samples:
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ---------------------------------------------------------------
+# Pipeline metrics
+# ---------------------------------------------------------------
+REQUESTS = registry.counter(
+    "requests", "Requests theo endpoint và loại response (answer, clarification_needed, no_results, error)",
+    ("endpoint", "outcome")
+)
+INFLIGHT_REQUESTS = registry.gauge("inflight_requests", "Requests đang xử lý theo endpoint", ("endpoint",))
+ROUTING_CONFIDENCE = registry.counter(
+    "routing_confidence", "Số lần routing theo confidence level của router", ("confidence_level",)
+)
+
+# Model load / unload (VRAM swapping giữa reranker và LLM)
+MODEL_LOADS = registry.counter("model_loads", "Số lần load model", ("model", "result"))
+MODEL_UNLOADS = registry.counter("model_unloads", "Số lần unload model", ("model",))
+MODEL_LOAD_SECONDS = registry.histogram("model_load_seconds", "Thời gian load model", ("model",))
+MODEL_LOADED = registry.gauge("model_loaded", "Model đang nằm trong memory (1) hay không (0)", ("model",))
+
+# Structured answers (trả lời từ metadata, không gọi LLM)
+STRUCTURED_ANSWERS = registry.counter(
+    "structured_answers", "Câu hỏi intent metadata theo kết quả (answered, degraded, shadow, missing_field, compound, low_confidence, audit)",
+    ("intent", "outcome")
+)
+ANSWER_SECONDS = registry.histogram(
+    "answer_seconds", "Thời gian xử lý request trả lời theo nguồn câu trả lời (structured / llm)", ("source",),
+    buckets=(0.005, 0.01, 0.025) + DEFAULT_SECONDS_BUCKETS
+)
+
+# Caches
+CACHE_REQUESTS = registry.counter("cache_requests", "Cache lookups theo kết quả hit/miss", ("cache", "result"))
+
+# llama.cpp generation
+LLM_PROMPT_TOKENS = registry.counter("llm_prompt_tokens", "Tổng prompt tokens đã xử lý")
+LLM_COMPLETION_TOKENS = registry.counter("llm_completion_tokens", "Tổng completion tokens đã sinh")
+LLM_GENERATION_SECONDS = registry.counter("llm_generation_seconds", "Tổng thời gian generation của llama.cpp")
+LLM_DRAFT_TOKENS = registry.counter(
+    "llm_draft_tokens", "Draft tokens của speculative decoding đã verify (proposed / accepted)", ("result",)
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "llm_tokens_per_second", "Tốc độ sinh completion tokens mỗi request",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+)
+
+# Cancellation (client disconnect)
+CANCELLED_REQUESTS = registry.counter(
+    "cancelled_requests", "Requests bị hủy giữa chừng theo stage pipeline dừng lại", ("stage",)
+)
+CANCEL_RECLAIMED_SECONDS = registry.counter(
+    "cancel_reclaimed_seconds", "Ước lượng thời gian xử lý tiết kiệm nhờ hủy request (p50 phần stages còn lại)", ("stage",)
+)
+CANCEL_STOP_SECONDS = registry.histogram(
+    "cancel_stop_seconds", "Thời gian từ lúc request bị hủy tới khi pipeline dừng",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+# Deadline-aware degradation
+DEGRADATIONS = registry.counter(
+    "degradations", "Degradations do latency budget theo stage và hành động (shrink_k, skip_consensus, ...)", ("stage", "action")
+)
+DEADLINE_EXCEEDED = registry.counter("deadline_exceeded", "Requests có budget trả lời sau deadline", ("endpoint",))
+
+# Adaptive search k
+SEARCH_K_DECISIONS = registry.counter(
+    "search_k_decisions", "Quyết định dynamic_k theo mode (static, adaptive, explore)", ("mode",)
+)
+RERANK_PAIRS = registry.counter("rerank_pairs", "Số cặp (query, chunk) đưa vào reranker theo mode", ("mode",))
+
+# Request coalescing (single-flight)
+COALESCED_REQUESTS = registry.counter(
+    "coalesced_requests", "Requests trùng gắn vào pipeline đang chạy theo kết quả (joined, cancelled, fallback)", ("outcome",)
+)
+
+
+@contextmanager
+def track_model_load(model: str) -> Iterator[None]:
+    """Đo thời gian load model + đếm thành công / thất bại"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        MODEL_LOADS.inc(model=model, result="error")
+        raise
+    MODEL_LOAD_SECONDS.observe(time.perf_counter() - start, model=model)
+    MODEL_LOADS.inc(model=model, result="success")
+    MODEL_LOADED.set(1, model=model)
+
+
+def record_model_unload(model: str):
+    MODEL_UNLOADS.inc(model=model)
+    MODEL_LOADED.set(0, model=model)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_draft_tokens(proposed: int, accepted: int):
+    LLM_DRAFT_TOKENS.inc(proposed, result="proposed")
+    LLM_DRAFT_TOKENS.inc(accepted, result="accepted")
+
+
+def record_generation(prompt_tokens: int, completion_tokens: int, seconds: float):
+    LLM_PROMPT_TOKENS.inc(prompt_tokens)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens)
+    LLM_GENERATION_SECONDS.inc(seconds)
+    if seconds > 0 and completion_tokens:
+        LLM_TOKENS_PER_SECOND.observe(completion_tokens / seconds)
+
+
+def record_cancelled_request(stage: str, reclaimed_seconds: float, stop_seconds: Optional[float]):
+    CANCELLED_REQUESTS.inc(stage=stage)
+    CANCEL_RECLAIMED_SECONDS.inc(reclaimed_seconds, stage=stage)
+    if stop_seconds is not None:
+        CANCEL_STOP_SECONDS.observe(stop_seconds)
+
+
+def record_degradation(stage: str, action: str):
+    DEGRADATIONS.inc(stage=stage, action=action)
+
+
+def record_search_k(mode: str):
+    SEARCH_K_DECISIONS.inc(mode=mode)
+
+
+def record_rerank_pairs(mode: str, pairs: int):
+    RERANK_PAIRS.inc(pairs, mode=mode)
+
+
+def record_coalesced_request(outcome: str):
+    COALESCED_REQUESTS.inc(outcome=outcome)
+
+
+# ---------------------------------------------------------------
+# Derived metrics (tính lúc render)
+# ---------------------------------------------------------------
+def _collect_cache_hit_ratio() -> Iterable[MetricFamily]:
+    totals: Dict[str, Dict[str, float]] = {}
+    for _, labels, value in CACHE_REQUESTS.samples():
+        totals.setdefault(labels["cache"], {})[labels["result"]] = value
+
+    family = registry.family("cache_hit_ratio", "gauge", "Tỉ lệ cache hit (hit / (hit + miss))")
+    for cache, results in sorted(totals.items()):
+        lookups = results.get("hit", 0.0) + results.get("miss", 0.0)
+        if lookups:
+            family.add(results.get("hit", 0.0) / lookups, cache=cache)
+    return [family]
+
+
+def _collect_stage_latency() -> Iterable[MetricFamily]:
+    """Stage latency histograms của LatencyTracer (ms -> seconds)"""
+    stages = registry.family("stage_latency_seconds", "histogram", "Latency từng stage của pipeline")
+    for stage, histogram in tracer.stage_histograms():
+        counts, count, sum_ms = histogram.snapshot()
+        stages.samples().extend(histogram_samples(
+            {"stage": stage}, (b / 1000.0 for b in histogram.buckets_ms), counts, count, sum_ms / 1000.0
+        ))
+
+    by_confidence = registry.family(
+        "stage_latency_by_confidence_seconds", "histogram", "Latency từng stage theo confidence level của router"
+    )
+    for (level, stage), histogram in tracer.confidence_histograms():
+        counts, count, sum_ms = histogram.snapshot()
+        by_confidence.samples().extend(histogram_samples(
+            {"confidence_level": level, "stage": stage},
+            (b / 1000.0 for b in histogram.buckets_ms), counts, count, sum_ms / 1000.0
+        ))
+    return [stages, by_confidence]
+
+
+registry.register_collector("cache_hit_ratio", _collect_cache_hit_ratio)
+registry.register_collector("stage_latency", _collect_stage_latency)
@@ -0,0 +1,103 @@
+"""
+Pending Resolution
+Trạng thái retrieval giữ lại giữa các lượt clarification (session.metadata['pending_resolution']):
+
+Khi user chọn document (proceed_with_document), document đích đã biết - search có filter document_title,
+rerank / consensus rồi expand TOÀN BỘ document của nucleus chunk đều chỉ để chọn lại đúng document đó.
+Record nhỏ gọn lưu: collection, document (title + file_path), chunk ids của document (xếp theo câu hỏi gốc)
+và vector câu hỏi gốc. Khi user xác nhận câu hỏi gợi ý (proceed_with_question), process_query lấy
+nucleus từ các chunk ids (get by id, không query Chroma / không rerank) rồi đi thẳng tới context + generation.
+
+Record hết hạn sau CLARIFICATION_PENDING_TTL giây, chỉ dùng 1 lần và chỉ khi khớp collection + document.
+Chunk ids không còn (index reload) -> caller chạy lại pipeline đầy đủ.
+"""
+
+import logging
+import time
+from typing import Dict, Any, Optional, List
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PENDING_RESOLUTION_KEY = 'pending_resolution'
+
+# Số chunk ids tối đa giữ trong record (document dài: chỉ giữ các chunks gần câu hỏi gốc nhất)
+MAX_PENDING_CHUNKS = 32
+
+
+def _normalized(vector) -> Optional[np.ndarray]:
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else None
+
+
+def build_pending_resolution(
+    vectordb_service,
+    collection: str,
+    document_title: str,
+    query_vector: Optional[np.ndarray] = None
+) -> Optional[Dict[str, Any]]:
+    """Record cho document đã chọn - None nếu document không có chunk nào trong collection"""
+    chunks = vectordb_service.get_document_chunks(collection, document_title, include_embeddings=query_vector is not None)
+    ids, metadatas = chunks['ids'], chunks['metadatas']
+    if not ids:
+        return None
+
+    query_vector = _normalized(query_vector)
+    order = list(range(len(ids)))
+    if query_vector is not None and len(chunks['embeddings']) == len(ids):
+        scores = np.asarray(chunks['embeddings'], dtype=np.float32) @ query_vector
+        order = [int(i) for i in np.argsort(-scores, kind='stable')]
+    order = order[:MAX_PENDING_CHUNKS]
+
+    file_path = next((metadatas[i].get('file_path') for i in order if metadatas[i] and metadatas[i].get('file_path')), '')
+    return {
+        'collection': collection,
+        'document_title': document_title,
+        'file_path': file_path,
+        'chunk_ids': [ids[i] for i in order],
+        # float16: record nằm trong session metadata suốt clarification, 2 bytes / dim là đủ để xếp hạng chunks
+        'query_vector': query_vector.astype(np.float16).tolist() if query_vector is not None else None,
+        'created_at': time.time()
+    }
+
+
+def take_pending_resolution(metadata: Dict[str, Any], collection: str, document_title: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Lấy (và xóa) record nếu còn hạn và khớp collection + document user xác nhận"""
+    pending = metadata.pop(PENDING_RESOLUTION_KEY, None)
+    if not pending:
+        return None
+    if time.time() - pending.get('created_at', 0) > settings.clarification_pending_ttl:
+        logger.debug("⌛ Pending resolution expired")
+        return None
+    if pending.get('collection') != collection or (document_title and pending.get('document_title') != document_title):
+        return None
+    return pending
+
+
+def select_nucleus(chunks: List[Dict[str, Any]], query_vector: Optional[np.ndarray], pending: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Nucleus trong các chunks của record: gần câu hỏi đã xác nhận nhất (embedding của chunk),
+    không có vector thì theo câu hỏi gốc, rồi theo thứ tự đã xếp trong record
+    """
+    query_vector = _normalized(query_vector)
+    if query_vector is None:
+        query_vector = _normalized(pending.get('query_vector'))
+
+    embedded = [chunk for chunk in chunks if chunk.get('embedding') is not None]
+    if query_vector is None or not embedded:
+        nucleus = chunks[0]
+    else:
+        scores = np.asarray([chunk['embedding'] for chunk in embedded], dtype=np.float32) @ query_vector
+        best = int(np.argmax(scores))
+        nucleus = embedded[best]
+        nucleus['similarity'] = float(scores[best])
+    nucleus.pop('embedding', None)
+    for chunk in chunks:
+        chunk.pop('embedding', None)
+    return nucleus
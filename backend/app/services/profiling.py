@@ -0,0 +1,343 @@
+"""
+Sampling Profiler
+Profile opt-in cho hot path, xuất collapsed stacks (flamegraph.pl / speedscope / inferno):
+
+- On-demand: profile wall-clock + CPU của đúng 1 request (admin header X-Profile hoặc ?profile=true trên /query)
+- Rolling: sampler tần suất thấp trên mọi request đang chạy, stack được gắn prefix theo pipeline stage
+  (kind;stage:<stage>;frames...) - stage lấy từ RequestTrace của latency tracer
+
+Khi tắt không có sampler thread và không đăng ký observer vào tracer -> hot path không đổi.
+CPU time đọc qua per-thread CPU clock (pthread_getcpuclockid); platform không hỗ trợ chỉ có wall-clock.
+Weight trong collapsed stacks là microseconds.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator
+
+from ..core.config import settings
+from .tracing import tracer, RequestTrace
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KINDS = ("wall", "cpu")
+MAX_STACK_DEPTH = 128
+MAX_DISTINCT_STACKS = 20000
+TRUNCATED_STACK = "[truncated]"
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return None
+
+
+def _read_cpu_us(clock_id: Optional[int]) -> Optional[int]:
+    if clock_id is None:
+        return None
+    try:
+        return time.clock_gettime_ns(clock_id) // 1000
+    except OSError:
+        return None
+
+
+_frame_labels: Dict[Any, str] = {}
+
+
+def collapse_frame(frame, max_depth: int = MAX_STACK_DEPTH) -> str:
+    """Frame -> 'outer;...;inner' với label 'func (file.py:line)'"""
+    labels: List[str] = []
+    while frame is not None and len(labels) < max_depth:
+        code = frame.f_code
+        label = _frame_labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            _frame_labels[code] = label
+        labels.append(label)
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class StackProfile:
+    """Wall / CPU microseconds theo collapsed stack"""
+
+    def __init__(self, max_stacks: int = MAX_DISTINCT_STACKS):
+        self.max_stacks = max_stacks
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.stage_wall_us: Counter = Counter()
+        self.stage_cpu_us: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def add(self, stack: str, wall_us: int, cpu_us: Optional[int], stage: Optional[str] = None):
+        with self._lock:
+            if stack not in self.wall and len(self.wall) >= self.max_stacks:
+                stack = TRUNCATED_STACK
+            self.samples += 1
+            self.wall[stack] += wall_us
+            if cpu_us:
+                self.cpu[stack] += cpu_us
+            if stage is not None:
+                self.stage_wall_us[stage] += wall_us
+                if cpu_us:
+                    self.stage_cpu_us[stage] += cpu_us
+
+    def collapsed(self, kind: str = "wall", stage: Optional[str] = None) -> str:
+        """Collapsed stacks ('frame;frame;frame weight' mỗi dòng), lọc theo stage nếu có"""
+        with self._lock:
+            counts = dict(self.cpu if kind == "cpu" else self.wall)
+        marker = f"stage:{stage};" if stage else None
+        lines = [
+            f"{stack} {weight}" for stack, weight in sorted(counts.items())
+            if weight > 0 and (marker is None or marker in stack)
+        ]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {
+                    'wall_ms': round(wall_us / 1000.0, 2),
+                    'cpu_ms': round(self.stage_cpu_us.get(stage, 0) / 1000.0, 2)
+                }
+                for stage, wall_us in self.stage_wall_us.most_common()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.wall.clear()
+            self.cpu.clear()
+            self.stage_wall_us.clear()
+            self.stage_cpu_us.clear()
+            self.samples = 0
+
+
+class _ThreadState:
+    """Trace đang chạy trên 1 thread + CPU clock để tính CPU delta giữa 2 samples"""
+
+    __slots__ = ('trace', 'clock_id', 'last_cpu_us', 'last_wall')
+
+    def __init__(self, request_trace: RequestTrace, clock_id: Optional[int]):
+        self.trace = request_trace
+        self.clock_id = clock_id
+        self.last_cpu_us = _read_cpu_us(clock_id)
+        self.last_wall = time.perf_counter()
+
+
+class RequestProfile:
+    """Profile on-demand của 1 request: sampler thread riêng với interval ngắn"""
+
+    def __init__(self, profiler: "SamplingProfiler", thread_id: int, interval_seconds: float, label: str):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.profile = StackProfile()
+        self.started_at = time.time()
+        self.duration_seconds: Optional[float] = None
+        self.cpu_supported = _thread_cpu_clock(thread_id) is not None
+        self._profiler = profiler
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.profile_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration_seconds = time.time() - self.started_at
+
+    def _run(self):
+        clock_id = _thread_cpu_clock(self.thread_id)
+        last_cpu_us = _read_cpu_us(clock_id)
+        last_wall = time.perf_counter()
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            now = time.perf_counter()
+            cpu_us = _read_cpu_us(clock_id)
+            cpu_delta = cpu_us - last_cpu_us if cpu_us is not None and last_cpu_us is not None else None
+            stage = self._profiler.stage_of(self.thread_id)
+            stack = collapse_frame(frame)
+            if stage:
+                stack = f"stage:{stage};{stack}"
+            self.profile.add(stack, int((now - last_wall) * 1e6), cpu_delta, stage)
+            last_wall, last_cpu_us = now, cpu_us
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'profile_id': self.profile_id,
+            'label': self.label,
+            'started_at': self.started_at,
+            'duration_seconds': round(self.duration_seconds, 3) if self.duration_seconds is not None else None,
+            'samples': self.profile.samples,
+            'cpu_supported': self.cpu_supported,
+            'stages': self.profile.stage_summary()
+        }
+
+
+class SamplingProfiler:
+    """Rolling profile theo stage + lưu các request profiles gần nhất"""
+
+    def __init__(
+        self,
+        interval_ms: float = 100.0,
+        request_interval_ms: float = 5.0,
+        max_profiles: int = 20
+    ):
+        self.interval_seconds = interval_ms / 1000.0
+        self.request_interval_seconds = request_interval_ms / 1000.0
+        self.max_profiles = max_profiles
+
+        self.rolling = StackProfile()
+        self._active: Dict[int, _ThreadState] = {}
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._observer_users = 0
+        self._rolling_thread: Optional[threading.Thread] = None
+        self._rolling_stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------
+    # Tracer observer - chỉ đăng ký khi rolling bật hoặc có request profile đang chạy
+    # ---------------------------------------------------------------
+    def trace_started(self, request_trace: RequestTrace):
+        thread_id = threading.get_ident()
+        self._active[thread_id] = _ThreadState(request_trace, _thread_cpu_clock(thread_id))
+
+    def trace_finished(self, request_trace: RequestTrace):
+        thread_id = threading.get_ident()
+        state = self._active.get(thread_id)
+        if state is not None and state.trace is request_trace:
+            self._active.pop(thread_id, None)
+
+    def stage_of(self, thread_id: int) -> Optional[str]:
+        state = self._active.get(thread_id)
+        if state is None:
+            return None
+        return state.trace.current_stage() or state.trace.kind
+
+    def _acquire_observer(self):
+        with self._lock:
+            self._observer_users += 1
+            if self._observer_users == 1:
+                tracer.add_observer(self)
+
+    def _release_observer(self):
+        with self._lock:
+            self._observer_users -= 1
+            if self._observer_users == 0:
+                tracer.remove_observer(self)
+                self._active.clear()
+
+    # ---------------------------------------------------------------
+    # Rolling profile
+    # ---------------------------------------------------------------
+    @property
+    def rolling_enabled(self) -> bool:
+        return self._rolling_thread is not None
+
+    def start_rolling(self):
+        if self._rolling_thread is not None:
+            return
+        if not tracer.enabled:
+            logger.warning("⚠️ Rolling profiler cần LATENCY_TRACING_ENABLED=true để biết stage - chưa bật")
+            return
+        self._acquire_observer()
+        self._rolling_stop.clear()
+        self._rolling_thread = threading.Thread(target=self._run_rolling, name="rolling-profiler", daemon=True)
+        self._rolling_thread.start()
+        logger.info(f"🔬 Rolling profiler started (interval {self.interval_seconds * 1000:.0f}ms)")
+
+    def stop_rolling(self):
+        thread = self._rolling_thread
+        if thread is None:
+            return
+        self._rolling_stop.set()
+        thread.join()
+        self._rolling_thread = None
+        self._release_observer()
+        logger.info("🔬 Rolling profiler stopped")
+
+    def _run_rolling(self):
+        while not self._rolling_stop.wait(self.interval_seconds):
+            states = list(self._active.items())
+            if not states:
+                continue
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for thread_id, state in states:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                cpu_us = _read_cpu_us(state.clock_id)
+                elapsed_us = int((now - state.last_wall) * 1e6)
+                cpu_delta = None
+                if cpu_us is not None and state.last_cpu_us is not None:
+                    cpu_delta = min(cpu_us - state.last_cpu_us, elapsed_us)
+                # Request bắt đầu giữa 2 samples: chỉ tính phần đã chạy
+                wall_us = min(elapsed_us, int(self.interval_seconds * 1e6))
+                state.last_cpu_us, state.last_wall = cpu_us, now
+
+                stage = state.trace.current_stage() or state.trace.kind
+                stack = f"{state.trace.kind};stage:{stage};{collapse_frame(frame)}"
+                self.rolling.add(stack, wall_us, cpu_delta, stage)
+
+    # ---------------------------------------------------------------
+    # On-demand request profiles
+    # ---------------------------------------------------------------
+    @contextmanager
+    def profile_request(self, label: str = "") -> Iterator[RequestProfile]:
+        """Profile code chạy trong block (trên thread hiện tại)"""
+        request_profile = RequestProfile(self, threading.get_ident(), self.request_interval_seconds, label)
+        self._acquire_observer()
+        request_profile.start()
+        try:
+            yield request_profile
+        finally:
+            request_profile.stop()
+            self._release_observer()
+            with self._lock:
+                self._profiles[request_profile.profile_id] = request_profile
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+            logger.info(f"🔬 Request profile {request_profile.profile_id}: "
+                        f"{request_profile.profile.samples} samples in {request_profile.duration_seconds:.2f}s")
+
+    def get_profile(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            profiles = [p.to_dict() for p in reversed(self._profiles.values())]
+        return {
+            'rolling': {
+                'enabled': self.rolling_enabled,
+                'interval_ms': self.interval_seconds * 1000,
+                'samples': self.rolling.samples,
+                'distinct_stacks': len(self.rolling.wall),
+                'stages': self.rolling.stage_summary()
+            },
+            'request_interval_ms': self.request_interval_seconds * 1000,
+            'cpu_supported': _thread_cpu_clock(threading.get_ident()) is not None,
+            'profiles': profiles
+        }
+
+
+# Global profiler - rolling sampler được start trong lifespan nếu PROFILING_ENABLED
+profiler = SamplingProfiler(
+    interval_ms=settings.profiling_interval_ms,
+    request_interval_ms=settings.profiling_request_interval_ms,
+    max_profiles=settings.profiling_max_profiles
+)
@@ -8,6 +8,7 @@ Tích hợp:
 """
 
 import logging
+import threading
 import time
 import uuid
 import numpy as np
@@ -21,10 +22,47 @@ from .reranker import RerankerService
 from .clarification import ClarificationService
 from .router import QueryRouter, RouterBasedQueryService
 from .context import ContextExpander
+from .indexing import IncrementalIndexer
+from .snapshot import SnapshotManager
+from .tracing import tracer
+from .events import events
+from .embedding_cache import query_embedding_cache, reference_embedding_cache
+from .pending_resolution import PENDING_RESOLUTION_KEY, build_pending_resolution, take_pending_resolution, select_nucleus
+from .structured_answers import structured_answers
+from .cancellation import RequestCancelled, check_cancelled, current_cancel_event, record_cancellation
+from .deadline import RequestBudget, budget_scope, current_budget, resolve_deadline_ms, degradation_policy
+from .search_k import search_k_controller, static_search_k, CONSENSUS_CANDIDATES
+from .coalescing import single_flight, flight_key, record_session_update
+from .answer_cache import answer_cache, answer_fingerprint
+from .generation_scheduler import GenerationQueueFull, GenerationTimeout
+from .metrics import registry, record_rerank_pairs, REQUESTS, INFLIGHT_REQUESTS, ROUTING_CONFIDENCE, DEADLINE_EXCEEDED
 from ..core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# System prompt của answer generation - thuộc fingerprint của answer cache (đổi prompt -> câu trả lời cũ hết hiệu lực)
+ANSWER_SYSTEM_PROMPT = """Bạn là trợ lý AI chuyên về pháp luật Việt Nam.
+
+🚨 QUY TẮC BẮT BUỘC - KHÔNG ĐƯỢC VI PHẠM:
+1. CHỈ trả lời dựa CHÍNH XÁC trên thông tin CÓ TRONG tài liệu
+2. Trả lời NGẮN GỌN (tối đa 9-10 câu)
+3. KHÔNG tự sáng tạo thông tin không có trong tài liệu
+4. Nếu thông tin không có trong tài liệu, hãy trả lời: "Tài liệu không đề cập đến vấn đề này."
+
+🎯 CÁC LOẠI THÔNG TIN QUAN TRỌNG CẦN CHÚ Ý:
+- PHÍ/LỆ PHÍ: Tìm "fee_text", "fee_vnd" - nêu rõ miễn phí hoặc số tiền cụ thể
+- THỜI GIAN: Tìm "processing_time_text" - nêu rõ thời gian xử lý
+- CƠ QUAN: Tìm "executing_agency" - nêu rõ nơi thực hiện thủ tục  
+- FORM MẪU: Tìm "has_form" - nêu có/không có form mẫu
+- ĐIỀU KIỆN: Tìm "requirements_conditions" - nêu điều kiện cần đáp ứng
+- MÃ THỦ TỤC: Tìm "code" - mã quy trình
+
+ĐỊNH DẠNG TRẢ LỜI:
+- Câu trả lời ngắn gọn, chính xác
+- Ưu tiên thông tin user hỏi nhưng có thể bổ sung thông tin liên quan
+- Dẫn chứng từ tài liệu nếu có"""
+
+
 def convert_numpy_types(obj: Any) -> Any:
     """Convert numpy types to Python native types for JSON serialization"""
     if isinstance(obj, np.ndarray):
@@ -91,7 +129,11 @@ class OptimizedChatSession:
 
         # Nếu độ tin cậy hiện tại không đủ cao VÀ ngữ cảnh trước đó đủ tốt -> Ghi đè
         if current_confidence < VERY_HIGH_CONFIDENCE_GATE and self.last_successful_confidence >= MIN_CONTEXT_CONFIDENCE:
-            logger.info(f"🔥 STATEFUL ROUTER: Ghi đè vì current_confidence ({current_confidence:.3f}) < {VERY_HIGH_CONFIDENCE_GATE} và context_confidence ({self.last_successful_confidence:.3f}) >= {MIN_CONTEXT_CONFIDENCE}")
+            events.record(
+                "stateful_override",
+                current_confidence=current_confidence,
+                context_confidence=self.last_successful_confidence
+            )
             return True
 
         return False
@@ -197,14 +239,19 @@ class RAGService:
         self,
         documents_dir: str,
         vectordb_service: VectorDBService,
-        llm_service: LLMService
+        llm_service: LLMService,
+        index_components: Optional[Dict[str, Any]] = None,
+        reranker_service: Optional[RerankerService] = None
     ):
         self.documents_dir = documents_dir
-        self.vectordb_service = vectordb_service
         self.llm_service = llm_service
         
         # Initialize supporting services
-        self._initialize_services()
+        # index_components / reranker_service: đã được StartupOrchestrator load song song từ trước
+        self._initialize_services(vectordb_service, index_components, reranker_service)
+        
+        # Chỉ cho phép 1 incremental re-index chạy tại 1 thời điểm
+        self._reindex_lock = threading.Lock()
         
         # Chat sessions management
         self.chat_sessions: Dict[str, OptimizedChatSession] = {}
@@ -217,42 +264,91 @@ class RAGService:
             "avg_response_time": 0.0
         }
         
+        # Queue depths / sessions cho OpenMetrics exporter (tính lúc scrape)
+        registry.register_collector("rag_service", self._collect_metrics)
+        
+        # Answer cache chỉ dùng câu trả lời sinh bởi cùng LLM + prompt
+        answer_cache.bind(answer_fingerprint(llm_service, ANSWER_SYSTEM_PROMPT))
+        
         logger.info("✅ Optimized Enhanced RAG Service initialized")
         
-    def _initialize_services(self):
+    def _initialize_services(
+        self,
+        vectordb_service: VectorDBService,
+        index_components: Optional[Dict[str, Any]] = None,
+        reranker_service: Optional[RerankerService] = None
+    ):
         """Khởi tạo các service hỗ trợ với Enhanced Smart Router"""
         try:
-            # Enhanced Smart Query Router với Example Questions Database
-            embedding_model = self.vectordb_service.embedding_model
-            if embedding_model is None:
+            if vectordb_service.embedding_model is None:
                 raise ValueError("VectorDB embedding model not initialized")
-            self.smart_router = QueryRouter(embedding_model=embedding_model)
-            logger.info("✅ Enhanced Smart Query Router initialized")
+            
+            # Router / Vector DB / Context Expansion nằm trong versioned snapshot (hot-reload được)
+            if index_components is None:
+                index_components = self._build_index_snapshot(vectordb_service)
+            self.snapshots = SnapshotManager(
+                builder=self._build_index_snapshot,
+                initial_components=index_components
+            )
+            logger.info("✅ Index snapshot v1 initialized (router + vector DB + context expansion)")
             
             # Reranker Service (GPU)
-            self.reranker_service = RerankerService()
+            self.reranker_service = reranker_service or RerankerService()
             logger.info("✅ Reranker Service initialized (GPU)")
             
-            # Router-based Ambiguous Query Service (CPU)
-            self.ambiguous_service = RouterBasedQueryService(
-                router=self.smart_router
-            )
-            logger.info("✅ Router-based Ambiguous Query Service initialized (CPU)")
-            
             # Smart Clarification Service
             self.clarification_service = ClarificationService()
             logger.info("✅ Smart Clarification Service initialized")
             
-            # Enhanced Context Expansion Service  
-            self.context_expansion_service = ContextExpander(
-                vectordb_service=self.vectordb_service,
-                documents_dir=self.documents_dir
-            )
-            logger.info("✅ Enhanced Context Expansion Service initialized")
-            
         except Exception as e:
             logger.error(f"Error initializing services: {e}")
             raise
+    
+    def _build_index_snapshot(self, vectordb_service: Optional[VectorDBService] = None) -> Dict[str, Any]:
+        """Build bộ components phụ thuộc dữ liệu index - dùng cho startup và hot-reload"""
+        if vectordb_service is None:
+            # Reload: client Chroma + collection handles mới, dùng chung embedding model đã load
+            vectordb_service = self.snapshots.current.get('vectordb_service').spawn_snapshot()
+        
+        # Enhanced Smart Query Router với Example Questions Database
+        smart_router = QueryRouter(embedding_model=vectordb_service.embedding_model)
+        smart_router.seed_query_embedding_cache()
+        logger.info("✅ Enhanced Smart Query Router initialized")
+        
+        # Router-based Ambiguous Query Service (CPU)
+        ambiguous_service = RouterBasedQueryService(router=smart_router)
+        logger.info("✅ Router-based Ambiguous Query Service initialized (CPU)")
+        
+        # Enhanced Context Expansion Service
+        context_expansion_service = ContextExpander(
+            vectordb_service=vectordb_service,
+            documents_dir=self.documents_dir
+        )
+        logger.info("✅ Enhanced Context Expansion Service initialized")
+        
+        return {
+            'vectordb_service': vectordb_service,
+            'smart_router': smart_router,
+            'ambiguous_service': ambiguous_service,
+            'context_expansion_service': context_expansion_service
+        }
+    
+    # Index components - luôn lấy từ snapshot request hiện tại đang pin
+    @property
+    def vectordb_service(self) -> VectorDBService:
+        return self.snapshots.active().get('vectordb_service')
+    
+    @property
+    def smart_router(self) -> QueryRouter:
+        return self.snapshots.active().get('smart_router')
+    
+    @property
+    def ambiguous_service(self) -> RouterBasedQueryService:
+        return self.snapshots.active().get('ambiguous_service')
+    
+    @property
+    def context_expansion_service(self) -> ContextExpander:
+        return self.snapshots.active().get('context_expansion_service')
             
     def create_session(self, metadata: Optional[Dict[str, Any]] = None) -> str:
         """Tạo session chat mới"""
@@ -303,7 +399,73 @@ class RAGService:
         logger.info(f"🧹 Reset context for session: {session_id}")
         return True
         
+    @tracer.traced("query")
     def process_query(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        reranker_k: int = 10,
+        llm_k: int = 5,
+        threshold: float = 0.7,
+        forced_collection: Optional[str] = None,
+        forced_document_title: Optional[str] = None,
+        pending_resolution: Optional[Dict[str, Any]] = None,
+        deadline_ms: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Query chính - pin index snapshot cho suốt request (hot-reload không ảnh hưởng request đang chạy).
+        deadline_ms: latency budget (None -> REQUEST_DEADLINE_MS), pipeline tự giảm chất lượng để kịp deadline
+        """
+        budget, owns_budget = self._request_budget(deadline_ms)
+        with events.request("query", query=query[:200]), \
+                INFLIGHT_REQUESTS.track_inprogress(endpoint="query"), self.snapshots.acquire(), budget_scope(budget):
+            try:
+                result = self._process_query(
+                    query,
+                    session_id=session_id,
+                    reranker_k=reranker_k,
+                    llm_k=llm_k,
+                    threshold=threshold,
+                    forced_collection=forced_collection,
+                    forced_document_title=forced_document_title,
+                    pending_resolution=pending_resolution
+                )
+            except RequestCancelled as e:
+                # Client đã disconnect - không còn ai đọc câu trả lời
+                events.annotate(outcome="cancelled", cancelled_stage=e.stage)
+                REQUESTS.inc(endpoint="query", outcome="cancelled")
+                record_cancellation(e)
+                raise
+            except GenerationQueueFull:
+                events.annotate(outcome="overloaded")
+                REQUESTS.inc(endpoint="query", outcome="overloaded")
+                raise
+            events.annotate(outcome=result.get("type", "unknown"))
+            self._attach_budget(result, budget, owns_budget, endpoint="query")
+        REQUESTS.inc(endpoint="query", outcome=result.get("type", "unknown"))
+        return result
+    
+    @staticmethod
+    def _request_budget(deadline_ms: Optional[float]) -> Tuple[Optional[RequestBudget], bool]:
+        """(budget, owns_budget) - request lồng nhau (clarification -> process_query) dùng chung budget bên ngoài"""
+        budget = current_budget()
+        if budget is not None:
+            return budget, False
+        deadline_ms = resolve_deadline_ms(deadline_ms)
+        return (RequestBudget(deadline_ms) if deadline_ms > 0 else None), True
+    
+    @staticmethod
+    def _attach_budget(result: Dict[str, Any], budget: Optional[RequestBudget], owns_budget: bool, endpoint: str):
+        """Ghi budget + các degradations đã áp dụng vào response"""
+        if budget is None:
+            return
+        result["budget"] = budget.to_dict()
+        if owns_budget:
+            events.annotate(deadline_ms=budget.deadline_ms, degradations=[d['action'] for d in budget.degradations])
+            if result["budget"]["exceeded"]:
+                DEADLINE_EXCEEDED.inc(endpoint=endpoint)
+    
+    def _process_query(
         self,
         query: str,
         session_id: Optional[str] = None,
@@ -311,7 +473,8 @@ class RAGService:
         llm_k: int = 5,
         threshold: float = 0.7,
         forced_collection: Optional[str] = None,  # ⚡ THÊM THAM SỐ ANTI-LOOP
-        forced_document_title: Optional[str] = None  # 🔥 NEW: Force exact document filtering
+        forced_document_title: Optional[str] = None,  # 🔥 NEW: Force exact document filtering
+        pending_resolution: Optional[Dict[str, Any]] = None  # ⚡ Document đã chọn qua clarification (pending_resolution.py)
     ) -> Dict[str, Any]:
         """
         Query chính với tất cả tối ưu hóa - THIẾT KẾ GỐC: FULL DOCUMENT EXPANSION
@@ -330,37 +493,38 @@ class RAGService:
         self.metrics["total_queries"] += 1
         
         try:
-            # Get or create session
-            if session_id:
-                session = self.get_session(session_id)
-                if not session:
-                    # Create new session with provided ID
-                    session = OptimizedChatSession(
-                        session_id=session_id,
-                        created_at=time.time(),
-                        last_accessed=time.time(),
-                        metadata={}
-                    )
-                    self.chat_sessions[session_id] = session
-                    logger.info(f"🆕 Created new session with provided ID: {session_id}")
-            else:
-                session_id = self.create_session()
-                session = self.get_session(session_id)
+            with tracer.span("session"):
+                # Get or create session
+                if session_id:
+                    session = self.get_session(session_id)
+                    if not session:
+                        # Create new session with provided ID
+                        session = OptimizedChatSession(
+                            session_id=session_id,
+                            created_at=time.time(),
+                            last_accessed=time.time(),
+                            metadata={}
+                        )
+                        self.chat_sessions[session_id] = session
+                        events.record("session_created", session_id=session_id)
+                else:
+                    session_id = self.create_session()
+                    session = self.get_session(session_id)
                 
-            logger.info(f"Processing query in session {session_id}: {query[:50]}...")
+            events.annotate(session_id=session_id)
             
             # Check for preserved document context from manual input
             if not forced_document_title and not forced_collection and session:
                 preserved_document = session.metadata.get('preserved_document')
                 if preserved_document:
-                    logger.info(f"🔄 Found preserved document context: {preserved_document['title']}")
+                    events.record("preserved_document", title=preserved_document['title'], collection=preserved_document['collection'])
                     forced_collection = preserved_document['collection']
                     forced_document_title = preserved_document['title']
             
             # Step 1: Enhanced Smart Query Routing với MULTI-LEVEL Confidence Processing + Stateful Router
             if forced_collection:
                 # � FORCED ROUTING: Dành cho clarification hoặc debug
-                logger.info(f"⚡ Forced routing to collection: {forced_collection} (from clarification)")
+                events.record("forced_routing", collection=forced_collection, document_title=forced_document_title)
                 routing_result = {
                     "target_collection": forced_collection,
                     "confidence": 0.95,  # High confidence cho forced routing
@@ -368,70 +532,186 @@ class RAGService:
                 }
                 # Get confidence level from routing result for further processing
                 confidence_level = routing_result.get('confidence_level', 'forced_high')
+                tracer.set_label('confidence_level', confidence_level)
+                ROUTING_CONFIDENCE.inc(confidence_level=confidence_level)
                 best_collections = [forced_collection]
                 inferred_filters = {}
                 
                 # 🔥 NEW: Add document title filter if specified
                 if forced_document_title:
                     inferred_filters = {"document_title": forced_document_title}
-                    logger.info(f"🎯 Forced document filter: {forced_document_title}")
                 
             else:
                 # 🧠 SMART ROUTING: Sử dụng router bình thường
-                routing_result = self.smart_router.route_query(query, session)
+                with tracer.span("routing"):
+                    routing_result = self.smart_router.route_query(query, session)
                 confidence_level = routing_result.get('confidence_level', 'low')
+                tracer.set_label('confidence_level', confidence_level)
+                ROUTING_CONFIDENCE.inc(confidence_level=confidence_level)
                 was_overridden = routing_result.get('was_overridden', False)
                 
-                logger.info(f"Router confidence: {confidence_level} (score: {routing_result['confidence']:.3f})")
-                if was_overridden:
-                    logger.info(f"🔥 Session-based confidence override applied!")
+                events.record(
+                    "routing",
+                    confidence_level=confidence_level,
+                    score=float(routing_result['confidence']),
+                    target_collection=routing_result.get('target_collection'),
+                    overridden=was_overridden
+                )
                 
                 if confidence_level in ['high', 'override_high', 'high_followup']:
                     # HIGH CONFIDENCE (including overridden & follow-up) - Route trực tiếp
                     target_collection = routing_result['target_collection']
                     inferred_filters = routing_result.get('inferred_filters', {})
                     best_collections = [target_collection] if target_collection else [settings.chroma_collection_name]
-                    logger.info(f"✅ HIGH CONFIDENCE routing to: {target_collection}")
                     
                 elif confidence_level in ['low-medium', 'override_medium', 'medium_followup']:
                     # MEDIUM CONFIDENCE (including overridden & follow-up) - Route với caution
                     target_collection = routing_result['target_collection']
                     inferred_filters = routing_result.get('inferred_filters', {})
                     best_collections = [target_collection] if target_collection else [settings.chroma_collection_name]
-                    logger.info(f"⚠️ MEDIUM CONFIDENCE routing to: {target_collection}")
                     
                 else:
                     # TẤT CẢ CONFIDENCE < THRESHOLD - Hỏi lại user, không route
-                    logger.info(f"🤔 CONFIDENCE KHÔNG ĐỦ CAO ({confidence_level}) - hỏi lại user thay vì route")
+                    events.record("clarification_triggered", reason="router_confidence")
                     return self._generate_smart_clarification(routing_result, query, session_id, start_time)
             
-            # Step 2: Focused Search với ĐỘNG BROAD_SEARCH_K dựa trên router confidence
-            # 🚀 PERFORMANCE OPTIMIZATION: Giảm số documents cần rerank
-            dynamic_k = settings.broad_search_k  # default 12
-            if confidence_level in ['high', 'high_followup']:
-                dynamic_k = max(8, settings.broad_search_k - 4)  # Router tự tin → ít docs hơn
-                logger.info(f"🎯 HIGH CONFIDENCE: Giảm broad_search_k xuống {dynamic_k}")
-            elif confidence_level in ['low-medium', 'override_medium', 'medium_followup']:
-                dynamic_k = min(15, settings.broad_search_k + 3)  # Router không chắc → nhiều docs hơn
-                logger.info(f"🔍 MEDIUM CONFIDENCE: Tăng broad_search_k lên {dynamic_k}")
-            else:
-                logger.info(f"📊 DEFAULT/FALLBACK: Sử dụng broad_search_k={dynamic_k}")
+            # ⚡ PENDING RESOLUTION: document đã chọn qua clarification -> nucleus từ chunk ids đã lưu,
+            # bỏ qua search + rerank (expansion chỉ cần file của nucleus, là cùng document đó)
+            if pending_resolution and forced_collection:
+                with tracer.span("pending_resolution"):
+                    nucleus_chunks = self._nucleus_from_pending(query, forced_collection, pending_resolution)
+                events.record(
+                    "pending_resolution",
+                    hit=bool(nucleus_chunks),
+                    document_title=pending_resolution.get('document_title'),
+                    chunks=len(pending_resolution.get('chunk_ids', []))
+                )
+                if nucleus_chunks:
+                    return self._answer_with_nucleus(
+                        query=query,
+                        session=session,
+                        session_id=session_id,
+                        nucleus_chunks=nucleus_chunks,
+                        routing_result=routing_result,
+                        best_collections=best_collections,
+                        start_time=start_time
+                    )
+            
+            # ⚡ SINGLE-FLIGHT: câu hỏi + routing trùng với request đang chạy -> dùng chung 1 lần pipeline
+            return self._run_coalesced(
+                query=query,
+                session=session,
+                session_id=session_id,
+                start_time=start_time,
+                confidence_level=confidence_level,
+                best_collections=best_collections,
+                inferred_filters=inferred_filters,
+                forced_document_title=forced_document_title,
+                pipeline=lambda: self._search_and_answer(
+                    query=query,
+                    session=session,
+                    session_id=session_id,
+                    routing_result=routing_result,
+                    confidence_level=confidence_level,
+                    best_collections=best_collections,
+                    inferred_filters=inferred_filters,
+                    start_time=start_time
+                )
+            )
+            
+        except (RequestCancelled, GenerationQueueFull):
+            raise
+        except Exception as e:
+            logger.error(f"Error in enhanced query: {e}")
+            return {
+                "type": "error",
+                "error": str(e),
+                "session_id": session_id,
+                "processing_time": time.time() - start_time
+            }
             
+    def _run_coalesced(
+        self,
+        query: str,
+        session: Optional[OptimizedChatSession],
+        session_id: str,
+        start_time: float,
+        confidence_level: str,
+        best_collections: List[str],
+        inferred_filters: Dict[str, Any],
+        forced_document_title: Optional[str],
+        pipeline
+    ) -> Dict[str, Any]:
+        """
+        Chạy pipeline qua single-flight: request trùng key đang chạy -> chờ và nhận bản copy kết quả,
+        rồi áp dụng session updates của flight lên session của request này
+        """
+        if not single_flight.enabled or session is None:
+            return pipeline()
+        # Prompt dùng lượt hỏi-đáp gần nhất (answer rút gọn 100 ký tự) -> phải giống nhau mới dùng chung
+        last_turn = None
+        if session.query_history:
+            last_turn = (session.query_history[-1]['query'], session.query_history[-1]['answer'][:100])
+        key = flight_key(query, confidence_level, best_collections, inferred_filters, forced_document_title, last_turn)
+        
+        wait_start = time.perf_counter()
+        result, flight = single_flight.execute(key, pipeline)
+        if flight is None:
+            return result
+        
+        for update, details in flight.session_updates:
+            if 'query' in details:
+                details = dict(details, query=query)
+            getattr(self, self.SESSION_UPDATES[update])(session, **details)
+        result["session_id"] = session_id
+        result["processing_time"] = time.time() - start_time
+        result["coalesced"] = True
+        events.record(
+            "coalesced",
+            key=key[:12],
+            participants=flight.participants,
+            wait_ms=round((time.perf_counter() - wait_start) * 1000.0, 1)
+        )
+        return result
+    
+    def _search_and_answer(
+        self,
+        query: str,
+        session: Optional[OptimizedChatSession],
+        session_id: str,
+        routing_result: Dict[str, Any],
+        confidence_level: str,
+        best_collections: List[str],
+        inferred_filters: Dict[str, Any],
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Step 2-6: search + rerank + expansion + generation - phần pipeline dùng chung khi coalesce"""
+
+        # Step 2: Focused Search với ĐỘNG BROAD_SEARCH_K dựa trên router confidence
+        # 🚀 PERFORMANCE OPTIMIZATION: Giảm số documents cần rerank
+        static_k = static_search_k(confidence_level)
+        
+        # 📏 Adaptive k: vị trí nucleus đã học theo confidence level + các collections được search
+        # (cùng 1 k cho cả top 2 collections, nucleus có thể nằm ở collection thứ 2 -> bucket theo cả cặp)
+        search_k_collection = "+".join(best_collections[:2]) or None
+        dynamic_k, search_k_mode = search_k_controller.choose_k(confidence_level, search_k_collection, static_k)
+        
+        # ⏳ Latency budget: ít candidates hơn nếu không đủ thời gian rerank
+        budget = current_budget()
+        dynamic_k = degradation_policy.search_k(dynamic_k, budget)
+        events.record("search_k", mode=search_k_mode, static_k=static_k, k=dynamic_k)
+        
+        check_cancelled("search")
+        with tracer.span("search"), degradation_policy.measure("search", "full"):
             broad_search_results = []
             for collection_name in best_collections[:2]:  # Limit to top 2 collections
                 try:
                     # ✅ CRITICAL FIX: Pass smart filters to vector search với dynamic K
-                    # 🔍 DEBUG: Log filter trước khi tìm kiếm để debug vấn đề filter bị "đánh rơi"
-                    logger.info(f"🔍 Chuẩn bị tìm kiếm với filter: {inferred_filters}")
-                    
                     # 🔥 ADAPTIVE THRESHOLD: Hạ threshold khi có filter vì filter đã đảm bảo relevance
                     adaptive_threshold = settings.similarity_threshold
                     if inferred_filters:
                         adaptive_threshold = max(0.2, settings.similarity_threshold * 0.5)  # Hạ threshold khi có filter
-                        logger.info(f"🎯 ADAPTIVE THRESHOLD: {settings.similarity_threshold} -> {adaptive_threshold} (có filter)")
-                    else:
-                        logger.info(f"📊 STANDARD THRESHOLD: {adaptive_threshold} (không có filter)")
-                    
+                
                     results = self.vectordb_service.search_in_collection(
                         collection_name=collection_name,
                         query=query,
@@ -439,53 +719,72 @@ class RAGService:
                         similarity_threshold=adaptive_threshold,
                         where_filter=inferred_filters if inferred_filters else None
                     )
-                    
-                    for result in results:
+                
+                    for rank, result in enumerate(results, start=1):
                         result["collection"] = collection_name
-                        
-                    broad_search_results.extend(results)
+                        result["vector_rank"] = rank  # Vị trí trong collection - adaptive search k học từ đây
                     
+                    broad_search_results.extend(results)
+                    # Filter được log cùng kết quả để debug vấn đề filter bị "đánh rơi"
+                    events.record(
+                        "search",
+                        collection=collection_name,
+                        k=dynamic_k,
+                        threshold=adaptive_threshold,
+                        filters=inferred_filters or None,
+                        results=len(results)
+                    )
+                
                 except Exception as e:
                     logger.warning(f"Error searching in collection {collection_name}: {e}")
+        
+        events.record("candidates", count=len(broad_search_results))
+        
+        if not broad_search_results:
+            return {
+                "type": "no_results",
+                "message": "Không tìm thấy thông tin liên quan đến câu hỏi của bạn.",
+                "session_id": session_id,
+                "processing_time": time.time() - start_time
+            }
             
-            logger.info(f"📊 Dynamic search: {len(broad_search_results)} docs (k={dynamic_k}, confidence={confidence_level})")
-            
-            if not broad_search_results:
-                return {
-                    "type": "no_results",
-                    "message": "Không tìm thấy thông tin liên quan đến câu hỏi của bạn.",
-                    "session_id": session_id,
-                    "processing_time": time.time() - start_time
-                }
-                
-            logger.info(f"Found {len(broad_search_results)} candidate chunks")
-            
-            # Step 4: SEQUENTIAL PROCESSING để tối ưu VRAM (6GB limit)
-            # Phase 1: Reranking - Load Reranker, Unload LLM nếu cần
-            logger.info("🔄 PHASE 1: Reranking (GPU) - Optimizing VRAM usage...")
-            
-            # Temporarily unload LLM để đảm bảo VRAM cho reranker
-            if hasattr(self.llm_service, 'unload_model'):
-                self.llm_service.unload_model()
-            
-            if settings.use_reranker and len(broad_search_results) > 1:
+        # Step 4: SEQUENTIAL PROCESSING để tối ưu VRAM (6GB limit)
+        # Phase 1: Reranking - Load Reranker, Unload LLM nếu cần
+        
+        check_cancelled("rerank")
+        # ⏳ Latency budget: consensus -> single best -> bỏ reranker
+        rerank_mode = "skip"
+        if settings.use_reranker and len(broad_search_results) > 1:
+            rerank_mode = degradation_policy.rerank_mode(
+                len(broad_search_results), consensus=len(broad_search_results) >= CONSENSUS_CANDIDATES, budget=budget
+            )
+        
+        # Temporarily unload LLM để đảm bảo VRAM cho reranker (bỏ reranker vì budget -> giữ LLM)
+        if rerank_mode != "skip" or budget is None:
+            with tracer.span("llm_unload"):
+                if hasattr(self.llm_service, 'unload_model'):
+                    self.llm_service.unload_model()
+        
+        answer_confidence = None
+        with tracer.span("rerank"):
+            if rerank_mode != "skip":
                 # ✅ ENHANCED RERANKING: Consensus-based document selection for better accuracy
                 docs_to_rerank = broad_search_results  # RERANK ALL DOCUMENTS
-                logger.info(f"🎯 ENHANCED RERANKING - Analyzing {len(broad_search_results)} candidates for consensus")
-                
-                if len(broad_search_results) >= 5:
+                rerank_start = time.perf_counter()
+            
+                if rerank_mode == "consensus":
                     # ✅ NEW METHOD: Consensus-based document selection (more robust)
                     consensus_document = self.reranker_service.get_consensus_document(
                         query=query,
                         documents=docs_to_rerank,
-                        top_k=5,  # Analyze top 5 candidates
+                        top_k=CONSENSUS_CANDIDATES,  # Analyze top 5 candidates
                         consensus_threshold=0.6,  # 3/5 = 60%
                         min_rerank_score=-0.5  # Adjusted for legal documents
                     )
-                    
+                
+                    events.record("rerank_strategy", strategy="consensus", consensus_found=consensus_document is not None)
                     if consensus_document:
                         nucleus_chunks = [consensus_document]
-                        logger.info(f"✅ CONSENSUS FOUND: Selected document based on chunk agreement")
                     else:
                         # Fallback to traditional single best document
                         logger.warning("❌ NO CONSENSUS: Falling back to traditional single best document")
@@ -498,7 +797,7 @@ class RAGService:
                         )
                 else:
                     # Not enough candidates for consensus analysis
-                    logger.info(f"INSUFFICIENT CANDIDATES ({len(broad_search_results)}) - Using traditional reranking")
+                    events.record("rerank_strategy", strategy="single_best", candidates=len(broad_search_results))
                     nucleus_chunks = self.reranker_service.rerank_documents(
                         query=query,
                         documents=docs_to_rerank,
@@ -506,51 +805,128 @@ class RAGService:
                         router_confidence=routing_result.get('confidence', 0.0),
                         router_confidence_level=routing_result.get('confidence_level', 'low')
                     )
-                
+            
                 # Unload reranker sau khi hoàn thành để giải phóng VRAM
                 if hasattr(self.reranker_service, 'unload_model'):
                     self.reranker_service.unload_model()
-                
+                degradation_policy.observe(
+                    "rerank", rerank_mode, (time.perf_counter() - rerank_start) * 1000.0, units=len(docs_to_rerank)
+                )
+                record_rerank_pairs(rerank_mode, len(docs_to_rerank))
+                if nucleus_chunks:
+                    # Consensus xét cả top 5 sau rerank -> học vị trí xa nhất trong số đó
+                    nucleus_rank = nucleus_chunks[0].get('decisive_vector_rank') or nucleus_chunks[0].get('vector_rank')
+                    if nucleus_rank:
+                        search_k_controller.observe(
+                            confidence_level, search_k_collection, nucleus_rank, searched_k=dynamic_k, static_k=static_k
+                        )
+            
                 # 🚨 INTELLIGENT CONFIDENCE CHECK - Kiểm tra COMBINED confidence trước khi gọi LLM
                 router_confidence = routing_result.get('confidence', 0.0)
                 best_score = nucleus_chunks[0].get('rerank_score', 0) if nucleus_chunks and len(nucleus_chunks) > 0 else 0.0
-                
+            
                 # Calculate combined confidence score
                 combined_confidence = (router_confidence * 0.4 + best_score * 0.6)  # Reranker có trọng số cao hơn
-                logger.info(f"🎯 Combined Confidence: {combined_confidence:.4f} (Router: {router_confidence:.4f}, Rerank: {best_score:.4f})")
-                
+                answer_confidence = combined_confidence
+                events.record(
+                    "combined_confidence",
+                    combined=float(combined_confidence),
+                    router=float(router_confidence),
+                    rerank=float(best_score)
+                )
+            
                 # SMART CLARIFICATION THRESHOLD - Tránh câu trả lời sai lệch
                 CLARIFICATION_THRESHOLD = 0.3  # Điều chỉnh threshold này theo cần thiết
-                
+            
                 if combined_confidence < CLARIFICATION_THRESHOLD:
                     logger.warning(f"🚨 COMBINED CONFIDENCE QUÁ THẤP ({combined_confidence:.4f} < {CLARIFICATION_THRESHOLD}) - Kích hoạt Smart Clarification")
-                    
-                    return self._generate_smart_clarification(routing_result, query, session_id, start_time)
                 
-                if nucleus_chunks and len(nucleus_chunks) > 0:
-                    logger.info(f"Best rerank score: {best_score:.4f}")
-                    logger.info("🎯 PURE RERANKER MODE - No protective logic, full expansion strategy")
+                    return self._generate_smart_clarification(routing_result, query, session_id, start_time)
             
-                logger.info(f"Selected {len(nucleus_chunks)} nucleus chunk with rerank-based strategy")
+                # 🎯 PURE RERANKER MODE - No protective logic, full expansion strategy
             else:
                 nucleus_chunks = broad_search_results[:1]  # Fallback: lấy chunk tốt nhất theo vector similarity
-                
-            # Step 5: INTELLIGENT Context Expansion - Ưu tiên nucleus chunk + context liên quan
-            expanded_context = None
-            logger.info("🎯 INTELLIGENT CONTEXT EXPANSION - Ưu tiên nucleus chunk từ reranker")
-            self.metrics["context_expansions"] += 1
-            
-            # 🧠 SMART OPTIMIZATION: Ưu tiên nucleus chunk + context liên quan thay vì cắt ngẫu nhiên
-            # Logic: Luôn giữ nguyên nucleus chunk + thêm context xung quanh nếu còn chỗ
-            # Step 5: Context Expansion - THIẾT KẾ GỐC: FULL DOCUMENT
-            logger.info("Context expansion: Loading TOÀN BỘ DOCUMENT để đảm bảo ngữ cảnh pháp luật đầy đủ")
             
+        return self._answer_with_nucleus(
+            query=query,
+            session=session,
+            session_id=session_id,
+            nucleus_chunks=nucleus_chunks,
+            routing_result=routing_result,
+            best_collections=best_collections,
+            start_time=start_time,
+            answer_confidence=answer_confidence
+        )
+    
+
+    def _build_pending_resolution(self, session: OptimizedChatSession, collection: str, document_title: str) -> Optional[Dict[str, Any]]:
+        """Pending resolution cho document user vừa chọn - chunk ids xếp theo câu hỏi gốc của clarification"""
+        try:
+            query_vector = None
+            original_query = session.metadata.get('original_query')
+            if original_query and self.smart_router is not None:
+                # Đã encode ở bước chọn collection (similar-procedure lookup) -> hit reference LRU
+                query_vector = reference_embedding_cache.encode(self.smart_router.embedding_model, original_query)
+            return build_pending_resolution(self.vectordb_service, collection, document_title, query_vector)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not build pending resolution for '{document_title}': {e}")
+            return None
+    
+    def _nucleus_from_pending(self, query: str, collection: str, pending: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Nucleus chunk từ pending resolution ([] nếu chunks không còn trong index -> chạy pipeline đầy đủ)"""
+        chunks = self.vectordb_service.get_chunks_by_ids(collection, pending.get('chunk_ids', []), include_embeddings=True)
+        if not chunks:
+            return []
+        query_vector = None
+        if self.vectordb_service.embedding_model is not None:
+            # Câu hỏi gợi ý lấy nguyên văn từ router examples -> thường hit persistent tier, không encode
+            query_vector = query_embedding_cache.encode(self.vectordb_service.embedding_model, query)
+        return [select_nucleus(chunks, query_vector, pending)]
+    
+    @staticmethod
+    def _nucleus_document_title(nucleus_chunks: List[Dict[str, Any]]) -> str:
+        if not nucleus_chunks:
+            return ''
+        source = nucleus_chunks[0].get('source') or nucleus_chunks[0].get('metadata', {}).get('source') or {}
+        return source.get('document_title', '') if isinstance(source, dict) else ''
+    
+    def _answer_with_nucleus(
+        self,
+        query: str,
+        session: Optional[OptimizedChatSession],
+        session_id: str,
+        nucleus_chunks: List[Dict[str, Any]],
+        routing_result: Dict[str, Any],
+        best_collections: List[str],
+        start_time: float,
+        answer_confidence: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Step 5-6: context expansion (full document của nucleus) + generation + cập nhật session.
+        answer_confidence: combined router + reranker confidence (không rerank -> router confidence),
+        dùng cho structured answer
+        """
+        # Step 5: INTELLIGENT Context Expansion - Ưu tiên nucleus chunk + context liên quan
+        expanded_context = None
+        self.metrics["context_expansions"] += 1
+        
+        # 🧠 SMART OPTIMIZATION: Ưu tiên nucleus chunk + context liên quan thay vì cắt ngẫu nhiên
+        # Logic: Luôn giữ nguyên nucleus chunk + thêm context xung quanh nếu còn chỗ
+        # Step 5: Context Expansion - THIẾT KẾ GỐC: FULL DOCUMENT
+        
+        # ⏳ Latency budget: nucleus section thay vì toàn bộ document (prompt ngắn hơn)
+        budget = current_budget()
+        context_mode = degradation_policy.expansion_mode(budget)
+        
+        check_cancelled("context_expansion")
+        with tracer.span("context_expansion"), degradation_policy.measure("context_expansion", context_mode):
             expanded_context = self.context_expansion_service.expand_context_with_nucleus(
-                nucleus_chunks=nucleus_chunks
+                nucleus_chunks=nucleus_chunks,
+                include_full_document=context_mode == "full_document"
             )
-            
+        
             context_text = self._build_context_from_expanded(expanded_context)
-            
+        
             # ✅ ENHANCED: Smart context building với intent detection
             detected_intent = self._detect_specific_intent(query)
             if detected_intent and expanded_context.get('structured_metadata'):
@@ -559,121 +935,243 @@ class RAGService:
                     metadata=expanded_context['structured_metadata'],
                     full_text=context_text
                 )
-            
-            logger.info(f"Context expanded: {expanded_context['total_length']} chars from {len(expanded_context.get('source_documents', []))} documents")
-            if detected_intent:
-                logger.info(f"🎯 Detected intent: {detected_intent} - Applied smart context building")
-            
-            # Phase 2: LLM Generation - Load LLM cho generation phase
-            logger.info("🔄 PHASE 2: LLM Generation (GPU) - Loading LLM for final answer...")
-            
-            # Step 6: Generate Answer (GPU LLM)
-            if not session:
-                return {
-                    "type": "error",
-                    "error": "Session not found",
-                    "session_id": session_id,
-                    "processing_time": time.time() - start_time
-                }
-                
-            answer = self._generate_answer_with_context(
-                query=query,
-                context=context_text,
-                session=session
-            )
-            
-            # Update session history
-            session.query_history.append({
-                "query": query,
-                "answer": answer,
-                "timestamp": time.time(),
-                "nucleus_chunks_count": len(nucleus_chunks),
-                "context_length": len(context_text)
-            })
-            
-            # Keep only last 5 queries in session (giảm từ 10 để tiết kiệm memory)
-            if len(session.query_history) > 5:
-                session.query_history = session.query_history[-5:]
-            
-            # 🔥 Update session state for Stateful Router
-            # Chỉ update state khi routing thành công với confidence đủ tốt (0.78+)
-            if routing_result and routing_result.get('confidence', 0) >= 0.78:
-                target_collection = routing_result.get('target_collection')
-                if target_collection:
-                    rag_content = {
-                        "context_text": context_text,
-                        "nucleus_chunks": nucleus_chunks,
-                        "expanded_context": expanded_context,
-                        "collections": best_collections
-                    }
-                    
-                    # 🔧 FIX: Also preserve document information from successful queries
-                    enhanced_filters = routing_result.get('inferred_filters', {}).copy()
-                    if expanded_context and expanded_context.get('source_documents'):
-                        # Get the first/main document name
-                        source_docs = expanded_context['source_documents']
-                        if source_docs:
-                            main_doc = source_docs[0] if isinstance(source_docs, list) else str(source_docs)
-                            # Extract document title from path
-                            if isinstance(main_doc, str) and main_doc:
-                                doc_name = main_doc.split('\\')[-1].replace('.json', '') if '\\' in main_doc else main_doc
-                                enhanced_filters["source_file"] = doc_name
-                                # Also store in session metadata for persistence
-                                session.metadata["current_document"] = doc_name
-                    
-                    session.update_successful_routing(
-                        collection=target_collection, 
-                        confidence=routing_result.get('confidence', 0),
-                        filters=enhanced_filters,  # � Enhanced filters with document info
-                        rag_content=rag_content
-                    )
-                    logger.info(f"🔥 Updated session state: {target_collection} (confidence: {routing_result.get('confidence', 0):.3f})")
-                
-            processing_time = time.time() - start_time
-            self.metrics["avg_response_time"] = (
-                (self.metrics["avg_response_time"] * (self.metrics["total_queries"] - 1) + processing_time) 
-                / self.metrics["total_queries"]
+        
+            events.record(
+                "context",
+                chars=expanded_context['total_length'],
+                documents=len(expanded_context.get('source_documents', [])),
+                intent=detected_intent
             )
-            
-            return {
-                "type": "answer",
-                "answer": answer,
-                "context_info": {
-                    "nucleus_chunks": len(nucleus_chunks),
-                    "context_length": len(context_text),
-                    "source_collections": list(set(chunk.get("collection", "") for chunk in nucleus_chunks)),
-                    "source_documents": list(expanded_context.get("source_documents", [])) if expanded_context else []
-                },
-                "context_details": {
-                    "total_length": expanded_context.get("total_length", len(context_text)) if expanded_context else len(context_text),
-                    "expansion_strategy": expanded_context.get("expansion_strategy", "unknown") if expanded_context else "no_expansion",
-                    "source_documents": expanded_context.get("source_documents", []) if expanded_context else [],
-                    "nucleus_chunks_count": len(nucleus_chunks)
-                },
-                "session_id": session_id,
-                "processing_time": processing_time,
-                "routing_info": {
-                    "best_collections": best_collections,
-                    "target_collection": routing_result.get('target_collection'),
-                    "confidence": float(routing_result.get('confidence', 0.0)),
-                    "original_confidence": float(routing_result.get('original_confidence', 0.0)) if routing_result.get('original_confidence') is not None else None,
-                    "was_overridden": routing_result.get('was_overridden', False),
-                    "inferred_filters": routing_result.get('inferred_filters', {}),
-                    "confidence_level": routing_result.get('confidence_level', 'unknown'),
-                    "status": routing_result.get('status', 'routed')
-                }
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in enhanced query: {e}")
+        
+        # Phase 2: LLM Generation - Load LLM cho generation phase
+        
+        # Step 6: Generate Answer (GPU LLM)
+        if not session:
             return {
                 "type": "error",
-                "error": str(e),
+                "error": "Session not found",
                 "session_id": session_id,
                 "processing_time": time.time() - start_time
             }
             
+        # ⚡ STRUCTURED ANSWER: câu hỏi 1 trường metadata (phí, thời gian, cơ quan, biểu mẫu, điều kiện)
+        # trả lời từ structured metadata, không gọi LLM
+        structured_metadata = expanded_context.get('structured_metadata') or {}
+        if answer_confidence is None:
+            answer_confidence = float(routing_result.get('confidence', 0.0))
+        # ⏳ Latency budget không đủ cho generation: structured answer bất kể confidence, không thì giảm max_tokens
+        generation_plan = degradation_policy.generation_plan(settings.max_tokens, context_mode, budget)
+        structured = structured_answers.evaluate(
+            query=query,
+            metadata=structured_metadata,
+            document_title=structured_metadata.get('title') or self._nucleus_document_title(nucleus_chunks),
+            confidence=answer_confidence,
+            degraded=generation_plan['structured']
+        )
+        if structured['outcome'] == 'degraded':
+            budget.degrade("generation", "structured_answer", intent=structured['intent'])
+        if structured['intent']:
+            events.record(
+                "structured_answer",
+                intent=structured['intent'],
+                outcome=structured['outcome'],
+                confidence=float(answer_confidence),
+                audit=structured['audit']
+            )
+        
+        answer = structured['answer'] if structured['serve'] else None
+        llm_source = "llm"
+        if answer is None or structured['audit']:
+            # 💾 Answer cache: câu hỏi đầu session (prompt không có chat history) với cùng context
+            cache_key = answer_cache.key(query, context_text) if not session.query_history else None
+            llm_answer = answer_cache.get(cache_key) if cache_key else None
+            if llm_answer is not None:
+                llm_source = "cache"
+                events.record("answer_cache", outcome="hit")
+            elif cache_key and answer_cache.defer(cache_key, query, context_text):
+                # Bulk precompute (tools/precompute_answers.py): generation chạy sau theo batch
+                llm_answer = ""
+            else:
+                if generation_plan['max_tokens'] < settings.max_tokens:
+                    budget.degrade("generation", "cap_max_tokens", from_tokens=settings.max_tokens,
+                                   to_tokens=generation_plan['max_tokens'])
+                check_cancelled("generation")
+                generation_start = time.perf_counter()
+                with tracer.span("generation"):
+                    llm_answer = self._generate_answer_with_context(
+                        query=query,
+                        context=context_text,
+                        session=session,
+                        max_tokens=generation_plan['max_tokens'],
+                        cache_key=cache_key
+                    )
+                # Chỉ học chi phí generation đầy đủ (không tính lần bị cap / truncate / timeout)
+                if budget is None or not any(entry['stage'] == "generation" for entry in budget.degradations):
+                    degradation_policy.observe("generation", context_mode, (time.perf_counter() - generation_start) * 1000.0)
+            if structured['audit']:
+                audit = structured_answers.record_audit(query, structured, structured_metadata, llm_answer)
+                events.record("structured_answer_audit", **audit)
+            if answer is None:
+                answer = llm_answer
+        answer_source = "structured" if structured['serve'] else llm_source
+        
+        # Update session history + state cho Stateful Router
+        self._update_session(
+            session,
+            "answer",
+            query=query,
+            answer=answer,
+            nucleus_chunks=nucleus_chunks,
+            context_text=context_text,
+            expanded_context=expanded_context,
+            routing_result=routing_result,
+            best_collections=best_collections
+        )
+            
+        processing_time = time.time() - start_time
+        self.metrics["avg_response_time"] = (
+            (self.metrics["avg_response_time"] * (self.metrics["total_queries"] - 1) + processing_time) 
+            / self.metrics["total_queries"]
+        )
+        if not (structured['serve'] and structured['audit']):
+            # Audit samples chạy cả LLM - không tính vào latency của structured answers
+            structured_answers.observe_answer(answer_source, processing_time)
+        
+        return {
+            "type": "answer",
+            "answer": answer,
+            "answer_source": answer_source,
+            "context_info": {
+                "nucleus_chunks": len(nucleus_chunks),
+                "context_length": len(context_text),
+                "source_collections": list(set(chunk.get("collection", "") for chunk in nucleus_chunks)),
+                "source_documents": list(expanded_context.get("source_documents", [])) if expanded_context else []
+            },
+            "context_details": {
+                "total_length": expanded_context.get("total_length", len(context_text)) if expanded_context else len(context_text),
+                "expansion_strategy": expanded_context.get("expansion_strategy", "unknown") if expanded_context else "no_expansion",
+                "source_documents": expanded_context.get("source_documents", []) if expanded_context else [],
+                "nucleus_chunks_count": len(nucleus_chunks)
+            },
+            "session_id": session_id,
+            "processing_time": processing_time,
+            "routing_info": {
+                "best_collections": best_collections,
+                "target_collection": routing_result.get('target_collection'),
+                "confidence": float(routing_result.get('confidence', 0.0)),
+                "original_confidence": float(routing_result.get('original_confidence', 0.0)) if routing_result.get('original_confidence') is not None else None,
+                "was_overridden": routing_result.get('was_overridden', False),
+                "inferred_filters": routing_result.get('inferred_filters', {}),
+                "confidence_level": routing_result.get('confidence_level', 'unknown'),
+                "status": routing_result.get('status', 'routed')
+            }
+        }
+    
+    # Session updates theo tên - joiners của single-flight áp dụng lại lên session của họ
+    SESSION_UPDATES = {
+        "answer": "_record_answer_in_session",
+        "clarification": "_remember_clarification_context"
+    }
+    
+    def _update_session(self, session: OptimizedChatSession, update: str, **details):
+        getattr(self, self.SESSION_UPDATES[update])(session, **details)
+        record_session_update(update, details)
+    
+    def _record_answer_in_session(
+        self,
+        session: OptimizedChatSession,
+        query: str,
+        answer: str,
+        nucleus_chunks: List[Dict[str, Any]],
+        context_text: str,
+        expanded_context: Optional[Dict[str, Any]],
+        routing_result: Dict[str, Any],
+        best_collections: List[str]
+    ):
+        session.query_history.append({
+            "query": query,
+            "answer": answer,
+            "timestamp": time.time(),
+            "nucleus_chunks_count": len(nucleus_chunks),
+            "context_length": len(context_text)
+        })
+        
+        # Keep only last 5 queries in session (giảm từ 10 để tiết kiệm memory)
+        if len(session.query_history) > 5:
+            session.query_history = session.query_history[-5:]
+        
+        # 🔥 Update session state for Stateful Router
+        # Chỉ update state khi routing thành công với confidence đủ tốt (0.78+)
+        if routing_result and routing_result.get('confidence', 0) >= 0.78:
+            target_collection = routing_result.get('target_collection')
+            if target_collection:
+                rag_content = {
+                    "context_text": context_text,
+                    "nucleus_chunks": nucleus_chunks,
+                    "expanded_context": expanded_context,
+                    "collections": best_collections
+                }
+                
+                # 🔧 FIX: Also preserve document information from successful queries
+                enhanced_filters = routing_result.get('inferred_filters', {}).copy()
+                if expanded_context and expanded_context.get('source_documents'):
+                    # Get the first/main document name
+                    source_docs = expanded_context['source_documents']
+                    if source_docs:
+                        main_doc = source_docs[0] if isinstance(source_docs, list) else str(source_docs)
+                        # Extract document title from path
+                        if isinstance(main_doc, str) and main_doc:
+                            doc_name = main_doc.split('\\')[-1].replace('.json', '') if '\\' in main_doc else main_doc
+                            enhanced_filters["source_file"] = doc_name
+                            # Also store in session metadata for persistence
+                            session.metadata["current_document"] = doc_name
+                
+                session.update_successful_routing(
+                    collection=target_collection, 
+                    confidence=routing_result.get('confidence', 0),
+                    filters=enhanced_filters,  # � Enhanced filters with document info
+                    rag_content=rag_content
+                )
+                events.record("session_state_updated", collection=target_collection, confidence=float(routing_result.get('confidence', 0)))
+    
+    @staticmethod
+    def _remember_clarification_context(session: OptimizedChatSession, routing_result: Dict[str, Any], query: str):
+        # 🔧 STORE ROUTING CONTEXT: Save original routing info to session for Step 2→3 similarity matching
+        session.metadata['original_routing_context'] = routing_result
+        session.metadata['original_query'] = query
+        session.metadata.pop(PENDING_RESOLUTION_KEY, None)
+    
+    @tracer.traced("clarification")
     def handle_clarification(
+        self,
+        session_id: str,
+        selected_option: Dict[str, Any],
+        original_query: str,
+        deadline_ms: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Xử lý clarification - pin index snapshot cho suốt request (deadline_ms: như process_query)"""
+        budget, owns_budget = self._request_budget(deadline_ms)
+        with events.request("clarification", query=original_query[:200], session_id=session_id,
+                            action=selected_option.get('action')), \
+                INFLIGHT_REQUESTS.track_inprogress(endpoint="clarification"), self.snapshots.acquire(), \
+                budget_scope(budget):
+            try:
+                result = self._handle_clarification(session_id, selected_option, original_query)
+            except RequestCancelled as e:
+                events.annotate(outcome="cancelled", cancelled_stage=e.stage)
+                REQUESTS.inc(endpoint="clarification", outcome="cancelled")
+                record_cancellation(e)
+                raise
+            except GenerationQueueFull:
+                events.annotate(outcome="overloaded")
+                REQUESTS.inc(endpoint="clarification", outcome="overloaded")
+                raise
+            events.annotate(outcome=result.get("type", "unknown"))
+            self._attach_budget(result, budget, owns_budget, endpoint="clarification")
+        REQUESTS.inc(endpoint="clarification", outcome=result.get("type", "unknown"))
+        return result
+    
+    def _handle_clarification(
         self,
         session_id: str,
         selected_option: Dict[str, Any],  # 🔧 CHANGE: Nhận full option object thay vì string
@@ -697,33 +1195,16 @@ class RAGService:
             
         action = selected_option.get('action')
         collection = selected_option.get('collection')
+        tracer.set_label('clarification_action', action)
         
         if action == 'proceed_with_collection' and collection:
             # 🎯 GIAI ĐOẠN 2: User chọn collection, hiển thị documents để chọn
-            logger.info(f"🎯 Clarification Step 2: User selected collection '{collection}'. Showing documents.")
+            events.record("clarification_step", step="select_collection", collection=collection)
             
             try:
-                # Lấy danh sách documents trong collection này từ smart_router
-                collection_questions = self.smart_router.get_example_questions_for_collection(collection)
-                
-                # Extract unique documents from questions
-                collection_documents = {}
-                for question in collection_questions:
-                    source = question.get('source', '')
-                    if source:
-                        # Clean up source path to get document name
-                        doc_name = source.replace('.json', '').split('/')[-1]
-                        if '. ' in doc_name:
-                            doc_name = doc_name.split('. ', 1)[1]  # Remove numbering
-                        
-                        if doc_name not in collection_documents:
-                            collection_documents[doc_name] = {
-                                "filename": source,
-                                "title": doc_name,
-                                "description": f"Tài liệu về {doc_name}",
-                                "question_count": 0
-                            }
-                        collection_documents[doc_name]["question_count"] += 1
+                # Documents của collection: lookup trong clarification catalog (build sẵn cùng router cache)
+                with tracer.span("clarification_documents"):
+                    collection_documents = self.smart_router.clarification_catalog.documents(collection)
                 
                 if not collection_documents:
                     logger.warning(f"⚠️ No documents found in collection '{collection}'")
@@ -734,9 +1215,21 @@ class RAGService:
                         "processing_time": time.time() - start_time
                     }
                 
-                # Convert to list and limit to top 8 documents
-                document_list = list(collection_documents.values())
-                document_list = sorted(document_list, key=lambda x: x["question_count"], reverse=True)[:8]
+                # Thủ tục gần câu hỏi gốc nhất lên đầu (similar-procedure lookup), còn lại theo số câu hỏi
+                procedure_rank = {}
+                reference_query = session.metadata.get('original_query')
+                if reference_query:
+                    with tracer.span("similar_procedures"):
+                        similar = self.smart_router.get_similar_procedures_for_collection(
+                            collection, reference_query, top_k=8
+                        )
+                    procedure_rank = {item['source']: rank for rank, item in enumerate(similar) if item['similarity'] > 0}
+                
+                # Catalog đã xếp theo question_count, sort stable giữ thứ tự đó sau các thủ tục tương đồng; top 8
+                document_list = sorted(
+                    collection_documents,
+                    key=lambda x: procedure_rank.get(x["filename"], len(procedure_rank))
+                )[:8]
                 
                 # Tạo suggestions cho document selection
                 document_suggestions = []
@@ -797,22 +1290,14 @@ class RAGService:
             document_filename = selected_option.get('document_filename')
             document_title = selected_option.get('document_title')
             
-            logger.info(f"🎯 Clarification Step 2.5: User selected document '{document_title}' in collection '{collection}'. Generating question suggestions.")
+            events.record("clarification_step", step="select_document", collection=collection, document_title=document_title)
             
             try:
-                # Lấy tất cả questions trong collection và filter theo document
-                collection_questions = self.smart_router.get_example_questions_for_collection(collection)
-                
-                # Filter questions by document source
-                document_questions = []
-                for question in collection_questions:
-                    if question.get('source') and document_filename in question.get('source', ''):
-                        document_questions.append(question)
-                
-                if not document_questions:
-                    logger.warning(f"⚠️ No questions found for document {document_title}")
-                    # Fallback: Use all collection questions
-                    document_questions = collection_questions[:5]
+                # Câu hỏi gợi ý đã xếp hạng của document (catalog; không tìm thấy document -> 5 câu đầu collection)
+                with tracer.span("clarification_questions"):
+                    document_questions = self.smart_router.clarification_catalog.document_questions(
+                        collection, document_filename, document_title
+                    )
                 
                 # Create suggestions from document questions
                 suggestions = []
@@ -858,6 +1343,14 @@ class RAGService:
                     }
                 }
                 
+                # ⚡ Pending resolution: document đã chọn -> xác nhận câu hỏi gợi ý không cần search + rerank lại
+                session.metadata.pop(PENDING_RESOLUTION_KEY, None)
+                if settings.clarification_fast_path and document_title:
+                    with tracer.span("pending_resolution_build"):
+                        pending = self._build_pending_resolution(session, collection, document_title)
+                    if pending:
+                        session.metadata[PENDING_RESOLUTION_KEY] = pending
+                
                 # Update session state
                 session.metadata["routing_state"] = {
                     "collection": collection,
@@ -893,16 +1386,25 @@ class RAGService:
             source_file = selected_option.get('source_file')  # 🔥 NEW: For debugging
             
             if question_text and collection:
-                logger.info(f"🚀 Clarification Step 3→4: User selected question '{question_text}' in collection '{collection}'.")
-                if document_title:
-                    logger.info(f"🎯 Target document: '{document_title}' (source: {source_file})")
+                events.record(
+                    "clarification_step",
+                    step="select_question",
+                    collection=collection,
+                    question=question_text,
+                    document_title=document_title,
+                    source_file=source_file
+                )
+                
+                # Document đã chọn ở bước trước -> dùng lại retrieval state thay vì chạy lại search + rerank
+                pending = take_pending_resolution(session.metadata, collection, document_title)
                 
                 # Chạy RAG với câu hỏi ĐÃ ĐƯỢC LÀM RÕ và collection ĐÃ CHỈ ĐỊNH
                 return self.process_query(
                     query=question_text,  # 🔥 Dùng câu hỏi cụ thể, không phải original query mơ hồ
                     session_id=session_id,
                     forced_collection=collection,  # 🔥 Force routing to selected collection
-                    forced_document_title=document_title  # 🔥 NEW: Force exact document filtering
+                    forced_document_title=document_title,  # 🔥 NEW: Force exact document filtering
+                    pending_resolution=pending if settings.clarification_fast_path else None
                 )
             else:
                 return {
@@ -915,6 +1417,7 @@ class RAGService:
         elif action == 'manual_input':
             # 🔧 IMPROVED: Manual input với context preservation
             logger.info(f"🔄 Manual input requested by user. Preserving valuable context.")
+            session.metadata.pop(PENDING_RESOLUTION_KEY, None)  # Câu hỏi tự nhập: không dùng lại retrieval state
             
             # ✅ SMART CONTEXT PRESERVATION: Giữ context có giá trị thay vì clear all
             original_routing = session.metadata.get('original_routing_context', {})
@@ -1083,16 +1586,21 @@ class RAGService:
         self,
         query: str,
         context: str,
-        session: OptimizedChatSession
+        session: OptimizedChatSession,
+        max_tokens: Optional[int] = None,
+        cache_key: Optional[str] = None,
+        cache_source: str = "online"
     ) -> str:
-        """Generate answer với context và session history sử dụng ChatML format"""
+        """
+        Generate answer với context và session history sử dụng ChatML format.
+        cache_key: câu trả lời đầy đủ (không cap max_tokens / truncate / lỗi) được lưu vào answer cache
+        """
         
         # CHUẨN BỊ CHAT HISTORY CÓ CẤU TRÚC cho ChatML template
         chat_history_structured = []
         if len(session.query_history) > 0:
             # 🚀 PERFORMANCE OPTIMIZATION: Chỉ lấy 1 lượt hỏi-đáp gần nhất để giảm prompt length
             recent_queries = session.query_history[-1:]  # Only last 1 query thay vì 3
-            logger.info(f"⚡ Chat history: {len(recent_queries)} entries (optimized for speed)")
             
             for item in recent_queries:
                 chat_history_structured.append({"role": "user", "content": item['query']})
@@ -1101,28 +1609,7 @@ class RAGService:
                 chat_history_structured.append({"role": "assistant", "content": answer_preview})
             
         # ALWAYS use FULL system prompt - No conservative strategy
-        system_prompt = """Bạn là trợ lý AI chuyên về pháp luật Việt Nam.
-
-🚨 QUY TẮC BẮT BUỘC - KHÔNG ĐƯỢC VI PHẠM:
-1. CHỈ trả lời dựa CHÍNH XÁC trên thông tin CÓ TRONG tài liệu
-2. Trả lời NGẮN GỌN (tối đa 9-10 câu)
-3. KHÔNG tự sáng tạo thông tin không có trong tài liệu
-4. Nếu thông tin không có trong tài liệu, hãy trả lời: "Tài liệu không đề cập đến vấn đề này."
-
-🎯 CÁC LOẠI THÔNG TIN QUAN TRỌNG CẦN CHÚ Ý:
-- PHÍ/LỆ PHÍ: Tìm "fee_text", "fee_vnd" - nêu rõ miễn phí hoặc số tiền cụ thể
-- THỜI GIAN: Tìm "processing_time_text" - nêu rõ thời gian xử lý
-- CƠ QUAN: Tìm "executing_agency" - nêu rõ nơi thực hiện thủ tục  
-- FORM MẪU: Tìm "has_form" - nêu có/không có form mẫu
-- ĐIỀU KIỆN: Tìm "requirements_conditions" - nêu điều kiện cần đáp ứng
-- MÃ THỦ TỤC: Tìm "code" - mã quy trình
-
-ĐỊNH DẠNG TRẢ LỜI:
-- Câu trả lời ngắn gọn, chính xác
-- Ưu tiên thông tin user hỏi nhưng có thể bổ sung thông tin liên quan
-- Dẫn chứng từ tài liệu nếu có"""
-        
-        logger.info(f"📝 Using ChatML format with structured chat history: {len(chat_history_structured)} messages")
+        system_prompt = ANSWER_SYSTEM_PROMPT
         
         # 🔥 TOKEN MANAGEMENT - Kiểm soát độ dài để tránh context overflow
         from app.core.config import settings
@@ -1143,37 +1630,69 @@ class RAGService:
             
             if remaining_space > 500:  # Đảm bảo có ít nhất 500 ký tự cho context
                 context = context[:remaining_space] + "\n\n[...THÔNG TIN ĐÃ ĐƯỢC RÚT GỌN ĐỂ TRÁNH QUÁ TẢI...]"
-                logger.info(f"✂️ Context truncated to {len(context)} chars")
+                events.record("context_truncated", chars=len(context))
             else:
                 # Nếu không đủ chỗ, bỏ chat history
                 chat_history_structured = []
                 context = context[:max_context_tokens * 3 // 2] + "\n\n[...RÚT GỌN...]"
                 logger.warning("⚠️ Removed chat history due to extreme context overflow")
         
-        logger.info(f"📝 Final context length: {len(context)} chars (~{len(context)//3} tokens)")
+        events.record("prompt", context_chars=len(context), history_messages=len(chat_history_structured))
 
+        budget = current_budget()
         try:
             response_data = self.llm_service.generate_response(
                 user_query=query,
                 context=context,
-                max_tokens=settings.max_tokens,
+                max_tokens=max_tokens or settings.max_tokens,
                 temperature=settings.temperature,
                 system_prompt=system_prompt,
-                chat_history=chat_history_structured  # 🔥 THAM SỐ MỚI cho ChatML
+                chat_history=chat_history_structured,  # 🔥 THAM SỐ MỚI cho ChatML
+                cancel_event=current_cancel_event(),  # Client disconnect -> dừng ở token kế tiếp
+                deadline=budget.generation_deadline() if budget is not None else None  # Hết budget -> dừng sớm (truncated)
             )
             
+            if budget is not None and isinstance(response_data, dict) and response_data.get('truncated') == 'deadline':
+                budget.degrade("generation", "truncated", completion_tokens=response_data.get('completion_tokens', 0))
+            
             # Extract response text from dict
             if isinstance(response_data, dict) and "response" in response_data:
-                return response_data["response"].strip()
+                answer = response_data["response"].strip()
             elif isinstance(response_data, str):
-                return response_data.strip()
+                answer = response_data.strip()
             else:
-                return str(response_data).strip()
+                answer = str(response_data).strip()
+            
+            complete = not (isinstance(response_data, dict) and response_data.get('truncated'))
+            if cache_key and complete and (max_tokens or settings.max_tokens) == settings.max_tokens:
+                answer_cache.put(cache_key, query, answer, source=cache_source)
+            return answer
             
+        except (RequestCancelled, GenerationQueueFull):
+            # Hàng đợi LLM đầy: API trả 429 + Retry-After, không ghi session / answer cache
+            raise
+        except GenerationTimeout:
+            # Hết budget khi còn chờ generation slot
+            budget.degrade("generation", "queue_timeout")
+            return "Xin lỗi, hệ thống đang quá tải nên chưa thể trả lời trong thời gian cho phép. Vui lòng thử lại sau."
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
             return f"Xin lỗi, có lỗi xảy ra khi tạo câu trả lời: {e}"
             
+    def generate_deferred_answer(self, pending: Dict[str, Any], source: str = "precompute") -> str:
+        """
+        Generation đã hoãn trong answer_cache.deferred_generation() (pending: key, query, context):
+        cùng prompt như request thật ở lượt đầu session, câu trả lời đầy đủ được lưu với source
+        """
+        session = OptimizedChatSession(session_id=f"{source}-{uuid.uuid4()}", created_at=time.time(), last_accessed=time.time())
+        return self._generate_answer_with_context(
+            query=pending['query'],
+            context=pending['context'],
+            session=session,
+            cache_key=pending['key'],
+            cache_source=source
+        )
+    
     def get_health_status(self) -> Dict[str, Any]:
         """Trạng thái health của service"""
         try:
@@ -1199,6 +1718,7 @@ class RAGService:
                 "reranker_device": "GPU",
                 "active_sessions": len(self.chat_sessions),
                 "metrics": self.metrics,
+                "index_snapshot": self.snapshots.get_status(),
                 "router_stats": self.smart_router.get_collection_info(),
                 "context_expansion": {
                     "total_chunks_cached": len(self.context_expansion_service.document_metadata_cache),
@@ -1212,6 +1732,25 @@ class RAGService:
                 "error": str(e)
             }
             
+    def _collect_metrics(self):
+        """Gauges tính từ state hiện tại: sessions, index snapshots đang drain, re-index đang chạy"""
+        sessions = registry.family("active_sessions", "gauge", "Số chat sessions trong memory")
+        sessions.add(len(self.chat_sessions))
+        
+        snapshot_status = self.snapshots.get_status()
+        snapshot_requests = registry.family(
+            "index_snapshot_active_requests", "gauge", "Requests đang pin từng index snapshot (current + draining)"
+        )
+        snapshot_requests.add(snapshot_status['active_requests'], version=snapshot_status['version'], state="current")
+        for draining in snapshot_status['draining']:
+            snapshot_requests.add(draining['active_requests'], version=draining['version'], state="draining")
+        
+        background_jobs = registry.family("background_jobs_running", "gauge", "Background jobs đang chạy")
+        background_jobs.add(1 if snapshot_status['reloading'] else 0, job="index_reload")
+        background_jobs.add(1 if self._reindex_lock.locked() else 0, job="reindex")
+        
+        return [sessions, snapshot_requests, background_jobs]
+    
     def cleanup_old_sessions(self, max_age_hours: int = 24):
         """Dọn dẹp sessions cũ"""
         current_time = time.time()
@@ -1316,16 +1855,55 @@ class RAGService:
                 'error': str(e)
             }
     
+    def reindex_documents(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Incremental re-index data/documents theo content hash rồi refresh các cache phụ thuộc
+        
+        Chỉ upsert chunks đã đổi / xóa chunks của file đã xóa - không cần rebuild hay restart server
+        """
+        if not self._reindex_lock.acquire(blocking=False):
+            return {'status': 'busy', 'message': 'Re-index is already running'}
+        
+        try:
+            indexer = IncrementalIndexer(
+                vectordb_service=self.vectordb_service,
+                documents_dir=Path(self.documents_dir),
+                manifest_path=settings.index_manifest_path,
+                batch_size=settings.index_embed_batch_size,
+                chunk_manifest_dir=settings.chunk_manifest_path
+            )
+            index_stats = indexer.run(dry_run=dry_run)
+            
+            result = {'status': 'success', 'index': index_stats}
+            if index_stats['has_changes'] and not dry_run:
+                result['refresh'] = self.refresh_indexes()
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in incremental re-index: {e}")
+            return {'status': 'error', 'error': str(e)}
+        finally:
+            self._reindex_lock.release()
+    
+    def refresh_indexes(self) -> Dict[str, Any]:
+        """Build index snapshot mới (router, vector DB handles, context cache) và swap - chờ đến khi xong"""
+        return self.snapshots.reload(wait=True)
+    
+    def reload_indexes(self) -> Dict[str, Any]:
+        """Hot-reload không chờ: build snapshot ở background, request đang chạy dùng tiếp snapshot cũ"""
+        return self.snapshots.reload(wait=False)
+    
     def _generate_smart_clarification(self, routing_result: Dict[str, Any], query: str, session_id: str, start_time: float) -> Dict[str, Any]:
         """Tạo clarification thông minh dựa trên confidence level"""
         try:
             # Gọi Smart Clarification Service để tạo clarification thông minh
             clarification_service = ClarificationService()
-            clarification_response = clarification_service.generate_clarification(
-                query=query,
-                confidence=routing_result.get('confidence', 0.0),
-                routing_result=routing_result
-            )
+            with tracer.span("clarification"):
+                clarification_response = clarification_service.generate_clarification(
+                    query=query,
+                    confidence=routing_result.get('confidence', 0.0),
+                    routing_result=routing_result
+                )
             
             # Merge clarification response with required fields
             processing_time = time.time() - start_time
@@ -1344,11 +1922,9 @@ class RAGService:
                 }
             })
             
-            # 🔧 STORE ROUTING CONTEXT: Save original routing info to session for Step 2→3 similarity matching
             session = self.get_session(session_id)
             if session:
-                session.metadata['original_routing_context'] = routing_result
-                session.metadata['original_query'] = query
+                self._update_session(session, "clarification", routing_result=routing_result, query=query)
                 logger.info(f"💾 Stored original routing context for session {session_id}")
             
             return convert_numpy_types(response)
@@ -1383,6 +1959,7 @@ class RAGService:
             }
             return convert_numpy_types(fallback_response)
     
+    @tracer.traced("vector_backup")
     def _activate_vector_backup_strategy(self, routing_result: Dict[str, Any], query: str, session_id: str, start_time: float) -> Dict[str, Any]:
         """Kích hoạt Vector Backup Strategy khi Smart Router hoàn toàn thất bại"""
         try:
@@ -1392,31 +1969,32 @@ class RAGService:
             all_collections = self.vectordb_service.list_collections()
             backup_results = []
             
-            for collection_info in all_collections[:3]:  # Limit to top 3 collections for performance
-                collection_name = collection_info["name"]
-                try:
-                    collection = self.vectordb_service.get_collection(collection_name)
-                    search_results = self.vectordb_service.search_in_collection(
-                        collection_name,
-                        query,
-                        top_k=2,  # Chỉ lấy top 2 results per collection
-                        similarity_threshold=0.3,
-                        where_filter={}
-                    )
+            with tracer.span("backup_search"):
+                for collection_info in all_collections[:3]:  # Limit to top 3 collections for performance
+                    collection_name = collection_info["name"]
+                    try:
+                        collection = self.vectordb_service.get_collection(collection_name)
+                        search_results = self.vectordb_service.search_in_collection(
+                            collection_name,
+                            query,
+                            top_k=2,  # Chỉ lấy top 2 results per collection
+                            similarity_threshold=0.3,
+                            where_filter={}
+                        )
                     
-                    if search_results:
-                        best_result = search_results[0]
-                        backup_results.append({
-                            'collection': collection_name,
-                            'score': best_result.get('similarity', best_result.get('score', 0)),
-                            'content': best_result.get('content', best_result.get('document', ''))[:200] + "...",
-                            'metadata': best_result.get('metadata', {}),
-                            'source': best_result.get('metadata', {}).get('source', 'N/A')
-                        })
+                        if search_results:
+                            best_result = search_results[0]
+                            backup_results.append({
+                                'collection': collection_name,
+                                'score': best_result.get('similarity', best_result.get('score', 0)),
+                                'content': best_result.get('content', best_result.get('document', ''))[:200] + "...",
+                                'metadata': best_result.get('metadata', {}),
+                                'source': best_result.get('metadata', {}).get('source', 'N/A')
+                            })
                         
-                except Exception as e:
-                    logger.warning(f"Error searching collection {collection_name}: {e}")
-                    continue
+                    except Exception as e:
+                        logger.warning(f"Error searching collection {collection_name}: {e}")
+                        continue
             
             # Sort by score và tạo suggestions
             backup_results.sort(key=lambda x: x['score'], reverse=True)
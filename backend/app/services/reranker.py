@@ -1,14 +1,22 @@
 import logging
 import os
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional
-from sentence_transformers import CrossEncoder
 import numpy as np
 from ..core.config import settings
+from .metrics import track_model_load, record_model_unload
+from .events import events
+from .cancellation import RequestCancelled, current_token
 
 logger = logging.getLogger(__name__)
 
+# Request có cancellation token: predict theo từng nhóm pairs, kiểm tra cancel giữa các nhóm.
+# Bội số batch_size mặc định của CrossEncoder.predict (32) để GPU batch vẫn đầy; rerank thường (<= 30 pairs) chạy 1 lần
+CANCEL_CHECK_PAIRS = 64
+
 class RerankerService:
     """Service quản lý Vietnamese Reranker model - VRAM optimized với on-demand loading"""
     
@@ -16,6 +24,9 @@ class RerankerService:
         self.model_name = model_name or settings.reranker_model_name
         self.model = None
         self.model_loaded = False
+        self._pins = 0  # keep_loaded() đang mở -> unload_model() bỏ qua
+        self._load_lock = threading.RLock()
+        self._active_requests = 0  # rerank_documents đang chạy - unload_model() bỏ qua (giống LLMService)
         
         # VRAM Optimization: Load model khi cần thiết
         # self._load_model()  # Comment out để load on-demand
@@ -27,6 +38,7 @@ class RerankerService:
             
         try:
             logger.info(f"Loading reranker model: {self.model_name}")
+            from sentence_transformers import CrossEncoder  # Heavy import - chỉ khi thực sự load model
             
             # Thử load từ local cache trước - sử dụng GPU với max_length=2304 theo documentation
             local_model_path = self._get_local_model_path()
@@ -81,9 +93,28 @@ class RerankerService:
             self.model_loaded = False
             raise
     
+    @contextmanager
+    def keep_loaded(self):
+        """
+        Giữ model trong VRAM suốt scope (bulk jobs rerank nhiều queries liên tiếp, vd. tools/precompute_answers.py):
+        pipeline vẫn gọi unload_model() sau mỗi query nhưng không unload / load lại
+        """
+        with self._load_lock:
+            self._pins += 1
+        try:
+            yield self
+        finally:
+            with self._load_lock:
+                self._pins -= 1
+    
     def unload_model(self):
-        """Unload reranker model để giải phóng VRAM"""
-        if self.model is not None:
+        """Unload reranker model để giải phóng VRAM (bỏ qua khi đang pin / còn request đang rerank)"""
+        with self._load_lock:
+            if self._pins or self.model is None:
+                return
+            if self._active_requests:
+                logger.info(f"⏭️ Skip reranker unload: {self._active_requests} rerank request(s) in flight")
+                return
             logger.info("🔄 Unloading Reranker model to free VRAM...")
             del self.model
             self.model = None
@@ -100,13 +131,16 @@ class RerankerService:
                     logger.info("✅ CUDA cache cleared")
             except ImportError:
                 pass
-                
+            
+            record_model_unload("reranker")
             logger.info("✅ Reranker model unloaded, VRAM freed")
     
     def ensure_loaded(self):
         """Ensure reranker model is loaded"""
         if not self.model_loaded or self.model is None:
-            self._load_model()
+            # Load từ local cache hoặc HuggingFace - đo chung cho mọi strategy
+            with track_model_load("reranker"):
+                self._load_model()
     
     def is_model_loaded(self) -> bool:
         """Check if reranker model is loaded"""
@@ -156,9 +190,24 @@ class RerankerService:
         Returns:
             Danh sách documents đã được sắp xếp lại theo độ liên quan
         """
-        # VRAM Optimization: Ensure model is loaded
-        self.ensure_loaded()
-        
+        # VRAM Optimization: Ensure model is loaded - giữ model tới khi rerank xong (unload_model bỏ qua)
+        with self._load_lock:
+            self.ensure_loaded()
+            self._active_requests += 1
+        try:
+            return self._rerank_loaded(query, documents, top_k, router_confidence, router_confidence_level)
+        finally:
+            with self._load_lock:
+                self._active_requests -= 1
+    
+    def _rerank_loaded(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_k: Optional[int],
+        router_confidence: Optional[float],
+        router_confidence_level: Optional[str]
+    ) -> List[Dict[str, Any]]:
         if not self.model:
             logger.warning("Reranker model not loaded, returning original order")
             return documents[:top_k] if top_k else documents
@@ -168,14 +217,8 @@ class RerankerService:
         
         # 🛡️ ROUTER TRUST MODE: Khi router có HIGH confidence, tin tưởng router hơn
         trust_router = (router_confidence_level == 'high' and router_confidence and router_confidence >= 0.85)
-        if trust_router:
-            logger.info(f"🛡️ ROUTER TRUST MODE: Router confidence {router_confidence:.3f} (HIGH) - Minimal rerank interference")
-        
         try:
-            # 🔍 DEBUG: Log số lượng documents và thời gian rerank
             rerank_start_time = time.time()
-            logger.info(f"🔍 RERANK QUERY: '{query}' ({len(query)} chars)")
-            logger.info(f"🔢 RERANK INPUT: {len(documents)} documents to process")
             
             # 🚀 PERFORMANCE OPTIMIZATION: Loại bỏ CPU preprocessing 
             # Chuẩn bị pairs (query, document_content) trực tiếp cho reranker
@@ -192,14 +235,11 @@ class RerankerService:
                 if len(cleaned_content) > 6000:  # Soft limit trước khi tokenization
                     cleaned_content = cleaned_content[:6000] + "..."
                 
-                logger.info(f"🔍 RERANK DOC[{i}]: {len(cleaned_content)} chars")
                 pairs.append((query, cleaned_content))
             
             # Tính rerank scores
-            logger.info(f"🔥 RERANKING {len(documents)} documents with optimized settings...")
-            scores = self.model.predict(pairs)
+            scores = self._predict(pairs, rerank_start_time)
             rerank_time = time.time() - rerank_start_time
-            logger.info(f"⏱️ RERANK COMPLETED in {rerank_time:.2f}s ({len(documents)} docs)")
             
             # Gán điểm rerank vào mỗi document
             reranked_docs = []
@@ -211,16 +251,21 @@ class RerankerService:
             # Sắp xếp theo rerank score giảm dần
             reranked_docs.sort(key=lambda x: x['rerank_score'], reverse=True)
             
-            # Log thông tin về top document
+            # Ghi thông tin về top document
             if reranked_docs:
                 top_doc = reranked_docs[0]
-                logger.info(f"Top document after reranking: score={top_doc['rerank_score']:.4f}, "
-                          f"similarity={top_doc.get('similarity', 'N/A')}")
+                events.record(
+                    "rerank",
+                    documents=len(documents),
+                    passage_chars=sum(len(passage) for _, passage in pairs),
+                    seconds=round(rerank_time, 4),
+                    top_score=top_doc['rerank_score'],
+                    top_similarity=top_doc.get('similarity'),
+                    trust_router=bool(trust_router)
+                )
                 
                 # 🛡️ ROUTER TRUST MODE: Không trigger conservative strategy khi router HIGH confidence
-                if trust_router:
-                    logger.info(f"🛡️ TRUSTING ROUTER: Accepting rerank results without conservative override (router: {router_confidence:.3f})")
-                elif top_doc['rerank_score'] < 0.2:
+                if not trust_router and top_doc['rerank_score'] < 0.2:
                     logger.warning(f"⚠️  LOW RERANK SCORE ({top_doc['rerank_score']:.4f}) - Conservative strategy may be triggered")
             
             # Trả về top_k documents nếu được chỉ định
@@ -229,11 +274,24 @@ class RerankerService:
             
             return reranked_docs
             
+        except RequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error during reranking: {e}")
             # Fallback về sắp xếp theo similarity score ban đầu
             return sorted(documents, key=lambda x: x.get('similarity', 0), reverse=True)[:top_k] if top_k else documents
     
+    def _predict(self, pairs: List[Tuple[str, str]], rerank_start_time: float) -> List[float]:
+        """CrossEncoder scores - request hủy được (client disconnect) dừng sau nhóm pairs đang chạy"""
+        token = current_token()
+        if token is None:
+            return self.model.predict(pairs)
+        scores = []
+        for start in range(0, len(pairs), CANCEL_CHECK_PAIRS):
+            token.raise_if_cancelled("rerank", time.time() - rerank_start_time)
+            scores.extend(self.model.predict(pairs[start:start + CANCEL_CHECK_PAIRS]))
+        return scores
+    
     # 🗑️ REMOVED: CPU intensive preprocessing functions
     # _extract_query_keywords() và _extract_relevant_content() đã được loại bỏ
     # để tối ưu hóa performance và để GPU CrossEncoder tự xử lý
@@ -283,10 +341,8 @@ class RerankerService:
         
         if not qualified_chunks:
             logger.warning(f"No chunks meet minimum rerank score {min_rerank_score}")
-            return reranked[0] if reranked else None  # Fallback to best chunk
+            return self._with_window_rank(reranked[0], reranked)  # Fallback to best chunk
             
-        logger.info(f"🔍 CONSENSUS ANALYSIS: Analyzing {len(qualified_chunks)} qualified chunks (top_k={top_k})")
-        
         # Bước 3: Phân tích document consensus
         document_analysis = self._analyze_document_consensus(qualified_chunks)
         
@@ -298,22 +354,39 @@ class RerankerService:
         )
         
         if best_consensus:
-            logger.info(f"✅ CONSENSUS FOUND: Document '{best_consensus['document_id']}' "
-                       f"has {best_consensus['chunk_count']}/{len(qualified_chunks)} chunks "
-                       f"(ratio: {best_consensus['consensus_ratio']:.2f})")
-            return best_consensus['best_chunk']
+            events.record(
+                "consensus",
+                document_id=best_consensus['document_id'],
+                chunks=best_consensus['chunk_count'],
+                qualified=len(qualified_chunks),
+                ratio=round(best_consensus['consensus_ratio'], 3)
+            )
+            return self._with_window_rank(best_consensus['best_chunk'], reranked)
         else:
             # 🔥 NEW LOGIC: Kiểm tra nếu các chunks thuộc các documents hoàn toàn khác nhau
             unique_documents = set(self._extract_document_id(chunk) for chunk in qualified_chunks)
             
-            if len(unique_documents) == len(qualified_chunks):
-                logger.warning(f"🚨 SCATTERED CHUNKS: {len(qualified_chunks)} chunks from {len(unique_documents)} different documents")
-                logger.info("📋 Falling back to SINGLE BEST CHUNK strategy (traditional reranking)")
-                return qualified_chunks[0]  # Return highest scored chunk
-            else:
-                logger.warning(f"❌ NO STRONG CONSENSUS: Falling back to traditional single best document "
-                              f"(threshold: {consensus_threshold})")
-                return qualified_chunks[0]  # Fallback to highest scored chunk
+            # Fallback: chunk có score cao nhất (single best chunk strategy)
+            events.record(
+                "consensus",
+                document_id=None,
+                qualified=len(qualified_chunks),
+                documents=len(unique_documents),
+                fallback="scattered_chunks" if len(unique_documents) == len(qualified_chunks) else "below_threshold",
+                threshold=consensus_threshold
+            )
+            return self._with_window_rank(qualified_chunks[0], reranked)
+
+    @staticmethod
+    def _with_window_rank(chunk: Dict[str, Any], window: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Gắn decisive_vector_rank: vector rank lớn nhất trong top-k sau rerank mà consensus đã xét.
+        Search giữ đủ tới rank này thì consensus chọn lại đúng chunk (adaptive search k, search_k.py)
+        """
+        ranks = [doc['vector_rank'] for doc in window if doc.get('vector_rank')]
+        if ranks:
+            chunk['decisive_vector_rank'] = max(ranks)
+        return chunk
 
     def _analyze_document_consensus(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -403,9 +476,6 @@ class RerankerService:
             chunk_count = len(info['chunks'])
             consensus_ratio = chunk_count / total_chunks
             
-            logger.info(f"📊 Document '{doc_id}': {chunk_count}/{total_chunks} chunks "
-                       f"(ratio: {consensus_ratio:.2f}, threshold: {consensus_threshold})")
-            
             # Kiểm tra xem có đạt threshold không
             if consensus_ratio >= consensus_threshold:
                 if (best_consensus is None or 
@@ -10,16 +10,28 @@ import os
 import pickle
 import time
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Any
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Dict, List, Tuple, Optional, Any, TYPE_CHECKING
+
+from ..core.config import settings
+from .metrics import record_cache
+from .embedding_cache import query_embedding_cache, reference_embedding_cache
+from .clarification_catalog import ClarificationCatalog
+from .vector_index import QuantizedVectorIndex, normalize_rows
+from .tracing import tracer
+from .events import events
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 logger = logging.getLogger(__name__)
 
+# Thủ tục biến thể (không phải thủ tục chính) - title boost nhỏ hơn trong similar-procedure lookup
+SPECIALIZED_PROCEDURE_MARKERS = ('lưu động', 'có yếu tố nước ngoài', 'lại', 'kết hợp', 'chấm dứt')
+
 class QueryRouter:
     """Router thông minh sử dụng database example questions cho routing chính xác"""
     
-    def __init__(self, embedding_model: SentenceTransformer):
+    def __init__(self, embedding_model: "SentenceTransformer"):
         self.embedding_model = embedding_model
         self.base_path = "data/router_examples"
         self.cache_file = "data/cache/router_embeddings.pkl"
@@ -32,6 +44,15 @@ class QueryRouter:
         self.question_vectors = {}
         self.collection_mappings = {}
         
+        # Vectors mọi collection gộp thành 1 index (ROUTER_VECTOR_INDEX), segment = (collection, start, end)
+        self.question_index: Optional[QuantizedVectorIndex] = None
+        self._index_segments: List[Tuple[str, int, int]] = []
+        self._question_matrix: Optional[np.ndarray] = None
+        # Similar-procedure lookup (clarification): index theo document, build lazy từng collection
+        self._document_indexes: Dict[str, Dict[str, Any]] = {}
+        # Catalog collection -> documents -> câu hỏi gợi ý cho clarification (lưu cùng router cache)
+        self.clarification_catalog: Optional[ClarificationCatalog] = None
+        
         # Thresholds - Hạ thấp để linh hoạt hơn, không quá cứng nhắc
         self.high_confidence_threshold = 0.80  # Hạ từ 0.85 -> 0.80 để linh hoạt hơn
         self.min_confidence_threshold = 0.50   # Dưới threshold này = hỏi lại user
@@ -40,7 +61,9 @@ class QueryRouter:
         logger.info("💡 STRATEGY: Threshold CỰC CAO, nếu không chắc chắn thì hỏi lại user")
         
         # Initialize database - cache first, fallback to live loading
-        if self._load_from_cache():
+        cache_hit = self._load_from_cache()
+        record_cache("router_embeddings", hit=cache_hit)
+        if cache_hit:
             logger.info("📦 Router loaded from cache (fast startup)")
         else:
             logger.info("🔄 Cache not available, loading from files (slow startup)...")
@@ -49,6 +72,14 @@ class QueryRouter:
             # Save cache for next time
             self._save_to_cache()
         
+        if self.clarification_catalog is None:
+            self.clarification_catalog = ClarificationCatalog.build(self.example_questions)
+        logger.info(f"🗂️ Clarification catalog: {self.clarification_catalog.get_stats()}")
+        
+        self._build_question_index()
+        for collection_name, _, _ in self._index_segments:
+            self._get_document_index(collection_name)
+        
         logger.info(f"✅ Enhanced Smart Query Router initialized with {len(self.collection_mappings)} collections")
     
     def _is_followup_question(self, query: str) -> bool:
@@ -227,6 +258,11 @@ class QueryRouter:
                     'total_questions': len(questions)
                 }
             
+            # Catalog cũ (cache build trước khi có catalog / không khớp) -> build lại từ questions
+            self.clarification_catalog = ClarificationCatalog.from_dict(
+                cache_data.get('clarification_catalog'), self.example_questions
+            )
+            
             load_time = time.time() - start_time
             total_questions = cache_data['metadata'].get('total_questions', 0)
             
@@ -247,6 +283,9 @@ class QueryRouter:
             logger.info("💾 Saving router cache...")
             start_time = time.time()
             
+            if self.clarification_catalog is None:
+                self.clarification_catalog = ClarificationCatalog.build(self.example_questions)
+            
             # Prepare cache data
             cache_data = {
                 'metadata': {
@@ -256,7 +295,8 @@ class QueryRouter:
                     'collections': {name: len(questions) for name, questions in self.example_questions.items()}
                 },
                 'questions': self.example_questions,
-                'embeddings': self.question_vectors
+                'embeddings': self.question_vectors,
+                'clarification_catalog': self.clarification_catalog.to_dict()
             }
             
             # Save cache
@@ -275,6 +315,105 @@ class QueryRouter:
             # Don't fail initialization just because of cache save failure
             pass
     
+    def _build_question_index(self):
+        """Gộp vectors mọi collection (float32, chuẩn hóa) thành QuantizedVectorIndex cho route_query"""
+        matrices, segments, offset = [], [], 0
+        for collection_name, questions in self.example_questions.items():
+            vectors = self.question_vectors.get(collection_name)
+            if vectors is None or len(vectors) == 0:
+                continue
+            # Pin dtype: pickle cũ có thể lưu float64
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if vectors.ndim != 2 or len(vectors) != len(questions):
+                logger.warning(f"⚠️ Router vectors of {collection_name} don't match its questions, skipped")
+                continue
+            matrices.append(vectors)
+            segments.append((collection_name, offset, offset + len(vectors)))
+            offset += len(vectors)
+        
+        if not matrices:
+            return
+        
+        normalized = normalize_rows(np.concatenate(matrices))
+        mode = settings.router_vector_index
+        rescore_vectors = self._store_rescore_vectors(normalized) if mode != "float32" else None
+        self.question_index = QuantizedVectorIndex(
+            normalized, mode=mode, rescore_k=settings.router_vector_rescore_k, rescore_vectors=rescore_vectors
+        )
+        self._index_segments = segments
+        
+        # question_vectors trỏ vào float32 của index (view / memmap) thay cho arrays từ pickle
+        float_vectors = rescore_vectors if rescore_vectors is not None else normalized
+        self._question_matrix = float_vectors
+        for collection_name, start, end in segments:
+            self.question_vectors[collection_name] = float_vectors[start:end]
+        
+        logger.info(f"🧮 Router vector index: {self.question_index.memory_usage()}")
+    
+    def _store_rescore_vectors(self, normalized: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Float32 cho rescoring ghi ra .npy cạnh router cache rồi mmap - RAM chỉ giữ codes đã nén.
+        File cũ còn khớp thì dùng lại (snapshot đang drain có thể vẫn mmap file đó)
+        """
+        vectors_file = os.path.splitext(self.cache_file)[0] + "_vectors.npy"
+        try:
+            if os.path.exists(vectors_file):
+                existing = np.load(vectors_file, mmap_mode='r')
+                sample = np.unique(np.linspace(0, len(normalized) - 1, num=min(8, len(normalized)), dtype=int))
+                if existing.shape == normalized.shape and np.array_equal(existing[sample], normalized[sample]):
+                    return existing
+                del existing
+            
+            os.makedirs(os.path.dirname(vectors_file), exist_ok=True)
+            tmp_file = vectors_file[:-4] + ".tmp.npy"
+            np.save(tmp_file, normalized)
+            os.replace(tmp_file, vectors_file)
+            return np.load(vectors_file, mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"⚠️ Could not mmap router vectors ({vectors_file}), rescoring from memory: {e}")
+            return None
+    
+    def _score_collections(self, query_vector: np.ndarray) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """
+        Cosine cao nhất của query với example questions từng collection + row tương ứng.
+        Index nén: score xấp xỉ -> shortlist (top rescore_k + row tốt nhất mỗi collection) -> rescore exact
+        """
+        scores = self.question_index.approx_scores(query_vector)
+        segment_best = [start + int(np.argmax(scores[start:end])) for _, start, end in self._index_segments]
+        
+        if self.question_index.mode == "float32":
+            rows, exact = np.asarray(segment_best), scores[segment_best]
+        else:
+            rows = np.union1d(self.question_index.shortlist(scores), segment_best)
+            exact = self.question_index.exact_scores(query_vector, rows)
+        
+        starts = np.asarray([start for _, start, _ in self._index_segments])
+        row_segments = np.searchsorted(starts, rows, side='right') - 1
+        collection_scores, best_rows = {}, {}
+        for segment_id, (collection_name, start, _) in enumerate(self._index_segments):
+            in_segment = np.flatnonzero(row_segments == segment_id)
+            best = in_segment[np.argmax(exact[in_segment])]
+            collection_scores[collection_name] = float(exact[best])
+            best_rows[collection_name] = int(rows[best]) - start
+        return collection_scores, best_rows
+    
+    def seed_query_embedding_cache(self):
+        """
+        Vector example questions đã có trong router index -> persistent tier của query embedding cache.
+        Seed phải encode vài mẫu để kiểm tra - gọi sau khi embedding model load xong, không gọi trong __init__
+        (router load từ cache không được chờ embedding model)
+        """
+        if self.question_index is None:
+            return
+        texts = []
+        for collection_name, _, _ in self._index_segments:
+            texts.extend(question.get('text', '') for question in self.example_questions[collection_name])
+        
+        try:
+            query_embedding_cache.seed(self.embedding_model, texts, self._question_matrix)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to seed query embedding cache: {e}")
+    
     def _load_example_questions(self):
         """Load all example questions from individual router JSON files"""
         try:
@@ -426,7 +565,8 @@ class QueryRouter:
         """
         try:
             # Create vector for query
-            query_vector = self.embedding_model.encode([query])[0]
+            with tracer.span("embed"):
+                query_vector = query_embedding_cache.encode(self.embedding_model, query)
             
             # Find best matching example question across all collections
             best_collection = None
@@ -436,40 +576,29 @@ class QueryRouter:
             best_filters = {}
             collection_scores = {}
             
-            for collection_name, questions in self.example_questions.items():
-                if collection_name not in self.question_vectors:
-                    continue
-                
-                # Calculate similarities with all questions in this collection
-                question_vectors = self.question_vectors[collection_name]
-                similarities = cosine_similarity(
-                    query_vector.reshape(1, -1),
-                    question_vectors
-                )[0]
+            with tracer.span("similarity"):
+                if self.question_index is not None:
+                    collection_scores, best_rows = self._score_collections(query_vector)
+                    for collection_name, score in collection_scores.items():
+                        if score > best_score:
+                            best_score = score
+                            best_collection = collection_name
                 
-                # Get best match in this collection
-                max_idx = np.argmax(similarities)
-                max_similarity = similarities[max_idx]
-                collection_scores[collection_name] = float(max_similarity)
-                
-                # Update global best
-                if max_similarity > best_score:
-                    best_score = max_similarity
-                    best_collection = collection_name
-                    best_example = questions[max_idx]['text']
-                    best_source = questions[max_idx]['source']
-                    best_filters = questions[max_idx].get('filters', {})
-                    
-                    # 🐛 DEBUG: Log the exact match info
-                    logger.info(f"🔍 NEW BEST MATCH: score={max_similarity:.3f}, collection={collection_name}")
-                    logger.info(f"🔍 Question text: '{best_example[:100]}...'")
-                    logger.info(f"🔍 Source procedure: {best_source}")
-                    if 'exact_title' in best_filters:
-                        logger.info(f"🔍 Exact title from filters: {best_filters['exact_title']}")
-            
-            logger.info(f"🎯 Query: '{query[:50]}...' -> Best match: {best_collection} ({best_score:.3f})")
-            if best_example:
-                logger.info(f"📝 Matched example: '{best_example[:80]}...'")
+                if best_collection is not None:
+                    best_question = self.example_questions[best_collection][best_rows[best_collection]]
+                    best_example = best_question['text']
+                    best_source = best_question['source']
+                    best_filters = best_question.get('filters', {})
+            
+            # Best match (example, source procedure, exact title) - thay cho log từng lần đổi best match
+            events.record(
+                "route_match",
+                collection=best_collection,
+                score=float(best_score),
+                example=best_example[:100] if best_example else None,
+                source=best_source,
+                exact_title=best_filters.get('exact_title')
+            )
             
             # 🔥 STATEFUL ROUTER LOGIC - Confidence Override (ƯU TIÊN CAO NHẤT)
             original_confidence = best_score
@@ -486,9 +615,13 @@ class QueryRouter:
                     best_collection = override_collection
                     if override_filters:
                         best_filters = override_filters  # 🔥 NEW: Override filters
-                        logger.info(f"🔥 OVERRIDE FILTERS: {override_filters}")
-                    logger.info(f"🔥 CONFIDENCE OVERRIDE: {original_confidence:.3f} -> {best_score:.3f}")
-                    logger.info(f"🔥 Override to collection: {override_collection} (from session state)")
+                    events.record(
+                        "route_override",
+                        collection=override_collection,
+                        original_score=float(original_confidence),
+                        score=float(best_score),
+                        filters=override_filters
+                    )
                     
                     # Update display info for overridden case
                     if override_collection in self.collection_mappings:
@@ -500,30 +633,20 @@ class QueryRouter:
                     session.increment_low_confidence()
                     if session.consecutive_low_confidence_count >= 3:
                         # Too many failed attempts - clear state
-                        logger.info("🧹 Clearing session state due to consecutive low confidence queries")
+                        events.record("session_state_cleared", reason="consecutive_low_confidence")
                         session.clear_routing_state()
             
             # 🔗 FOLLOW-UP DETECTION (chỉ khi KHÔNG có override)
             if not should_override and session and hasattr(session, 'last_successful_collection') and session.last_successful_collection:
-                logger.info(f"🔗 Session has previous context: {session.last_successful_collection}")
                 is_followup = self._is_followup_question(query)
-                logger.info(f"🔗 Follow-up check: query='{query}' -> is_followup={is_followup}")
+                events.record("followup_check", previous_collection=session.last_successful_collection, is_followup=is_followup)
                 if is_followup:
-                    logger.info(f"🔗 FOLLOW-UP DETECTED: '{query[:50]}...' -> maintaining {session.last_successful_collection}")
                     return self._route_followup(query, session)
-            elif not should_override:
-                logger.info(f"🔗 No session context available: session={session is not None}, has_attr={hasattr(session, 'last_successful_collection') if session else False}, value={getattr(session, 'last_successful_collection', None) if session else None}")
-            
-            # �🐛 DEBUG: Final validation before returning
-            if best_filters:
-                final_title = best_filters.get('exact_title', ['Unknown'])
-                logger.info(f"🔍 FINAL FILTERS CHECK - Exact title: {final_title}")
             
             # Determine routing decision - LOGIC MỚI với 3 mức tin cậy + Override
             if best_score >= self.high_confidence_threshold:
                 # High confidence - route immediately với tin cậy cao
                 confidence_level = 'high' if not should_override else 'override_high'
-                logger.info(f"✅ HIGH CONFIDENCE routing: {best_score:.3f} >= {self.high_confidence_threshold}")
                 return {
                     'status': 'routed',
                     'confidence_level': confidence_level,
@@ -542,7 +665,6 @@ class QueryRouter:
             elif best_score >= self.min_confidence_threshold:
                 # Khả năng match có thể đúng nhưng chưa chắc chắn - ROUTE NHƯNG CAUTION
                 confidence_level = 'low-medium' if not should_override else 'override_medium'
-                logger.info(f"⚠️ LOW-MEDIUM CONFIDENCE routing: {best_score:.3f} >= {self.min_confidence_threshold}")
                 return {
                     'status': 'routed',
                     'confidence_level': confidence_level, 
@@ -561,7 +683,7 @@ class QueryRouter:
             
             else:
                 # Below min threshold - cần clarification vì quá mơ hồ
-                logger.warning(f"🤔 TOO AMBIGUOUS - cần clarification: {best_score:.3f} < {self.min_confidence_threshold}")
+                events.record("route_ambiguous", score=float(best_score), threshold=self.min_confidence_threshold)
                 return {
                     'status': 'clarification_needed',
                     'confidence_level': 'low',
@@ -662,7 +784,8 @@ class QueryRouter:
     ) -> List[Dict[str, Any]]:
         """
         Tìm các thủ tục tương đồng trong collection dựa trên reference query
-        Sử dụng embedding similarity để tìm procedures có liên quan cao nhất
+        Score mỗi thủ tục (document) = cosine cao nhất giữa reference và các câu hỏi của nó (1 phép matmul),
+        cộng boost khi title khớp reference
         
         Args:
             collection_name: Tên collection cần tìm
@@ -670,180 +793,47 @@ class QueryRouter:
             top_k: Số lượng procedures trả về tối đa
             
         Returns:
-            List các procedures tương đồng cao nhất, có thể ít hơn top_k nếu collection nhỏ
+            List các procedures tương đồng cao nhất (mỗi document 1 entry), có thể ít hơn top_k nếu collection nhỏ
         """
         try:
-            # Get all example questions for this collection
             collection_questions = self.example_questions.get(collection_name, [])
-            
             if not collection_questions:
                 logger.warning(f"No example questions found for collection: {collection_name}")
                 return []
             
-            # 🚀 OPTIMIZED: Get embedding for reference query with caching
-            reference_cache_key = f"reference:{reference_query}"
-            if reference_cache_key in self.question_vectors:
-                reference_embedding = np.array(self.question_vectors[reference_cache_key]).reshape(1, -1)
-                logger.info(f"📦 Using cached embedding for reference query")
-            else:
-                reference_embedding = self.embedding_model.encode([reference_query])
-                # Cache the reference embedding for future use
-                self.question_vectors[reference_cache_key] = reference_embedding[0].tolist()
-                logger.info(f"🔄 Generated and cached embedding for reference query")
-            
-            # Calculate similarities with all questions in collection
-            similarities = []
-            
-            # 🚀 DEBUG: Log cache structure để hiểu format
-            if collection_name in self.question_vectors:
-                cache_format = self.question_vectors[collection_name]
-                if isinstance(cache_format, list):
-                    logger.info(f"🔍 DEBUG: Cache format for {collection_name} is list with {len(cache_format)} items")
-                elif isinstance(cache_format, dict):
-                    logger.info(f"🔍 DEBUG: Cache format for {collection_name} is dict with keys: {list(cache_format.keys())[:3]}...")
-                else:
-                    logger.info(f"🔍 DEBUG: Cache format for {collection_name} is {type(cache_format)}")
-                    
-            for i, question in enumerate(collection_questions):
-                question_text = question.get('text', question) if isinstance(question, dict) else question
-                
-                # 🚀 OPTIMIZED: Use pre-computed embedding from cache with correct format
-                question_embedding = None
-                
-                # Try cache format: collection_name -> embeddings (numpy array or list)
-                if collection_name in self.question_vectors:
-                    collection_embeddings = self.question_vectors[collection_name]
-                    
-                    # Handle numpy array format (from cache)
-                    if isinstance(collection_embeddings, np.ndarray):
-                        if len(collection_embeddings.shape) == 2 and i < collection_embeddings.shape[0]:
-                            question_embedding = collection_embeddings[i:i+1]  # Keep 2D shape
-                            if i == 0:  # Log first match only to avoid spam
-                                logger.info(f"📦 Using cached embedding (numpy format) for {collection_name}[{i}]")
-                    
-                    # Handle list format (fallback)
-                    elif isinstance(collection_embeddings, list) and i < len(collection_embeddings):
-                        embedding_data = collection_embeddings[i]
-                        if embedding_data is not None:
-                            question_embedding = np.array(embedding_data).reshape(1, -1)
-                            if i == 0:  # Log first match only to avoid spam
-                                logger.info(f"📦 Using cached embedding (list format) for {collection_name}[{i}]")
-                
-                # Try alternative cache format: "collection:question" key
-                if question_embedding is None:
-                    question_key = f"{collection_name}:{question_text}"
-                    if question_key in self.question_vectors:
-                        question_embedding = np.array(self.question_vectors[question_key]).reshape(1, -1)
-                        if i == 0:  # Log first match only
-                            logger.info(f"📦 Using cached embedding (key format) for {question_key[:50]}...")
-                
-                # Try embedded format: question dict with embedding
-                if question_embedding is None and isinstance(question, dict) and 'embedding' in question:
-                    question_embedding = np.array(question['embedding']).reshape(1, -1)
-                    if i == 0:  # Log first match only
-                        logger.info(f"📦 Using embedded embedding for {question_text[:50]}...")
-                
-                # Last resort: compute new embedding
-                if question_embedding is None:
-                    logger.warning(f"⚠️ Computing new embedding for: {question_text[:50]}...")
-                    question_embedding = self.embedding_model.encode([question_text])
-                    # Cache it for future use with both formats
-                    question_key = f"{collection_name}:{question_text}"
-                    self.question_vectors[question_key] = question_embedding[0].tolist()
-                    
-                    # Also update collection format if it exists
-                    if collection_name not in self.question_vectors:
-                        self.question_vectors[collection_name] = []
-                    if isinstance(self.question_vectors[collection_name], list):
-                        while len(self.question_vectors[collection_name]) <= i:
-                            self.question_vectors[collection_name].append(None)
-                        self.question_vectors[collection_name][i] = question_embedding[0].tolist()
-                
-                # Calculate cosine similarity
-                similarity = cosine_similarity(reference_embedding, question_embedding)[0][0]
-                
-                similarities.append({
-                    'question': question,
-                    'similarity': float(similarity),
-                    'text': question_text
-                })
-            
-            # Sort by similarity and return top_k
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
+            document_index = self._get_document_index(collection_name)
+            reference_vector = normalize_rows(
+                reference_embedding_cache.encode(self.embedding_model, reference_query).reshape(1, -1)
+            )[0]
+            scores = np.asarray(document_index['vectors'] @ reference_vector, dtype=np.float32)
+            
+            # Best variant mỗi document: sort theo (document, -score), lấy row đầu mỗi nhóm
+            row_document = document_index['row_document']
+            order = np.lexsort((-scores, row_document))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = row_document[order[1:]] != row_document[order[:-1]]
+            best_rows = order[first]
+            document_scores = scores[best_rows].astype(np.float64)
+            
+            # 🎯 Title boost: reference chứa title (hoặc ngược lại) - thủ tục chính +0.3, biến thể đặc biệt +0.1
+            clean_reference = reference_query.lower().strip()
+            for document_id, doc_title in enumerate(document_index['titles']):
+                if doc_title and (doc_title in clean_reference or clean_reference in doc_title):
+                    boost = 0.3 if document_index['core'][document_id] else 0.1
+                    document_scores[document_id] = min(1.0, document_scores[document_id] + boost)
             
-            # 🎯 ENHANCED: Boost exact/partial title matches to prioritize core procedures
-            for item in similarities:
-                question = item['question']
-                question_text = item['text']
-                
-                # Extract document title if available
-                if isinstance(question, dict):
-                    doc_title = question.get('title', '')
-                    source_file = question.get('source', '')
-                    
-                    # Extract title from source filename if no explicit title
-                    if not doc_title and source_file:
-                        filename = source_file.split('/')[-1].replace('.json', '').replace('.doc', '')
-                        if '. ' in filename:
-                            doc_title = filename.split('. ', 1)[1]  # Remove numbering like "01. "
-                    
-                    # 🔥 EXACT TITLE MATCH: Boost if reference query contains the exact document title
-                    if doc_title:
-                        # Clean both strings for comparison
-                        clean_reference = reference_query.lower().strip()
-                        clean_doc_title = doc_title.lower().strip()
-                        
-                        # Check for exact match or reference contains the document title
-                        if clean_doc_title in clean_reference or clean_reference in clean_doc_title:
-                            # 🚀 Special boost for core procedures (without "lưu động", "có yếu tố nước ngoài", etc.)
-                            is_core_procedure = not any(special in clean_doc_title for special in [
-                                'lưu động', 'có yếu tố nước ngoài', 'lại', 'kết hợp', 'chấm dứt'
-                            ])
-                            
-                            if is_core_procedure:
-                                # Major boost for core procedures with exact title match
-                                item['similarity'] = min(1.0, item['similarity'] + 0.3)
-                                logger.info(f"🎯 CORE TITLE MATCH: Boosted '{doc_title}' similarity to {item['similarity']:.3f}")
-                            else:
-                                # Minor boost for specialized procedures
-                                item['similarity'] = min(1.0, item['similarity'] + 0.1)
-                                logger.info(f"🎯 SPECIALIZED TITLE MATCH: Boosted '{doc_title}' similarity to {item['similarity']:.3f}")
-            
-            # Re-sort after boosting
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # Return top results, ensuring we have diverse procedures
             results = []
-            seen_sources = set()  # Track sources to avoid duplicate procedures from same document
-            
-            for item in similarities[:top_k * 2]:  # Get more to filter
-                question = item['question']
-                
-                # Extract source info to avoid duplicates
-                source = None
-                if isinstance(question, dict):
-                    source = question.get('source', question.get('file', ''))
-                
-                # Add if we haven't seen this source or if no source info available
-                if not source or source not in seen_sources:
-                    results.append({
-                        'text': item['text'],
-                        'similarity': item['similarity'],
-                        'source': source or 'Unknown',
-                        'category': question.get('category', 'general') if isinstance(question, dict) else 'general',
-                        'collection': collection_name
-                    })
-                    
-                    if source:
-                        seen_sources.add(source)
-                    
-                    if len(results) >= top_k:
-                        break
-            
-            logger.info(f"🎯 Found {len(results)} similar procedures in {collection_name} for reference: {reference_query[:50]}...")
-            if results:
-                logger.info(f"   Top similarity: {results[0]['similarity']:.3f} - {results[0]['text'][:60]}...")
+            for document_id in np.argsort(-document_scores, kind='stable')[:top_k]:
+                question = collection_questions[best_rows[document_id]]
+                results.append({
+                    'text': question.get('text', question) if isinstance(question, dict) else question,
+                    'similarity': float(document_scores[document_id]),
+                    'source': document_index['sources'][document_id] or 'Unknown',
+                    'category': question.get('category', 'general') if isinstance(question, dict) else 'general',
+                    'collection': collection_name
+                })
             
+            logger.debug(f"🎯 Found {len(results)} similar procedures in {collection_name} for reference: {reference_query[:50]}...")
             return results
             
         except Exception as e:
@@ -860,6 +850,62 @@ class QueryRouter:
                 }
                 for q in fallback_questions
             ]
+    
+    def _get_document_index(self, collection_name: str) -> Dict[str, Any]:
+        """
+        Index theo document của 1 collection (build 1 lần, dùng lại cho mọi clarification):
+        vectors chuẩn hóa (view của router index), row -> document id, source / title / core flag từng document
+        """
+        document_index = self._document_indexes.get(collection_name)
+        if document_index is not None:
+            return document_index
+        
+        questions = self.example_questions.get(collection_name, [])
+        # Đã chuẩn hóa trong _build_question_index
+        vectors = self.question_vectors.get(collection_name)
+        if vectors is None or len(vectors) != len(questions):
+            # Collection không có trong router index: encode 1 batch, giữ trong document index
+            texts = [q.get('text', q) if isinstance(q, dict) else q for q in questions]
+            logger.warning(f"⚠️ No router vectors for {collection_name}, encoding {len(texts)} questions")
+            vectors = normalize_rows(self.embedding_model.encode(texts))
+        
+        document_ids: Dict[str, int] = {}
+        row_document = np.empty(len(questions), dtype=np.int32)
+        sources, titles, core = [], [], []
+        for i, question in enumerate(questions):
+            source = question.get('source', question.get('file', '')) if isinstance(question, dict) else ''
+            # Câu hỏi không có source = 1 document riêng (không gộp)
+            key = source or f"#{i}"
+            if key not in document_ids:
+                document_ids[key] = len(sources)
+                doc_title = self._document_title(question).lower().strip()
+                sources.append(source)
+                titles.append(doc_title)
+                core.append(not any(special in doc_title for special in SPECIALIZED_PROCEDURE_MARKERS))
+            row_document[i] = document_ids[key]
+        
+        document_index = {
+            'vectors': vectors,
+            'row_document': row_document,
+            'sources': sources,
+            'titles': titles,
+            'core': core
+        }
+        self._document_indexes[collection_name] = document_index
+        return document_index
+    
+    @staticmethod
+    def _document_title(question: Any) -> str:
+        """Title của document: field title, không có thì lấy từ tên file source ("01. Tên thủ tục.json")"""
+        if not isinstance(question, dict):
+            return ''
+        doc_title = question.get('title', '')
+        source_file = question.get('source', '')
+        if not doc_title and source_file:
+            filename = source_file.split('/')[-1].replace('.json', '').replace('.doc', '')
+            if '. ' in filename:
+                doc_title = filename.split('. ', 1)[1]  # Remove numbering like "01. "
+        return doc_title
 
 class RouterBasedQueryService:
     """Service xử lý câu hỏi mơ hồ dựa trên router results"""
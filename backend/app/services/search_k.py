@@ -0,0 +1,236 @@
+"""
+Adaptive broad_search_k
+dynamic_k (số candidates vector search đưa vào reranker, mỗi candidate = 1 cặp cross-encoder) học từ kết quả
+rerank thay vì chỉ dùng các nhánh cố định theo confidence level:
+
+- Mỗi query có rerank ghi vị trí (rank theo vector similarity, 1-based) của nucleus chunk được chọn,
+  theo bucket (confidence level của router, các collections đã search - vd. "a+b" khi search top 2)
+- k của bucket = vị trí nhỏ nhất phủ SEARCH_K_TARGET_COVERAGE nucleus đã quan sát + SEARCH_K_MARGIN, trong
+  [max(SEARCH_K_MIN, CONSENSUS_CANDIDATES), k tĩnh]. Bucket chưa đủ SEARCH_K_MIN_SAMPLES mẫu -> k tĩnh như trước
+- Search chỉ lấy k candidates thì không thấy nucleus nằm sau k (censoring): chỉ học từ queries chạy k tĩnh,
+  và SEARCH_K_EXPLORE_RATE queries của bucket đã adaptive vẫn chạy k tĩnh để tiếp tục học phần đuôi
+- Statistics lưu JSON (SEARCH_K_STATS_FILE, ghi atomic mỗi SAVE_EVERY mẫu mới và lúc shutdown), load lại lúc startup
+
+Nucleus nằm trong top k -> reranker thấy cùng chunk đó, với single best cũng chọn lại đúng chunk
+(cross-encoder chấm từng cặp độc lập); tools/benchmark_search_k.py kiểm chứng offline trên routing dataset.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .metrics import registry, record_search_k
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SEARCH_K_MARGIN = 1
+# Consensus rerank cần ít nhất chừng này candidates - k đã học không được thấp hơn (không thì mất consensus)
+CONSENSUS_CANDIDATES = 5
+SAVE_EVERY = 50
+STATS_VERSION = 1
+
+
+def static_search_k(confidence_level: str) -> int:
+    """dynamic_k cố định theo router confidence (trước khi có số liệu của bucket)"""
+    if confidence_level in ['high', 'high_followup']:
+        return max(8, settings.broad_search_k - 4)  # Router tự tin → ít docs hơn
+    if confidence_level in ['low-medium', 'override_medium', 'medium_followup']:
+        return min(15, settings.broad_search_k + 3)  # Router không chắc → nhiều docs hơn
+    return settings.broad_search_k
+
+
+def smallest_covering_k(position_counts: List[int], coverage: float) -> Optional[int]:
+    """Vị trí nhỏ nhất k sao cho tỷ lệ nucleus có rank <= k đạt coverage (None khi chưa có mẫu)"""
+    total = sum(position_counts)
+    if total == 0:
+        return None
+    cumulative = 0
+    for index, count in enumerate(position_counts):
+        cumulative += count
+        if cumulative >= coverage * total - 1e-9:
+            return index + 1
+    return len(position_counts)
+
+
+class AdaptiveSearchK:
+    """Controller dynamic_k theo bucket (confidence level, collection) - thread-safe"""
+
+    def __init__(
+        self,
+        stats_path: Optional[Path] = None,
+        enabled: Optional[bool] = None,
+        target_coverage: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        explore_rate: Optional[float] = None,
+        min_k: Optional[int] = None
+    ):
+        self.stats_path = Path(stats_path) if stats_path else settings.search_k_stats_path
+        self.enabled = settings.adaptive_search_k if enabled is None else enabled
+        self.target_coverage = target_coverage if target_coverage is not None else settings.search_k_target_coverage
+        self.min_samples = min_samples if min_samples is not None else settings.search_k_min_samples
+        self.explore_rate = explore_rate if explore_rate is not None else settings.search_k_explore_rate
+        self.min_k = max(CONSENSUS_CANDIDATES, min_k if min_k is not None else settings.search_k_min)
+        self._buckets: Dict[str, Dict[str, Any]] = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.load()
+
+    @staticmethod
+    def bucket_key(confidence_level: str, collection: Optional[str]) -> str:
+        # collection: 1 collection hoặc "a+b" (các collections cùng chạy với 1 k)
+        return f"{confidence_level}|{collection or '-'}"
+
+    def _bucket(self, key: str) -> Dict[str, Any]:
+        """Gọi trong lock"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = {'positions': [], 'samples': 0, 'queries': 0, 'pairs_saved': 0}
+        return bucket
+
+    # ---------------------------------------------------------------
+    # Decide / observe
+    # ---------------------------------------------------------------
+    def choose_k(self, confidence_level: str, collection: Optional[str], static_k: int) -> Tuple[int, str]:
+        """(k, mode) - mode: static (chưa đủ mẫu / tắt), adaptive, explore"""
+        if not self.enabled:
+            return static_k, "static"
+        key = self.bucket_key(confidence_level, collection)
+        with self._lock:
+            bucket = self._bucket(key)
+            bucket['queries'] += 1
+            learned = self._learned_k(bucket, static_k)
+            if learned is None or learned >= static_k:
+                mode, k = "static", static_k
+            elif self._random.random() < self.explore_rate:
+                mode, k = "explore", static_k
+            else:
+                mode, k = "adaptive", learned
+                bucket['pairs_saved'] += static_k - learned
+        record_search_k(mode)
+        return k, mode
+
+    def _learned_k(self, bucket: Dict[str, Any], static_k: int) -> Optional[int]:
+        if bucket['samples'] < self.min_samples:
+            return None
+        covering = smallest_covering_k(bucket['positions'], self.target_coverage)
+        if covering is None:
+            return None
+        return max(self.min_k, min(static_k, covering + SEARCH_K_MARGIN))
+
+    def observe(self, confidence_level: str, collection: Optional[str], position: int, searched_k: int, static_k: int):
+        """
+        Nucleus sau rerank nằm ở vector rank `position` (1-based, trong collection của nó).
+        Chỉ học khi search chạy k tĩnh (searched_k >= static_k) - không thì phân phối bị cắt ở searched_k
+        """
+        if not self.enabled or position <= 0 or searched_k < static_k:
+            return
+        key = self.bucket_key(confidence_level, collection)
+        with self._lock:
+            bucket = self._bucket(key)
+            positions = bucket['positions']
+            if len(positions) < position:
+                positions.extend([0] * (position - len(positions)))
+            positions[position - 1] += 1
+            bucket['samples'] += 1
+            self._unsaved += 1
+            should_save = self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    # ---------------------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------------------
+    def load(self):
+        if not self.stats_path.exists():
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != STATS_VERSION:
+                logger.warning(f"⚠️ Search k stats version {data.get('version')} != {STATS_VERSION}, ignored")
+                return
+            with self._lock:
+                for key, bucket in data.get('buckets', {}).items():
+                    self._buckets[key] = {
+                        'positions': [int(count) for count in bucket.get('positions', [])],
+                        'samples': int(bucket.get('samples', 0)),
+                        'queries': 0,
+                        'pairs_saved': 0
+                    }
+            logger.info(f"📏 Loaded search k stats for {len(self._buckets)} buckets from {self.stats_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load search k stats {self.stats_path}: {e}")
+
+    def save(self):
+        """Ghi atomic (tmp rồi replace) - chỉ phân phối vị trí, counters của process không lưu"""
+        with self._lock:
+            if self._unsaved == 0 and self.stats_path.exists():
+                return
+            payload = {
+                'version': STATS_VERSION,
+                'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'buckets': {
+                    key: {'positions': list(bucket['positions']), 'samples': bucket['samples']}
+                    for key, bucket in self._buckets.items() if bucket['samples']
+                }
+            }
+            self._unsaved = 0
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.stats_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save search k stats {self.stats_path}: {e}")
+
+    # ---------------------------------------------------------------
+    # Stats
+    # ---------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = {key: dict(bucket, positions=list(bucket['positions'])) for key, bucket in self._buckets.items()}
+        report = {}
+        for key, bucket in sorted(buckets.items()):
+            report[key] = {
+                'samples': bucket['samples'],
+                'queries': bucket['queries'],
+                'pairs_saved': bucket['pairs_saved'],
+                'covering_k': smallest_covering_k(bucket['positions'], self.target_coverage),
+                'active': bucket['samples'] >= self.min_samples,
+                'positions': bucket['positions']
+            }
+        return {
+            'enabled': self.enabled,
+            'target_coverage': self.target_coverage,
+            'min_samples': self.min_samples,
+            'explore_rate': self.explore_rate,
+            'min_k': self.min_k,
+            'stats_path': str(self.stats_path),
+            'buckets': report
+        }
+
+    def collect_metrics(self):
+        covering = registry.family(
+            "search_k_covering", "gauge",
+            "Vector rank nhỏ nhất phủ target coverage vị trí nucleus theo bucket (confidence level, collection)"
+        )
+        samples = registry.family("search_k_samples", "gauge", "Số vị trí nucleus đã học theo bucket")
+        for key, bucket in self.get_stats()['buckets'].items():
+            confidence_level, collection = key.split("|", 1)
+            samples.add(bucket['samples'], confidence_level=confidence_level, collection=collection)
+            if bucket['covering_k'] is not None:
+                covering.add(bucket['covering_k'], confidence_level=confidence_level, collection=collection)
+        return [covering, samples]
+
+
+# Global instance
+search_k_controller = AdaptiveSearchK()
+registry.register_collector("search_k", search_k_controller.collect_metrics)
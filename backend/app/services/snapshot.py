@@ -0,0 +1,176 @@
+"""
+Versioned Index Snapshots
+Cho phép reload router / vector DB / document metadata cache mà không restart server:
+
+1. Build snapshot mới ở background thread (request đang chạy không bị ảnh hưởng)
+2. Swap atomically - request mới dùng snapshot mới, request đang chạy dùng tiếp snapshot cũ
+3. Snapshot cũ được release khi request cuối cùng dùng nó kết thúc (drain)
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Snapshot mà request hiện tại đã acquire (nested calls dùng lại cùng snapshot)
+_active_snapshot: ContextVar[Optional["IndexSnapshot"]] = ContextVar("active_index_snapshot", default=None)
+
+
+@dataclass
+class IndexSnapshot:
+    """Bộ components phụ thuộc vào dữ liệu index, luôn được dùng cùng nhau"""
+    version: int
+    components: Dict[str, Any]
+    created_at: float = field(default_factory=time.time)
+    build_seconds: float = 0.0
+    active_requests: int = 0
+    retired: bool = False
+    released: bool = False
+
+    def get(self, name: str) -> Any:
+        return self.components[name]
+
+
+class SnapshotManager:
+    """Giữ snapshot hiện tại + các snapshot cũ đang drain, đếm request đang dùng mỗi snapshot"""
+
+    def __init__(self, builder: Callable[[], Dict[str, Any]], initial_components: Optional[Dict[str, Any]] = None):
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._draining: List[IndexSnapshot] = []
+
+        self.last_reload: Dict[str, Any] = {}
+
+        start = time.time()
+        components = initial_components if initial_components is not None else builder()
+        self._current = IndexSnapshot(version=1, components=components, build_seconds=time.time() - start)
+
+    @property
+    def current(self) -> IndexSnapshot:
+        return self._current
+
+    def active(self) -> IndexSnapshot:
+        """Snapshot của request hiện tại (nếu đã acquire), nếu không thì snapshot mới nhất"""
+        return _active_snapshot.get() or self._current
+
+    @contextmanager
+    def acquire(self):
+        """Pin snapshot hiện tại cho suốt request - reentrant cho nested calls"""
+        pinned = _active_snapshot.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        with self._lock:
+            snapshot = self._current
+            snapshot.active_requests += 1
+        token = _active_snapshot.set(snapshot)
+        try:
+            yield snapshot
+        finally:
+            _active_snapshot.reset(token)
+            with self._lock:
+                snapshot.active_requests -= 1
+                should_release = snapshot.retired and snapshot.active_requests == 0
+            if should_release:
+                self._release(snapshot)
+
+    @property
+    def is_reloading(self) -> bool:
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def reload(self, wait: bool = False) -> Dict[str, Any]:
+        """
+        Build snapshot mới rồi swap
+
+        Args:
+            wait: True = chờ build xong (dùng nội bộ), False = chạy background và trả về ngay
+        """
+        with self._lock:
+            if self.is_reloading:
+                return {'status': 'busy', 'current_version': self._current.version}
+            target_version = self._current.version + 1
+            self._reload_thread = threading.Thread(
+                target=self._reload_worker, args=(target_version,), name="index-snapshot-reload", daemon=True
+            )
+            self._reload_thread.start()
+
+        if wait:
+            self._reload_thread.join()
+            return dict(self.last_reload)
+
+        return {'status': 'started', 'target_version': target_version, 'current_version': self._current.version}
+
+    def _reload_worker(self, target_version: int):
+        logger.info(f"🔄 Building index snapshot v{target_version} in background...")
+        start = time.time()
+        try:
+            components = self._builder()
+            build_seconds = time.time() - start
+            new_snapshot = IndexSnapshot(version=target_version, components=components, build_seconds=build_seconds)
+
+            with self._lock:
+                old_snapshot = self._current
+                self._current = new_snapshot
+                old_snapshot.retired = True
+                release_now = old_snapshot.active_requests == 0
+                if not release_now:
+                    self._draining.append(old_snapshot)
+
+            if release_now:
+                self._release(old_snapshot)
+            else:
+                logger.info(f"⏳ Snapshot v{old_snapshot.version} draining ({old_snapshot.active_requests} in-flight requests)")
+
+            self.last_reload = {
+                'status': 'success',
+                'version': target_version,
+                'previous_version': old_snapshot.version,
+                'duration_seconds': round(build_seconds, 3),
+                'finished_at': time.time()
+            }
+            logger.info(f"✅ Index snapshot v{target_version} active (built in {build_seconds:.2f}s)")
+
+        except Exception as e:
+            self.last_reload = {
+                'status': 'error',
+                'version': target_version,
+                'error': str(e),
+                'duration_seconds': round(time.time() - start, 3),
+                'finished_at': time.time()
+            }
+            logger.error(f"❌ Index snapshot v{target_version} build failed, keeping v{self._current.version}: {e}")
+
+    def _release(self, snapshot: IndexSnapshot):
+        with self._lock:
+            if snapshot.released:
+                return
+            snapshot.released = True
+            if snapshot in self._draining:
+                self._draining.remove(snapshot)
+        # Bỏ references để GC thu hồi router vectors / metadata cache của snapshot cũ
+        snapshot.components = {}
+        logger.info(f"🧹 Released index snapshot v{snapshot.version}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            current = self._current
+            draining = [
+                {'version': s.version, 'active_requests': s.active_requests}
+                for s in self._draining
+            ]
+            return {
+                'version': current.version,
+                'active_requests': current.active_requests,
+                'created_at': current.created_at,
+                'build_seconds': round(current.build_seconds, 3),
+                'reloading': self.is_reloading,
+                'draining': draining,
+                'last_reload': dict(self.last_reload) if self.last_reload else None
+            }
@@ -0,0 +1,149 @@
+"""
+Speculative Decoding Drafters
+Draft tokens cho draft-model hook của llama-cpp-python (Llama(draft_model=...)):
+
+- Prompt lookup: câu trả lời pháp lý phần lớn chép nguyên văn từ tài liệu trong prompt (lệ phí, thời hạn,
+  giấy tờ). N-gram cuối của chuỗi đang sinh được tìm lại trong prompt + phần đã sinh, các token đi sau
+  lần xuất hiện gần nhất là draft - model chính verify cả draft trong 1 batch eval
+- Draft GGUF (tùy chọn, LLM_DRAFT_MODEL_PATH): model nhỏ cùng tokenizer, chỉ chạy khi n-gram không khớp
+
+Llama gọi drafter với input_ids = các token đã được chấp nhận + token vừa sample, nên số draft tokens
+được chấp nhận suy ra được ở lần gọi kế tiếp (so draft trước với phần tiếp theo của input_ids).
+Draft cuối cùng của 1 lần generate không biết kết quả -> không tính.
+"""
+
+import logging
+from typing import Dict, Any, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .metrics import record_draft_tokens
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_MODES = ("off", "prompt_lookup")
+
+_EMPTY_DRAFT = np.empty(0, dtype=np.intc)
+
+
+def draft_stats(counts: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        **counts,
+        'acceptance': round(counts['accepted'] / counts['proposed'], 4) if counts['proposed'] else 0.0
+    }
+
+
+class _DraftTracker:
+    """Đếm draft tokens đề xuất / được chấp nhận cho từng lần generate"""
+
+    def __init__(self):
+        self._pending = None  # (vị trí bắt đầu draft trong input_ids, draft tokens)
+        self.request = {'calls': 0, 'proposed': 0, 'accepted': 0}
+
+    def begin(self):
+        self._pending = None
+        self.request = {'calls': 0, 'proposed': 0, 'accepted': 0}
+
+    def _resolve(self, input_ids: np.ndarray):
+        if self._pending is None:
+            return
+        start, draft = self._pending
+        self._pending = None
+        continuation = input_ids[start:start + len(draft)]
+        if len(continuation) == 0:
+            return  # Generation dừng trước khi verify draft
+        mismatch = np.flatnonzero(continuation != draft[:len(continuation)])
+        accepted = int(mismatch[0]) if len(mismatch) else len(continuation)
+        self.request['proposed'] += len(draft)
+        self.request['accepted'] += accepted
+        record_draft_tokens(len(draft), accepted)
+
+    def _observe(self, input_ids: np.ndarray, draft: np.ndarray):
+        self._resolve(input_ids)
+        self.request['calls'] += 1
+        if len(draft):
+            self._pending = (len(input_ids), draft)
+
+    def finish(self) -> Dict[str, Any]:
+        """Kết thúc 1 lần generate: stats của request (draft cuối chưa verify bị bỏ)"""
+        self._pending = None
+        return draft_stats(self.request)
+
+
+class PromptLookupDrafter(_DraftTracker):
+    """Draft từ n-gram match trong prompt + phần đã sinh, fallback draft GGUF nếu có"""
+
+    def __init__(self, max_ngram_size: int = 3, num_pred_tokens: int = 10, fallback: Optional["GGUFDrafter"] = None):
+        super().__init__()
+        self.max_ngram_size = max_ngram_size
+        self.num_pred_tokens = num_pred_tokens
+        self.fallback = fallback
+
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:
+        length = len(input_ids)
+        for size in range(min(self.max_ngram_size, length - 1), 0, -1):
+            tail = input_ids[length - size:]
+            # Windows trên input_ids[:-1]: không khớp với chính n-gram cuối, continuation luôn khác rỗng
+            windows = sliding_window_view(input_ids[:length - 1], size)
+            matches = np.flatnonzero((windows == tail).all(axis=1))
+            if len(matches):
+                start = int(matches[-1]) + size  # Lần xuất hiện gần nhất
+                return input_ids[start:start + self.num_pred_tokens].astype(np.intc)
+        return _EMPTY_DRAFT
+
+    def __call__(self, input_ids, **kwargs) -> np.ndarray:
+        input_ids = np.asarray(input_ids, dtype=np.intc)
+        draft = self.propose(input_ids)
+        if len(draft) == 0 and self.fallback is not None:
+            draft = self.fallback.propose(input_ids)
+        self._observe(input_ids, draft)
+        return draft
+
+
+class GGUFDrafter:
+    """Draft model GGUF nhỏ (cùng vocabulary với model chính) - greedy num_pred_tokens tokens"""
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 10, **llama_kwargs):
+        from llama_cpp import Llama  # Heavy import - chỉ khi dùng draft model
+
+        self.model_path = model_path
+        self.num_pred_tokens = num_pred_tokens
+        self.model = Llama(model_path=model_path, **llama_kwargs)
+        logger.info(f"✅ Draft model loaded: {model_path}")
+
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:
+        draft = []
+        # generate() dùng lại KV cache theo prefix chung với lần gọi trước -> chỉ eval phần token mới
+        for token in self.model.generate(input_ids.tolist(), top_k=1, temp=0.0, repeat_penalty=1.0):
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.asarray(draft, dtype=np.intc)
+
+    def close(self):
+        self.model = None
+
+
+def build_drafter(
+    mode: str,
+    max_ngram_size: int,
+    num_pred_tokens: int,
+    draft_model_path: Optional[str] = None,
+    **llama_kwargs
+) -> Optional[PromptLookupDrafter]:
+    """Drafter cho LLMService theo mode - None khi tắt speculative decoding"""
+    mode = (mode or "off").lower()
+    if mode not in SPECULATIVE_MODES:
+        logger.warning(f"⚠️ Unknown speculative decoding mode '{mode}', disabled")
+        return None
+    if mode == "off":
+        return None
+
+    fallback = None
+    if draft_model_path:
+        try:
+            fallback = GGUFDrafter(draft_model_path, num_pred_tokens=num_pred_tokens, **llama_kwargs)
+        except Exception as e:
+            logger.warning(f"⚠️ Draft model unavailable ({e}), using prompt lookup only")
+    return PromptLookupDrafter(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens, fallback=fallback)
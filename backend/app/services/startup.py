@@ -0,0 +1,229 @@
+"""
+Startup Orchestrator
+Load các components độc lập song song (embedding model, router cache, document metadata cache, ...)
+theo dependency graph, theo dõi tiến độ + thời gian load từng component cho liveness/readiness.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ComponentState:
+    """Trạng thái load của 1 component"""
+    name: str
+    loader: Callable[[Dict[str, Any]], Any]
+    depends_on: Tuple[str, ...] = ()
+    required: bool = True
+    status: str = "pending"  # pending -> loading -> ready | failed | skipped
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future)
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = self.duration
+        return {
+            'status': self.status,
+            'depends_on': list(self.depends_on),
+            'required': self.required,
+            'duration_seconds': round(duration, 3) if duration is not None else None,
+            'error': self.error
+        }
+
+
+class DeferredValue:
+    """
+    Proxy cho kết quả của 1 component chưa load xong
+
+    Attribute access chờ component ready - vd. router load từ cache không cần embedding model,
+    chỉ khi cache miss mới phải chờ model để encode.
+    """
+
+    def __init__(self, future: Future):
+        self._future = future
+
+    def resolve(self) -> Any:
+        return self._future.result()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._future.result(), name)
+
+
+class StartupOrchestrator:
+    """Chạy loaders theo dependency graph trên thread pool, component nào đủ dependencies thì chạy ngay"""
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+        self.components: Dict[str, ComponentState] = {}
+        self.results: Dict[str, Any] = {}
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._callbacks: List[Callable[["StartupOrchestrator"], None]] = []
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def add(self, name: str, loader: Callable[[Dict[str, Any]], Any], depends_on: Tuple[str, ...] = (), required: bool = True):
+        """Đăng ký component - loader nhận dict results của các dependencies"""
+        for dependency in depends_on:
+            if dependency not in self.components:
+                raise ValueError(f"Component '{name}' depends on unknown component '{dependency}'")
+        self.components[name] = ComponentState(name=name, loader=loader, depends_on=tuple(depends_on), required=required)
+        return self
+
+    def deferred(self, name: str) -> DeferredValue:
+        """Proxy tới kết quả component (dùng được trước khi component load xong)"""
+        return DeferredValue(self.components[name].future)
+
+    def on_complete(self, callback: Callable[["StartupOrchestrator"], None]):
+        self._callbacks.append(callback)
+        return self
+
+    # ---------------------------------------------------------------
+    # Execution
+    # ---------------------------------------------------------------
+    def start(self):
+        """Bắt đầu load ở background, trả về ngay (server có thể serve /live, /ready trong lúc load)"""
+        self._started_at = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup")
+        self._schedule_ready_components()
+        if not self.components:
+            self._finish()
+        return self
+
+    def run(self, timeout: Optional[float] = None) -> bool:
+        """Load blocking - trả về True nếu tất cả required components ready"""
+        self.start()
+        self.wait(timeout)
+        return self.is_ready
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _schedule_ready_components(self):
+        with self._lock:
+            runnable = []
+            for state in self.components.values():
+                if state.status != "pending":
+                    continue
+                dependency_states = [self.components[d].status for d in state.depends_on]
+                if any(s in ("failed", "skipped") for s in dependency_states):
+                    state.status = "skipped"
+                    state.error = "dependency failed"
+                    state.future.set_exception(RuntimeError(f"Component '{state.name}' skipped: dependency failed"))
+                    continue
+                if all(s == "ready" for s in dependency_states):
+                    state.status = "loading"
+                    state.started_at = time.perf_counter()
+                    runnable.append(state)
+
+            finished = all(s.status in ("ready", "failed", "skipped") for s in self.components.values())
+
+        for state in runnable:
+            self._executor.submit(self._run_component, state)
+
+        if finished and not runnable:
+            self._finish()
+
+    def _run_component(self, state: ComponentState):
+        logger.info(f"⏳ Loading component: {state.name}")
+        try:
+            dependencies = {d: self.results[d] for d in state.depends_on}
+            result = state.loader(dependencies)
+            with self._lock:
+                self.results[state.name] = result
+                state.status = "ready"
+                state.finished_at = time.perf_counter()
+            state.future.set_result(result)
+            logger.info(f"✅ Component ready: {state.name} ({state.duration:.2f}s)")
+        except Exception as e:
+            with self._lock:
+                state.status = "failed"
+                state.error = str(e)
+                state.finished_at = time.perf_counter()
+            state.future.set_exception(e)
+            logger.error(f"❌ Component failed: {state.name}: {e}")
+
+        self._schedule_ready_components()
+
+    def _finish(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._finished_at = time.perf_counter()
+            self._done.set()
+
+        status = "ready" if self.is_ready else "failed"
+        logger.info(f"🏁 Startup {status} in {self.total_seconds:.2f}s")
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"❌ Startup callback failed: {e}")
+
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    # ---------------------------------------------------------------
+    # Status
+    # ---------------------------------------------------------------
+    @property
+    def is_ready(self) -> bool:
+        return all(s.status == "ready" for s in self.components.values() if s.required)
+
+    @property
+    def is_finished(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def total_seconds(self) -> Optional[float]:
+        if self._started_at is None:
+            return None
+        end = self._finished_at if self._finished_at is not None else time.perf_counter()
+        return end - self._started_at
+
+    def get_timings(self) -> Dict[str, Optional[float]]:
+        return {name: state.duration for name, state in self.components.items()}
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            components = {name: state.to_dict() for name, state in self.components.items()}
+        loaded = sum(1 for c in components.values() if c['status'] == 'ready')
+
+        if self.is_ready:
+            phase = "ready"
+        elif self.is_finished:
+            phase = "failed"
+        elif self._started_at is None:
+            phase = "not_started"
+        else:
+            phase = "starting"
+
+        total = self.total_seconds
+        return {
+            'phase': phase,
+            'ready': self.is_ready,
+            'progress': f"{loaded}/{len(components)}",
+            'total_seconds': round(total, 3) if total is not None else None,
+            'max_workers': self.max_workers,
+            'components': components
+        }
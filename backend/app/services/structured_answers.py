@@ -0,0 +1,257 @@
+"""
+Structured Answers
+Trả lời trực tiếp từ structured metadata của document (không gọi LLM) cho câu hỏi 1 trường:
+
+- query_fee -> fee_text / fee_vnd, query_time -> processing_time_text, query_agency -> executing_agency,
+  query_form -> has_form, query_requirements -> requirements_conditions
+- Chỉ khi: đúng 1 intent (keyword khớp nguyên từ), câu hỏi không phức hợp (điều kiện / so sánh / nhiều ý),
+  confidence của router + reranker >= STRUCTURED_ANSWER_MIN_CONFIDENCE và trường có dữ liệu
+- Còn lại -> LLM như cũ (outcome được đếm để biết vì sao)
+
+STRUCTURED_ANSWER_MODE:
+- on: trả câu trả lời template; STRUCTURED_ANSWER_AUDIT_RATE phần requests vẫn chạy LLM để đối chiếu (audit event)
+- shadow (mặc định): luôn trả lời bằng LLM, chỉ render template + ghi audit event (đánh giá trước khi bật)
+- off: tắt
+
+Stats: tỷ lệ câu trả lời không cần LLM và latency theo nguồn câu trả lời (structured / llm).
+"""
+
+import logging
+import random
+import re
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+from ..core.config import settings
+from .metrics import STRUCTURED_ANSWERS, ANSWER_SECONDS
+from .tracing import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+STRUCTURED_ANSWER_MODES = ("off", "shadow", "on")
+
+# Keywords chặt hơn _detect_specific_intent: chỉ những cụm chắc chắn hỏi đúng 1 trường metadata
+# ('đơn', 'giấy tờ', 'hồ sơ' không nằm ở đây - danh sách hồ sơ không có trong metadata)
+STRUCTURED_INTENT_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    'query_fee': ('phí', 'lệ phí', 'bao nhiêu tiền', 'tốn tiền', 'chi phí', 'miễn phí', 'mất tiền'),
+    'query_time': ('thời gian', 'bao lâu', 'mất bao lâu', 'khi nào xong', 'mấy ngày', 'thời hạn giải quyết'),
+    'query_agency': ('cơ quan', 'nộp ở đâu', 'làm ở đâu', 'ở đâu', 'nơi nộp', 'nơi làm'),
+    'query_form': ('biểu mẫu', 'mẫu tờ khai', 'mẫu đơn', 'form'),
+    'query_requirements': ('điều kiện',),
+}
+
+# Câu hỏi có điều kiện / so sánh / giải thích / lựa chọn -> cần LLM đọc toàn văn
+COMPLEX_QUESTION_MARKERS = (
+    'nếu', 'trường hợp', 'có được', 'được không', 'tại sao', 'vì sao', 'so với', 'khác nhau', 'hay',
+    'ngoài ra', 'còn gì', 'hướng dẫn', 'như thế nào', 'thế nào', 'cách', 'ý nghĩa', 'phạt'
+)
+# Câu hỏi có/không ("... có cần ... không?") - template chỉ nêu giá trị trường, không trả lời có/không
+_YES_NO_PATTERN = re.compile(r'(?<!\w)có(?!\w).*(?<!\w)không(?!\w)')
+
+# Số audit samples gần nhất giữ trong stats
+MAX_RECENT_AUDITS = 10
+
+
+def _compile(phrases) -> "re.Pattern":
+    # Khớp nguyên từ: 'phí' không khớp trong 'phía', 'form' không khớp trong 'format'
+    return re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(p) for p in sorted(phrases, key=len, reverse=True)) + r')(?!\w)')
+
+
+_INTENT_PATTERNS = {intent: _compile(keywords) for intent, keywords in STRUCTURED_INTENT_KEYWORDS.items()}
+_COMPLEX_PATTERN = _compile(COMPLEX_QUESTION_MARKERS)
+
+
+def detect_structured_intents(query: str) -> List[str]:
+    """Mọi intent metadata có trong câu hỏi (theo thứ tự STRUCTURED_INTENT_KEYWORDS)"""
+    query_lower = query.lower()
+    return [intent for intent, pattern in _INTENT_PATTERNS.items() if pattern.search(query_lower)]
+
+
+def _field_text(value: Any) -> str:
+    if value is None or isinstance(value, bool):
+        return ''
+    if isinstance(value, (list, tuple)):
+        return '; '.join(str(item).strip() for item in value if str(item).strip())
+    return str(value).strip()
+
+
+def _sentence(text: str) -> str:
+    text = text.strip()
+    return text if text.endswith(('.', '!', '?')) else f"{text}."
+
+
+def _format_fee(metadata: Dict[str, Any]) -> str:
+    fee_text = _field_text(metadata.get('fee_text'))
+    if fee_text:
+        return fee_text
+    fee_vnd = metadata.get('fee_vnd')
+    if isinstance(fee_vnd, (int, float)) and not isinstance(fee_vnd, bool):
+        return "Miễn lệ phí" if fee_vnd == 0 else f"{int(fee_vnd):,} đồng".replace(',', '.')
+    return _field_text(fee_vnd)
+
+
+def render_structured_answer(intent: str, metadata: Dict[str, Any], document_title: str) -> Optional[str]:
+    """Câu trả lời template tiếng Việt cho intent - None nếu metadata không có trường tương ứng"""
+    procedure = f"thủ tục {document_title}" if document_title else "thủ tục này"
+
+    if intent == 'query_fee':
+        fee = _format_fee(metadata)
+        return _sentence(f"Lệ phí của {procedure}: {fee}") if fee else None
+
+    if intent == 'query_time':
+        processing_time = _field_text(metadata.get('processing_time_text'))
+        return _sentence(f"Thời gian giải quyết {procedure}: {processing_time}") if processing_time else None
+
+    if intent == 'query_agency':
+        agency = _field_text(metadata.get('executing_agency'))
+        return _sentence(f"Cơ quan thực hiện {procedure}: {agency}") if agency else None
+
+    if intent == 'query_form':
+        if 'has_form' not in metadata:
+            return None
+        if metadata.get('has_form'):
+            return f"{procedure.capitalize()} có biểu mẫu/tờ khai cần điền khi nộp hồ sơ."
+        return f"{procedure.capitalize()} không có biểu mẫu cụ thể."
+
+    if intent == 'query_requirements':
+        requirements = _field_text(metadata.get('requirements_conditions'))
+        return _sentence(f"Điều kiện thực hiện {procedure}: {requirements}") if requirements else None
+
+    return None
+
+
+def _field_value(intent: str, metadata: Dict[str, Any]) -> str:
+    """Giá trị trường metadata của intent (dùng cho audit: LLM answer có nêu giá trị này không)"""
+    if intent == 'query_fee':
+        return _format_fee(metadata)
+    field = {
+        'query_time': 'processing_time_text',
+        'query_agency': 'executing_agency',
+        'query_requirements': 'requirements_conditions'
+    }.get(intent)
+    return _field_text(metadata.get(field)) if field else ''
+
+
+class StructuredAnswerEngine:
+    """Quyết định structured answer vs LLM cho 1 request + thống kê traffic / latency theo nguồn câu trả lời"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes: Dict[str, int] = {}
+        self._audits = {'count': 0, 'field_in_llm_answer': 0}
+        self._recent_audits: List[Dict[str, Any]] = []
+        self._latency = {'structured': LatencyHistogram(), 'llm': LatencyHistogram(), 'cache': LatencyHistogram()}
+
+    @property
+    def mode(self) -> str:
+        mode = str(settings.structured_answer_mode).lower()
+        return mode if mode in STRUCTURED_ANSWER_MODES else "off"
+
+    def _count(self, intent: Optional[str], outcome: str):
+        STRUCTURED_ANSWERS.inc(intent=intent or "none", outcome=outcome)
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def evaluate(
+        self,
+        query: str,
+        metadata: Optional[Dict[str, Any]],
+        document_title: str,
+        confidence: float,
+        degraded: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Quyết định cho 1 câu hỏi:
+        {'intent', 'outcome', 'answer' (template hoặc None), 'serve' (trả template thay vì gọi LLM), 'audit'}
+        degraded: hết latency budget (deadline.py) -> bỏ qua confidence tối thiểu và shadow mode, không audit
+        """
+        decision = {'intent': None, 'outcome': 'disabled', 'answer': None, 'serve': False, 'audit': False}
+        mode = self.mode
+        if mode == "off":
+            return decision
+
+        intents = detect_structured_intents(query)
+        if not intents:
+            decision['outcome'] = 'no_intent'
+            return decision  # Không đếm: phần lớn traffic, tỷ lệ tính trên requests trả lời
+        decision['intent'] = intents[0]
+
+        query_lower = query.lower()
+        if len(intents) > 1 or _COMPLEX_PATTERN.search(query_lower) or _YES_NO_PATTERN.search(query_lower):
+            decision['outcome'] = 'compound'
+        elif confidence < settings.structured_answer_min_confidence and not degraded:
+            decision['outcome'] = 'low_confidence'
+        else:
+            decision['answer'] = render_structured_answer(intents[0], metadata or {}, document_title)
+            if decision['answer'] is None:
+                decision['outcome'] = 'missing_field'
+            elif degraded:
+                decision['outcome'], decision['serve'] = 'degraded', True
+            elif mode == "shadow":
+                decision['outcome'], decision['audit'] = 'shadow', True
+            else:
+                decision['outcome'], decision['serve'] = 'answered', True
+                decision['audit'] = random.random() < settings.structured_answer_audit_rate
+
+        self._count(decision['intent'], decision['outcome'])
+        return decision
+
+    def record_audit(self, query: str, decision: Dict[str, Any], metadata: Optional[Dict[str, Any]], llm_answer: str):
+        """So sánh template với câu trả lời LLM của cùng request (audit sample / shadow mode)"""
+        value = _field_value(decision['intent'], metadata or {})
+        # Đối chiếu rẻ: LLM có nêu lại giá trị trường metadata không (theo cụm đầu của giá trị)
+        probe = value.split('.')[0].strip().lower()[:60]
+        field_in_llm_answer = bool(probe) and probe in llm_answer.lower()
+        sample = {
+            'query': query[:200],
+            'intent': decision['intent'],
+            'structured_answer': decision['answer'],
+            'llm_answer': llm_answer[:500],
+            'field_in_llm_answer': field_in_llm_answer
+        }
+        with self._lock:
+            self._audits['count'] += 1
+            self._audits['field_in_llm_answer'] += int(field_in_llm_answer)
+            self._recent_audits = (self._recent_audits + [sample])[-MAX_RECENT_AUDITS:]
+        STRUCTURED_ANSWERS.inc(intent=decision['intent'], outcome="audit")
+        return sample
+
+    def observe_answer(self, source: str, seconds: float):
+        """Latency end-to-end của request trả lời theo nguồn câu trả lời (structured / llm / cache)"""
+        ANSWER_SECONDS.observe(seconds, source=source)
+        self._latency[source].observe(seconds * 1000.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            audits = dict(self._audits)
+        latency = {source: histogram.to_dict() for source, histogram in self._latency.items()}
+        for stats in latency.values():
+            stats.pop('buckets', None)
+
+        structured, llm = latency['structured'], latency['llm']
+        answers = structured['count'] + llm['count']
+        gap = None
+        if structured['p50_ms'] is not None and llm['p50_ms'] is not None:
+            gap = round(llm['p50_ms'] - structured['p50_ms'], 2)
+        return {
+            'mode': self.mode,
+            'outcomes': outcomes,
+            'answers': {'structured': structured['count'], 'llm': llm['count'], 'cache': latency['cache']['count']},
+            'structured_share': round(structured['count'] / answers, 4) if answers else 0.0,
+            'latency': latency,
+            'latency_gap_p50_ms': gap,
+            'audits': {
+                **audits,
+                'agreement': round(audits['field_in_llm_answer'] / audits['count'], 4) if audits['count'] else None
+            }
+        }
+
+    def recent_audits(self, limit: int = MAX_RECENT_AUDITS) -> List[Dict[str, Any]]:
+        """Audit samples gần nhất - chứa query + câu trả lời của users, chỉ trả qua admin endpoint"""
+        with self._lock:
+            return list(self._recent_audits[-limit:]) if limit > 0 else []
+
+
+# Global engine (giống tracer / events)
+structured_answers = StructuredAnswerEngine()
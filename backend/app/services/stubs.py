@@ -0,0 +1,263 @@
+"""
+Stub Models cho Benchmark / Load Test
+Thay thế embedding model, reranker và LLM bằng implementation nhẹ có latency cấu hình được:
+
+- StubEmbeddingModel: feature hashing (từ + cặp từ) -> câu hỏi gần nhau vẫn có cosine cao,
+  nên routing / search / rerank chạy đúng luồng thật mà không cần sentence-transformers
+- StubRerankerService: dùng lại RerankerService (ensure_loaded / unload / consensus), chỉ thay CrossEncoder
+- StubLLMService: không load model, trả lời cố định sau latency cấu hình được; chạy qua GenerationScheduler
+  như LLMService (slots, priority, deadline, cancel), decode từng token (sleep hoặc matmul numpy tốn CPU)
+
+Vector tạo bởi StubEmbeddingModel không tương thích với index build bằng model thật -
+load test nên dùng vector DB build lại bằng stub embedding (xem tools/load_test.py --build-index).
+"""
+
+import logging
+import re
+import time
+import unicodedata
+import zlib
+from typing import List, Dict, Any, Union, Tuple, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from .metrics import registry, track_model_load, record_model_unload, record_generation
+from .reranker import RerankerService
+from .generation_scheduler import GenerationScheduler, GenerationCancelled
+from .cancellation import estimate_remaining_seconds
+from .coalescing import current_stream
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokenize(text: str) -> List[str]:
+    normalized = unicodedata.normalize('NFC', text).lower()
+    return _WORD_PATTERN.findall(normalized)
+
+
+class StubEmbeddingModel:
+    """
+    Embedding giả lập tương thích SentenceTransformer.encode():
+    hash từng từ và cặp từ liền kề vào vector dim chiều (ký hiệu ±1 theo hash), chuẩn hóa L2.
+    Hash dùng crc32 (ổn định giữa các process) để index build ở process khác vẫn khớp.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 1024,
+        latency_seconds: float = 0.0,
+        latency_per_text_seconds: float = 0.0
+    ):
+        self.dimension = dimension
+        self.latency_seconds = latency_seconds
+        self.latency_per_text_seconds = latency_per_text_seconds
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        words = _tokenize(text)
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.calls += 1
+
+        delay = self.latency_seconds + self.latency_per_text_seconds * len(texts)
+        if delay > 0:
+            time.sleep(delay)
+
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        embeddings = np.stack([self._embed(text) for text in texts])
+        return embeddings[0] if single else embeddings
+
+
+class StubCrossEncoder:
+    """CrossEncoder.predict() giả lập: score = tỷ lệ từ của query xuất hiện trong passage"""
+
+    def __init__(self, latency_seconds: float = 0.0, latency_per_pair_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.latency_per_pair_seconds = latency_per_pair_seconds
+
+    def predict(self, pairs: List[Tuple[str, str]], **kwargs) -> np.ndarray:
+        delay = self.latency_seconds + self.latency_per_pair_seconds * len(pairs)
+        if delay > 0:
+            time.sleep(delay)
+
+        scores = []
+        for query, passage in pairs:
+            query_words = set(_tokenize(query))
+            if not query_words:
+                scores.append(0.0)
+                continue
+            passage_words = set(_tokenize(passage))
+            scores.append(len(query_words & passage_words) / len(query_words))
+        return np.array(scores, dtype=np.float32)
+
+
+class StubRerankerService(RerankerService):
+    """
+    RerankerService với StubCrossEncoder - giữ nguyên luồng on-demand load / unload
+    (kể cả chi phí load mỗi query) để load test phản ánh đúng VRAM swap
+    """
+
+    def __init__(
+        self,
+        load_seconds: float = 0.0,
+        latency_seconds: float = 0.0,
+        latency_per_pair_seconds: float = 0.0
+    ):
+        super().__init__(model_name="stub-reranker")
+        self.load_seconds = load_seconds
+        self.latency_seconds = latency_seconds
+        self.latency_per_pair_seconds = latency_per_pair_seconds
+
+    def _load_model(self):
+        if self.model_loaded:
+            return
+        if self.load_seconds > 0:
+            time.sleep(self.load_seconds)
+        self.model = StubCrossEncoder(self.latency_seconds, self.latency_per_pair_seconds)
+        self.model_loaded = True
+
+
+class StubLLMService:
+    """
+    LLM giả lập cho benchmark / load test: không load model, trả về câu trả lời cố định
+    sau latency cấu hình được - đo retrieval + rerank mà không phụ thuộc GPU.
+    compute_dim > 0: mỗi token 1 matmul float32 compute_dim x compute_dim (numpy nhả GIL) thay cho sleep,
+    để slots song song tranh CPU như llama.cpp thật.
+    prompt_tokens_per_second > 0: prefill tốn thời gian theo độ dài context (~3 ký tự / token)
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        tokens_per_second: float = 0.0,
+        load_seconds: float = 0.0,
+        completion_tokens: int = 32,
+        slots: Optional[int] = None,
+        compute_dim: int = 0,
+        prompt_tokens_per_second: float = 0.0
+    ):
+        self.latency_seconds = latency_seconds
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.load_seconds = load_seconds
+        self.completion_tokens = completion_tokens
+        self.compute_dim = compute_dim
+        self.model = None
+        self.model_loaded = False
+        self.calls = 0
+        self.num_slots = max(1, slots if slots is not None else settings.llm_slots)
+        self.scheduler = GenerationScheduler([None] * self.num_slots, max_queue=settings.llm_queue_size, name="llm")
+        registry.register_collector("llm_scheduler", self.scheduler.collect_metrics)
+
+    def unload_model(self):
+        if self.model is not None:
+            self.model = None
+            self.model_loaded = False
+            record_model_unload("llm")
+
+    def ensure_loaded(self):
+        if not self.model_loaded:
+            with track_model_load("llm"):
+                if self.load_seconds > 0:
+                    time.sleep(self.load_seconds)
+                self.model = "stub"
+                self.model_loaded = True
+
+    def is_model_loaded(self) -> bool:
+        return self.model_loaded
+
+    def is_loaded(self) -> bool:
+        return self.model_loaded
+
+    def _decode_token(self, state: Optional[np.ndarray], weights: Optional[np.ndarray]):
+        if weights is not None:
+            return np.tanh(weights @ state)
+        if self.tokens_per_second > 0:
+            time.sleep(1.0 / self.tokens_per_second)
+        return state
+
+    def generate_response(
+        self,
+        user_query: str,
+        context: str = "",
+        priority: int = 0,
+        deadline: Optional[float] = None,
+        cancel_event=None,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        self.ensure_loaded()
+        self.calls += 1
+        prompt_tokens = len(context) // 3
+        token_limit = min(self.completion_tokens, max_tokens) if max_tokens else self.completion_tokens
+        with self.scheduler.acquire(priority=priority, deadline=deadline, cancel_event=cancel_event) as ticket:
+            start_time = time.time()
+            delay = self.latency_seconds
+            if self.prompt_tokens_per_second > 0:
+                delay += prompt_tokens / self.prompt_tokens_per_second
+            if delay > 0:
+                time.sleep(delay)
+
+            weights = state = None
+            if self.compute_dim > 0:
+                rng = np.random.default_rng(ticket.slot.index)
+                weights = rng.standard_normal((self.compute_dim, self.compute_dim), dtype=np.float32) / self.compute_dim
+                state = rng.standard_normal((self.compute_dim, 8), dtype=np.float32)
+
+            response = f"[stub] {user_query[:100]}"
+            words = response.split(" ")
+            stream = current_stream()
+            completion_tokens, stop_reason = 0, None
+            while completion_tokens < token_limit:
+                stop_reason = ticket.should_stop()
+                if stop_reason:
+                    break
+                state = self._decode_token(state, weights)
+                if stream is not None and completion_tokens < len(words):
+                    stream.publish(words[completion_tokens] + (" " if completion_tokens < len(words) - 1 else ""))
+                completion_tokens += 1
+            if stop_reason == 'cancelled':
+                raise GenerationCancelled(estimate_remaining_seconds("generation", time.time() - start_time))
+
+            processing_time = time.time() - start_time
+        record_generation(prompt_tokens, completion_tokens, processing_time)
+        result = {
+            'response': response,
+            'processing_time': processing_time,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+        if stop_reason:
+            result['truncated'] = stop_reason
+        return result
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {
+            'model_path': 'stub',
+            'is_loaded': self.model_loaded,
+            'latency_seconds': self.latency_seconds,
+            'tokens_per_second': self.tokens_per_second,
+            'prompt_tokens_per_second': self.prompt_tokens_per_second,
+            'slots': self.num_slots,
+            'scheduler': self.scheduler.get_stats()
+        }
@@ -0,0 +1,293 @@
+"""
+Per-stage Latency Tracing
+Span tracer nhẹ cho hot path (routing, search, rerank, context expansion, generation):
+
+- 1 RequestTrace / request, lưu trong ContextVar -> nested calls (handle_clarification -> process_query,
+  vector backup strategy) ghi vào cùng trace
+- Thời gian từng stage được ghi vào histogram bucket cố định (p50/p95/p99 theo stage và theo confidence level)
+- Breakdown của từng request được trả về trong response (stage_timings)
+"""
+
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds (ms) - đủ rộng cho cả routing (vài ms) lẫn LLM generation (vài chục giây)
+DEFAULT_BUCKETS_MS: Tuple[float, ...] = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000
+)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_request_trace", default=None)
+
+
+class LatencyHistogram:
+    """Histogram bucket cố định - observe O(log buckets), percentile nội suy tuyến tính trong bucket"""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.counts = [0] * (len(self.buckets_ms) + 1)  # bucket cuối = overflow (> bucket lớn nhất)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms: float):
+        index = bisect_left(self.buckets_ms, value_ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum_ms += value_ms
+            if value_ms > self.max_ms:
+                self.max_ms = value_ms
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        """(bucket counts không cộng dồn, count, sum_ms) - dùng cho exporter"""
+        with self._lock:
+            return list(self.counts), self.count, self.sum_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Ước lượng percentile q (0-100) từ bucket counts"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            max_ms = self.max_ms
+        if total == 0:
+            return None
+
+        rank = q / 100.0 * total
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets_ms[index - 1] if index > 0 else 0.0
+                upper = self.buckets_ms[index] if index < len(self.buckets_ms) else max_ms
+                upper = min(upper, max_ms)
+                fraction = (rank - cumulative) / bucket_count
+                return lower + (max(upper, lower) - lower) * fraction
+            cumulative += bucket_count
+        return max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self.count
+            sum_ms = self.sum_ms
+            max_ms = self.max_ms
+            counts = list(self.counts)
+
+        def _round(value: Optional[float]) -> Optional[float]:
+            return round(value, 2) if value is not None else None
+
+        return {
+            'count': count,
+            'mean_ms': _round(sum_ms / count) if count else None,
+            'p50_ms': _round(self.percentile(50)),
+            'p95_ms': _round(self.percentile(95)),
+            'p99_ms': _round(self.percentile(99)),
+            'max_ms': _round(max_ms) if count else None,
+            'buckets': {
+                **{f"le_{bound:g}": c for bound, c in zip(self.buckets_ms, counts)},
+                'overflow': counts[-1]
+            }
+        }
+
+
+class RequestTrace:
+    """Spans của 1 request - tên stage lồng nhau được nối bằng '.' (vd. clarification.search)"""
+
+    __slots__ = ('kind', 'labels', 'started_at', 'finished_at', 'stage_ms', '_stack')
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.labels: Dict[str, str] = {}
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.stage_ms: Dict[str, float] = {}
+        self._stack: List[str] = []
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        full_name = f"{self._stack[-1]}.{name}" if self._stack else name
+        self._stack.append(full_name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            self._stack.pop()
+            # Cùng stage gọi nhiều lần (vd. search nhiều collections) -> cộng dồn
+            self.stage_ms[full_name] = self.stage_ms.get(full_name, 0.0) + elapsed_ms
+
+    def set_label(self, key: str, value: Any):
+        self.labels[key] = str(value)
+
+    def current_stage(self) -> Optional[str]:
+        """Stage đang chạy - an toàn khi đọc từ thread khác (sampling profiler)"""
+        try:
+            return self._stack[-1]
+        except IndexError:
+            return None
+
+    @property
+    def total_ms(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return (end - self.started_at) * 1000.0
+
+    def timings(self) -> Dict[str, float]:
+        """Breakdown trả về trong response: {stage: ms, ..., total: ms}"""
+        result = {name: round(ms, 2) for name, ms in self.stage_ms.items()}
+        result['total'] = round(self.total_ms, 2)
+        return result
+
+
+class _NullSpan:
+    """No-op context manager khi không có trace (gọi ngoài request hoặc tracing tắt)"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class LatencyTracer:
+    """Registry histograms theo stage và theo (confidence_level, stage)"""
+
+    def __init__(self, enabled: bool = True, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS):
+        self.enabled = enabled
+        self.buckets_ms = buckets_ms
+        self._stages: Dict[str, LatencyHistogram] = {}
+        self._by_confidence: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._traces_recorded = 0
+        self._observers: List[Any] = []  # trace_started / trace_finished (vd. sampling profiler)
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------
+    # Tracing API
+    # ---------------------------------------------------------------
+    @contextmanager
+    def trace(self, kind: str) -> Iterator[Optional[RequestTrace]]:
+        """Mở trace cho request - reentrant: nested call dùng lại trace của request ngoài cùng"""
+        current = _current_trace.get()
+        if current is not None or not self.enabled:
+            yield current
+            return
+
+        request_trace = RequestTrace(kind)
+        token = _current_trace.set(request_trace)
+        observers = self._observers
+        for observer in observers:
+            observer.trace_started(request_trace)
+        try:
+            yield request_trace
+        finally:
+            _current_trace.reset(token)
+            request_trace.finished_at = time.perf_counter()
+            for observer in observers:
+                observer.trace_finished(request_trace)
+            self.record(request_trace)
+
+    def traced(self, kind: str) -> Callable:
+        """Decorator: chạy method trong trace, gắn stage_timings vào dict response"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.trace(kind) as request_trace:
+                    result = func(*args, **kwargs)
+                    if request_trace is not None and isinstance(result, dict):
+                        result['stage_timings'] = request_trace.timings()
+                    return result
+            return wrapper
+        return decorator
+
+    def add_observer(self, observer: Any):
+        with self._lock:
+            if observer not in self._observers:
+                # Copy-on-write: trace() đang chạy giữ list cũ, không cần lock trên hot path
+                self._observers = self._observers + [observer]
+
+    def remove_observer(self, observer: Any):
+        with self._lock:
+            self._observers = [o for o in self._observers if o is not observer]
+
+    def span(self, name: str):
+        request_trace = _current_trace.get()
+        if request_trace is None:
+            return _NULL_SPAN
+        return request_trace.span(name)
+
+    def set_label(self, key: str, value: Any):
+        request_trace = _current_trace.get()
+        if request_trace is not None:
+            request_trace.set_label(key, value)
+
+    # ---------------------------------------------------------------
+    # Histograms
+    # ---------------------------------------------------------------
+    def _histogram(self, registry: Dict, key) -> LatencyHistogram:
+        histogram = registry.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = registry.setdefault(key, LatencyHistogram(self.buckets_ms))
+        return histogram
+
+    def record(self, request_trace: RequestTrace):
+        stages = dict(request_trace.stage_ms)
+        stages[f"{request_trace.kind}.total"] = request_trace.total_ms
+        confidence_level = request_trace.labels.get('confidence_level')
+
+        for stage, elapsed_ms in stages.items():
+            self._histogram(self._stages, stage).observe(elapsed_ms)
+            if confidence_level:
+                self._histogram(self._by_confidence, (confidence_level, stage)).observe(elapsed_ms)
+        with self._lock:
+            self._traces_recorded += 1
+
+    def stage_histograms(self) -> List[Tuple[str, LatencyHistogram]]:
+        with self._lock:
+            return sorted(self._stages.items())
+
+    def confidence_histograms(self) -> List[Tuple[Tuple[str, str], LatencyHistogram]]:
+        with self._lock:
+            return sorted(self._by_confidence.items())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = dict(self._stages)
+            by_confidence = dict(self._by_confidence)
+            traces_recorded = self._traces_recorded
+
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for (level, stage), histogram in sorted(by_confidence.items()):
+            grouped.setdefault(level, {})[stage] = histogram.to_dict()
+
+        return {
+            'enabled': self.enabled,
+            'traces_recorded': traces_recorded,
+            'stages': {stage: histogram.to_dict() for stage, histogram in sorted(stages.items())},
+            'by_confidence_level': grouped
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._by_confidence.clear()
+            self._traces_recorded = 0
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+# Global tracer (giống settings) - RAGService và API dùng chung
+tracer = LatencyTracer(enabled=settings.latency_tracing_enabled)
@@ -1,18 +1,17 @@
 import logging
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import hashlib
 import json
 from ..core.config import settings
+from .metrics import track_model_load, record_cache
+from .embedding_cache import query_embedding_cache
 
 logger = logging.getLogger(__name__)
 
 class VectorDBService:
     """Service quản lý ChromaDB và embeddings với hỗ trợ multi-collection"""
     
-    def __init__(self, persist_directory: Optional[str] = None, embedding_model: Optional[str] = None, default_collection_name: Optional[str] = None):
+    def __init__(self, persist_directory: Optional[str] = None, embedding_model: Optional[str] = None, default_collection_name: Optional[str] = None, load_embedding: bool = True):
         self.persist_directory = persist_directory or str(settings.vectordb_path)
         self.default_collection_name = default_collection_name or settings.chroma_collection_name
         self.embedding_model_name = embedding_model or settings.embedding_model_name
@@ -21,20 +20,60 @@ class VectorDBService:
         if not self.embedding_model_name:
             raise ValueError("Embedding model name cannot be None or empty")
         
-        # Khởi tạo ChromaDB client
+        # Khởi tạo ChromaDB client (heavy import - chỉ khi thực sự tạo client)
+        import chromadb
         self.client = chromadb.PersistentClient(path=self.persist_directory)
         
+        # Cache for collections
+        self.collections_cache = {}
+        
         # Load embedding model với retry logic
-        self.embedding_model = self._load_embedding_model()
+        # load_embedding=False: startup orchestrator load model song song rồi gọi load_embedding_model()
+        self.embedding_model = None
+        if load_embedding:
+            self.load_embedding_model()
+    
+    def load_embedding_model(self):
+        """Load embedding model (idempotent) - raise nếu tất cả strategies đều fail"""
+        if self.embedding_model is not None:
+            return self.embedding_model
         
-        if not self.embedding_model:
-            raise RuntimeError(f"Failed to load embedding model: {self.embedding_model_name}")
+        with track_model_load("embedding"):
+            model = self._load_embedding_model()
+            if not model:
+                raise RuntimeError(f"Failed to load embedding model: {self.embedding_model_name}")
         
-        # Cache for collections
-        self.collections_cache = {}
+        self.embedding_model = model
+        return model
     
+    def spawn_snapshot(self) -> "VectorDBService":
+        """
+        Tạo VectorDBService mới cho index snapshot: client + collection handles mới,
+        dùng chung embedding model đã load (không load lại model khi hot-reload)
+        """
+        import chromadb
+        
+        snapshot = VectorDBService.__new__(VectorDBService)
+        snapshot.persist_directory = self.persist_directory
+        snapshot.default_collection_name = self.default_collection_name
+        snapshot.embedding_model_name = self.embedding_model_name
+        snapshot.client = chromadb.PersistentClient(path=self.persist_directory)
+        snapshot.embedding_model = self.embedding_model
+        snapshot.collections_cache = {}
+        return snapshot
+
     def _load_embedding_model(self):
         """Load embedding model với fallback strategies"""
+        # ONNX backends (export offline) - lỗi thì fallback về PyTorch
+        if settings.embedding_backend != "torch":
+            try:
+                from .embedding_backends import load_onnx_embedding_model
+                return load_onnx_embedding_model(settings.embedding_backend)
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding backend '{settings.embedding_backend}' failed, falling back to torch: {e}")
+        
+        from sentence_transformers import SentenceTransformer  # Heavy import - chỉ khi load model
+        
         # Strategy 1: Load từ explicit local cache path FIRST - CPU for VRAM optimization
         try:
             logger.info(f"Loading embedding model from local cache: {self.embedding_model_name}")
@@ -68,28 +107,20 @@ class VectorDBService:
     
     def _load_from_cache_path(self):
         """Try loading từ explicit local cache path"""
-        cache_path = settings.hf_cache_path / "hub"
-        model_folders = list(cache_path.glob(f"models--{self.embedding_model_name.replace('/', '--')}"))
-        
-        if not model_folders:
-            raise FileNotFoundError(f"No cached model found for {self.embedding_model_name}")
-        
-        # Lấy folder đầu tiên (thường chỉ có 1)
-        model_folder = model_folders[0]
-        snapshots = list((model_folder / "snapshots").iterdir())
-        
-        if not snapshots:
-            raise FileNotFoundError(f"No snapshots found in {model_folder}")
+        from .embedding_backends import find_cached_snapshot
         
         # Load từ snapshot path - FORCE CPU để tiết kiệm VRAM
-        snapshot_path = str(snapshots[0])  # Lấy snapshot đầu tiên
+        from sentence_transformers import SentenceTransformer
+        snapshot_path = str(find_cached_snapshot(self.embedding_model_name))
         logger.info(f"Loading from explicit path: {snapshot_path}")
         return SentenceTransformer(snapshot_path, device='cpu')
     
     def _get_or_create_collection(self, collection_name: str, metadata: Optional[Dict] = None):
         """Tạo hoặc lấy collection theo tên"""
         if collection_name in self.collections_cache:
+            record_cache("chroma_collections", hit=True)
             return self.collections_cache[collection_name]
+        record_cache("chroma_collections", hit=False)
             
         try:
             
@@ -145,13 +176,16 @@ class VectorDBService:
         content = f"{source}_{chunk_index}_{text[:100]}"
         return hashlib.md5(content.encode()).hexdigest()
     
-    def embed_text(self, texts: List[str]) -> List[List[float]]:
+    def embed_text(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
         """Tạo embeddings cho list texts"""
         if not self.embedding_model:
             raise Exception("Embedding model not loaded")
         
         try:
-            embeddings = self.embedding_model.encode(texts, convert_to_tensor=False)
+            encode_kwargs = {'convert_to_tensor': False}
+            if batch_size:
+                encode_kwargs['batch_size'] = batch_size
+            embeddings = self.embedding_model.encode(texts, **encode_kwargs)
             # Convert to proper format
             if hasattr(embeddings, 'tolist'):
                 return embeddings.tolist()
@@ -161,6 +195,59 @@ class VectorDBService:
             logger.error(f"Error creating embeddings: {e}")
             raise
     
+    def build_chunk_record(self, chunk_data: Dict[str, Any], collection_name: str, index: int = 0) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Chuyển 1 chunk (format từ JSON processing) thành (id, content, metadata) cho ChromaDB
+        
+        Returns None nếu chunk không có content
+        """
+        content = chunk_data.get('content', '')
+        if not content:
+            return None
+        
+        # Lấy source info và metadata
+        source_info = chunk_data.get('source', {})
+        metadata_info = chunk_data.get('metadata', {})
+        
+        # Tạo metadata đầy đủ cho ChromaDB
+        full_metadata = {
+            # Source information for traceability
+            'file_path': source_info.get('file_path', ''),
+            'document_title': source_info.get('document_title', ''),
+            'document_code': source_info.get('document_code', ''),
+            'section_title': source_info.get('section_title', ''),
+            'source_reference': source_info.get('source_reference', ''),
+            'chunk_id': source_info.get('chunk_id', ''),
+            'chunk_index_num': source_info.get('chunk_index_num', 0),  # Thêm chunk_index_num
+            'document_id': source_info.get('document_id', ''),  # Thêm document_id
+            'issuing_authority': source_info.get('issuing_authority', ''),
+            'executing_agency': source_info.get('executing_agency', ''),
+            'effective_date': source_info.get('effective_date', ''),
+            
+            # Content metadata
+            'type': chunk_data.get('type', 'json_section'),
+            'keywords': json.dumps(chunk_data.get('keywords', []), ensure_ascii=False),
+            'processing_time': metadata_info.get('processing_time', ''),
+            'fee_info': metadata_info.get('fee_info', ''),
+            'legal_basis': json.dumps(metadata_info.get('legal_basis', []), ensure_ascii=False),
+            
+            # Collection info
+            'collection': collection_name
+        }
+        
+        # Sử dụng chunk_id từ source làm ID, đảm bảo là string
+        chunk_id_raw = source_info.get('chunk_id', '')
+        if chunk_id_raw:
+            unique_id = str(chunk_id_raw)
+        else:
+            unique_id = self._generate_document_id(
+                content, 
+                source_info.get('file_path', 'unknown'), 
+                index
+            )
+        
+        return unique_id, content, full_metadata
+    
     def add_documents_to_collection(self, collection_name: str, documents: List[Dict[str, Any]], collection_metadata: Optional[Dict] = None) -> int:
         """Thêm documents vào collection cụ thể - đã cập nhật cho JSON format"""
         collection = self._get_or_create_collection(collection_name, collection_metadata)
@@ -176,54 +263,14 @@ class VectorDBService:
         ids = []
         
         for chunk_data in documents:
-            content = chunk_data.get('content', '')
-            if not content:
+            record = self.build_chunk_record(chunk_data, collection_name, len(ids))
+            if not record:
                 continue
             
-            # Lấy source info và metadata
-            source_info = chunk_data.get('source', {})
-            metadata_info = chunk_data.get('metadata', {})
-            
-            # Tạo metadata đầy đủ cho ChromaDB
-            full_metadata = {
-                # Source information for traceability
-                'file_path': source_info.get('file_path', ''),
-                'document_title': source_info.get('document_title', ''),
-                'document_code': source_info.get('document_code', ''),
-                'section_title': source_info.get('section_title', ''),
-                'source_reference': source_info.get('source_reference', ''),
-                'chunk_id': source_info.get('chunk_id', ''),
-                'chunk_index_num': source_info.get('chunk_index_num', 0),  # Thêm chunk_index_num
-                'document_id': source_info.get('document_id', ''),  # Thêm document_id
-                'issuing_authority': source_info.get('issuing_authority', ''),
-                'executing_agency': source_info.get('executing_agency', ''),
-                'effective_date': source_info.get('effective_date', ''),
-                
-                # Content metadata
-                'type': chunk_data.get('type', 'json_section'),
-                'keywords': json.dumps(chunk_data.get('keywords', []), ensure_ascii=False),
-                'processing_time': metadata_info.get('processing_time', ''),
-                'fee_info': metadata_info.get('fee_info', ''),
-                'legal_basis': json.dumps(metadata_info.get('legal_basis', []), ensure_ascii=False),
-                
-                # Collection info
-                'collection': collection_name
-            }
-            
+            unique_id, content, full_metadata = record
+            ids.append(unique_id)
             chunk_texts.append(content)
             metadatas.append(full_metadata)
-            
-            # Sử dụng chunk_id từ source làm ID, đảm bảo là string
-            chunk_id_raw = source_info.get('chunk_id', '')
-            if chunk_id_raw:
-                unique_id = str(chunk_id_raw)
-            else:
-                unique_id = self._generate_document_id(
-                    content, 
-                    source_info.get('file_path', 'unknown'), 
-                    len(ids)
-                )
-            ids.append(unique_id)
         
         if chunk_texts:
             try:
@@ -246,6 +293,75 @@ class VectorDBService:
         
         logger.info(f"Total {total_chunks} chunks added to collection {collection_name}")
         return total_chunks
+    
+    def upsert_chunk_batch(self, collection_name: str, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings: List[List[float]]) -> int:
+        """
+        Ghi 1 batch chunks đã embed sẵn vào collection (upsert - idempotent)
+        
+        Dùng cho streaming build: ghi lại cùng chunk id không sinh duplicate
+        """
+        if not ids:
+            return 0
+        
+        collection = self._get_or_create_collection(collection_name)
+        collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings
+        )
+        return len(ids)
+
+    def delete_chunks(self, collection_name: str, ids: List[str]) -> int:
+        """Xóa các chunks theo id khỏi collection"""
+        if not ids:
+            return 0
+
+        collection = self._get_or_create_collection(collection_name)
+        collection.delete(ids=ids)
+        logger.info(f"Deleted {len(ids)} chunks from collection {collection_name}")
+        return len(ids)
+
+    def get_chunks_for_file(self, collection_name: str, file_path: str) -> List[Dict[str, Any]]:
+        """Lấy chunks (id, content, metadata) đã index của 1 file - lọc trực tiếp theo metadata file_path"""
+        try:
+            if not self.collection_exists(collection_name):
+                return []
+
+            collection = self.get_collection(collection_name)
+            results = collection.get(
+                where={'file_path': file_path},
+                include=['documents', 'metadatas']
+            )
+
+            ids = results.get('ids') or []
+            documents = results.get('documents') or []
+            metadatas = results.get('metadatas') or []
+            return [
+                {'id': chunk_id, 'content': documents[i], 'metadata': metadatas[i]}
+                for i, chunk_id in enumerate(ids)
+                if i < len(documents) and i < len(metadatas)
+            ]
+        except Exception as e:
+            logger.error(f"Error getting chunks for {file_path} from {collection_name}: {e}")
+            return []
+
+    def get_indexed_files(self) -> Dict[str, Dict[str, List[str]]]:
+        """collection -> file_path -> chunk ids của mọi chunk đang có trong Chroma (chỉ đọc metadata)"""
+        indexed: Dict[str, Dict[str, List[str]]] = {}
+        for info in self.list_collections():
+            collection_name = info['name']
+            try:
+                results = self.get_collection(collection_name).get(include=['metadatas'])
+            except Exception as e:
+                logger.error(f"Error listing indexed files of {collection_name}: {e}")
+                continue
+            files = indexed.setdefault(collection_name, {})
+            for chunk_id, metadata in zip(results.get('ids') or [], results.get('metadatas') or []):
+                file_path = (metadata or {}).get('file_path')
+                if file_path:
+                    files.setdefault(file_path, []).append(chunk_id)
+        return indexed
 
     def search_in_collection(self, collection_name: str, query: str, top_k: Optional[int] = None, similarity_threshold: Optional[float] = None, where_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Tìm kiếm trong collection cụ thể - sử dụng config defaults"""
@@ -258,7 +374,9 @@ class VectorDBService:
             collection = self.get_collection(collection_name)
             
             # Tạo embedding cho query
-            query_embedding = self.embed_text([query])[0]
+            if not self.embedding_model:
+                raise Exception("Embedding model not loaded")
+            query_embedding = query_embedding_cache.encode(self.embedding_model, query).tolist()
             
             # Convert smart_filters to ChromaDB where clause
             where_clause = self._build_where_clause(where_filter) if where_filter else None
@@ -273,24 +391,26 @@ class VectorDBService:
             # 🔧 DEBUG: Test different approaches  
             if where_clause:
                 query_params['where'] = where_clause
-                logger.info(f"🔍 Searching WITH filters: {where_clause}")
+                logger.debug("🔍 Searching WITH filters: %s", where_clause)
                 
                 # DEBUG: Test a simple search first to see if collection has data
-                try:
-                    simple_results = collection.query(
-                        query_embeddings=[query_embedding],
-                        n_results=min(3, top_k),
-                        include=['documents', 'metadatas']
-                    )
-                    simple_count = 0
-                    if simple_results and simple_results.get('documents') and simple_results['documents']:
-                        simple_count = len(simple_results['documents'][0])
-                    logger.info(f"🔍 Simple search (no filters): {simple_count} results")
-                except Exception as e:
-                    logger.warning(f"🔍 Simple search failed: {e}")
+                # (thêm 1 query Chroma mỗi request -> chỉ chạy khi bật DEBUG log)
+                if logger.isEnabledFor(logging.DEBUG):
+                    try:
+                        simple_results = collection.query(
+                            query_embeddings=[query_embedding],
+                            n_results=min(3, top_k),
+                            include=['documents', 'metadatas']
+                        )
+                        simple_count = 0
+                        if simple_results and simple_results.get('documents') and simple_results['documents']:
+                            simple_count = len(simple_results['documents'][0])
+                        logger.debug("🔍 Simple search (no filters): %s results", simple_count)
+                    except Exception as e:
+                        logger.warning(f"🔍 Simple search failed: {e}")
                 
             else:
-                logger.info(f"🔍 Search WITHOUT filters")
+                logger.debug("🔍 Search WITHOUT filters")
             
             # Execute the main search with fallback
             try:
@@ -340,17 +460,7 @@ class VectorDBService:
                             pass
                         
                         # Tạo source information để frontend sử dụng
-                        source_info = {
-                            'file_path': metadata.get('file_path', ''),
-                            'document_title': metadata.get('document_title', ''),
-                            'document_code': metadata.get('document_code', ''),
-                            'section_title': metadata.get('section_title', ''),
-                            'source_reference': metadata.get('source_reference', ''),
-                            'chunk_id': metadata.get('chunk_id', ''),
-                            'issuing_authority': metadata.get('issuing_authority', ''),
-                            'executing_agency': metadata.get('executing_agency', ''),
-                            'effective_date': metadata.get('effective_date', '')
-                        }
+                        source_info = self._source_info(metadata)
                         
                         formatted_results.append({
                             'content': doc,
@@ -364,13 +474,75 @@ class VectorDBService:
                             'fee_info': metadata.get('fee_info', '')
                         })
             
-            logger.info(f"Search in collection {collection_name}: {len(formatted_results)} results above threshold {similarity_threshold}")
+            logger.debug("Search in collection %s: %s results above threshold %s", collection_name, len(formatted_results), similarity_threshold)
             return formatted_results
             
         except Exception as e:
             logger.error(f"Error searching in collection {collection_name}: {e}")
             return []
     
+    @staticmethod
+    def _source_info(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'file_path': metadata.get('file_path', ''),
+            'document_title': metadata.get('document_title', ''),
+            'document_code': metadata.get('document_code', ''),
+            'section_title': metadata.get('section_title', ''),
+            'source_reference': metadata.get('source_reference', ''),
+            'chunk_id': metadata.get('chunk_id', ''),
+            'issuing_authority': metadata.get('issuing_authority', ''),
+            'executing_agency': metadata.get('executing_agency', ''),
+            'effective_date': metadata.get('effective_date', '')
+        }
+    
+    def get_document_chunks(self, collection_name: str, document_title: str, include_embeddings: bool = False) -> Dict[str, List[Any]]:
+        """ids / metadatas (+ embeddings) các chunks của 1 document - lọc metadata document_title, không embed query"""
+        try:
+            collection = self.get_collection(collection_name)
+            include = ['metadatas', 'embeddings'] if include_embeddings else ['metadatas']
+            results = collection.get(where={'document_title': document_title}, include=include)
+            embeddings = results.get('embeddings') if include_embeddings else None
+            return {
+                'ids': results.get('ids') or [],
+                'metadatas': results.get('metadatas') or [],
+                'embeddings': embeddings if embeddings is not None else []
+            }
+        except Exception as e:
+            logger.error(f"Error getting chunks of '{document_title}' from {collection_name}: {e}")
+            return {'ids': [], 'metadatas': [], 'embeddings': []}
+    
+    def get_chunks_by_ids(self, collection_name: str, ids: List[str], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Chunks theo id, cùng format với kết quả search_in_collection (thứ tự theo ids, id không còn thì bỏ qua)"""
+        if not ids:
+            return []
+        try:
+            collection = self.get_collection(collection_name)
+            include = ['documents', 'metadatas'] + (['embeddings'] if include_embeddings else [])
+            results = collection.get(ids=list(ids), include=include)
+        except Exception as e:
+            logger.error(f"Error getting chunks by id from {collection_name}: {e}")
+            return []
+        
+        documents = results.get('documents') or []
+        metadatas = results.get('metadatas') or []
+        embeddings = results.get('embeddings') if include_embeddings else None
+        chunks = {}
+        for i, chunk_id in enumerate(results.get('ids') or []):
+            metadata = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+            chunk = {
+                'id': chunk_id,
+                'content': documents[i] if i < len(documents) else '',
+                'metadata': metadata,
+                'source': self._source_info(metadata),
+                'collection': collection_name,
+                'processing_time': metadata.get('processing_time', ''),
+                'fee_info': metadata.get('fee_info', '')
+            }
+            if embeddings is not None and i < len(embeddings):
+                chunk['embedding'] = embeddings[i]
+            chunks[chunk_id] = chunk
+        return [chunks[chunk_id] for chunk_id in ids if chunk_id in chunks]
+    
     def search_across_collections(self, query: str, collections: Optional[List[str]] = None, top_k: Optional[int] = None, similarity_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
         """Tìm kiếm qua nhiều collections - sử dụng config defaults"""
         # Sử dụng values từ config nếu không được truyền vào
@@ -497,7 +669,7 @@ class VectorDBService:
         ChromaDB requires $and operator for multiple conditions
         """
         # 🔍 DEBUG: Log input filters
-        logger.info(f"🔍 _build_where_clause input: {smart_filters}")
+        logger.debug("🔍 _build_where_clause input: %s", smart_filters)
         
         conditions = []
         
@@ -505,7 +677,7 @@ class VectorDBService:
             # 🎯 PRIORITY STRATEGY: Use exact_title ONLY if available (highest precision)
             if 'exact_title' in smart_filters and smart_filters['exact_title']:
                 exact_titles = smart_filters['exact_title']
-                logger.info(f"🔍 Found exact_title: {exact_titles}, type: {type(exact_titles)}")
+                logger.debug("🔍 Found exact_title: %s, type: %s", exact_titles, type(exact_titles))
                 if isinstance(exact_titles, list) and exact_titles:
                     # Đảm bảo list không rỗng và có giá trị hợp lệ
                     valid_titles = [title for title in exact_titles if title and title.strip()]
@@ -515,21 +687,21 @@ class VectorDBService:
                         else:
                             filter_result = {"document_title": {"$in": valid_titles}}
                         # 🔥 HIGH PRECISION: If we have exact title, use ONLY that filter
-                        logger.info(f"🎯 Using HIGH PRECISION filter: {filter_result}")
+                        logger.debug("🎯 Using HIGH PRECISION filter: %s", filter_result)
                         return filter_result
                 elif isinstance(exact_titles, str) and exact_titles.strip():
                     filter_result = {"document_title": exact_titles.strip()}
-                    logger.info(f"🎯 Using HIGH PRECISION filter (string): {filter_result}")
+                    logger.debug("🎯 Using HIGH PRECISION filter (string): %s", filter_result)
                     return filter_result
             
             # 🔥 NEW: Support direct document_title filter (for forced routing)
             if 'document_title' in smart_filters and smart_filters['document_title']:
                 doc_title = smart_filters['document_title']
                 if isinstance(doc_title, str) and doc_title.strip():
-                    logger.info(f"🎯 Using FORCED document filter: {doc_title}")
+                    logger.debug("🎯 Using FORCED document filter: %s", doc_title)
                     return {"document_title": doc_title.strip()}
                 elif isinstance(doc_title, list) and doc_title:
-                    logger.info(f"🎯 Using FORCED document filter: {doc_title}")
+                    logger.debug("🎯 Using FORCED document filter: %s", doc_title)
                     return {"document_title": {"$in": [t.strip() for t in doc_title if t.strip()]}}
             
             # 🎯 FALLBACK: If no exact_title or document_title, use other filters
@@ -580,14 +752,14 @@ class VectorDBService:
             
             # Build final where clause
             if len(conditions) == 0:
-                logger.info(f"🔍 No conditions found, returning empty filter")
+                logger.debug("🔍 No conditions found, returning empty filter")
                 return {}
             elif len(conditions) == 1:
                 where_clause = conditions[0]
             else:
                 where_clause = {"$and": conditions}
                         
-            logger.info(f"🔧 Built where clause with {len(conditions)} conditions: {where_clause}")
+            logger.debug("🔧 Built where clause with %s conditions: %s", len(conditions), where_clause)
             return where_clause
             
         except Exception as e:
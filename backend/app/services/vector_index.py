@@ -0,0 +1,171 @@
+"""
+Quantized Vector Index
+Brute-force cosine search trên vectors đã chuẩn hóa với 4 dạng lưu trữ:
+
+- float32: exact (matmul trực tiếp)
+- float16: 2x nhỏ hơn, score xấp xỉ (NumPy không có BLAS half - chậm hơn float32 trên CPU, chỉ lợi RAM)
+- int8:    4x nhỏ hơn, scale riêng từng dimension (max |x| của cột / 127)
+- binary:  32x nhỏ hơn, 1 bit dấu / dimension, pre-filter bằng Hamming distance (XOR + popcount)
+
+Các dạng nén chỉ dùng để lấy shortlist (rescore_k rows), shortlist được rescore exact bằng float32.
+Float32 dùng để rescore có thể là np.memmap (.npy trên disk) - chỉ các rows trong shortlist được đọc,
+nên RAM chỉ giữ codes.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_MODES = ("float32", "float16", "int8", "binary")
+
+# Binary shortlist = rescore_k x BINARY_OVERSAMPLE (Hamming distance phân biệt kém giữa các câu gần nhau)
+BINARY_OVERSAMPLE = 4
+
+# Popcount cho numpy < 2.0 (không có np.bitwise_count)
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits)
+    return _POPCOUNT_TABLE[bits]
+
+
+class QuantizedVectorIndex:
+    """
+    Cosine index cho vectors (n, dim). Vectors được chuẩn hóa L2 khi build;
+    rescore_vectors (nếu truyền vào) phải là float32 đã chuẩn hóa cùng thứ tự rows - thường là memmap.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        mode: str = "float32",
+        rescore_k: int = 32,
+        rescore_vectors: Optional[np.ndarray] = None,
+        block_rows: int = 128
+    ):
+        if mode not in VECTOR_INDEX_MODES:
+            raise ValueError(f"Unknown vector index mode: {mode} (choose from {', '.join(VECTOR_INDEX_MODES)})")
+
+        normalized = normalize_rows(vectors) if rescore_vectors is None else None
+        self.mode = mode
+        self.rescore_k = rescore_k
+        self.block_rows = block_rows
+        self.rows, self.dim = np.shape(vectors)
+        self._rescore = rescore_vectors if rescore_vectors is not None else normalized
+
+        if mode == "float32":
+            self._codes = self._rescore
+        else:
+            source = normalized if normalized is not None else np.asarray(self._rescore, dtype=np.float32)
+            if mode == "float16":
+                self._codes = source.astype(np.float16)
+            elif mode == "int8":
+                self._scale = np.clip(np.abs(source).max(axis=0), 1e-12, None) / 127.0
+                self._codes = np.round(source / self._scale).astype(np.int8)
+            else:
+                self._codes = np.packbits(source > 0, axis=1)
+                # XOR + popcount trên uint64 nhanh hơn ~1.5x so với từng byte
+                if self._codes.shape[1] % 8 == 0:
+                    self._codes = self._codes.view(np.uint64)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @classmethod
+    def from_npy(cls, path: Path, mode: str = "float32", rescore_k: int = 32, mmap: bool = True) -> "QuantizedVectorIndex":
+        """Index từ .npy float32 đã chuẩn hóa - mmap: float32 chỉ nằm trên disk / page cache"""
+        vectors = np.load(path, mmap_mode='r' if mmap else None)
+        if mode == "float32" and not mmap:
+            return cls(vectors, mode=mode, rescore_k=rescore_k)
+        return cls(vectors, mode=mode, rescore_k=rescore_k, rescore_vectors=vectors)
+
+    # ---------------------------------------------------------------
+    # Scoring
+    # ---------------------------------------------------------------
+    def approx_scores(self, query: np.ndarray) -> np.ndarray:
+        """Score xấp xỉ cosine (n,) - exact với float32"""
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+
+        if self.mode == "float32":
+            return np.asarray(self._codes @ query, dtype=np.float32)
+
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0).view(self._codes.dtype)
+            hamming = _popcount(np.bitwise_xor(self._codes, query_bits)).sum(axis=1, dtype=np.int32)
+            # SimHash: cos ≈ cos(pi * hamming / dim) - giữ đúng thứ tự, đủ để so sánh xấp xỉ giữa collections
+            return np.cos(np.pi * hamming / self.dim).astype(np.float32)
+
+        # float16 / int8: upcast từng block nhỏ vào buffer dùng lại (nằm trong L2 cache),
+        # không tạo bản float32 của cả ma trận
+        weights = query * self._scale if self.mode == "int8" else query
+        scores = np.empty(self.rows, dtype=np.float32)
+        buffer = np.empty((self.block_rows, self.dim), dtype=np.float32)
+        for start in range(0, self.rows, self.block_rows):
+            block = self._codes[start:start + self.block_rows]
+            np.copyto(buffer[:len(block)], block, casting='unsafe')
+            scores[start:start + len(block)] = buffer[:len(block)] @ weights
+        return scores
+
+    def exact_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine exact cho các rows (float32, đọc từ memmap nếu có)"""
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        rows = np.asarray(rows)
+        order = np.argsort(rows)  # memmap đọc tuần tự nhanh hơn
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[order] = np.asarray(self._rescore[rows[order]], dtype=np.float32) @ query
+        return scores
+
+    def shortlist(self, scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+        """Top-k rows theo score (không sort) - binary lấy rộng hơn vì Hamming chỉ xếp hạng thô"""
+        if k is None:
+            k = self.rescore_k * (BINARY_OVERSAMPLE if self.mode == "binary" else 1)
+        k = min(k, len(scores))
+        if k >= len(scores):
+            return np.arange(len(scores))
+        return np.argpartition(-scores, k - 1)[:k]
+
+    def search(self, query: np.ndarray, top_k: int = 10, rescore_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, exact scores) top_k, giảm dần"""
+        scores = self.approx_scores(query)
+        if self.mode == "float32":
+            rows = self.shortlist(scores, top_k)
+            exact = scores[rows]
+        else:
+            rows = self.shortlist(scores, max(top_k, rescore_k) if rescore_k else None)
+            if len(rows) < top_k:
+                rows = self.shortlist(scores, top_k)
+            exact = self.exact_scores(query, rows)
+        order = np.argsort(-exact, kind='stable')[:top_k]
+        return rows[order], exact[order]
+
+    # ---------------------------------------------------------------
+    # Stats
+    # ---------------------------------------------------------------
+    def memory_usage(self) -> Dict[str, Any]:
+        """Codes (RAM) + float32 rescore vectors (0 trong RAM nếu memmap)"""
+        rescore_mmap = isinstance(self._rescore, np.memmap)
+        code_bytes = int(self._codes.nbytes) if self._codes is not self._rescore else 0
+        if self.mode == "int8":
+            code_bytes += int(self._scale.nbytes)
+        rescore_bytes = int(np.asarray(self._rescore).nbytes)
+        heap_bytes = code_bytes + (0 if rescore_mmap else rescore_bytes)
+        return {
+            'mode': self.mode,
+            'rows': self.rows,
+            'dim': self.dim,
+            'code_bytes': code_bytes,
+            'rescore_bytes': rescore_bytes,
+            'rescore_mmap': rescore_mmap,
+            'heap_mb': round(heap_bytes / (1024 * 1024), 3)
+        }
@@ -8,6 +8,8 @@ Optimized Enhanced Main.py với VRAM-optimized architecture
 """
 
 import logging
+from typing import Any, Callable, Dict, Optional
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,7 +18,14 @@ from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.services.vector import VectorDBService
 from app.services.language_model import LLMService
+from app.services.reranker import RerankerService
+from app.services.router import QueryRouter, RouterBasedQueryService
+from app.services.context import ContextExpander
 from app.services.rag_engine import RAGService
+from app.services.startup import StartupOrchestrator
+from app.services.profiling import profiler
+from app.services.events import events
+from app.services.search_k import search_k_controller
 from app.api import rag
 
 # Cấu hình logging
@@ -30,64 +39,136 @@ logger = logging.getLogger(__name__)
 vectordb_service = None
 llm_service = None
 rag_service = None
+startup_orchestrator = None
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Quản lý lifecycle với VRAM-optimized architecture"""
-    # Startup
-    logger.info("🚀 Starting VRAM-Optimized LegalRAG API...")
+# Factories thay thế models thật ("embedding", "llm", "reranker") - load test gán stubs trước khi boot app
+model_overrides: Dict[str, Callable[[], Any]] = {}
+
+def create_startup_orchestrator(
+    max_workers: int = settings.startup_workers,
+    overrides: Optional[Dict[str, Callable[[], Any]]] = None
+) -> StartupOrchestrator:
+    """
+    Dependency graph của startup - các nhánh độc lập load song song:
     
-    try:
-        # Khởi tạo services theo thứ tự tối ưu VRAM
-        global vectordb_service, llm_service, rag_service
-        logger.info("Initializing VRAM-optimized services...")
-        
-        # 1. VectorDB Service (Embedding Model sẽ được chuyển sang CPU)
-        logger.info("🔧 Initializing VectorDB service with CPU embedding...")
-        vectordb_service = VectorDBService()
-        logger.info("✅ VectorDB service initialized (Embedding: CPU)")
-        
-        # 2. LLM Service (GPU cho generation tasks)
-        logger.info("🔧 Initializing LLM service on GPU...")
-        llm_service = LLMService()
-        logger.info("✅ LLM service initialized (LLM: GPU)")
-        
-        # 3. Optimized Enhanced RAG Service
-        logger.info("🔧 Initializing Optimized Enhanced RAG service...")
-        documents_dir = settings.base_dir / "data" / "documents"  
-        rag_service = RAGService(
+        chroma ──┬── embedding_model ──┐
+                 ├── router_cache ─────┤  (router chỉ chờ embedding model khi cache miss)
+                 └── document_metadata ┤
+        llm ───────────────────────────┤
+        reranker ──────────────────────┴── rag_service
+    """
+    documents_dir = settings.base_dir / "data" / "documents"
+    overrides = overrides or {}
+    orchestrator = StartupOrchestrator(max_workers=max_workers)
+    
+    # 1. ChromaDB client - embedding model load riêng để chạy song song với router/metadata cache
+    orchestrator.add("chroma", lambda deps: VectorDBService(load_embedding=False))
+    
+    # 2. Embedding Model (CPU)
+    def load_embedding_model(deps):
+        if "embedding" in overrides:
+            deps["chroma"].embedding_model = overrides["embedding"]()
+        return deps["chroma"].load_embedding_model()
+    
+    orchestrator.add("embedding_model", load_embedding_model, depends_on=("chroma",))
+    
+    # 3. Router - load từ cache không cần embedding model
+    orchestrator.add(
+        "router_cache",
+        lambda deps: QueryRouter(embedding_model=orchestrator.deferred("embedding_model")),
+        depends_on=("chroma",)
+    )
+    
+    # 4. Document metadata cache cho context expansion
+    orchestrator.add(
+        "document_metadata",
+        lambda deps: ContextExpander(vectordb_service=deps["chroma"], documents_dir=str(documents_dir)),
+        depends_on=("chroma",)
+    )
+    
+    # 5. LLM (GPU, load on-demand) + Reranker (GPU, load on-demand)
+    orchestrator.add("llm", lambda deps: overrides["llm"]() if "llm" in overrides else LLMService())
+    orchestrator.add(
+        "reranker",
+        lambda deps: overrides["reranker"]() if "reranker" in overrides else RerankerService()
+    )
+    
+    # 6. RAG Service từ các components đã load
+    def build_rag_service(deps):
+        # Embedding model đã sẵn sàng: seed query embedding cache từ vectors router vừa load
+        deps["router_cache"].seed_query_embedding_cache()
+        return RAGService(
             documents_dir=str(documents_dir),
-            vectordb_service=vectordb_service,
-            llm_service=llm_service
+            vectordb_service=deps["chroma"],
+            llm_service=deps["llm"],
+            index_components={
+                'vectordb_service': deps["chroma"],
+                'smart_router': deps["router_cache"],
+                'ambiguous_service': RouterBasedQueryService(router=deps["router_cache"]),
+                'context_expansion_service': deps["document_metadata"]
+            },
+            reranker_service=deps["reranker"]
         )
-        logger.info("✅ Optimized Enhanced RAG service initialized")
+    
+    orchestrator.add(
+        "rag_service",
+        build_rag_service,
+        depends_on=("chroma", "embedding_model", "router_cache", "document_metadata", "llm", "reranker")
+    )
+    return orchestrator
+
+def _on_startup_complete(orchestrator: StartupOrchestrator):
+    """Gắn services vào routes khi startup xong, log timings từng component"""
+    global vectordb_service, llm_service, rag_service
+    
+    if orchestrator.is_ready:
+        vectordb_service = orchestrator.results["chroma"]
+        llm_service = orchestrator.results["llm"]
+        rag_service = orchestrator.results["rag_service"]
         
         # Set global service for routes
         rag.rag_service = rag_service
-        
-        # Log system capabilities với thông tin VRAM optimization
-        health_status = rag_service.get_health_status()
-        logger.info("📊 VRAM-Optimized System Status:")
-        logger.info(f"  - Collections: {health_status.get('total_collections', 0)}")
-        logger.info(f"  - Documents: {health_status.get('total_documents', 0)}")
-        logger.info(f"  - LLM (GPU): {health_status.get('llm_loaded', False)}")
-        logger.info(f"  - Reranker (GPU): {health_status.get('reranker_loaded', False)}")
-        logger.info(f"  - Embedding (CPU): {health_status.get('embedding_device', 'N/A')}")
-        logger.info(f"  - Active Sessions: {health_status.get('active_sessions', 0)}")
-        logger.info(f"  - Ambiguous Patterns: {health_status.get('ambiguous_patterns', 0)}")
-        logger.info(f"  - Context Expansion Cache: {health_status.get('context_expansion', {}).get('total_chunks_cached', 0)} chunks")
-        
-        logger.info("🎉 VRAM-Optimized LegalRAG API started successfully!")
+    
+    logger.info("📊 Startup timings:")
+    for name, component in orchestrator.get_status()["components"].items():
+        logger.info(f"  - {name}: {component['status']} ({component['duration_seconds']}s)")
+    
+    if orchestrator.is_ready:
+        logger.info(f"🎉 VRAM-Optimized LegalRAG API ready in {orchestrator.total_seconds:.2f}s!")
         logger.info("💡 Architecture: Embedding(CPU) + LLM(GPU) + Reranker(GPU)")
-        
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize Optimized services: {e}")
-        raise
+    else:
+        logger.error("❌ Failed to initialize Optimized services - /api/v1/ready sẽ báo lỗi từng component")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Quản lý lifecycle với VRAM-optimized architecture"""
+    # Startup
+    logger.info("🚀 Starting VRAM-Optimized LegalRAG API...")
+    
+    # Load components song song ở background - server nhận request ngay,
+    # /api/v1/live trả về 200, /api/v1/ready trả về 503 cho đến khi load xong
+    global startup_orchestrator
+    startup_orchestrator = create_startup_orchestrator(overrides=model_overrides)
+    startup_orchestrator.on_complete(_on_startup_complete)
+    rag.startup_orchestrator = startup_orchestrator
+    startup_orchestrator.start()
+    
+    if settings.profiling_enabled:
+        profiler.start_rolling()
+    
+    # Coalescing chỉ gộp requests chạy cùng lúc trong threadpool - QUERY_CONCURRENCY=1 thì không bao giờ có
+    if settings.query_coalescing and settings.query_concurrency <= 1:
+        logger.warning("⚠️ QUERY_COALESCING=true nhưng QUERY_CONCURRENCY<=1: requests chạy tuần tự nên không bao giờ được gộp "
+                       "(đặt QUERY_CONCURRENCY > 1 để bật coalescing)")
     
     yield
     
     # Shutdown
     logger.info("🔄 Shutting down VRAM-Optimized LegalRAG API...")
+    profiler.stop_rolling()
+    events.close()  # ghi nốt sampled events còn trong queue
+    search_k_controller.save()  # vị trí nucleus học được từ lần save gần nhất
+    startup_orchestrator.shutdown()
     
     # Cleanup sessions if needed
     if rag_service:
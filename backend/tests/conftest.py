@@ -0,0 +1,90 @@
+"""
+Shared fixtures - tests chỉ cover pure logic, không load chromadb / torch / llama.cpp:
+FakeVectorDB giữ chunks trong dict với cùng interface VectorDBService mà indexing dùng.
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.services.vector import VectorDBService  # noqa: E402 - chromadb / sentence-transformers import lazy
+
+
+class FakeVectorDB:
+    """collection -> chunk id -> (content, metadata); ghi lại mọi lần embed / upsert / delete"""
+
+    build_chunk_record = VectorDBService.build_chunk_record
+    _generate_document_id = VectorDBService._generate_document_id
+
+    def __init__(self):
+        self.collections: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = {}
+        self.embedded: List[str] = []
+        self.deleted: List[Tuple[str, List[str]]] = []
+
+    def embed_text(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    def upsert_chunk_batch(self, collection_name, ids, documents, metadatas, embeddings):
+        assert len(ids) == len(documents) == len(metadatas) == len(embeddings)
+        chunks = self.collections.setdefault(collection_name, {})
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            chunks[chunk_id] = (document, metadata)
+
+    def delete_chunks(self, collection_name: str, ids: List[str]):
+        self.deleted.append((collection_name, list(ids)))
+        for chunk_id in ids:
+            self.collections.get(collection_name, {}).pop(chunk_id, None)
+
+    def get_chunks_for_file(self, collection_name: str, file_path: str) -> List[Dict[str, Any]]:
+        return [
+            {'id': chunk_id, 'content': document, 'metadata': metadata}
+            for chunk_id, (document, metadata) in self.collections.get(collection_name, {}).items()
+            if metadata.get('file_path') == file_path
+        ]
+
+    def get_indexed_files(self) -> Dict[str, Dict[str, List[str]]]:
+        indexed: Dict[str, Dict[str, List[str]]] = {}
+        for collection_name, chunks in self.collections.items():
+            files = indexed.setdefault(collection_name, {})
+            for chunk_id, (_, metadata) in chunks.items():
+                files.setdefault(metadata.get('file_path'), []).append(chunk_id)
+        return indexed
+
+    def list_collections(self) -> List[Dict[str, Any]]:
+        return [{'name': name, 'document_count': len(chunks)} for name, chunks in self.collections.items()]
+
+    def chunk_ids(self, collection_name: str) -> List[str]:
+        return sorted(self.collections.get(collection_name, {}))
+
+
+def write_document(path: Path, contents: List[str], title: str = "Thủ tục thử nghiệm"):
+    """JSON document tối thiểu theo format data/documents (metadata + content_chunks)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        'metadata': {'title': title},
+        'content_chunks': [
+            {'chunk_id': index + 1, 'section_title': f"Mục {index + 1}", 'content': content}
+            for index, content in enumerate(contents)
+        ]
+    }
+    path.write_text(json.dumps(document, ensure_ascii=False), encoding='utf-8')
+
+
+@pytest.fixture
+def fake_vectordb() -> FakeVectorDB:
+    return FakeVectorDB()
+
+
+@pytest.fixture
+def documents_dir(tmp_path: Path) -> Path:
+    path = tmp_path / "documents"
+    path.mkdir()
+    return path
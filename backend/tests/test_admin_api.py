@@ -0,0 +1,40 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import rag
+from app.core.config import settings
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(rag.router)
+    return TestClient(app)
+
+
+def test_admin_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_token', "")
+    response = client.get("/api/v1/admin/events")
+    assert response.status_code == 403
+    assert "ADMIN_TOKEN" in response.json()['detail']
+
+
+def test_admin_requires_matching_token(client, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_token', "s3cret")
+    assert client.get("/api/v1/admin/events").status_code == 403
+    assert client.get("/api/v1/admin/events", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/v1/admin/events", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+
+def test_structured_answer_audits_admin_only(client, monkeypatch):
+    from app.services.structured_answers import structured_answers
+
+    monkeypatch.setattr(settings, 'admin_token', "s3cret")
+    decision = {'intent': 'query_fee', 'answer': "Lệ phí của thủ tục này: Miễn lệ phí."}
+    structured_answers.record_audit("Lệ phí khai sinh?", decision, {'fee_text': 'Miễn lệ phí'}, "Miễn lệ phí.")
+
+    assert client.get("/api/v1/admin/structured-answers/audits").status_code == 403
+    response = client.get("/api/v1/admin/structured-answers/audits", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200
+    assert response.json()['audits'][-1]['query'] == "Lệ phí khai sinh?"
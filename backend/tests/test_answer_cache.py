@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app.services.answer_cache import AnswerCache, deferred_generation
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "answer_cache.jsonl"
+
+
+def make_cache(path, fingerprint="fp-1", **kwargs):
+    cache = AnswerCache(path=path, enabled=True, **kwargs)
+    cache.bind(fingerprint)
+    return cache
+
+
+def test_key_normalizes_question_but_not_context():
+    assert AnswerCache.key("Lệ phí  KHAI SINH?", "ctx") == AnswerCache.key("lệ phí khai sinh?", "ctx")
+    assert AnswerCache.key("Lệ phí?", "ctx-1") != AnswerCache.key("Lệ phí?", "ctx-2")
+
+
+def test_put_get_and_reload(cache_path):
+    cache = make_cache(cache_path)
+    key = AnswerCache.key("Lệ phí?", "ctx")
+    assert cache.get(key) is None
+    assert cache.put(key, "Lệ phí?", "Miễn lệ phí.")
+    assert not cache.put(key, "Lệ phí?", "Trùng")
+    assert cache.get(key) == "Miễn lệ phí."
+
+    reloaded = make_cache(cache_path)
+    assert reloaded.get(key) == "Miễn lệ phí."
+    assert reloaded.get_stats()['sources'] == {'online': 1}
+
+
+def test_unbound_or_disabled_cache_is_inert(cache_path):
+    unbound = AnswerCache(path=cache_path, enabled=True)
+    assert not unbound.put("k", "q", "a")
+    assert unbound.get("k") is None
+
+    disabled = AnswerCache(path=cache_path, enabled=False)
+    disabled.bind("fp-1")
+    assert not disabled.put("k", "q", "a")
+    assert not cache_path.exists()
+
+
+def test_fingerprint_change_skips_stale_entries(cache_path):
+    make_cache(cache_path, "fp-old").put("k", "q", "old answer")
+
+    cache = make_cache(cache_path, "fp-new")
+    assert cache.get("k") is None
+    assert cache.get_stats()['stale_on_load'] == 1
+
+
+def test_max_entries_rejects_new_answers(cache_path):
+    cache = make_cache(cache_path, max_entries=1)
+    assert cache.put("k1", "q1", "a1")
+    assert not cache.put("k2", "q2", "a2")
+    assert cache.get_stats()['rejected'] == 1
+
+
+def test_partial_last_line_is_ignored(cache_path):
+    make_cache(cache_path).put("k", "q", "a")
+    with open(cache_path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "half-written')
+
+    assert make_cache(cache_path).get("k") == "a"
+
+
+def test_compact_keeps_only_current_entries(cache_path):
+    make_cache(cache_path, "fp-old").put("old", "q", "a")
+    cache = make_cache(cache_path, "fp-new")
+    cache.put("new", "q", "a", source="precompute")
+
+    assert cache.compact() == 1
+    lines = [json.loads(line) for line in cache_path.read_text(encoding='utf-8').splitlines()]
+    assert [(entry['key'], entry['source']) for entry in lines] == [("new", "precompute")]
+
+
+def test_defer_only_inside_deferred_generation(cache_path):
+    cache = make_cache(cache_path)
+    assert not cache.defer("k", "q", "ctx")
+
+    with deferred_generation() as pending:
+        assert cache.defer("k", "q", "ctx")
+    assert pending == [{'key': "k", 'query': "q", 'context': "ctx"}]
+    assert not cache.defer("k2", "q", "ctx")
@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import pytest
+
+from app.services.cancellation import CancellationToken, RequestCancelled, cancellation_scope
+from app.services.coalescing import SingleFlight, TokenStream, flight_key, record_session_update
+
+
+def key_for(query, last_turn=None):
+    return flight_key(query, "high", ["chung_thuc"], {}, None, last_turn)
+
+
+def test_flight_key_normalizes_query():
+    assert key_for("Lệ phí  khai sinh?") == key_for("lệ phí khai sinh?")
+    assert key_for("Lệ phí khai sinh?") != key_for("Lệ phí khai tử?")
+    assert key_for("Lệ phí?", last_turn=("a", "b")) != key_for("Lệ phí?")
+
+
+def run_joiner(flight_registry, key, func, results, token=None):
+    def target():
+        try:
+            with cancellation_scope(token) if token is not None else nullcontext():
+                results.append(flight_registry.execute(key, func))
+        except RequestCancelled as e:
+            results.append(e)
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_for_participants(flight_registry, key, count):
+    deadline = time.monotonic() + 5
+    while flight_registry._flights.get(key) is None or flight_registry._flights[key].participants < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def flights():
+    return SingleFlight(enabled=True)
+
+
+def test_joiner_shares_leader_result(flights):
+    key, release, calls = key_for("Lệ phí?"), threading.Event(), []
+
+    def pipeline():
+        calls.append(1)
+        record_session_update("record_answer", {'query': "Lệ phí?"})
+        release.wait(5)
+        return {'answer': "Miễn lệ phí.", 'sources': [{'id': 1}]}
+
+    leader_results, joiner_results = [], []
+    leader = run_joiner(flights, key, pipeline, leader_results)
+    wait_for_participants(flights, key, 1)
+    joiner = run_joiner(flights, key, pipeline, joiner_results)
+    wait_for_participants(flights, key, 2)
+    release.set()
+    leader.join(5)
+    joiner.join(5)
+
+    assert len(calls) == 1
+    (leader_result, leader_flight), = leader_results
+    (joiner_result, joiner_flight), = joiner_results
+    assert leader_flight is None
+    assert joiner_flight.session_updates == [("record_answer", {'query': "Lệ phí?"})]
+    assert joiner_result == leader_result
+    assert joiner_result['sources'] is not leader_result['sources']  # Bản copy, không dùng chung object
+    assert flights.get_stats()['coalesced'] == 1
+    assert flights.get_stats()['in_flight'] == 0
+
+
+def test_joiner_falls_back_when_leader_fails(flights):
+    key, release = key_for("Lệ phí?"), threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("search failed")
+
+    leader_results = []
+
+    def leader_target():
+        try:
+            flights.execute(key, failing)
+        except RuntimeError as e:
+            leader_results.append(e)
+
+    leader = threading.Thread(target=leader_target, daemon=True)
+    leader.start()
+    wait_for_participants(flights, key, 1)
+    joiner_results = []
+    joiner = run_joiner(flights, key, lambda: {'answer': "tự chạy"}, joiner_results)
+    wait_for_participants(flights, key, 2)
+    release.set()
+    leader.join(5)
+    joiner.join(5)
+
+    assert isinstance(leader_results[0], RuntimeError)
+    assert joiner_results == [({'answer': "tự chạy"}, None)]
+    assert flights.get_stats()['fallbacks'] == 1
+
+
+def test_cancelled_joiner_leaves_flight(flights):
+    key, release = key_for("Lệ phí?"), threading.Event()
+    leader_results, joiner_results = [], []
+    leader = run_joiner(flights, key, lambda: release.wait(5) and {'answer': "ok"}, leader_results)
+    wait_for_participants(flights, key, 1)
+
+    token = CancellationToken()
+    joiner = run_joiner(flights, key, lambda: {'answer': "không chạy"}, joiner_results, token=token)
+    wait_for_participants(flights, key, 2)
+    token.cancel("client_disconnect")
+    joiner.join(5)
+    release.set()
+    leader.join(5)
+
+    assert isinstance(joiner_results[0], RequestCancelled)
+    assert leader_results[0] == ({'answer': "ok"}, None)
+    assert flights.get_stats()['cancelled_joiners'] == 1
+
+
+def test_token_stream_replays_for_late_reader():
+    stream = TokenStream()
+    stream.publish("Miễn ")
+    stream.publish_bytes("lệ".encode('utf-8')[:2])  # Ký tự UTF-8 bị tách qua 2 tokens
+    stream.publish_bytes("lệ".encode('utf-8')[2:])
+    stream.finish("Miễn lệ phí.")
+
+    assert "".join(stream.iter_text()) == "Miễn lệ phí."
+    assert stream.closed
@@ -0,0 +1,50 @@
+import unicodedata
+from concurrent.futures import Future
+
+from app.services.embedding_cache import QueryEmbeddingCache
+from app.services.startup import DeferredValue
+from app.services.stubs import StubEmbeddingModel
+
+EXAMPLES = ["Lệ phí chứng thực bản sao?", "Thủ tục đăng ký khai sinh?", "Hồ sơ chứng thực chữ ký?"]
+
+
+def deferred(model):
+    future = Future()
+    future.set_result(model)
+    return DeferredValue(future)
+
+
+def test_key_normalizes_whitespace_and_unicode():
+    cache = QueryEmbeddingCache(max_size=8)
+    model = StubEmbeddingModel(dimension=16)
+    cache.encode(model, "Lệ phí  khai sinh?")
+    cache.encode(model, "Lệ phí khai sinh?")  # Dạng tổ hợp (NFD) của "Lệ"
+
+    stats = cache.get_stats()
+    assert (stats['misses'], stats['lru_hits']) == (1, 1)
+
+
+def test_router_proxy_and_search_model_share_cache():
+    model = StubEmbeddingModel(dimension=16)
+    router_side, search_side = deferred(model), model  # Router lúc startup giữ proxy, vector search giữ model thật
+    cache = QueryEmbeddingCache(max_size=8)
+    assert cache.seed(deferred(model), EXAMPLES, model.encode(EXAMPLES)) == len(EXAMPLES)
+    calls_after_seed = model.calls
+
+    for query in ["Lệ phí khai tử?", "Thời hạn giải quyết?", "Lệ phí khai tử?"]:
+        cache.encode(router_side, query)
+        cache.encode(search_side, query)
+    cache.encode(router_side, EXAMPLES[0])
+
+    stats = cache.get_stats()
+    assert stats['persistent_size'] == len(EXAMPLES)
+    assert stats['persistent_hits'] == 1
+    assert stats['lru_hits'] == 4
+    assert model.calls - calls_after_seed == 2
+
+
+def test_model_change_clears_cache():
+    cache = QueryEmbeddingCache(max_size=8)
+    cache.encode(StubEmbeddingModel(dimension=16), "Lệ phí?")
+    cache.encode(StubEmbeddingModel(dimension=16), "Lệ phí?")
+    assert cache.get_stats()['misses'] == 2
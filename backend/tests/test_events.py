@@ -0,0 +1,26 @@
+import logging
+
+from app.services.context import ContextExpander
+from app.services.events import EventLog
+from app.services import context as context_module
+
+from conftest import write_document
+
+
+def test_context_expansion_records_events_instead_of_info_logs(tmp_path, monkeypatch, caplog):
+    event_log = EventLog(enabled=True, buffer_size=10)
+    monkeypatch.setattr(context_module, 'events', event_log)
+    path = tmp_path / "a.json"
+    write_document(path, ["một", "hai"])
+    expander = ContextExpander.__new__(ContextExpander)  # Không cần vector DB khi load full document
+    nucleus = {'id': "a_chunk_1", 'source': {'file_path': str(path), 'document_title': "Thủ tục thử nghiệm"}}
+
+    with caplog.at_level(logging.INFO, logger=context_module.__name__), event_log.request("query"):
+        expanded = expander.expand_context_with_nucleus([nucleus])
+
+    assert expanded['expansion_strategy'] == "full_document_legal_context"
+    assert caplog.records == []
+    recorded = event_log.recent(limit=1)[0]['events']
+    assert [event['event'] for event in recorded] == ["document_loaded", "context_expansion"]
+    assert recorded[1]['chars'] == expanded['total_length']
+    assert recorded[1]['metadata_fields'] == ['title']
@@ -0,0 +1,171 @@
+import threading
+import time
+
+import pytest
+
+from app.services.generation_scheduler import (
+    GenerationCancelled,
+    GenerationQueueFull,
+    GenerationScheduler,
+    GenerationTimeout,
+)
+
+
+def hold_slot(scheduler, release: threading.Event, acquired: threading.Event):
+    with scheduler.acquire():
+        acquired.set()
+        release.wait(5)
+
+
+def start_holder(scheduler):
+    release, acquired = threading.Event(), threading.Event()
+    thread = threading.Thread(target=hold_slot, args=(scheduler, release, acquired), daemon=True)
+    thread.start()
+    assert acquired.wait(5)
+    return release, thread
+
+
+def wait_for_queue(scheduler, depth: int):
+    deadline = time.monotonic() + 5
+    while scheduler.get_stats()['queue_depth'] < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_free_slot_is_assigned_immediately():
+    scheduler = GenerationScheduler(["ctx-0", "ctx-1"], max_queue=0)
+    with scheduler.acquire() as first, scheduler.acquire() as second:
+        assert {first.slot.resource, second.slot.resource} == {"ctx-0", "ctx-1"}
+    assert scheduler.get_stats()['outcomes']['served'] == 2
+    assert not scheduler.busy()
+
+
+def test_queue_full_rejects_immediately():
+    scheduler = GenerationScheduler(["ctx"], max_queue=1)
+    release, holder = start_holder(scheduler)
+
+    def wait_and_release():
+        with scheduler.acquire():
+            pass
+
+    waiter = threading.Thread(target=wait_and_release, daemon=True)
+    waiter.start()
+    wait_for_queue(scheduler, 1)
+
+    start = time.perf_counter()
+    with pytest.raises(GenerationQueueFull):
+        with scheduler.acquire():
+            pass
+    assert time.perf_counter() - start < 1.0
+    assert scheduler.get_stats()['outcomes']['rejected'] == 1
+
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert not scheduler.busy()
+
+
+def test_deadline_expires_while_queued():
+    scheduler = GenerationScheduler(["ctx"], max_queue=4)
+    release, holder = start_holder(scheduler)
+
+    with pytest.raises(GenerationTimeout):
+        with scheduler.acquire(deadline=time.monotonic() + 0.05):
+            pass
+    stats = scheduler.get_stats()
+    assert stats['outcomes']['expired'] == 1
+    assert stats['queue_depth'] == 0
+
+    release.set()
+    holder.join(5)
+    # Slot trả về cho request kế tiếp, không bị ticket đã hết hạn giữ
+    with scheduler.acquire(deadline=time.monotonic() + 1.0) as ticket:
+        assert ticket.slot is not None
+
+
+def test_cancel_while_queued():
+    scheduler = GenerationScheduler(["ctx"], max_queue=4)
+    release, holder = start_holder(scheduler)
+    cancel_event = threading.Event()
+    threading.Timer(0.05, cancel_event.set).start()
+
+    with pytest.raises(GenerationCancelled):
+        with scheduler.acquire(cancel_event=cancel_event):
+            pass
+    assert scheduler.get_stats()['outcomes']['cancelled'] == 1
+
+    release.set()
+    holder.join(5)
+
+
+def test_higher_priority_served_first():
+    scheduler = GenerationScheduler(["ctx"], max_queue=4)
+    release, holder = start_holder(scheduler)
+    order = []
+
+    def waiter(name, priority):
+        with scheduler.acquire(priority=priority):
+            order.append(name)
+
+    low = threading.Thread(target=waiter, args=("low", 0), daemon=True)
+    low.start()
+    wait_for_queue(scheduler, 1)
+    high = threading.Thread(target=waiter, args=("high", 5), daemon=True)
+    high.start()
+    wait_for_queue(scheduler, 2)
+
+    release.set()
+    for thread in (holder, low, high):
+        thread.join(5)
+    assert order == ["high", "low"]
+
+
+def test_should_stop_reports_deadline():
+    scheduler = GenerationScheduler(["ctx"])
+    with scheduler.acquire(deadline=time.monotonic() - 1) as ticket:
+        assert ticket.should_stop() == 'deadline'
+
+
+# ---------------------------------------------------------------
+# Queue full: pipeline propagate -> API 429 + Retry-After
+# ---------------------------------------------------------------
+
+class QueueFullLLM:
+    def generate_response(self, **kwargs):
+        raise GenerationQueueFull("Generation queue full (32 waiting)")
+
+
+def test_generate_answer_propagates_queue_full(tmp_path):
+    from types import SimpleNamespace
+    from app.services.answer_cache import AnswerCache
+    from app.services.rag_engine import RAGService, OptimizedChatSession
+
+    cache = AnswerCache(path=tmp_path / "answers.jsonl", enabled=True)
+    cache.bind("fingerprint")
+    session = OptimizedChatSession(session_id="s", created_at=0.0, last_accessed=0.0)
+    service = SimpleNamespace(llm_service=QueueFullLLM())
+
+    with pytest.raises(GenerationQueueFull):
+        RAGService._generate_answer_with_context(service, "Lệ phí?", "context", session, cache_key="k")
+    assert session.query_history == []
+    assert len(cache) == 0
+
+
+def test_query_endpoint_returns_429_with_retry_after(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import rag
+    from app.core.config import settings
+
+    class OverloadedService:
+        def process_query(self, **kwargs):
+            raise GenerationQueueFull("Generation queue full (32 waiting)")
+
+    monkeypatch.setattr(rag, 'rag_service', OverloadedService())
+    monkeypatch.setattr(settings, 'llm_queue_retry_after', 7)
+    app = FastAPI()
+    app.include_router(rag.router)
+
+    response = TestClient(app).post("/api/v1/query", json={"query": "Lệ phí khai sinh?"})
+    assert response.status_code == 429
+    assert response.headers['retry-after'] == "7"
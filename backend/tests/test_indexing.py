@@ -0,0 +1,154 @@
+from app.services.indexing import BuildCheckpoint, IncrementalIndexer, StreamingIndexPipeline
+
+from conftest import write_document
+
+
+def make_pipeline(vectordb, documents_dir, tmp_path):
+    return StreamingIndexPipeline(
+        vectordb_service=vectordb,
+        documents_dir=documents_dir,
+        checkpoint_path=tmp_path / "checkpoint.json",
+        workers=1,
+        batch_size=2
+    )
+
+
+def test_checkpoint_done_only_for_same_content_hash(tmp_path):
+    checkpoint = BuildCheckpoint(tmp_path / "checkpoint.json")
+    checkpoint.mark_done("a.json", "chung_thuc", 3, "hash-1")
+
+    reloaded = BuildCheckpoint(tmp_path / "checkpoint.json")
+    assert reloaded.is_done("a.json", "hash-1")
+    assert not reloaded.is_done("a.json", "hash-2")
+    assert not reloaded.is_done("b.json", "hash-1")
+
+
+def test_checkpoint_without_hash_still_resumes(tmp_path):
+    checkpoint = BuildCheckpoint(tmp_path / "checkpoint.json")
+    checkpoint.mark_done("a.json", "chung_thuc", 3)
+    assert checkpoint.is_done("a.json", "any-hash")
+
+
+def test_pipeline_writes_all_chunks_and_checkpoints(fake_vectordb, documents_dir, tmp_path):
+    write_document(documents_dir / "quy_trinh_chung_thuc" / "a.json", ["một", "hai", "ba"])
+    write_document(documents_dir / "quy_trinh_nuoi_con_nuoi" / "b.json", ["bốn"])
+
+    pipeline = make_pipeline(fake_vectordb, documents_dir, tmp_path)
+    result = pipeline.run()
+
+    assert result['success']
+    assert result['docs_parsed'] == 2
+    assert result['chunks_written'] == 4
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["a_chunk_1", "a_chunk_2", "a_chunk_3"]
+    assert fake_vectordb.chunk_ids("nuoi_con_nuoi") == ["b_chunk_1"]
+    assert pipeline.checkpoint.is_completed
+
+
+def test_completed_build_indexes_new_and_changed_files(fake_vectordb, documents_dir, tmp_path):
+    collection_dir = documents_dir / "quy_trinh_chung_thuc"
+    write_document(collection_dir / "a.json", ["một", "hai", "ba"])
+    make_pipeline(fake_vectordb, documents_dir, tmp_path).run()
+
+    write_document(collection_dir / "a.json", ["một (sửa)"])
+    write_document(collection_dir / "b.json", ["mới"])
+    result = make_pipeline(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert result['docs_parsed'] == 2
+    assert result['docs_skipped'] == 0
+    # Chunks cũ của file đã sửa bị xóa trước khi ghi lại
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["a_chunk_1", "b_chunk_1"]
+    assert fake_vectordb.collections["chung_thuc"]["a_chunk_1"][0].endswith("một (sửa)")
+
+    result = make_pipeline(fake_vectordb, documents_dir, tmp_path).run()
+    assert result['docs_parsed'] == 0
+    assert result['docs_skipped'] == 2
+
+
+# ---------------------------------------------------------------
+# IncrementalIndexer: add / modify / delete diff
+# ---------------------------------------------------------------
+
+def make_indexer(vectordb, documents_dir, tmp_path):
+    return IncrementalIndexer(vectordb, documents_dir, tmp_path / "manifest.json", batch_size=2)
+
+
+def test_incremental_adds_new_file(fake_vectordb, documents_dir, tmp_path):
+    write_document(documents_dir / "quy_trinh_chung_thuc" / "a.json", ["một", "hai"])
+
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert stats['added_files'] == [str(documents_dir / "quy_trinh_chung_thuc" / "a.json")]
+    assert stats['chunks_upserted'] == 2
+    assert stats['affected_collections'] == ["chung_thuc"]
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["a_chunk_1", "a_chunk_2"]
+
+
+def test_incremental_unchanged_file_is_skipped(fake_vectordb, documents_dir, tmp_path):
+    write_document(documents_dir / "quy_trinh_chung_thuc" / "a.json", ["một", "hai"])
+    make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+    fake_vectordb.embedded.clear()
+
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert stats['unchanged_files'] == 1
+    assert not stats['has_changes']
+    assert fake_vectordb.embedded == []
+
+
+def test_incremental_modified_file_upserts_only_changed_chunks(fake_vectordb, documents_dir, tmp_path):
+    path = documents_dir / "quy_trinh_chung_thuc" / "a.json"
+    write_document(path, ["một", "hai", "ba"])
+    make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+    fake_vectordb.embedded.clear()
+
+    write_document(path, ["một", "hai (sửa)"])
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert stats['changed_files'] == [str(path)]
+    assert stats['chunks_upserted'] == 1
+    assert stats['chunks_unchanged'] == 1
+    assert stats['chunks_deleted'] == 1
+    assert len(fake_vectordb.embedded) == 1
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["a_chunk_1", "a_chunk_2"]
+
+
+def test_incremental_deleted_file_removes_chunks(fake_vectordb, documents_dir, tmp_path):
+    path = documents_dir / "quy_trinh_chung_thuc" / "a.json"
+    write_document(path, ["một", "hai"])
+    write_document(documents_dir / "quy_trinh_chung_thuc" / "b.json", ["ba"])
+    make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    path.unlink()
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert stats['removed_files'] == [str(path)]
+    assert stats['chunks_deleted'] == 2
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["b_chunk_1"]
+
+
+def test_incremental_removes_orphans_of_full_build_without_manifest(fake_vectordb, documents_dir, tmp_path):
+    path = documents_dir / "quy_trinh_chung_thuc" / "a.json"
+    write_document(path, ["một", "hai"])
+    write_document(documents_dir / "quy_trinh_chung_thuc" / "b.json", ["ba"])
+    make_pipeline(fake_vectordb, documents_dir, tmp_path).run()  # Full build không ghi manifest
+
+    path.unlink()
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+
+    assert stats['removed_files'] == [str(path)]
+    assert stats['chunks_deleted'] == 2
+    # b.json có trong Chroma nhưng chưa có trong manifest: baseline từ Chroma -> không re-embed
+    assert stats['chunks_upserted'] == 0
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["b_chunk_1"]
+
+
+def test_incremental_dry_run_changes_nothing(fake_vectordb, documents_dir, tmp_path):
+    path = documents_dir / "quy_trinh_chung_thuc" / "a.json"
+    write_document(path, ["một"])
+    make_indexer(fake_vectordb, documents_dir, tmp_path).run()
+    path.unlink()
+
+    stats = make_indexer(fake_vectordb, documents_dir, tmp_path).run(dry_run=True)
+
+    assert stats['removed_files'] == [str(path)]
+    assert fake_vectordb.chunk_ids("chung_thuc") == ["a_chunk_1"]
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from app.services import reranker as reranker_module
+from app.services.cancellation import CancellationToken, cancellation_scope
+from app.services.stubs import StubRerankerService
+
+DOCUMENTS = [{'content': f"Đoạn văn {index}", 'similarity': 1.0 - index / 10} for index in range(6)]
+
+
+class RecordingCrossEncoder:
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.batches = []
+
+    def predict(self, pairs):
+        self.batches.append(len(pairs))
+        time.sleep(self.latency_seconds)
+        return [float(len(passage)) for _, passage in pairs]
+
+
+def test_unload_skipped_while_rerank_in_flight():
+    reranker = StubRerankerService(latency_seconds=0.2)
+    worker = threading.Thread(target=reranker.rerank_documents, args=("Lệ phí?", DOCUMENTS), daemon=True)
+    worker.start()
+    deadline = time.monotonic() + 5
+    while not reranker._active_requests:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+    reranker.unload_model()
+    assert reranker.is_model_loaded()
+
+    worker.join(5)
+    reranker.unload_model()
+    assert not reranker.is_model_loaded()
+    assert reranker._active_requests == 0
+
+
+def test_keep_loaded_pins_model():
+    reranker = StubRerankerService()
+    with reranker.keep_loaded():
+        reranker.rerank_documents("Lệ phí?", DOCUMENTS)
+        reranker.unload_model()
+        assert reranker.is_model_loaded()
+    reranker.unload_model()
+    assert not reranker.is_model_loaded()
+
+
+def test_cancellable_predict_keeps_batches_large():
+    reranker = StubRerankerService()
+    reranker.ensure_loaded()
+    reranker.model = RecordingCrossEncoder()
+    pairs = [("q", f"p{index}") for index in range(reranker_module.CANCEL_CHECK_PAIRS + 10)]
+
+    with cancellation_scope(CancellationToken()):
+        scores = reranker._predict(pairs, time.time())
+
+    assert len(scores) == len(pairs)
+    assert reranker.model.batches == [reranker_module.CANCEL_CHECK_PAIRS, 10]
+    assert reranker_module.CANCEL_CHECK_PAIRS >= 32
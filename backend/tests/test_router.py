@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import Future
+
+from app.services.router import QueryRouter
+from app.services.startup import DeferredValue
+from app.services.stubs import StubEmbeddingModel
+
+from conftest import BACKEND_DIR
+
+
+def test_router_from_cache_does_not_wait_for_embedding_model(tmp_path, monkeypatch):
+    (tmp_path / "data" / "cache").mkdir(parents=True)
+    (tmp_path / "data" / "router_examples_smart_v3").symlink_to(BACKEND_DIR / "data" / "router_examples_smart_v3")
+    monkeypatch.chdir(tmp_path)  # Router cache nằm trong data/cache theo cwd
+    model = StubEmbeddingModel(dimension=64)
+    QueryRouter(embedding_model=model)  # Lần đầu: encode examples + ghi cache
+    calls_after_build = model.calls
+
+    pending = Future()
+    routers = []
+    loader = threading.Thread(target=lambda: routers.append(QueryRouter(embedding_model=DeferredValue(pending))), daemon=True)
+    loader.start()
+    loader.join(30)
+    assert routers, "router load từ cache bị block chờ embedding model"
+
+    pending.set_result(model)
+    routers[0].seed_query_embedding_cache()
+    assert model.calls > calls_after_build  # Seed kiểm tra mẫu bằng model sau khi model sẵn sàng
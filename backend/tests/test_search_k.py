@@ -0,0 +1,82 @@
+import pytest
+
+from app.services.search_k import AdaptiveSearchK, CONSENSUS_CANDIDATES, SEARCH_K_MARGIN, smallest_covering_k
+
+STATIC_K = 16
+
+
+@pytest.fixture
+def controller(tmp_path):
+    return AdaptiveSearchK(
+        stats_path=tmp_path / "search_k_stats.json",
+        enabled=True,
+        target_coverage=0.9,
+        min_samples=10,
+        explore_rate=0.0,
+        min_k=1
+    )
+
+
+def observe_many(controller, positions, collection="chung_thuc", searched_k=STATIC_K):
+    for position in positions:
+        controller.observe("high", collection, position, searched_k=searched_k, static_k=STATIC_K)
+
+
+def test_smallest_covering_k():
+    assert smallest_covering_k([], 0.9) is None
+    assert smallest_covering_k([5, 3, 2], 0.5) == 1
+    assert smallest_covering_k([5, 3, 2], 0.8) == 2
+    assert smallest_covering_k([5, 3, 2], 1.0) == 3
+
+
+def test_static_until_min_samples(controller):
+    observe_many(controller, [1] * 9)
+    assert controller.choose_k("high", "chung_thuc", STATIC_K) == (STATIC_K, "static")
+
+
+def test_learned_k_never_below_consensus_size(controller):
+    assert controller.min_k == CONSENSUS_CANDIDATES
+    observe_many(controller, [1] * 20)
+    assert controller.choose_k("high", "chung_thuc", STATIC_K) == (CONSENSUS_CANDIDATES, "adaptive")
+
+
+def test_learned_k_covers_target_plus_margin(controller):
+    observe_many(controller, [2] * 5 + [7] * 4 + [12])
+    k, mode = controller.choose_k("high", "chung_thuc", STATIC_K)
+    assert mode == "adaptive"
+    assert k == 7 + SEARCH_K_MARGIN
+
+
+def test_censored_observations_ignored(controller):
+    observe_many(controller, [1] * 20, searched_k=8)
+    assert controller.get_stats()['buckets'] == {}
+
+
+def test_buckets_are_per_collection_set(controller):
+    observe_many(controller, [1] * 20, collection="chung_thuc+ho_tich_cap_xa")
+    assert controller.choose_k("high", "chung_thuc+ho_tich_cap_xa", STATIC_K)[1] == "adaptive"
+    assert controller.choose_k("high", "chung_thuc", STATIC_K)[1] == "static"
+
+
+def test_explore_runs_static_k(controller):
+    controller.explore_rate = 1.0
+    observe_many(controller, [1] * 20)
+    assert controller.choose_k("high", "chung_thuc", STATIC_K) == (STATIC_K, "explore")
+
+
+def test_disabled_controller_is_static(tmp_path):
+    controller = AdaptiveSearchK(stats_path=tmp_path / "stats.json", enabled=False)
+    controller.observe("high", "chung_thuc", 1, searched_k=STATIC_K, static_k=STATIC_K)
+    assert controller.choose_k("high", "chung_thuc", STATIC_K) == (STATIC_K, "static")
+
+
+def test_stats_persist(controller, tmp_path):
+    observe_many(controller, [3] * 12)
+    controller.save()
+
+    reloaded = AdaptiveSearchK(stats_path=tmp_path / "search_k_stats.json", enabled=True, target_coverage=0.9,
+                               min_samples=10, explore_rate=0.0)
+    bucket = reloaded.get_stats()['buckets']["high|chung_thuc"]
+    assert bucket['samples'] == 12
+    assert bucket['covering_k'] == 3
+    assert reloaded.choose_k("high", "chung_thuc", STATIC_K) == (CONSENSUS_CANDIDATES, "adaptive")
@@ -0,0 +1,92 @@
+import pytest
+
+from app.core.config import settings
+from app.services.structured_answers import StructuredAnswerEngine, detect_structured_intents, render_structured_answer
+
+METADATA = {
+    'fee_text': 'Miễn lệ phí',
+    'processing_time_text': '03 ngày làm việc',
+    'executing_agency': 'Ủy ban nhân dân cấp xã',
+    'has_form': True
+}
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(settings, 'structured_answer_mode', 'on')
+    monkeypatch.setattr(settings, 'structured_answer_min_confidence', 0.7)
+    monkeypatch.setattr(settings, 'structured_answer_audit_rate', 0.0)
+    return StructuredAnswerEngine()
+
+
+def test_detect_intents_matches_whole_words():
+    assert detect_structured_intents("Lệ phí đăng ký khai sinh là bao nhiêu?") == ['query_fee']
+    assert detect_structured_intents("Nộp hồ sơ ở phía nào của tòa nhà") == []
+
+
+def test_render_fee_from_vnd():
+    answer = render_structured_answer('query_fee', {'fee_vnd': 50000}, "Đăng ký khai sinh")
+    assert answer == "Lệ phí của thủ tục Đăng ký khai sinh: 50.000 đồng."
+
+
+def test_off_mode_is_disabled(engine, monkeypatch):
+    monkeypatch.setattr(settings, 'structured_answer_mode', 'off')
+    decision = engine.evaluate("Lệ phí là bao nhiêu?", METADATA, "Khai sinh", confidence=0.95)
+    assert decision['outcome'] == 'disabled'
+    assert not decision['serve']
+
+
+def test_default_mode_is_shadow():
+    assert type(settings).model_fields['structured_answer_mode'].default == "shadow"
+
+
+@pytest.mark.parametrize("query, confidence, outcome", [
+    ("Thủ tục khai sinh gồm những bước gì?", 0.95, 'no_intent'),
+    ("Lệ phí và thời gian giải quyết là bao lâu?", 0.95, 'compound'),
+    ("Nếu nộp trễ thì lệ phí là bao nhiêu?", 0.95, 'compound'),
+    ("Có mất lệ phí không?", 0.95, 'compound'),
+    ("Lệ phí là bao nhiêu?", 0.5, 'low_confidence'),
+    ("Điều kiện thực hiện là gì?", 0.95, 'missing_field'),
+])
+def test_evaluate_falls_back_to_llm(engine, query, confidence, outcome):
+    decision = engine.evaluate(query, METADATA, "Khai sinh", confidence=confidence)
+    assert decision['outcome'] == outcome
+    assert not decision['serve']
+
+
+def test_on_mode_serves_template(engine):
+    decision = engine.evaluate("Lệ phí là bao nhiêu?", METADATA, "Khai sinh", confidence=0.95)
+    assert decision['outcome'] == 'answered'
+    assert decision['serve']
+    assert not decision['audit']
+    assert decision['answer'] == "Lệ phí của thủ tục Khai sinh: Miễn lệ phí."
+
+
+def test_shadow_mode_only_audits(engine, monkeypatch):
+    monkeypatch.setattr(settings, 'structured_answer_mode', 'shadow')
+    decision = engine.evaluate("Thời gian giải quyết mất bao lâu?", METADATA, "Khai sinh", confidence=0.95)
+    assert decision['outcome'] == 'shadow'
+    assert decision['audit']
+    assert not decision['serve']
+    assert decision['answer'] is not None
+
+
+def test_degraded_serves_below_min_confidence(engine, monkeypatch):
+    monkeypatch.setattr(settings, 'structured_answer_mode', 'shadow')
+    decision = engine.evaluate("Nộp hồ sơ ở đâu?", METADATA, "Khai sinh", confidence=0.3, degraded=True)
+    assert decision['outcome'] == 'degraded'
+    assert decision['serve']
+
+
+def test_audit_samples_not_in_public_stats(engine):
+    decision = engine.evaluate("Lệ phí là bao nhiêu?", METADATA, "Khai sinh", confidence=0.95)
+    engine.record_audit("Lệ phí là bao nhiêu?", decision, METADATA, "Thủ tục này miễn lệ phí.")
+
+    stats = engine.get_stats()
+    assert 'recent' not in stats['audits']
+    assert stats['audits']['count'] == 1
+    assert stats['audits']['agreement'] == 1.0
+
+    samples = engine.recent_audits()
+    assert samples[0]['query'] == "Lệ phí là bao nhiêu?"
+    assert samples[0]['field_in_llm_answer']
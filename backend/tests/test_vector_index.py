@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from app.services.vector_index import QuantizedVectorIndex, VECTOR_INDEX_MODES, normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((500, 64)).astype(np.float32)
+
+
+def exact_top(vectors, query, k):
+    scores = normalize_rows(vectors) @ normalize_rows(query.reshape(1, -1))[0]
+    return np.argsort(-scores, kind='stable')[:k], scores
+
+
+def test_unknown_mode_rejected(vectors):
+    with pytest.raises(ValueError):
+        QuantizedVectorIndex(vectors, mode="int4")
+
+
+def test_float32_search_is_exact(vectors):
+    index = QuantizedVectorIndex(vectors, mode="float32")
+    query = vectors[7] + 0.01
+    rows, scores = index.search(query, top_k=5)
+
+    expected_rows, expected_scores = exact_top(vectors, query, 5)
+    assert list(rows) == list(expected_rows)
+    np.testing.assert_allclose(scores, expected_scores[expected_rows], rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", [mode for mode in VECTOR_INDEX_MODES if mode != "float32"])
+def test_quantized_search_rescores_with_exact_scores(vectors, mode):
+    index = QuantizedVectorIndex(vectors, mode=mode, rescore_k=32)
+    query = vectors[42]
+    rows, scores = index.search(query, top_k=3)
+
+    _, exact = exact_top(vectors, query, 3)
+    assert rows[0] == 42
+    assert np.all(np.diff(scores) <= 0)
+    np.testing.assert_allclose(scores, exact[rows], rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_approx_scores_close_to_cosine(vectors, mode):
+    index = QuantizedVectorIndex(vectors, mode=mode)
+    query = vectors[3]
+    _, exact = exact_top(vectors, query, 1)
+    np.testing.assert_allclose(index.approx_scores(query), exact, atol=0.02)
+
+
+def test_binary_shortlist_oversamples(vectors):
+    index = QuantizedVectorIndex(vectors, mode="binary", rescore_k=10)
+    assert len(index.shortlist(index.approx_scores(vectors[0]))) == 40
+
+
+def test_top_k_larger_than_index(vectors):
+    index = QuantizedVectorIndex(vectors[:4], mode="int8", rescore_k=2)
+    rows, _ = index.search(vectors[0], top_k=10)
+    assert sorted(rows) == [0, 1, 2, 3]
+
+
+def test_from_npy_memmap_keeps_float32_off_heap(vectors, tmp_path):
+    path = tmp_path / "vectors.npy"
+    np.save(path, normalize_rows(vectors))
+
+    index = QuantizedVectorIndex.from_npy(path, mode="int8", rescore_k=16)
+    usage = index.memory_usage()
+
+    assert usage['rescore_mmap']
+    assert usage['code_bytes'] < usage['rescore_bytes'] / 3
+    rows, _ = index.search(vectors[9], top_k=1)
+    assert rows[0] == 9
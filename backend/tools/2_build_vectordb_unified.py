@@ -11,6 +11,11 @@ Usage:
     python tools/2_build_vectordb_unified.py
     python tools/2_build_vectordb_unified.py --force  # Clear existing and rebuild
     python tools/2_build_vectordb_unified.py --clean  # Remove entire vectordb directory
+    python tools/2_build_vectordb_unified.py --workers 8 --batch-size 128  # Tune streaming pipeline
+    python tools/2_build_vectordb_unified.py --incremental  # Chỉ re-index documents đã thay đổi
+
+Build chạy theo dạng streaming (parse song song -> embed theo batch -> ghi Chroma theo batch)
+và checkpoint sau mỗi file, nên chạy lại sau khi bị ngắt sẽ tiếp tục từ file chưa ghi xong.
 """
 
 import sys
@@ -28,7 +33,17 @@ sys.path.insert(0, str(backend_dir))
 
 # Import from app modules
 from app.core.config import settings
-from app.services.vector_database import VectorDBService  
+from app.services.vector import VectorDBService
+from app.services.indexing import (
+    COLLECTION_MAPPINGS,
+    IncrementalIndexer,
+    IndexManifest,
+    StreamingIndexPipeline,
+    detect_collection_from_path,
+    load_json_document,
+    process_json_chunks,
+    parse_document_file
+)
 
 # Setup logging
 logging.basicConfig(
@@ -50,14 +65,7 @@ class UnifiedVectorDBBuilder:
         self.vectordb_dir = self.data_dir / "vectordb"
         
         # Collection mappings
-        self.collection_mappings = {
-            'quy_trinh_cap_ho_tich_cap_xa': 'ho_tich_cap_xa',
-            'ho_tich_cap_xa_moi_nhat': 'ho_tich_cap_xa',
-            'quy_trinh_chung_thuc': 'chung_thuc',
-            'quy_trinh_nb_chung_thuc_dung_chung': 'chung_thuc',
-            'quy_trinh_nuoi_con_nuoi': 'nuoi_con_nuoi',
-            'iso_ncn_moi': 'nuoi_con_nuoi',
-        }
+        self.collection_mappings = dict(COLLECTION_MAPPINGS)
         
         # Create directories if needed
         self.vectordb_dir.mkdir(parents=True, exist_ok=True)
@@ -70,224 +78,22 @@ class UnifiedVectorDBBuilder:
     
     def detect_collection_from_path(self, file_path: str) -> str:
         """Xác định collection dựa trên đường dẫn file"""
-        path_obj = Path(file_path)
-        path_parts = path_obj.parts
-        
-        for part in path_parts:
-            for pattern, collection in self.collection_mappings.items():
-                if pattern in part.lower():
-                    return collection
-        
-        return 'general'
+        return detect_collection_from_path(file_path, self.collection_mappings)
     
     def load_json_document(self, file_path: str) -> Optional[Dict[str, Any]]:
         """Load và validate JSON document"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Validate cấu trúc cơ bản
-            if not isinstance(data, dict):
-                logger.error(f"Invalid JSON structure in {file_path}: not a dict")
-                return None
-            
-            if 'metadata' not in data or 'content_chunks' not in data:
-                logger.error(f"Invalid JSON structure in {file_path}: missing required fields")
-                return None
-            
-            return data
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error in {file_path}: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Error reading JSON file {file_path}: {e}")
-            return None
+        return load_json_document(file_path)
     
     def process_json_chunks(self, json_data: Dict[str, Any], file_path: str) -> List[Dict[str, Any]]:
         """Chuyển đổi content_chunks từ JSON thành format phù hợp với vector database"""
-        metadata = json_data.get('metadata', {})
-        content_chunks = json_data.get('content_chunks', [])
-        
-        processed_chunks = []
-        
-        # Lấy thông tin metadata quan trọng để thêm context
-        document_title = metadata.get('title', '')
-        executing_agency = metadata.get('executing_agency', '')
-        applicant_type = metadata.get('applicant_type', [])
-        processing_time = metadata.get('processing_time_text', '')
-        fee_text = metadata.get('fee_text', '')
-        has_form = metadata.get('has_form', False)
-        requirements_conditions = metadata.get('requirements_conditions', '')
-        
-        for i, chunk in enumerate(content_chunks):
-            # Lấy thông tin từ chunk
-            chunk_id = chunk.get('chunk_id', i + 1)
-            chunk_index_num = i  # Thêm chunk_index_num (0-based index)
-            section_title = chunk.get('section_title', '')
-            content = chunk.get('content', '')
-            source_reference = chunk.get('source_reference', '')
-            keywords = chunk.get('keywords', [])
-            
-            # Tăng cường ngữ cảnh cho mỗi chunk với metadata phong phú
-            context_parts = []
-            
-            # 1. Tiêu đề tài liệu (quan trọng nhất)
-            if document_title:
-                context_parts.append(f"Tiêu đề tài liệu: {document_title}")
-            
-            # 2. Cơ quan thực hiện
-            if executing_agency:
-                context_parts.append(f"Cơ quan thực hiện: {executing_agency}")
-            
-            # 3. Đối tượng thực hiện
-            if applicant_type and len(applicant_type) > 0:
-                context_parts.append(f"Đối tượng thực hiện: {', '.join(applicant_type)}")
-            
-            # 4. Có biểu mẫu hay không
-            if has_form:
-                context_parts.append("Có biểu mẫu: Có")
-            
-            # 5. Điều kiện yêu cầu (nếu có)
-            if requirements_conditions:
-                context_parts.append(f"Điều kiện: {requirements_conditions}")
-            
-            # 6. Thời gian xử lý (rút gọn để không quá dài)
-            if processing_time and len(processing_time) < 150:  # Chỉ thêm nếu không quá dài
-                context_parts.append(f"Thời gian xử lý: {processing_time}")
-            
-            # 7. Thông tin lệ phí (rút gọn)
-            if fee_text:
-                # Lấy thông tin lệ phí chính, bỏ qua chi tiết quá dài
-                fee_summary = fee_text.split('.')[0] if fee_text else fee_text
-                if len(fee_summary) < 100:
-                    context_parts.append(f"Lệ phí: {fee_summary}")
-            
-            # 8. Tiêu đề mục (section)
-            if section_title:
-                context_parts.append(f"Mục: {section_title}")
-            
-            # 9. Phần "Nội dung:" để phân tách rõ ràng
-            if context_parts and content.strip():
-                context_parts.append("Nội dung:")
-            
-            # Ghép tất cả lại với nội dung chính
-            if context_parts:
-                full_content = "\n".join(context_parts) + "\n" + content
-            else:
-                full_content = content
-            
-            # Tạo source information để frontend có thể truy vết
-            source_info = {
-                'file_path': file_path,
-                'document_title': metadata.get('title', ''),
-                'document_code': metadata.get('code', ''),
-                'issuing_authority': metadata.get('issuing_authority', ''),
-                'effective_date': metadata.get('effective_date', ''),
-                'executing_agency': metadata.get('executing_agency', ''),
-                'source_reference': source_reference,
-                'section_title': section_title,
-                'chunk_id': f"{Path(file_path).stem}_chunk_{chunk_id}",  # Tạo ID unique
-                'chunk_index_num': chunk_index_num,  # Thêm chunk_index_num cho context expansion
-                'document_id': Path(file_path).stem  # Thêm document_id để group chunks
-            }
-            
-            # Tạo processed chunk
-            processed_chunk = {
-                'content': full_content.strip(),
-                'chunk_id': f"{Path(file_path).stem}_chunk_{chunk_id}",
-                'type': 'json_section',
-                'char_start': 0,
-                'char_end': len(full_content),
-                'keywords': keywords,
-                'source': source_info,
-                'metadata': {
-                    'document_metadata': metadata,
-                    'section_title': section_title,
-                    'source_reference': source_reference,
-                    'processing_time': metadata.get('processing_time_text', ''),
-                    'fee_info': metadata.get('fee_text', ''),
-                    'legal_basis': metadata.get('legal_basis_references', [])
-                }
-            }
-            
-            processed_chunks.append(processed_chunk)
-        
-        return processed_chunks
+        return process_json_chunks(json_data, file_path)
     
     def process_document(self, file_path: str) -> Dict[str, Any]:
         """Process single JSON document"""
-        try:
-            # Load JSON data
-            json_data = self.load_json_document(file_path)
-            if not json_data:
-                return {"error": "Failed to load JSON document"}
-            
-            # Process chunks
-            processed_chunks = self.process_json_chunks(json_data, file_path)
-            
-            if not processed_chunks:
-                logger.warning(f"No chunks processed from {file_path}")
-                return {"error": "No chunks processed"}
-            
-            # Detect collection
-            collection_name = self.detect_collection_from_path(file_path)
-            
-            # Calculate total characters
-            total_chars = sum(len(chunk['content']) for chunk in processed_chunks)
-            
-            return {
-                "file_path": file_path,
-                "collection": collection_name,
-                "chunks": processed_chunks,
-                "total_chunks": len(processed_chunks),
-                "total_characters": total_chars,
-                "document_metadata": json_data.get('metadata', {}),
-                "status": "success"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error processing JSON document {file_path}: {e}")
-            return {"error": str(e)}
-    
-    def process_all_documents(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Process all JSON documents in directory, organized by collections"""
-        collections_data = {}
-        
-        try:
-            json_files = list(self.documents_dir.rglob("*.json"))
-            logger.info(f"Found {len(json_files)} JSON files to process")
-            
-            for file_path in json_files:
-                logger.info(f"Processing JSON file: {file_path}")
-                
-                doc_data = self.process_document(str(file_path))
-                
-                if "error" not in doc_data:
-                    collection_name = doc_data["collection"]
-                    
-                    if collection_name not in collections_data:
-                        collections_data[collection_name] = []
-                    
-                    # Thêm chunks vào collection
-                    collections_data[collection_name].extend(doc_data["chunks"])
-                    
-                    logger.info(
-                        f"Added {doc_data['total_chunks']} chunks from '{doc_data['document_metadata'].get('title', file_path.name)}' "
-                        f"to collection '{collection_name}'"
-                    )
-                else:
-                    logger.error(f"Failed to process {file_path}: {doc_data['error']}")
-            
-            # Log summary
-            for collection_name, chunks in collections_data.items():
-                logger.info(f"Collection '{collection_name}': {len(chunks)} total chunks")
-            
-            return collections_data
-            
-        except Exception as e:
-            logger.error(f"Error processing documents directory {self.documents_dir}: {e}")
-            return {}
+        doc_data = parse_document_file(file_path)
+        if "error" in doc_data:
+            logger.error(f"Error processing JSON document {file_path}: {doc_data['error']}")
+        return doc_data
     
     def check_prerequisites(self) -> bool:
         """Check if documents exist and are processable"""
@@ -324,12 +130,28 @@ class UnifiedVectorDBBuilder:
             logger.error(f"❌ Error testing JSON structure: {e}")
             return False
     
-    def build_vector_database(self, force_rebuild: bool = False) -> bool:
-        """Build complete vector database with integrated JSON processing"""
-        logger.info("🔄 BUILDING VECTOR DATABASE (UNIFIED)")
+    def build_vector_database(
+        self,
+        force_rebuild: bool = False,
+        workers: int = settings.index_build_workers,
+        batch_size: int = settings.index_embed_batch_size,
+        queue_size: int = settings.index_queue_size
+    ) -> bool:
+        """Build vector database bằng streaming pipeline (parse song song -> embed batch -> ghi batch)"""
+        logger.info("🔄 BUILDING VECTOR DATABASE (STREAMING)")
         logger.info("-" * 40)
         
         try:
+            pipeline = StreamingIndexPipeline(
+                vectordb_service=self.vectordb_service,
+                documents_dir=self.documents_dir,
+                checkpoint_path=settings.index_checkpoint_path,
+                workers=workers,
+                batch_size=batch_size,
+                queue_size=queue_size,
+                chunk_manifest_dir=settings.chunk_manifest_path
+            )
+            
             # Clean rebuild if requested
             if force_rebuild:
                 logger.info("   🗑️ Force rebuild - clearing existing collections...")
@@ -346,54 +168,43 @@ class UnifiedVectorDBBuilder:
                         persist_directory=str(self.vectordb_dir),
                         embedding_model=settings.embedding_model_name
                     )
+                    pipeline.vectordb_service = self.vectordb_service
+                    
+                    # Manifest của incremental indexer không còn khớp với DB mới
+                    IndexManifest(settings.index_manifest_path).reset()
                 except Exception as e:
                     logger.warning(f"   ⚠️ Error clearing database: {e}")
+            elif pipeline.checkpoint.is_completed:
+                # Chỉ bỏ qua files checkpoint đã ghi xong (cùng content hash) - file mới / đã sửa vẫn được index
+                logger.info("   ♻️ Previous build completed - indexing only new or changed documents (use --force to rebuild)")
             
-            # Process all documents using integrated processing
-            logger.info("   📊 Processing all JSON documents...")
-            collections_data = self.process_all_documents()
+            result = pipeline.run(resume=not force_rebuild)
             
-            if not collections_data:
-                logger.error("❌ No data processed from JSON files")
+            if result['docs_total'] == 0:
+                logger.error("❌ No JSON documents found")
                 return False
             
-            # Process each collection
-            total_chunks = 0
-            
-            for collection_name, chunks in collections_data.items():
-                if not chunks:
-                    logger.warning(f"      ⚠️ No chunks for collection {collection_name}")
-                    continue
-                
-                logger.info(f"   📂 Processing collection: {collection_name}")
-                logger.info(f"      📄 Chunks: {len(chunks)}")
-                
-                # Log first chunk to verify structure
-                if chunks:
-                    first_chunk = chunks[0]
-                    logger.info(f"      📝 Sample chunk ID: {first_chunk.get('chunk_id', 'N/A')}")
-                    logger.info(f"      📝 Document title: {first_chunk.get('source', {}).get('document_title', 'N/A')}")
-                
-                # Add documents to vector database using VectorDBService
-                try:
-                    added_count = self.vectordb_service.add_documents_to_collection(
-                        collection_name=collection_name,
-                        documents=chunks
-                    )
-                    logger.info(f"      ✅ Added {added_count} chunks to {collection_name}")
-                    total_chunks += added_count
-                    
-                except Exception as e:
-                    logger.error(f"      ❌ Error adding to collection {collection_name}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            
-            logger.info(f"📊 Unified vector database build completed")
-            logger.info(f"   📂 Collections: {len(collections_data)}")
-            logger.info(f"   📄 Total chunks: {total_chunks}")
+            throughput = result['throughput']
+            logger.info(f"📊 Streaming vector database build completed")
+            for collection_name, count in result['collections'].items():
+                logger.info(f"   📂 {collection_name}: {count} chunks written")
+            logger.info(f"   📄 Documents: {result['docs_parsed']} parsed, {result['docs_skipped']} resumed from checkpoint, "
+                        f"{result['docs_failed']} failed")
+            logger.info(f"   📄 Total chunks written: {result['chunks_written']}")
+            logger.info(f"   ⚡ Parse: {throughput['parse_docs_per_s']} docs/s, {throughput['parse_chunks_per_s']} chunks/s")
+            logger.info(f"   ⚡ Embed: {throughput['embed_embeddings_per_s']} embeddings/s")
+            logger.info(f"   ⚡ Write: {throughput['write_chunks_per_s']} chunks/s")
+            logger.info(f"   ⚡ Overall: {throughput['overall_chunks_per_s']} chunks/s in {result['wall_seconds']}s")
+            if result['peak_memory_mb'] is not None:
+                logger.info(f"   🧠 Peak memory: {result['peak_memory_mb']} MB")
             logger.info(f"   💾 Database location: {self.vectordb_dir}")
             
+            if not result['success']:
+                for error in result['errors']:
+                    logger.error(f"   ❌ {error}")
+                logger.info("   💡 Run the tool again to resume from the last checkpoint")
+                return False
+            
             return True
             
         except Exception as e:
@@ -402,6 +213,38 @@ class UnifiedVectorDBBuilder:
             traceback.print_exc()
             return False
     
+    def incremental_update(self, batch_size: int = settings.index_embed_batch_size, dry_run: bool = False) -> bool:
+        """Re-index chỉ những documents đã thay đổi (theo content hash) thay vì rebuild toàn bộ"""
+        logger.info("🔄 INCREMENTAL RE-INDEX" + (" (DRY RUN)" if dry_run else ""))
+        logger.info("-" * 40)
+        
+        try:
+            indexer = IncrementalIndexer(
+                vectordb_service=self.vectordb_service,
+                documents_dir=self.documents_dir,
+                manifest_path=settings.index_manifest_path,
+                batch_size=batch_size,
+                chunk_manifest_dir=settings.chunk_manifest_path
+            )
+            stats = indexer.run(dry_run=dry_run)
+            
+            for label in ('added_files', 'changed_files', 'removed_files'):
+                for file_path in stats[label]:
+                    logger.info(f"   📄 {label.split('_')[0]}: {file_path}")
+            logger.info(f"   ✅ Unchanged files: {stats['unchanged_files']}")
+            logger.info(f"   📄 Chunks upserted: {stats['chunks_upserted']}, deleted: {stats['chunks_deleted']}, "
+                        f"unchanged: {stats['chunks_unchanged']}")
+            if stats['has_changes'] and not dry_run:
+                logger.info("   💡 Running server: POST /api/v1/index/refresh để refresh context/router caches")
+            
+            return not stats['failed_files']
+            
+        except Exception as e:
+            logger.error(f"❌ Error in incremental re-index: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
     def test_vector_database(self) -> bool:
         """Test vector database functionality using VectorDBService"""
         logger.info("🧪 TESTING VECTOR DATABASE")
@@ -482,14 +325,19 @@ Examples:
   python tools/2_build_vectordb_unified.py           # Build vector database
   python tools/2_build_vectordb_unified.py --force   # Force rebuild (clear existing)
   python tools/2_build_vectordb_unified.py --clean   # Clean rebuild (remove entire DB)
+  python tools/2_build_vectordb_unified.py --workers 8 --batch-size 128 --queue-size 8
+  python tools/2_build_vectordb_unified.py --incremental            # Re-index changed documents only
+  python tools/2_build_vectordb_unified.py --incremental --dry-run  # Show what would change
 
 This unified tool will:
 1. Process JSON documents and convert to vector database format
 2. Ensure proper ID generation (document_id + chunk_id)
 3. Maintain metadata enrichment for better search
 4. Support context expansion via document grouping
-5. Build complete vector database
-6. Test search functionality across collections
+5. Stream documents through parse (process pool) -> embed (batches) -> write (batches)
+6. Checkpoint each written file so an interrupted build resumes where it stopped
+7. Report per-stage throughput and peak memory
+8. Test search functionality across collections
 
 Note: This replaces both document_processor.py and 2_build_vectordb_final.py
         """
@@ -507,8 +355,44 @@ Note: This replaces both document_processor.py and 2_build_vectordb_final.py
         help='Clean rebuild - delete entire vectordb directory and start fresh'
     )
     
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=settings.index_build_workers,
+        help=f'Parser processes (default: {settings.index_build_workers})'
+    )
+    
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=settings.index_embed_batch_size,
+        help=f'Chunks per embedding/write batch (default: {settings.index_embed_batch_size})'
+    )
+    
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=settings.index_queue_size,
+        help=f'Max batches buffered between stages (default: {settings.index_queue_size})'
+    )
+    
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Incremental re-index - only upsert changed chunks and delete chunks of removed files'
+    )
+    
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='With --incremental: report changes without writing'
+    )
+    
     args = parser.parse_args()
     
+    if args.incremental and (args.force or args.clean):
+        parser.error('--incremental cannot be combined with --force/--clean')
+    
     logger.info("📊 LEGALRAG UNIFIED VECTOR DATABASE BUILDER")
     logger.info("=" * 60)
     
@@ -540,9 +424,21 @@ Note: This replaces both document_processor.py and 2_build_vectordb_final.py
         logger.error("❌ Prerequisites not met")
         return 1
     
+    if args.incremental:
+        if not builder.incremental_update(batch_size=args.batch_size, dry_run=args.dry_run):
+            logger.error("❌ Incremental re-index finished with errors")
+            return 1
+        logger.info("🎉 INCREMENTAL RE-INDEX COMPLETED!")
+        return 0
+    
     # Build vector database  
     force_rebuild = args.force or args.clean
-    if not builder.build_vector_database(force_rebuild=force_rebuild):
+    if not builder.build_vector_database(
+        force_rebuild=force_rebuild,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size
+    ):
         logger.error("❌ Failed to build vector database")
         return 1
     
@@ -371,6 +371,12 @@ class RouterCacheBuilder:
         
         cache_data['metadata']['total_questions'] = total_questions
         
+        # Clarification catalog (collection -> documents -> câu hỏi gợi ý) lưu cùng cache
+        from app.services.clarification_catalog import ClarificationCatalog
+        catalog = ClarificationCatalog.build(cache_data['questions'])
+        cache_data['clarification_catalog'] = catalog.to_dict()
+        logger.info(f"   🗂️ Clarification catalog: {catalog.get_stats()}")
+        
         # Save cache
         logger.info(f"💾 Saving cache: {self.cache_file}")
         with open(self.cache_file, 'wb') as f:
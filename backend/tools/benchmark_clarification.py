@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Clarification Stage Benchmark for LegalRAG
+==========================================
+
+Đo latency từng bước clarification trước / sau tối ưu:
+
+1. Similar-procedure lookup - QueryRouter.get_similar_procedures_for_collection (user chọn collection,
+   documents được xếp theo độ gần với câu hỏi gốc), trước / sau khi chuyển sang index theo document:
+
+   - legacy: bản port của implementation cũ - loop từng câu hỏi, cosine_similarity (sklearn) từng vector,
+     title boost trên từng câu, reference embedding cache trong dict không giới hạn
+   - document index: 1 matmul trên vectors của collection, best variant mỗi document, reference LRU riêng
+
+   Query = example questions (router_examples_smart_v3) của các collections, mỗi query chạy lookup
+   trên từng collection (như clarification của 1 session). Report latency (p50 / p95 / p99),
+   top-1 document agreement và overlap top-k giữa 2 cách.
+
+2. Catalog stages - danh sách documents (proceed_with_collection) và câu hỏi gợi ý của document
+   (proceed_with_document): duyệt lại example questions như trước vs lookup trong ClarificationCatalog.
+   Kiểm tra luôn 2 cách cho cùng danh sách documents.
+
+3. Clarification -> answer (--answer, cần vector DB + reranker thật, LLM stub): chạy đủ 3 lượt
+   chọn collection -> chọn document -> xác nhận câu hỏi gợi ý cho từng document, với
+   CLARIFICATION_FAST_PATH tắt (search + rerank lại) và bật (pending resolution). Report latency của
+   lượt xác nhận, stage timings và tỷ lệ 2 cách trả lời từ cùng source document.
+
+Usage:
+    cd backend
+    python tools/benchmark_clarification.py
+    python tools/benchmark_clarification.py --collections chung_thuc ho_tich_cap_xa nuoi_con_nuoi --queries 300
+    python tools/benchmark_clarification.py --stub-embedding --output data/benchmarks/clarification.json
+    python tools/benchmark_clarification.py --answer --documents-per-collection 5 --stub-llm-latency 0.5
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTIONS = ['chung_thuc', 'ho_tich_cap_xa', 'nuoi_con_nuoi']
+SPECIAL_MARKERS = ['lưu động', 'có yếu tố nước ngoài', 'lại', 'kết hợp', 'chấm dứt']
+
+
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    try:
+        from sklearn.metrics.pairwise import cosine_similarity
+        return cosine_similarity(a, b)
+    except ImportError:
+        a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+        b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+        return a @ b.T
+
+
+def legacy_similar_procedures(
+    router,
+    reference_cache: Dict[str, List[float]],
+    collection_name: str,
+    reference_query: str,
+    top_k: int = 5
+) -> List[Dict[str, Any]]:
+    """Implementation cũ (bỏ log): per-question cosine, boost per question, dedup source trong top_k * 2"""
+    collection_questions = router.example_questions.get(collection_name, [])
+    if not collection_questions:
+        return []
+
+    reference_cache_key = f"reference:{reference_query}"
+    if reference_cache_key in reference_cache:
+        reference_embedding = np.array(reference_cache[reference_cache_key]).reshape(1, -1)
+    else:
+        reference_embedding = router.embedding_model.encode([reference_query])
+        reference_cache[reference_cache_key] = reference_embedding[0].tolist()
+
+    collection_embeddings = router.question_vectors[collection_name]
+    similarities = []
+    for i, question in enumerate(collection_questions):
+        question_embedding = collection_embeddings[i:i + 1]
+        similarity = _cosine_similarity(reference_embedding, question_embedding)[0][0]
+        similarities.append({'question': question, 'similarity': float(similarity), 'text': question.get('text', '')})
+    similarities.sort(key=lambda x: x['similarity'], reverse=True)
+
+    for item in similarities:
+        question = item['question']
+        doc_title = question.get('title', '')
+        source_file = question.get('source', '')
+        if not doc_title and source_file:
+            filename = source_file.split('/')[-1].replace('.json', '').replace('.doc', '')
+            if '. ' in filename:
+                doc_title = filename.split('. ', 1)[1]
+        if doc_title:
+            clean_reference = reference_query.lower().strip()
+            clean_doc_title = doc_title.lower().strip()
+            if clean_doc_title in clean_reference or clean_reference in clean_doc_title:
+                is_core = not any(special in clean_doc_title for special in SPECIAL_MARKERS)
+                item['similarity'] = min(1.0, item['similarity'] + (0.3 if is_core else 0.1))
+    similarities.sort(key=lambda x: x['similarity'], reverse=True)
+
+    results, seen_sources = [], set()
+    for item in similarities[:top_k * 2]:
+        source = item['question'].get('source', item['question'].get('file', ''))
+        if not source or source not in seen_sources:
+            results.append({'text': item['text'], 'similarity': item['similarity'], 'source': source or 'Unknown'})
+            if source:
+                seen_sources.add(source)
+            if len(results) >= top_k:
+                break
+    return results
+
+
+def legacy_document_list(router, collection_name: str) -> List[Dict[str, Any]]:
+    """Bước proceed_with_collection cũ: duyệt example questions, parse tên file, đếm câu hỏi từng document"""
+    collection_documents = {}
+    for question in router.get_example_questions_for_collection(collection_name):
+        source = question.get('source', '')
+        if source:
+            doc_name = source.replace('.json', '').split('/')[-1]
+            if '. ' in doc_name:
+                doc_name = doc_name.split('. ', 1)[1]
+            if doc_name not in collection_documents:
+                collection_documents[doc_name] = {"filename": source, "title": doc_name, "question_count": 0}
+            collection_documents[doc_name]["question_count"] += 1
+    return sorted(collection_documents.values(), key=lambda x: x["question_count"], reverse=True)[:8]
+
+
+def legacy_document_questions(router, collection_name: str, document_filename: str) -> List[Dict[str, Any]]:
+    """Bước proceed_with_document cũ: substring match document_filename với source của mọi câu hỏi"""
+    collection_questions = router.get_example_questions_for_collection(collection_name)
+    document_questions = [q for q in collection_questions if q.get('source') and document_filename in q.get('source', '')]
+    return (document_questions or collection_questions[:5])[:5]
+
+
+def _timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000.0
+
+
+def run_stages(router, collections: List[str], repeat: int) -> Dict[str, Any]:
+    catalog = router.clarification_catalog
+    timings = {name: [] for name in ('documents_legacy', 'documents_catalog', 'questions_legacy', 'questions_catalog')}
+    mismatched = []
+
+    for collection_name in collections:
+        legacy_titles = [doc['title'] for doc in legacy_document_list(router, collection_name)]
+        if legacy_titles != [doc['title'] for doc in catalog.documents(collection_name)[:8]]:
+            mismatched.append(collection_name)
+
+        for _ in range(repeat):
+            timings['documents_legacy'].append(_timed(legacy_document_list, router, collection_name))
+            timings['documents_catalog'].append(_timed(catalog.documents, collection_name))
+
+        for doc in catalog.documents(collection_name):
+            for _ in range(repeat):
+                timings['questions_legacy'].append(
+                    _timed(legacy_document_questions, router, collection_name, doc['filename'])
+                )
+                timings['questions_catalog'].append(
+                    _timed(catalog.document_questions, collection_name, doc['filename'], doc['title'])
+                )
+
+    return {
+        'latency': {name: percentiles(values) for name, values in timings.items()},
+        'document_list_mismatches': mismatched
+    }
+
+
+def _clarification_answer(rag_service, collection_name: str, document_index: int, reference_query: str) -> Optional[Dict[str, Any]]:
+    """1 session: chọn collection -> chọn document thứ document_index -> xác nhận câu hỏi gợi ý đầu tiên"""
+    session_id = rag_service.create_session()
+    rag_service.get_session(session_id).metadata['original_query'] = reference_query
+    try:
+        step = rag_service.handle_clarification(
+            session_id, {'action': 'proceed_with_collection', 'collection': collection_name}, reference_query
+        )
+        documents = step.get('documents') or []
+        if document_index >= len(documents):
+            return None
+        document = documents[document_index]
+        step = rag_service.handle_clarification(session_id, {
+            'action': 'proceed_with_document',
+            'collection': collection_name,
+            'document_filename': document['filename'],
+            'document_title': document['title']
+        }, reference_query)
+        options = [option for option in step['clarification']['options'] if option['action'] == 'proceed_with_question']
+        if not options:
+            return None
+
+        start = time.perf_counter()
+        answer = rag_service.handle_clarification(session_id, options[0], reference_query)
+        return {
+            'latency_ms': (time.perf_counter() - start) * 1000.0,
+            'type': answer.get('type'),
+            'source_documents': (answer.get('context_info') or {}).get('source_documents', []),
+            'stage_timings': answer.get('stage_timings') or {}
+        }
+    finally:
+        rag_service.chat_sessions.pop(session_id, None)
+
+
+def run_answer(rag_service, collections: List[str], documents_per_collection: int, reference_query: str) -> Dict[str, Any]:
+    from app.core.config import settings
+
+    fast_path = settings.clarification_fast_path
+    runs = {'full_pipeline': [], 'pending_resolution': []}
+    same_source = compared = 0
+    try:
+        for collection_name in collections:
+            for document_index in range(documents_per_collection):
+                outputs = {}
+                for mode, enabled in (('full_pipeline', False), ('pending_resolution', True)):
+                    settings.clarification_fast_path = enabled
+                    outputs[mode] = _clarification_answer(rag_service, collection_name, document_index, reference_query)
+                if not all(outputs.values()):
+                    continue
+                for mode, output in outputs.items():
+                    runs[mode].append(output)
+                compared += 1
+                same_source += int(outputs['full_pipeline']['source_documents'] == outputs['pending_resolution']['source_documents'])
+    finally:
+        settings.clarification_fast_path = fast_path
+
+    def summarize(outputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        stages = sorted({stage for output in outputs for stage in output['stage_timings']})
+        return {
+            'latency': percentiles([output['latency_ms'] for output in outputs]),
+            'answers': sum(output['type'] == 'answer' for output in outputs),
+            'stages': {
+                stage: percentiles([output['stage_timings'][stage] for output in outputs if stage in output['stage_timings']])
+                for stage in stages
+            }
+        }
+
+    return {
+        'confirmations': compared,
+        'same_source_document': round(same_source / compared, 4) if compared else None,
+        **{mode: summarize(outputs) for mode, outputs in runs.items()}
+    }
+
+
+def run(router, queries: List[str], collections: List[str], top_k: int) -> Dict[str, Any]:
+    reference_cache: Dict[str, List[float]] = {}
+    legacy_latencies, new_latencies = [], []
+    top1_agree, overlap, lookups = 0, 0.0, 0
+
+    for query in queries:
+        for collection_name in collections:
+            start = time.perf_counter()
+            legacy = legacy_similar_procedures(router, reference_cache, collection_name, query, top_k)
+            legacy_latencies.append((time.perf_counter() - start) * 1000.0)
+
+            start = time.perf_counter()
+            new = router.get_similar_procedures_for_collection(collection_name, query, top_k)
+            new_latencies.append((time.perf_counter() - start) * 1000.0)
+
+            if not legacy or not new:
+                continue
+            lookups += 1
+            top1_agree += int(legacy[0]['source'] == new[0]['source'])
+            legacy_sources = {item['source'] for item in legacy}
+            overlap += len(legacy_sources & {item['source'] for item in new}) / max(len(legacy_sources), 1)
+
+    return {
+        'lookups': lookups,
+        'legacy': {'latency': percentiles(legacy_latencies), 'reference_cache_entries': len(reference_cache)},
+        'document_index': {'latency': percentiles(new_latencies)},
+        'top1_agreement': round(top1_agree / lookups, 4) if lookups else None,
+        f'top{top_k}_overlap': round(overlap / lookups, 4) if lookups else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark clarification stages: similar-procedure lookup and catalog lookups vs the previous question walks',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (default: data/router_examples_smart_v3)')
+    parser.add_argument('--collections', nargs='+', default=DEFAULT_COLLECTIONS,
+                        help=f'Collections to run the lookup on (default: {" ".join(DEFAULT_COLLECTIONS)})')
+    parser.add_argument('--queries', type=int, default=200, help='Reference queries sampled (default: 200)')
+    parser.add_argument('--top-k', type=int, default=5, help='Procedures returned per lookup (default: 5)')
+    parser.add_argument('--stub-embedding', action='store_true',
+                        help='Use the hashing stub embedding instead of the real model (latency of the lookup only)')
+    parser.add_argument('--stage-repeat', type=int, default=20,
+                        help='Repetitions per collection / document for the catalog stage timings (default: 20)')
+    parser.add_argument('--answer', action='store_true',
+                        help='Also time clarification -> answer with and without the pending resolution (needs the vector DB)')
+    parser.add_argument('--documents-per-collection', type=int, default=5,
+                        help='Documents confirmed per collection in --answer mode (default: 5)')
+    parser.add_argument('--reference-query', type=str, default='Thủ tục này cần giấy tờ gì?',
+                        help='Original (ambiguous) query stored in each --answer session')
+    parser.add_argument('--stub-llm-latency', type=float, default=0.0, help='Stub LLM fixed latency in seconds (--answer)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    from app.core.config import settings
+    settings.setup_environment()
+
+    # Log của router / cache ở mức INFO làm nhiễu kết quả latency
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    from app.services.router import QueryRouter
+
+    rag_service = None
+    start = time.perf_counter()
+    if args.answer:
+        from app.services.vector import VectorDBService
+        from app.services.stubs import StubLLMService
+        from app.services.rag_engine import RAGService
+
+        rag_service = RAGService(
+            documents_dir=str(settings.documents_path),
+            vectordb_service=VectorDBService(),
+            llm_service=StubLLMService(latency_seconds=args.stub_llm_latency)
+        )
+        router = rag_service.smart_router
+    else:
+        if args.stub_embedding:
+            from app.services.stubs import StubEmbeddingModel
+            embedding_model = StubEmbeddingModel()
+        else:
+            from app.services.vector import VectorDBService
+            embedding_model = VectorDBService().embedding_model
+        router = QueryRouter(embedding_model=embedding_model)
+    logger.info(f"🧭 Router ready in {time.perf_counter() - start:.1f}s")
+
+    collections = [name for name in args.collections if router.example_questions.get(name)]
+    missing = sorted(set(args.collections) - set(collections))
+    if missing:
+        logger.warning(f"⚠️ Collections without router examples: {', '.join(missing)}")
+    if not collections:
+        logger.error("❌ No collection to benchmark")
+        return 1
+
+    texts = sorted({sample['query'] for sample in load_dataset(Path(args.router_dir), collections) if sample['query'].strip()})
+    queries = random.Random(args.seed).sample(texts, min(args.queries, len(texts)))
+    sizes = {name: len(router.example_questions[name]) for name in collections}
+    logger.info(f"📚 {len(queries)} reference queries x {len(collections)} collections {sizes}")
+
+    results = run(router, queries, collections, args.top_k)
+    stages = run_stages(router, collections, args.stage_repeat)
+    answer = None
+    if rag_service is not None:
+        logger.info(f"⏱️ Clarification -> answer: {args.documents_per_collection} documents x {len(collections)} collections...")
+        answer = run_answer(rag_service, collections, args.documents_per_collection, args.reference_query)
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'embedding': 'stub' if args.stub_embedding and not args.answer else settings.embedding_model_name,
+        'collections': sizes,
+        'queries': len(queries),
+        'top_k': args.top_k,
+        **results,
+        'stages': stages,
+        'answer': answer
+    }
+
+    legacy, new = results['legacy']['latency'], results['document_index']['latency']
+    logger.info("📊 SIMILAR-PROCEDURE LOOKUP")
+    logger.info("=" * 60)
+    logger.info(f"   legacy         p50 {legacy['p50_ms']}ms, p95 {legacy['p95_ms']}ms, p99 {legacy['p99_ms']}ms "
+                f"(reference dict grew to {results['legacy']['reference_cache_entries']} entries)")
+    logger.info(f"   document index p50 {new['p50_ms']}ms, p95 {new['p95_ms']}ms, p99 {new['p99_ms']}ms "
+                f"(x{legacy['p50_ms'] / max(new['p50_ms'], 1e-3):.1f} at p50)")
+    logger.info(f"   top-1 agreement {results['top1_agreement']:.2%}, "
+                f"top-{args.top_k} overlap {results[f'top{args.top_k}_overlap']:.2%}")
+
+    for stage in ('documents', 'questions'):
+        before, after = stages['latency'][f'{stage}_legacy'], stages['latency'][f'{stage}_catalog']
+        logger.info(f"   {stage:<9} walk p50 {before['p50_ms']}ms, p95 {before['p95_ms']}ms | "
+                    f"catalog p50 {after['p50_ms']}ms, p95 {after['p95_ms']}ms")
+    if stages['document_list_mismatches']:
+        logger.warning(f"⚠️ Document list differs from the question walk: {', '.join(stages['document_list_mismatches'])}")
+
+    if answer and answer['confirmations']:
+        before, after = answer['full_pipeline']['latency'], answer['pending_resolution']['latency']
+        logger.info(f"   confirm -> answer: full pipeline p50 {before['p50_ms']}ms, p95 {before['p95_ms']}ms | "
+                    f"pending resolution p50 {after['p50_ms']}ms, p95 {after['p95_ms']}ms "
+                    f"(same source document {answer['same_source_document']:.2%})")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
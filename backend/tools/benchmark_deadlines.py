@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Deadline Degradation Benchmark for LegalRAG
+===========================================
+
+Mô phỏng tail latency của RAGService.process_query dưới các latency budgets (X-Deadline-Ms / REQUEST_DEADLINE_MS,
+app/services/deadline.py) với stub models (embedding, reranker, LLM - app/services/stubs.py):
+
+- Chạy in-process, không HTTP: --concurrency requests đồng thời qua ThreadPoolExecutor, LLM --llm-slots slots
+  -> requests xếp hàng chờ generation như server bận
+- Warm up không budget (--warmup) để policy học chi phí đầy đủ của từng stage, rồi chạy cùng bộ câu hỏi
+  với mỗi budget trong --budgets (0 = không giới hạn, làm baseline)
+- Stub LLM có chi phí prefill theo độ dài context (--stub-llm-prompt-tps) -> nucleus section rẻ hơn full document
+
+Report mỗi budget: latency p50/p95/p99, tỷ lệ request kịp deadline, loại câu trả lời (llm / structured),
+số lần mỗi degradation (shrink_k, skip_consensus, skip_reranker, nucleus_section, structured_answer,
+cap_max_tokens, truncated, queue_timeout).
+
+Vector DB build bằng stub embedding nằm trong workspace (giống tools/load_test.py) - lần đầu chạy với --build-index.
+
+Usage:
+    cd backend
+    python tools/benchmark_deadlines.py --build-index --budgets 0 4000 2500 1500 800
+    python tools/benchmark_deadlines.py --budgets 0 2000 1000 --concurrency 4 --llm-slots 2 --output data/benchmarks/deadlines.json
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+from load_test import workspace_env, prepare_workspace, build_stub_index
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def build_service(args):
+    from app.core.config import settings
+    from app.services.vector import VectorDBService
+    from app.services.rag_engine import RAGService
+    from app.services.stubs import StubEmbeddingModel, StubLLMService, StubRerankerService
+
+    vectordb = VectorDBService(load_embedding=False)
+    vectordb.embedding_model = StubEmbeddingModel(dimension=args.embedding_dim, latency_seconds=args.stub_embedding_latency)
+    llm = StubLLMService(
+        latency_seconds=args.stub_llm_latency,
+        tokens_per_second=args.stub_llm_tps,
+        completion_tokens=args.stub_llm_tokens,
+        slots=args.llm_slots,
+        prompt_tokens_per_second=args.stub_llm_prompt_tps
+    )
+    reranker = StubRerankerService(
+        latency_seconds=args.stub_reranker_latency,
+        latency_per_pair_seconds=args.stub_reranker_per_pair
+    )
+    return RAGService(
+        documents_dir=str(settings.documents_path),
+        vectordb_service=vectordb,
+        llm_service=llm,
+        reranker_service=reranker
+    )
+
+
+def run_budget(rag_service, questions: List[str], budget_ms: float, concurrency: int) -> Dict[str, Any]:
+    def one(query: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = rag_service.process_query(query, deadline_ms=budget_ms)
+        return {'latency_ms': (time.perf_counter() - start) * 1000.0, 'result': result}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outputs = list(pool.map(one, questions))
+    elapsed = time.perf_counter() - start
+
+    latencies = [output['latency_ms'] for output in outputs]
+    types, sources, degradations = Counter(), Counter(), Counter()
+    for output in outputs:
+        result = output['result']
+        types[result.get('type', 'unknown')] += 1
+        if result.get('answer_source'):
+            sources[result['answer_source']] += 1
+        for entry in (result.get('budget') or {}).get('degradations', []):
+            degradations[f"{entry['stage']}/{entry['action']}"] += 1
+    met = sum(latency <= budget_ms for latency in latencies) if budget_ms > 0 else len(latencies)
+    return {
+        'budget_ms': budget_ms,
+        'requests': len(questions),
+        'seconds': round(elapsed, 3),
+        'latency': percentiles(latencies),
+        'deadline_met': round(met / len(latencies), 4) if latencies else None,
+        'types': dict(types),
+        'answer_sources': dict(sources),
+        'degradations': dict(degradations)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate tail latency under per-request deadlines with stub models',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0, 4000, 2500, 1500, 800],
+                        help='Deadlines in ms, 0 = unlimited baseline (default: 0 4000 2500 1500 800)')
+    parser.add_argument('--requests', type=int, default=60, help='Questions per budget (default: 60)')
+    parser.add_argument('--warmup', type=int, default=20, help='Unbudgeted requests to learn stage costs (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent requests (default: 4)')
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory used as question pool')
+    parser.add_argument('--workspace', type=str, default='data/loadtest',
+                        help='Scratch dir for router cache / stub index (default: data/loadtest)')
+    parser.add_argument('--build-index', action='store_true', help='Build the stub-embedding vector DB in the workspace first')
+    parser.add_argument('--seed', type=int, default=42, help='Question sampling seed (default: 42)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+
+    stubs = parser.add_argument_group('stub models')
+    stubs.add_argument('--embedding-dim', type=int, default=1024, help='Stub embedding dimension (default: 1024)')
+    stubs.add_argument('--stub-embedding-latency', type=float, default=0.01, help='Seconds per encode() call')
+    stubs.add_argument('--stub-reranker-latency', type=float, default=0.02, help='Seconds per predict() call')
+    stubs.add_argument('--stub-reranker-per-pair', type=float, default=0.01, help='Extra seconds per (query, doc) pair')
+    stubs.add_argument('--stub-llm-latency', type=float, default=0.1, help='Fixed seconds per generation')
+    stubs.add_argument('--stub-llm-tps', type=float, default=40.0, help='Simulated decode tokens/second (default: 40)')
+    stubs.add_argument('--stub-llm-prompt-tps', type=float, default=2000.0,
+                       help='Simulated prefill tokens/second, 0 = free prefill (default: 2000)')
+    stubs.add_argument('--stub-llm-tokens', type=int, default=60, help='Completion tokens per answer (default: 60)')
+    stubs.add_argument('--llm-slots', type=int, default=1, help='Generation slots (default: 1)')
+    args = parser.parse_args()
+
+    workspace = Path(args.workspace)
+    if not workspace.is_absolute():
+        workspace = backend_dir / workspace
+    workspace = workspace.resolve()
+    prepare_workspace(workspace)
+    os.environ.update(workspace_env(workspace))  # Trước khi import settings
+    os.chdir(backend_dir)
+
+    router_dir = Path(args.router_dir)
+    samples = load_dataset(router_dir)
+    if not samples:
+        logger.error(f"❌ No questions found in {router_dir}")
+        return 1
+    rng = random.Random(args.seed)
+    questions = [sample['query'] for sample in rng.sample(samples, min(args.requests, len(samples)))]
+    warmup = [sample['query'] for sample in rng.sample(samples, min(args.warmup, len(samples)))]
+
+    if args.build_index:
+        build_stub_index(args)
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    # Router cache (data/cache theo cwd) của stub embedding nằm trong workspace
+    os.chdir(workspace)
+    rag_service = build_service(args)
+    from app.services.deadline import degradation_policy
+
+    logger.info(f"🔥 Warm up: {len(warmup)} unbudgeted requests (concurrency {args.concurrency})")
+    run_budget(rag_service, warmup, 0, args.concurrency)
+    logger.info(f"📏 Learned stage costs: {degradation_policy.get_stats()['costs_ms']}")
+
+    runs = []
+    for budget_ms in args.budgets:
+        result = run_budget(rag_service, questions, budget_ms, args.concurrency)
+        runs.append(result)
+        latency = result['latency']
+        label = f"{budget_ms:.0f}ms" if budget_ms > 0 else "unlimited"
+        logger.info(
+            f"   budget {label:<10} p50 {latency.get('p50_ms')}ms p95 {latency.get('p95_ms')}ms p99 {latency.get('p99_ms')}ms | "
+            f"met {result['deadline_met']:.0%} | sources {result['answer_sources']} | degradations {result['degradations']}"
+        )
+
+    if args.output:
+        output_path = Path(args.output)
+        if not output_path.is_absolute():
+            output_path = backend_dir / output_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'concurrency': args.concurrency,
+            'stub_config': {key: value for key, value in vars(args).items() if key.startswith('stub_') or key == 'llm_slots'},
+            'stage_costs_ms': degradation_policy.get_stats()['costs_ms'],
+            'runs': runs
+        }
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Embedding Backend Parity & Latency Benchmark for LegalRAG
+=========================================================
+
+So sánh các embedding backends (torch float32 / onnx / onnx-int8, xem app/services/embedding_backends.py)
+trên corpus câu hỏi của router examples (data/router_examples_smart_v3/**.json):
+
+- parity so với torch float model: cosine(float, backend) từng câu (mean / min / p1 / tỷ lệ >= 0.99)
+  + nearest-neighbor agreement trong corpus (top-1 giống nhau, overlap top-5) - proxy cho routing / search
+- single-query latency: encode([query]) như router / search lúc serve (p50 / p95 / p99)
+- batch throughput: encode(corpus, batch_size) như lúc build index (texts/s)
+
+Export ONNX trước: python tools/export_embedding_onnx.py
+
+Usage:
+    cd backend
+    python tools/benchmark_embedding_backends.py
+    python tools/benchmark_embedding_backends.py --backends torch onnx-int8 --threads 6 --output data/benchmarks/embedding.json
+    python tools/benchmark_embedding_backends.py --limit 500 --min-cosine 0.99
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+
+def _neighbors(embeddings: np.ndarray, k: int) -> np.ndarray:
+    """Top-k neighbors (bỏ chính nó) theo cosine"""
+    similarities = embeddings @ embeddings.T
+    np.fill_diagonal(similarities, -np.inf)
+    return np.argsort(-similarities, axis=1)[:, :k]
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray, k: int = 5) -> Dict[str, Any]:
+    reference, candidate = _normalize(reference), _normalize(candidate)
+    cosines = np.sum(reference * candidate, axis=1)
+
+    reference_nn, candidate_nn = _neighbors(reference, k), _neighbors(candidate, k)
+    top1_agreement = float(np.mean(reference_nn[:, 0] == candidate_nn[:, 0]))
+    topk_overlap = float(np.mean([
+        len(set(ref_row) & set(cand_row)) / k for ref_row, cand_row in zip(reference_nn, candidate_nn)
+    ]))
+
+    return {
+        'cosine_mean': round(float(cosines.mean()), 5),
+        'cosine_min': round(float(cosines.min()), 5),
+        'cosine_p1': round(float(np.percentile(cosines, 1)), 5),
+        'cosine_ge_099': round(float(np.mean(cosines >= 0.99)), 4),
+        'nn_top1_agreement': round(top1_agreement, 4),
+        f'nn_top{k}_overlap': round(topk_overlap, 4)
+    }
+
+
+def measure_latency(model, queries: List[str]) -> Dict[str, Any]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return percentiles(latencies)
+
+
+def measure_throughput(model, texts: List[str], batch_size: int) -> Tuple[Dict[str, Any], np.ndarray]:
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return {
+        'texts': len(texts),
+        'batch_size': batch_size,
+        'seconds': round(elapsed, 2),
+        'texts_per_second': round(len(texts) / elapsed, 1) if elapsed > 0 else None
+    }, np.asarray(embeddings)
+
+
+def main():
+    from app.core.config import settings
+    from app.services.embedding_backends import EMBEDDING_BACKENDS
+
+    parser = argparse.ArgumentParser(
+        description='Compare embedding backends: cosine parity vs the float model, single-query latency, batch throughput',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--backends', nargs='+', default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS,
+                        help='Backends to compare (torch is always loaded as the reference)')
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (default: data/router_examples_smart_v3)')
+    parser.add_argument('--onnx-dir', type=str, default=settings.embedding_onnx_dir,
+                        help=f'ONNX export directory (default: {settings.embedding_onnx_dir})')
+    parser.add_argument('--limit', type=int, default=None, help='Random sample of N texts for parity / throughput')
+    parser.add_argument('--latency-queries', type=int, default=200, help='Single-query encodes per backend (default: 200)')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size for throughput (default: 32)')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads (default: EMBEDDING_ONNX_THREADS)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--min-cosine', type=float, default=None,
+                        help='Fail (exit 1) if any backend has mean cosine vs float below this value')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    settings.setup_environment()
+
+    from app.services.embedding_backends import load_embedding_backend
+
+    router_dir = Path(args.router_dir)
+    texts = sorted({sample['query'] for sample in load_dataset(router_dir) if sample['query'].strip()})
+    if not texts:
+        logger.error(f"❌ No router examples found in {router_dir}")
+        return 1
+    rng = random.Random(args.seed)
+    if args.limit and args.limit < len(texts):
+        texts = rng.sample(texts, args.limit)
+    latency_queries = rng.sample(texts, min(args.latency_queries, len(texts)))
+    logger.info(f"📚 Corpus: {len(texts)} unique questions from {router_dir}")
+
+    backends = ['torch'] + [backend for backend in args.backends if backend != 'torch']
+    reference = None
+    results = {}
+    for backend in backends:
+        logger.info(f"📥 Loading {backend} backend...")
+        start = time.perf_counter()
+        model = load_embedding_backend(backend, export_dir=Path(args.onnx_dir), num_threads=args.threads)
+        load_seconds = round(time.perf_counter() - start, 2)
+
+        # Warm up (lazy init, first run allocations)
+        model.encode(texts[:args.batch_size], batch_size=args.batch_size)
+
+        logger.info(f"⏱️ {backend}: single-query latency ({len(latency_queries)} queries)...")
+        latency = measure_latency(model, latency_queries)
+        logger.info(f"⏱️ {backend}: batch throughput ({len(texts)} texts)...")
+        throughput, embeddings = measure_throughput(model, texts, args.batch_size)
+
+        result = {'load_seconds': load_seconds, 'single_query_latency': latency, 'batch_throughput': throughput}
+        if reference is None:
+            reference = embeddings
+        else:
+            result['parity'] = parity(reference, embeddings)
+        results[backend] = result
+        del model
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'model': settings.embedding_model_name,
+        'router_dir': str(router_dir),
+        'texts': len(texts),
+        'threads': args.threads if args.threads is not None else settings.embedding_onnx_threads,
+        'backends': results
+    }
+
+    torch_p50 = results['torch']['single_query_latency']['p50_ms']
+    torch_tps = results['torch']['batch_throughput']['texts_per_second']
+    logger.info("📊 EMBEDDING BACKEND SUMMARY")
+    logger.info("=" * 60)
+    for backend, result in results.items():
+        latency, throughput = result['single_query_latency'], result['batch_throughput']
+        line = (f"{backend:<10} p50 {latency['p50_ms']}ms (x{torch_p50 / latency['p50_ms']:.2f}), "
+                f"p95 {latency['p95_ms']}ms | {throughput['texts_per_second']} texts/s "
+                f"(x{throughput['texts_per_second'] / torch_tps:.2f})")
+        if 'parity' in result:
+            p = result['parity']
+            line += (f" | cosine mean {p['cosine_mean']}, min {p['cosine_min']}, "
+                     f"NN top-1 agreement {p['nn_top1_agreement']:.2%}")
+        logger.info(line)
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    if args.min_cosine is not None:
+        failed = [backend for backend, result in results.items()
+                  if 'parity' in result and result['parity']['cosine_mean'] < args.min_cosine]
+        if failed:
+            logger.error(f"❌ Mean cosine below {args.min_cosine}: {', '.join(failed)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Event Log Overhead Benchmark for LegalRAG
+=========================================
+
+So sánh chi phí logging mỗi request (không cần models / vector DB):
+- legacy: ~90 logger.info f-strings của 1 request trước đây - API, route_query, vector search, rerank_documents,
+  context expansion, LLM generation (RERANK DOC[i] cho từng candidate, NEW BEST MATCH cho từng collection...),
+  handler ghi ra file
+- legacy_info_disabled: cùng các f-strings nhưng logger ở WARNING (string vẫn được format eagerly)
+- events: structured events (ring buffer + sampled async JSON lines) - chế độ mặc định hiện tại
+
+Usage:
+    cd backend
+    python tools/benchmark_event_log.py
+    python tools/benchmark_event_log.py --requests 20000 --candidates 20 --sample-rate 0.05 --output data/benchmarks/event_log.json
+"""
+
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any, Callable
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.events import EventLog
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUERY = "Thủ tục đăng ký khai sinh cho con cần những giấy tờ gì và lệ phí bao nhiêu?"
+EXAMPLE = "Đăng ký khai sinh cho trẻ em cần chuẩn bị hồ sơ gì, nộp ở đâu và mất bao lâu?"
+
+
+def make_legacy_request(hot_logger: logging.Logger, candidates: int, collections: int) -> Callable[[], None]:
+    """Tái hiện các logger.info của 1 request 'answer' trước khi chuyển sang event log"""
+    filters = {'exact_title': ['Đăng ký khai sinh']}
+
+    def request():
+        session_id = "3f2a9c1e-5b7d-4c8e-9a1f-2d3e4f5a6b7c"
+        hot_logger.info(f"Processing optimized query: {QUERY[:50]}...")
+        hot_logger.info(f"Processing query in session {session_id}: {QUERY[:50]}...")
+        # route_query: NEW BEST MATCH mỗi lần best thay đổi (~1/2 số collections)
+        for i in range(max(1, collections // 2)):
+            hot_logger.info(f"🔍 NEW BEST MATCH: score={0.5 + i * 0.05:.3f}, collection=ho_tich_cap_xa")
+            hot_logger.info(f"🔍 Question text: '{EXAMPLE[:100]}...'")
+            hot_logger.info(f"🔍 Source procedure: DANG KY KHAI SINH.json")
+            hot_logger.info(f"🔍 Exact title from filters: {filters['exact_title']}")
+        hot_logger.info(f"🎯 Query: '{QUERY[:50]}...' -> Best match: ho_tich_cap_xa ({0.873:.3f})")
+        hot_logger.info(f"📝 Matched example: '{EXAMPLE[:80]}...'")
+        hot_logger.info(f"🔗 No session context available: session={True}, has_attr={True}, value={None}")
+        hot_logger.info(f"🔍 FINAL FILTERS CHECK - Exact title: {filters['exact_title']}")
+        hot_logger.info(f"✅ HIGH CONFIDENCE routing: {0.873:.3f} >= {0.8}")
+        # process_query
+        hot_logger.info(f"Router confidence: high (score: {0.873:.3f})")
+        hot_logger.info(f"✅ HIGH CONFIDENCE routing to: ho_tich_cap_xa")
+        hot_logger.info(f"🎯 HIGH CONFIDENCE: Giảm broad_search_k xuống {16}")
+        hot_logger.info(f"🔍 Chuẩn bị tìm kiếm với filter: {filters}")
+        hot_logger.info(f"🎯 ADAPTIVE THRESHOLD: {0.3} -> {0.2} (có filter)")
+        # search_in_collection + _build_where_clause cho top 2 collections
+        for collection in ("ho_tich_cap_xa", "chung_thuc"):
+            hot_logger.info(f"🔍 _build_where_clause input: {filters}")
+            hot_logger.info(f"🔍 Found exact_title: {filters['exact_title']}, type: {type(filters['exact_title'])}")
+            hot_logger.info(f"🎯 Using HIGH PRECISION filter: {{'document_title': 'Đăng ký khai sinh'}}")
+            hot_logger.info(f"🔍 Searching WITH filters: {{'document_title': 'Đăng ký khai sinh'}}")
+            hot_logger.info(f"🔍 Simple search (no filters): {3} results")
+            hot_logger.info(f"Search in collection {collection}: {candidates // 2} results above threshold {0.2}")
+        hot_logger.info(f"📊 Dynamic search: {candidates} docs (k={16}, confidence=high)")
+        hot_logger.info(f"Found {candidates} candidate chunks")
+        hot_logger.info("🔄 PHASE 1: Reranking (GPU) - Optimizing VRAM usage...")
+        hot_logger.info(f"🎯 ENHANCED RERANKING - Analyzing {candidates} candidates for consensus")
+        # rerank_documents
+        hot_logger.info(f"🔍 RERANK QUERY: '{QUERY}' ({len(QUERY)} chars)")
+        hot_logger.info(f"🔢 RERANK INPUT: {candidates} documents to process")
+        for i in range(candidates):
+            hot_logger.info(f"🔍 RERANK DOC[{i}]: {1800 + i * 13} chars")
+        hot_logger.info(f"🔥 RERANKING {candidates} documents with optimized settings...")
+        hot_logger.info(f"⏱️ RERANK COMPLETED in {1.234:.2f}s ({candidates} docs)")
+        hot_logger.info(f"Top document after reranking: score={0.9123:.4f}, similarity={0.71}")
+        # consensus
+        hot_logger.info(f"🔍 CONSENSUS ANALYSIS: Analyzing {5} qualified chunks (top_k={5})")
+        for i in range(3):
+            hot_logger.info(f"📊 Document 'doc_{i}': {3 - i}/{5} chunks (ratio: {(3 - i) / 5:.2f}, threshold: {0.6})")
+        hot_logger.info(f"✅ CONSENSUS FOUND: Document 'doc_0' has {3}/{5} chunks (ratio: {0.6:.2f})")
+        hot_logger.info(f"✅ CONSENSUS FOUND: Selected document based on chunk agreement")
+        hot_logger.info(f"🎯 Combined Confidence: {0.89:.4f} (Router: {0.873:.4f}, Rerank: {0.9123:.4f})")
+        hot_logger.info(f"Best rerank score: {0.9123:.4f}")
+        hot_logger.info("🎯 PURE RERANKER MODE - No protective logic, full expansion strategy")
+        hot_logger.info(f"Selected {1} nucleus chunk with rerank-based strategy")
+        hot_logger.info("🎯 INTELLIGENT CONTEXT EXPANSION - Ưu tiên nucleus chunk từ reranker")
+        hot_logger.info("Context expansion: Loading TOÀN BỘ DOCUMENT để đảm bảo ngữ cảnh pháp luật đầy đủ")
+        # ContextExpander.expand_context + _load_full_document_and_metadata
+        hot_logger.info(f"Processing nucleus chunk with ID: doc_0_chunk_3")
+        hot_logger.info(f"Found source file: data/documents/quy_trinh_cap_ho_tich_cap_xa/DANG KY KHAI SINH.json")
+        hot_logger.info("Loading FULL DOCUMENT content để đảm bảo ngữ cảnh pháp luật đầy đủ")
+        hot_logger.info(f"Loading COMPLETE document content and metadata from: data/documents/DANG KY KHAI SINH.json")
+        hot_logger.info(f"Loaded COMPLETE document: {6543} characters + structured metadata")
+        hot_logger.info(f"Final context: {6543} chars, strategy: full_document_legal_context")
+        hot_logger.info(f"Extracted metadata fields: {['title', 'code', 'fee_text', 'processing_time']}")
+        hot_logger.info(f"Context expanded: {6543} chars from {1} documents")
+        hot_logger.info("🔄 PHASE 2: LLM Generation (GPU) - Loading LLM for final answer...")
+        hot_logger.info(f"⚡ Chat history: {1} entries (optimized for speed)")
+        hot_logger.info(f"📝 Using ChatML format with structured chat history: {2} messages")
+        hot_logger.info(f"📝 Final context length: {6543} chars (~{6543 // 3} tokens)")
+        # LLMService.generate_response
+        hot_logger.info(f"📏 Context Info: Total={8192}, Prompt≈{2400}, Available={5792}")
+        hot_logger.info(f"✅ Max Tokens: {1024} (no adjustment needed)")
+        hot_logger.info(f"✅ Generated response in {3.21:.2f}s, tokens: {2650} (prompt: {2400}, completion: {250})")
+        hot_logger.info(f"🔥 Updated session state: ho_tich_cap_xa (confidence: {0.873:.3f})")
+
+    return request
+
+
+def make_events_request(event_log: EventLog, candidates: int) -> Callable[[], None]:
+    """Cùng request với structured events (như process_query / route_query / rerank / context / generation hiện tại)"""
+    filters = {'exact_title': ['Đăng ký khai sinh']}
+
+    def request():
+        with event_log.request("query", query=QUERY):
+            event_log.annotate(session_id="3f2a9c1e-5b7d-4c8e-9a1f-2d3e4f5a6b7c")
+            event_log.record("route_match", collection="ho_tich_cap_xa", score=0.873, example=EXAMPLE[:100],
+                             source="DANG KY KHAI SINH.json", exact_title=filters['exact_title'])
+            event_log.record("routing", confidence_level="high", score=0.873, target_collection="ho_tich_cap_xa",
+                             overridden=False)
+            for collection in ("ho_tich_cap_xa", "chung_thuc"):
+                event_log.record("search", collection=collection, k=16, threshold=0.2, filters=filters,
+                                 results=candidates // 2)
+            event_log.record("candidates", count=candidates)
+            event_log.record("rerank", documents=candidates, passage_chars=40000, seconds=1.234, top_score=0.9123,
+                             top_similarity=0.71, trust_router=True)
+            event_log.record("consensus", document_id="doc_0", chunks=3, qualified=5, ratio=0.6)
+            event_log.record("rerank_strategy", strategy="consensus", consensus_found=True)
+            event_log.record("combined_confidence", combined=0.89, router=0.873, rerank=0.9123)
+            event_log.record("document_loaded", file_path="data/documents/DANG KY KHAI SINH.json", chars=6543,
+                             metadata=True)
+            event_log.record("context_expansion", nucleus_id="doc_0_chunk_3",
+                             source_file="data/documents/DANG KY KHAI SINH.json",
+                             strategy="full_document_legal_context", chars=6543,
+                             metadata_fields=['title', 'code', 'fee_text', 'processing_time'])
+            event_log.record("context", chars=6543, documents=1, intent=None)
+            event_log.record("prompt", context_chars=6543, history_messages=2)
+            event_log.record("generation_budget", context_window=8192, prompt_tokens_estimated=2400, available=5792,
+                             max_tokens=1024)
+            event_log.record("generation", seconds=3.21, prompt_tokens=2400, completion_tokens=250, slot=0,
+                             truncated=None)
+            event_log.record("session_state_updated", collection="ho_tich_cap_xa", confidence=0.873)
+            event_log.annotate(outcome="answer")
+
+    return request
+
+
+def time_loop(func: Callable[[], None], iterations: int) -> float:
+    """Thời gian trung bình mỗi lần gọi (µs)"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def legacy_logger(name: str, path: Path, level: int) -> logging.Logger:
+    hot_logger = logging.getLogger(name)
+    hot_logger.propagate = False
+    hot_logger.setLevel(level)
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    hot_logger.addHandler(handler)
+    return hot_logger
+
+
+def benchmark(requests: int, candidates: int, collections: int, sample_rate: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        legacy_request = make_legacy_request(legacy_logger("legacy.info", tmp_dir / "legacy.log", logging.INFO),
+                                             candidates, collections)
+        quiet_request = make_legacy_request(legacy_logger("legacy.quiet", tmp_dir / "quiet.log", logging.WARNING),
+                                            candidates, collections)
+        event_log = EventLog(enabled=True, buffer_size=200, sample_rate=sample_rate, path=tmp_dir / "events.jsonl")
+        events_request = make_events_request(event_log, candidates)
+
+        # Warm up
+        for func in (legacy_request, quiet_request, events_request):
+            time_loop(func, 200)
+
+        legacy_us = time_loop(legacy_request, requests)
+        quiet_us = time_loop(quiet_request, requests)
+        events_us = time_loop(events_request, requests)
+
+        event_log.flush()
+        stats = event_log.get_stats()
+        event_log.close()
+        legacy_bytes = (tmp_dir / "legacy.log").stat().st_size
+        events_bytes = (tmp_dir / "events.jsonl").stat().st_size if (tmp_dir / "events.jsonl").exists() else 0
+
+    total_requests = requests + 200
+    return {
+        'requests': requests,
+        'candidates': candidates,
+        'sample_rate': sample_rate,
+        'legacy_us_per_request': round(legacy_us, 2),
+        'legacy_info_disabled_us_per_request': round(quiet_us, 2),
+        'events_us_per_request': round(events_us, 2),
+        'speedup_vs_legacy': round(legacy_us / events_us, 2) if events_us else None,
+        'legacy_bytes_per_request': round(legacy_bytes / total_requests, 1),
+        'events_bytes_per_request': round(events_bytes / total_requests, 1),
+        'events_written': stats['written'],
+        'events_dropped': stats['dropped_flush']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark per-request logging overhead: legacy INFO logs vs structured event log',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--requests', type=int, default=5000, help='Simulated requests (default: 5000)')
+    parser.add_argument('--candidates', type=int, default=20, help='Rerank candidates per request (default: 20)')
+    parser.add_argument('--collections', type=int, default=6, help='Router collections (default: 6)')
+    parser.add_argument('--sample-rate', type=float, default=0.05, help='Event log flush sample rate (default: 0.05)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    logger.info(f"📝 Benchmarking logging overhead ({args.requests} simulated requests)")
+    report = benchmark(args.requests, args.candidates, args.collections, args.sample_rate)
+
+    logger.info("📊 EVENT LOG OVERHEAD SUMMARY")
+    logger.info("=" * 60)
+    logger.info(f"Legacy INFO logs:          {report['legacy_us_per_request']}µs / request "
+                f"({report['legacy_bytes_per_request']} bytes)")
+    logger.info(f"Legacy (INFO disabled):    {report['legacy_info_disabled_us_per_request']}µs / request")
+    logger.info(f"Structured events:         {report['events_us_per_request']}µs / request "
+                f"({report['events_bytes_per_request']} bytes, sample rate {args.sample_rate})")
+    logger.info(f"Speedup vs legacy:         {report['speedup_vs_legacy']}x")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Generation Slots Benchmark for LegalRAG
+=======================================
+
+Throughput của LLMService theo số generation slots (LLM_SLOTS, app/services/generation_scheduler.py)
+và số requests đồng thời:
+
+- --model PATH: LLMService thật (GGUF nhỏ để thử nhanh, vd. model test vài chục MB), N_THREADS chia đều cho slots
+- không có --model: StubLLMService decode từng token bằng matmul numpy (--compute-dim, nhả GIL như llama.cpp)
+  -> throughput tăng theo slots tới khi hết cores; --compute-dim 0 = sleep theo --tokens-per-second
+
+Mỗi cặp (slots, concurrency) chạy --requests requests qua ThreadPoolExecutor, report: requests/s, tokens/s,
+latency p50/p95, thời gian chờ slot, utilisation từng slot.
+
+Usage:
+    cd backend
+    python tools/benchmark_llm_slots.py --slots 1 2 4 --concurrency 1 2 4 8
+    python tools/benchmark_llm_slots.py --model data/models/llm_dir/tiny.gguf --slots 1 2 --concurrency 1 2 4 --max-tokens 64
+"""
+
+import sys
+import os
+
+# Stub: mỗi slot 1 thread BLAS - giống n_threads chia cho slots của llama.cpp
+for _variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_variable, "1")
+
+import json
+import logging
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUERY = "Thủ tục đăng ký khai sinh cần những giấy tờ gì?"
+
+
+def build_service(args, slots: int):
+    if args.model:
+        from app.services.language_model import LLMService
+
+        service = LLMService(model_path=args.model, slots=slots, n_threads=args.n_threads, n_gpu_layers=args.n_gpu_layers)
+    else:
+        from app.services.stubs import StubLLMService
+
+        service = StubLLMService(tokens_per_second=args.tokens_per_second, completion_tokens=args.max_tokens,
+                                 slots=slots, compute_dim=args.compute_dim)
+    service.ensure_loaded()
+    service.generate_response(user_query=QUERY, context="", max_tokens=64, temperature=0.0)  # Warm up
+    return service
+
+
+def run_level(service, concurrency: int, requests: int, max_tokens: int) -> Dict[str, Any]:
+    def one(_):
+        start = time.perf_counter()
+        result = service.generate_response(user_query=QUERY, context="", max_tokens=max_tokens, temperature=0.0)
+        return (time.perf_counter() - start) * 1000.0, result.get('completion_tokens', 0)
+
+    busy_before = [slot['busy_seconds'] for slot in service.scheduler.get_stats()['slots']]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    stats = service.scheduler.get_stats()
+
+    latencies: List[float] = [latency for latency, _ in results]
+    tokens = sum(count for _, count in results)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(requests / elapsed, 3),
+        'tokens_per_second': round(tokens / elapsed, 2),
+        'latency': percentiles(latencies),
+        # Utilisation trong lần chạy này (get_stats tính từ lúc tạo service)
+        'slot_utilization': [
+            round((slot['busy_seconds'] - before) / elapsed, 4) for slot, before in zip(stats['slots'], busy_before)
+        ],
+        'scheduler_wait': stats['wait']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark generation throughput by number of LLM slots and concurrent requests',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--model', type=str, help='GGUF model path (default: CPU-bound stub LLM)')
+    parser.add_argument('--slots', type=int, nargs='+', default=[1, 2, 4], help='Slot counts to test (default: 1 2 4)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Concurrent requests to test (default: 1 2 4 8)')
+    parser.add_argument('--requests', type=int, default=32, help='Requests per level (default: 32)')
+    parser.add_argument('--max-tokens', type=int, default=64, help='Completion tokens per request (default: 64)')
+    parser.add_argument('--n-threads', type=int, default=os.cpu_count() or 4,
+                        help='Total llama.cpp threads, split across slots (default: CPU count)')
+    parser.add_argument('--n-gpu-layers', type=int, default=0, help='GPU layers for --model (default: 0)')
+    parser.add_argument('--compute-dim', type=int, default=384, help='Stub matmul size per token (default: 384)')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0,
+                        help='Stub decode speed when --compute-dim 0 (default: 50)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    logger.info(f"🧪 Backend: {args.model or f'stub (compute_dim={args.compute_dim})'}, {os.cpu_count()} CPUs")
+
+    runs = []
+    for slots in args.slots:
+        service = build_service(args, slots)
+        for concurrency in args.concurrency:
+            result = run_level(service, concurrency, args.requests, args.max_tokens)
+            runs.append({'slots': slots, **result})
+            logger.info(
+                f"   slots {slots} x concurrency {concurrency:<3} {result['requests_per_second']:>7} req/s "
+                f"{result['tokens_per_second']:>9} tok/s | p50 {result['latency'].get('p50_ms')}ms "
+                f"p95 {result['latency'].get('p95_ms')}ms | wait p50 {result['scheduler_wait'].get('p50_ms')}ms | "
+                f"utilization {result['slot_utilization']}"
+            )
+        service.unload_model()
+
+    logger.info("📊 THROUGHPUT BY SLOTS (best concurrency)")
+    baseline = None
+    for slots in args.slots:
+        best = max((run for run in runs if run['slots'] == slots), key=lambda run: run['tokens_per_second'])
+        baseline = baseline or best['tokens_per_second']
+        logger.info(f"   slots {slots}: {best['tokens_per_second']} tok/s (x{best['tokens_per_second'] / baseline:.2f}) "
+                    f"at concurrency {best['concurrency']}")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'model': args.model or 'stub',
+                  'cpu_count': os.cpu_count(), 'max_tokens': args.max_tokens, 'runs': runs}
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
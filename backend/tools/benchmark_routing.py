@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Routing Accuracy & Latency Benchmark for LegalRAG
+=================================================
+
+Dùng data/router_examples_smart_v3/**.json làm labelled dataset: mỗi question variant có
+expected_collection + metadata.title (document đúng). Chạy từng câu qua:
+- router mode (mặc định): QueryRouter.route_query
+- full mode (--full): RAGService.process_query (search + rerank + context expansion) với stub LLM
+
+Report:
+- top-1 collection accuracy, top-1 document accuracy
+- clarification rate
+- latency distribution từng stage (mean / p50 / p95 / p99) + throughput
+
+Lưu JSON baseline (--output) và so sánh với baseline cũ (--baseline) để đánh giá thay đổi
+threshold / index format / embedding backend trên cả tốc độ và độ chính xác.
+
+Lưu ý: example questions cũng nằm trong router index nên router-mode accuracy là cận trên,
+dùng để phát hiện regression chứ không phải accuracy trên câu hỏi thật.
+
+Usage:
+    cd backend
+    python tools/benchmark_routing.py --output data/benchmarks/routing.json
+    python tools/benchmark_routing.py --limit 300 --baseline data/benchmarks/routing.json
+    python tools/benchmark_routing.py --full --limit 100 --stub-llm-latency 0.5
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import math
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CLARIFICATION_TYPES = ('clarification_needed', 'clarification')
+
+
+def _document_key(path_or_title: str) -> str:
+    """Chuẩn hóa tên document: bỏ thư mục (cả '\\' lẫn '/'), đuôi .json"""
+    name = str(path_or_title or '').replace('\\', '/').split('/')[-1]
+    return name[:-5] if name.endswith('.json') else name
+
+
+def load_dataset(router_dir: Path, collections: Optional[List[str]] = None, include_main: bool = True) -> List[Dict[str, Any]]:
+    """Đọc question variants + nhãn (collection, document title, source document) từ router example files"""
+    samples = []
+    for json_file in sorted(router_dir.rglob("*.json")):
+        if json_file.name.endswith('_summary.json'):
+            continue
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                router_data = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping {json_file.name}: {e}")
+            continue
+
+        metadata = router_data.get('metadata', {})
+        collection = router_data.get('expected_collection') or metadata.get('collection')
+        if not collection or (collections and collection not in collections):
+            continue
+
+        questions = list(router_data.get('question_variants', []))
+        if include_main and router_data.get('main_question'):
+            questions.insert(0, router_data['main_question'])
+
+        for question in questions:
+            samples.append({
+                'query': question,
+                'expected_collection': collection,
+                'expected_title': metadata.get('title', ''),
+                'expected_document': _document_key(metadata.get('source_document', '')),
+                'router_file': str(json_file.relative_to(router_dir))
+            })
+    return samples
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        # Nearest-rank percentile
+        index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+        return ordered[index]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.mean(ordered), 2),
+        'p50_ms': round(pick(50), 2),
+        'p95_ms': round(pick(95), 2),
+        'p99_ms': round(pick(99), 2),
+        'max_ms': round(ordered[-1], 2)
+    }
+
+
+# ---------------------------------------------------------------
+# Runners - trả về {collection, document_title, documents, clarification, stage_timings}
+# ---------------------------------------------------------------
+class RouterRunner:
+    mode = "router"
+
+    def __init__(self):
+        from app.services.vector import VectorDBService
+        from app.services.router import QueryRouter
+        from app.services.tracing import tracer
+
+        self.tracer = tracer
+        vectordb_service = VectorDBService()
+        self.router = QueryRouter(embedding_model=vectordb_service.embedding_model)
+
+    def run(self, query: str) -> Dict[str, Any]:
+        with self.tracer.trace("routing_benchmark") as trace:
+            with self.tracer.span("routing"):
+                result = self.router.route_query(query)
+        return {
+            'collection': result.get('target_collection'),
+            'document_title': result.get('source_procedure'),
+            'documents': [],
+            'confidence_level': result.get('confidence_level', 'unknown'),
+            'clarification': result.get('status') != 'routed',
+            'stage_timings': trace.timings() if trace else {}
+        }
+
+
+class FullPipelineRunner:
+    mode = "full"
+
+    def __init__(self, stub_latency: float, stub_tokens_per_second: float):
+        from app.core.config import settings
+        from app.services.vector import VectorDBService
+        from app.services.stubs import StubLLMService
+        from app.services.rag_engine import RAGService
+
+        self.rag_service = RAGService(
+            documents_dir=str(settings.documents_path),
+            vectordb_service=VectorDBService(),
+            llm_service=StubLLMService(latency_seconds=stub_latency, tokens_per_second=stub_tokens_per_second)
+        )
+
+    def run(self, query: str) -> Dict[str, Any]:
+        # Mỗi câu 1 session mới để stateful router không ảnh hưởng kết quả
+        result = self.rag_service.process_query(query=query)
+        routing_info = result.get('routing_info') or {}
+        context_info = result.get('context_info') or {}
+        self.rag_service.chat_sessions.pop(result.get('session_id'), None)
+        return {
+            'collection': routing_info.get('target_collection'),
+            'document_title': None,
+            'documents': [_document_key(d) for d in context_info.get('source_documents', [])],
+            'confidence_level': routing_info.get('confidence_level', 'unknown'),
+            'clarification': result.get('type') in CLARIFICATION_TYPES,
+            'outcome': result.get('type'),
+            'stage_timings': result.get('stage_timings') or {}
+        }
+
+
+def evaluate(runner, samples: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    def run_sample(sample: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            output = runner.run(sample['query'])
+        except Exception as e:
+            output = {'error': str(e), 'stage_timings': {}}
+        output['latency_ms'] = (time.perf_counter() - start) * 1000.0
+        return output
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outputs = list(executor.map(run_sample, samples))
+    else:
+        outputs = [run_sample(sample) for sample in samples]
+    wall_seconds = time.perf_counter() - start
+
+    collection_hits = document_hits = clarifications = errors = 0
+    routed = routed_collection_hits = 0
+    stage_samples: Dict[str, List[float]] = {}
+    by_confidence: Dict[str, int] = {}
+    by_outcome: Dict[str, int] = {}
+    misrouted: List[Dict[str, Any]] = []
+
+    for sample, output in zip(samples, outputs):
+        if 'error' in output:
+            errors += 1
+            continue
+
+        collection_ok = output.get('collection') == sample['expected_collection']
+        if output.get('document_title') is not None:
+            document_ok = _document_key(output['document_title']) == _document_key(sample['expected_title'])
+        else:
+            document_ok = bool(output.get('documents')) and output['documents'][0] in (
+                sample['expected_document'], _document_key(sample['expected_title'])
+            )
+
+        collection_hits += collection_ok
+        document_hits += document_ok
+        clarifications += bool(output.get('clarification'))
+        if not output.get('clarification'):
+            routed += 1
+            routed_collection_hits += collection_ok
+
+        level = output.get('confidence_level', 'unknown')
+        by_confidence[level] = by_confidence.get(level, 0) + 1
+        if output.get('outcome'):
+            by_outcome[output['outcome']] = by_outcome.get(output['outcome'], 0) + 1
+
+        stage_samples.setdefault('end_to_end', []).append(output['latency_ms'])
+        for stage, elapsed_ms in output.get('stage_timings', {}).items():
+            stage_samples.setdefault(stage, []).append(elapsed_ms)
+
+        if not collection_ok and len(misrouted) < 20:
+            misrouted.append({
+                'query': sample['query'],
+                'expected': sample['expected_collection'],
+                'got': output.get('collection'),
+                'confidence_level': level
+            })
+
+    evaluated = len(samples) - errors
+    return {
+        'mode': runner.mode,
+        'queries': len(samples),
+        'errors': errors,
+        'concurrency': concurrency,
+        'collection_accuracy': round(collection_hits / evaluated, 4) if evaluated else None,
+        'document_accuracy': round(document_hits / evaluated, 4) if evaluated else None,
+        'routed_collection_accuracy': round(routed_collection_hits / routed, 4) if routed else None,
+        'clarification_rate': round(clarifications / evaluated, 4) if evaluated else None,
+        'throughput_qps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+        'wall_seconds': round(wall_seconds, 2),
+        'confidence_levels': by_confidence,
+        'outcomes': by_outcome,
+        'latency': {stage: percentiles(values) for stage, values in sorted(stage_samples.items())},
+        'misrouted_examples': misrouted
+    }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline_path: Path, max_accuracy_drop: float, max_regression: float) -> bool:
+    """False nếu accuracy giảm quá max_accuracy_drop (điểm %) hoặc p95 end-to-end chậm hơn quá max_regression %"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ok = True
+    if baseline.get('mode') != report['mode']:
+        logger.warning(f"⚠️ Baseline mode '{baseline.get('mode')}' != current mode '{report['mode']}'")
+
+    for metric in ('collection_accuracy', 'document_accuracy'):
+        before, after = baseline.get(metric), report.get(metric)
+        if before is None or after is None:
+            continue
+        drop = (before - after) * 100
+        marker = "✅" if drop <= max_accuracy_drop else "❌"
+        logger.info(f"{marker} {metric}: {before:.2%} -> {after:.2%} ({-drop:+.2f} pts)")
+        if drop > max_accuracy_drop:
+            ok = False
+
+    before = baseline.get('clarification_rate')
+    if before is not None and report.get('clarification_rate') is not None:
+        logger.info(f"ℹ️ clarification_rate: {before:.2%} -> {report['clarification_rate']:.2%}")
+
+    before_p95 = baseline.get('latency', {}).get('end_to_end', {}).get('p95_ms')
+    after_p95 = report.get('latency', {}).get('end_to_end', {}).get('p95_ms')
+    if before_p95 and after_p95:
+        change = (after_p95 - before_p95) / before_p95 * 100
+        marker = "✅" if change <= max_regression else "❌"
+        logger.info(f"{marker} p95 latency: {before_p95:.1f}ms -> {after_p95:.1f}ms ({change:+.1f}%)")
+        if change > max_regression:
+            ok = False
+
+    before_qps, after_qps = baseline.get('throughput_qps'), report.get('throughput_qps')
+    if before_qps and after_qps:
+        logger.info(f"ℹ️ throughput: {before_qps} -> {after_qps} q/s")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark routing accuracy and latency on router example questions',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (default: data/router_examples_smart_v3)')
+    parser.add_argument('--collections', nargs='*', help='Only benchmark these collections')
+    parser.add_argument('--no-main-question', action='store_true', help='Only use question_variants')
+    parser.add_argument('--limit', type=int, default=None, help='Random sample of N questions')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--concurrency', type=int, default=1, help='Parallel queries (default: 1)')
+    parser.add_argument('--full', action='store_true',
+                        help='Run full retrieval + rerank + context expansion (process_query) with a stub LLM')
+    parser.add_argument('--stub-llm-latency', type=float, default=0.0, help='Stub LLM fixed latency in seconds')
+    parser.add_argument('--stub-llm-tps', type=float, default=0.0, help='Stub LLM tokens/s (adds per-token delay)')
+    parser.add_argument('--output', type=str, help='Save report JSON (baseline) to this path')
+    parser.add_argument('--baseline', type=str, help='Compare with a previously saved report')
+    parser.add_argument('--max-accuracy-drop', type=float, default=1.0,
+                        help='Allowed accuracy drop vs baseline in percentage points (default: 1.0)')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Allowed p95 latency slowdown vs baseline in percent (default: 20)')
+    args = parser.parse_args()
+
+    # Router / services dùng đường dẫn tương đối với backend/
+    os.chdir(backend_dir)
+
+    router_dir = Path(args.router_dir)
+    samples = load_dataset(router_dir, args.collections, include_main=not args.no_main_question)
+    if not samples:
+        logger.error(f"❌ No router examples found in {router_dir}")
+        return 1
+    if args.limit and args.limit < len(samples):
+        samples = random.Random(args.seed).sample(samples, args.limit)
+    logger.info(f"📚 Loaded {len(samples)} labelled questions from {router_dir}")
+
+    # Logs từng query của services quá nhiều cho benchmark
+    logging.getLogger('app').setLevel(logging.WARNING)
+    if args.full:
+        runner = FullPipelineRunner(args.stub_llm_latency, args.stub_llm_tps)
+    else:
+        runner = RouterRunner()
+
+    # Warm up (lazy imports, first encode)
+    runner.run(samples[0]['query'])
+
+    logger.info(f"⏱️ Running {runner.mode} benchmark (concurrency={args.concurrency})...")
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'router_dir': str(router_dir),
+        'seed': args.seed,
+        **evaluate(runner, samples, args.concurrency)
+    }
+
+    logger.info("📊 ROUTING BENCHMARK SUMMARY")
+    logger.info("=" * 60)
+    logger.info(f"Mode: {report['mode']} | queries: {report['queries']} | errors: {report['errors']}")
+    logger.info(f"Collection accuracy (top-1): {report['collection_accuracy']:.2%}")
+    logger.info(f"Document accuracy (top-1):   {report['document_accuracy']:.2%}")
+    logger.info(f"Clarification rate:          {report['clarification_rate']:.2%}")
+    logger.info(f"Throughput:                  {report['throughput_qps']} q/s")
+    logger.info(f"Confidence levels: {report['confidence_levels']}")
+    for stage, stats in report['latency'].items():
+        logger.info(f"   - {stage}: p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, p99 {stats['p99_ms']}ms")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    if args.baseline:
+        if not compare_with_baseline(report, Path(args.baseline), args.max_accuracy_drop, args.max_regression):
+            logger.error("❌ Routing regression vs baseline")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
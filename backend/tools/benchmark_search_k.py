@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Adaptive Search K Benchmark for LegalRAG
+========================================
+
+Kiểm chứng offline adaptive broad_search_k (app/services/search_k.py) trên routing dataset
+(data/router_examples_smart_v3) - không cần LLM:
+
+1. Mỗi câu hỏi: router -> search collection đích với k tĩnh -> rerank như rag_engine (consensus khi >= 5
+   candidates, không thì single best) -> vị trí vector của nucleus (consensus: vị trí xa nhất trong top 5 sau rerank)
+2. Fit AdaptiveSearchK trên phần train (--train-ratio), không explore
+3. Phần test: k đã học của bucket (confidence level, collection), rerank lại candidates bị cắt còn top k
+
+Report: rerank pairs trung bình tĩnh vs adaptive, coverage (nucleus nằm trong top k), tỷ lệ nucleus
+không đổi sau khi cắt, k đã học từng bucket. --save-stats ghi statistics đã fit (seed cho SEARCH_K_STATS_FILE).
+
+Mặc định dùng embedding + reranker thật; --stub-models dùng stub embedding / reranker với vector DB
+trong workspace (giống tools/load_test.py, lần đầu thêm --build-index).
+
+Usage:
+    cd backend
+    python tools/benchmark_search_k.py --output data/benchmarks/search_k.json
+    python tools/benchmark_search_k.py --limit 500 --target-coverage 0.95 --min-samples 20
+    python tools/benchmark_search_k.py --stub-models --build-index --save-stats data/cache/search_k_stats.json
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset
+from load_test import workspace_env, prepare_workspace, build_stub_index
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ROUTED_LEVELS = ('high', 'override_high', 'high_followup', 'low-medium', 'override_medium', 'medium_followup')
+
+
+def build_services(args):
+    from app.services.vector import VectorDBService
+    from app.services.reranker import RerankerService
+    from app.services.router import QueryRouter
+
+    if args.stub_models:
+        from app.services.stubs import StubEmbeddingModel, StubRerankerService
+        vectordb = VectorDBService(load_embedding=False)
+        vectordb.embedding_model = StubEmbeddingModel(dimension=args.embedding_dim)
+        reranker = StubRerankerService()
+    else:
+        vectordb = VectorDBService()
+        reranker = RerankerService()
+    router = QueryRouter(embedding_model=vectordb.embedding_model)
+    return router, vectordb, reranker
+
+
+def pick_nucleus(reranker, query: str, candidates: List[Dict[str, Any]], routing: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Cùng logic chọn nucleus của RAGService._process_query"""
+    if len(candidates) >= 5:
+        nucleus = reranker.get_consensus_document(
+            query=query, documents=candidates, top_k=5, consensus_threshold=0.6, min_rerank_score=-0.5
+        )
+        if nucleus:
+            return nucleus
+    reranked = reranker.rerank_documents(
+        query=query,
+        documents=candidates,
+        top_k=1,
+        router_confidence=routing.get('confidence', 0.0),
+        router_confidence_level=routing.get('confidence_level', 'low')
+    )
+    return reranked[0] if reranked else None
+
+
+def chunk_key(chunk: Dict[str, Any]) -> Tuple[str, int]:
+    return chunk.get('collection', ''), chunk.get('vector_rank', 0)
+
+
+def collect(samples: List[Dict[str, Any]], router, vectordb, reranker) -> List[Dict[str, Any]]:
+    """Search k tĩnh + rerank cho từng câu hỏi được route (câu hỏi cần clarification / < 2 candidates bị bỏ qua)"""
+    from app.core.config import settings
+    from app.services.search_k import static_search_k
+
+    records = []
+    for index, sample in enumerate(samples, start=1):
+        query = sample['query']
+        routing = router.route_query(query)
+        confidence_level = routing.get('confidence_level', 'low')
+        if confidence_level not in ROUTED_LEVELS:
+            continue
+        collection = routing.get('target_collection') or settings.chroma_collection_name
+        filters = routing.get('inferred_filters') or {}
+        threshold = max(0.2, settings.similarity_threshold * 0.5) if filters else settings.similarity_threshold
+        static_k = static_search_k(confidence_level)
+        candidates = vectordb.search_in_collection(
+            collection_name=collection, query=query, top_k=static_k, similarity_threshold=threshold,
+            where_filter=filters or None
+        )
+        for rank, candidate in enumerate(candidates, start=1):
+            candidate['collection'] = collection
+            candidate['vector_rank'] = rank
+        if len(candidates) < 2:
+            continue
+        nucleus = pick_nucleus(reranker, query, candidates, routing)
+        if not nucleus:
+            continue
+        records.append({
+            'query': query,
+            'routing': routing,
+            'confidence_level': confidence_level,
+            'collection': collection,
+            'static_k': static_k,
+            'candidates': candidates,
+            'nucleus': chunk_key(nucleus),
+            'position': nucleus.get('decisive_vector_rank') or nucleus.get('vector_rank')
+        })
+        if index % 100 == 0:
+            logger.info(f"   {index}/{len(samples)} questions, {len(records)} reranked")
+    return records
+
+
+def evaluate(records: List[Dict[str, Any]], controller, reranker) -> Dict[str, Any]:
+    """k đã học trên từng record test: pairs, coverage, nucleus có đổi không"""
+    totals = {'queries': 0, 'static_pairs': 0, 'adaptive_pairs': 0, 'covered': 0, 'unchanged': 0, 'shrunk': 0}
+    per_bucket = defaultdict(lambda: {'queries': 0, 'static_pairs': 0, 'adaptive_pairs': 0, 'unchanged': 0, 'k': set()})
+    for record in records:
+        k, _ = controller.choose_k(record['confidence_level'], record['collection'], record['static_k'])
+        truncated = [candidate for candidate in record['candidates'] if candidate['vector_rank'] <= k]
+        unchanged = True
+        if len(truncated) < len(record['candidates']):
+            nucleus = pick_nucleus(reranker, record['query'], truncated, record['routing'])
+            unchanged = nucleus is not None and chunk_key(nucleus) == record['nucleus']
+            totals['shrunk'] += 1
+
+        totals['queries'] += 1
+        totals['static_pairs'] += len(record['candidates'])
+        totals['adaptive_pairs'] += len(truncated)
+        totals['covered'] += record['position'] <= k
+        totals['unchanged'] += unchanged
+
+        bucket = per_bucket[controller.bucket_key(record['confidence_level'], record['collection'])]
+        bucket['queries'] += 1
+        bucket['static_pairs'] += len(record['candidates'])
+        bucket['adaptive_pairs'] += len(truncated)
+        bucket['unchanged'] += unchanged
+        bucket['k'].add(k)
+
+    queries = max(1, totals['queries'])
+    return {
+        'queries': totals['queries'],
+        'shrunk_queries': totals['shrunk'],
+        'mean_pairs_static': round(totals['static_pairs'] / queries, 2),
+        'mean_pairs_adaptive': round(totals['adaptive_pairs'] / queries, 2),
+        'pairs_saved_ratio': round(1 - totals['adaptive_pairs'] / totals['static_pairs'], 4) if totals['static_pairs'] else 0.0,
+        'coverage': round(totals['covered'] / queries, 4),
+        'nucleus_unchanged': round(totals['unchanged'] / queries, 4),
+        'buckets': {
+            key: {
+                'queries': bucket['queries'],
+                'k': sorted(bucket['k']),
+                'mean_pairs_static': round(bucket['static_pairs'] / bucket['queries'], 2),
+                'mean_pairs_adaptive': round(bucket['adaptive_pairs'] / bucket['queries'], 2),
+                'nucleus_unchanged': round(bucket['unchanged'] / bucket['queries'], 4)
+            }
+            for key, bucket in sorted(per_bucket.items())
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Verify adaptive broad_search_k offline on the routing dataset',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (labelled questions)')
+    parser.add_argument('--limit', type=int, default=None, help='Random sample of N questions')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling / split seed (default: 42)')
+    parser.add_argument('--train-ratio', type=float, default=0.7, help='Fraction of questions used to fit (default: 0.7)')
+    parser.add_argument('--target-coverage', type=float, default=None, help='Override SEARCH_K_TARGET_COVERAGE')
+    parser.add_argument('--min-samples', type=int, default=None, help='Override SEARCH_K_MIN_SAMPLES')
+    parser.add_argument('--save-stats', type=str, help='Write the fitted statistics (SEARCH_K_STATS_FILE format) here')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+
+    stubs = parser.add_argument_group('stub models')
+    stubs.add_argument('--stub-models', action='store_true', help='Stub embedding + reranker with an index in --workspace')
+    stubs.add_argument('--workspace', type=str, default='data/loadtest',
+                       help='Scratch dir for router cache / stub index (default: data/loadtest)')
+    stubs.add_argument('--build-index', action='store_true', help='Build the stub-embedding vector DB in the workspace first')
+    stubs.add_argument('--embedding-dim', type=int, default=1024, help='Stub embedding dimension (default: 1024)')
+    args = parser.parse_args()
+
+    workspace = None
+    if args.stub_models:
+        workspace = Path(args.workspace)
+        if not workspace.is_absolute():
+            workspace = backend_dir / workspace
+        workspace = workspace.resolve()
+        prepare_workspace(workspace)
+        os.environ.update(workspace_env(workspace))  # Trước khi import settings
+    os.chdir(backend_dir)
+
+    router_dir = Path(args.router_dir)
+    samples = load_dataset(router_dir)
+    if not samples:
+        logger.error(f"❌ No router examples found in {router_dir}")
+        return 1
+    rng = random.Random(args.seed)
+    rng.shuffle(samples)
+    if args.limit:
+        samples = samples[:args.limit]
+
+    if args.stub_models and args.build_index:
+        build_stub_index(args)
+    logging.getLogger('app').setLevel(logging.WARNING)
+    if workspace is not None:
+        os.chdir(workspace)  # Router cache (data/cache theo cwd) của stub embedding nằm trong workspace
+
+    from app.services.search_k import AdaptiveSearchK
+
+    router, vectordb, reranker = build_services(args)
+    logger.info(f"🔎 Static-k search + rerank for {len(samples)} questions...")
+    start = time.perf_counter()
+    records = collect(samples, router, vectordb, reranker)
+    if not records:
+        logger.error("❌ No reranked queries (router needs clarification for every question?)")
+        return 1
+    split = int(len(records) * args.train_ratio)
+    train, test = records[:split], records[split:] or records
+    logger.info(f"📚 {len(records)} reranked queries ({time.perf_counter() - start:.1f}s): {len(train)} train / {len(test)} test")
+
+    # Không --save-stats: controller vẫn tự save mỗi SAVE_EVERY mẫu -> ghi vào thư mục tạm
+    stats_path = Path(args.save_stats) if args.save_stats else Path(tempfile.mkdtemp()) / "search_k_stats.json"
+    if not stats_path.is_absolute():
+        stats_path = backend_dir / stats_path
+    if stats_path.exists():
+        stats_path.unlink()  # Fit lại từ đầu, không load stats cũ
+    controller = AdaptiveSearchK(
+        stats_path=stats_path,
+        enabled=True,
+        target_coverage=args.target_coverage,
+        min_samples=args.min_samples,
+        explore_rate=0.0
+    )
+    for record in train:
+        controller.observe(
+            record['confidence_level'], record['collection'], record['position'],
+            searched_k=record['static_k'], static_k=record['static_k']
+        )
+
+    result = evaluate(test, controller, reranker)
+    fitted = controller.get_stats()
+    logger.info("📊 ADAPTIVE SEARCH K SUMMARY")
+    logger.info("=" * 60)
+    logger.info(f"Target coverage: {fitted['target_coverage']:.2%} | min samples / bucket: {fitted['min_samples']}")
+    logger.info(f"Rerank pairs / query: {result['mean_pairs_static']} static -> {result['mean_pairs_adaptive']} adaptive "
+                f"({result['pairs_saved_ratio']:.1%} saved)")
+    logger.info(f"Coverage (nucleus in top k): {result['coverage']:.2%}")
+    logger.info(f"Nucleus unchanged:           {result['nucleus_unchanged']:.2%} ({result['shrunk_queries']} queries shrunk)")
+    for key, bucket in result['buckets'].items():
+        logger.info(f"   - {key}: k {bucket['k']} | pairs {bucket['mean_pairs_static']} -> {bucket['mean_pairs_adaptive']} | "
+                    f"unchanged {bucket['nucleus_unchanged']:.0%} ({bucket['queries']} queries)")
+
+    if args.save_stats:
+        controller.save()
+        logger.info(f"💾 Fitted search k stats saved: {stats_path}")
+
+    if args.output:
+        output_path = Path(args.output)
+        if not output_path.is_absolute():
+            output_path = backend_dir / output_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'router_dir': str(router_dir),
+            'seed': args.seed,
+            'stub_models': args.stub_models,
+            'train_queries': len(train),
+            **result,
+            'fitted': {key: {k: v for k, v in bucket.items() if k != 'queries'} for key, bucket in fitted['buckets'].items()}
+        }
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
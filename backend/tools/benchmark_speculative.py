@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Speculative Decoding Benchmark for LegalRAG
+===========================================
+
+So sánh generation của LLMService khi tắt / bật speculative decoding (app/services/speculative.py):
+- off: decode bình thường
+- prompt_lookup: draft tokens từ n-gram match trong prompt (tài liệu được chép nguyên văn vào câu trả lời)
+- prompt_lookup + draft GGUF (--draft-model): model nhỏ draft khi n-gram không khớp
+
+Bộ câu hỏi + context cố định: example questions của router (--questions, --seed) với context là TOÀN BỘ
+document nguồn (như context expansion), lưu / đọc lại bằng --save-set / --set để so sánh giữa các lần chạy.
+
+Mỗi câu hỏi chạy 2 lần với temperature 0: lần 1 = end-to-end (prefill + decode), lần 2 prompt đã nằm
+trong KV cache (llama.cpp dùng lại prefix) -> thời gian ~ chỉ decode.
+Report mỗi mode: decode tokens/s, end-to-end latency, draft tokens proposed / accepted (accepted-draft ratio),
+tỷ lệ câu trả lời giống hệt baseline (off).
+
+Usage:
+    cd backend
+    python tools/benchmark_speculative.py --questions 20 --save-set data/benchmarks/speculative_set.json
+    python tools/benchmark_speculative.py --set data/benchmarks/speculative_set.json --draft-model data/models/llm_dir/draft.gguf
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def rate_percentiles(values: List[float]) -> Dict[str, Any]:
+    """percentiles() cho tokens/s (bỏ hậu tố _ms)"""
+    return {key.replace('_ms', ''): value for key, value in percentiles(values).items()}
+
+
+def build_question_set(router_dir: Path, documents_dir: Path, count: int, seed: int) -> List[Dict[str, Any]]:
+    """Câu hỏi + context (toàn bộ document nguồn) cố định theo seed"""
+    from app.services.context import ContextExpander
+
+    # Chỉ dùng loader file của ContextExpander, không cần vector DB
+    loader = ContextExpander.__new__(ContextExpander)
+    by_name = {path.name: path for path in documents_dir.rglob("*.json")}
+
+    samples = load_dataset(router_dir)
+    random.Random(seed).shuffle(samples)
+    question_set, used_documents = [], set()
+    for sample in samples:
+        path = documents_dir / sample['router_file']
+        if not path.exists():
+            path = by_name.get(Path(sample['router_file']).name)
+        # 1 câu hỏi / document: context khác nhau giữa các câu
+        if path is None or path in used_documents:
+            continue
+        context, _ = loader._load_full_document_and_metadata(str(path))
+        if not context:
+            continue
+        used_documents.add(path)
+        question_set.append({'query': sample['query'], 'document': sample['expected_title'], 'context': context})
+        if len(question_set) >= count:
+            break
+    return question_set
+
+
+def run_mode(mode: str, draft_model: Optional[str], question_set: List[Dict[str, Any]], max_tokens: int) -> Dict[str, Any]:
+    from app.services.language_model import LLMService
+
+    llm = LLMService(speculative_mode=mode, draft_model_path=draft_model)
+    llm.ensure_loaded()
+    llm.generate_response(user_query=question_set[0]['query'], context="", max_tokens=64, temperature=0.0)  # Warm up
+
+    outputs, end_to_end_ms, decode_tps = [], [], []
+    drafts = {'proposed': 0, 'accepted': 0}
+    completion_tokens = 0
+    for item in question_set:
+        first = llm.generate_response(user_query=item['query'], context=item['context'], max_tokens=max_tokens, temperature=0.0)
+        second = llm.generate_response(user_query=item['query'], context=item['context'], max_tokens=max_tokens, temperature=0.0)
+        end_to_end_ms.append(first['processing_time'] * 1000.0)
+        if second['processing_time'] > 0 and second['completion_tokens']:
+            decode_tps.append(second['completion_tokens'] / second['processing_time'])
+        completion_tokens += first['completion_tokens']
+        for result in (first, second):
+            for key in drafts:
+                drafts[key] += (result.get('speculative') or {}).get(key, 0)
+        outputs.append(first['response'])
+    llm.unload_model()
+
+    return {
+        'mode': mode,
+        'draft_model': draft_model,
+        'completion_tokens': completion_tokens,
+        'decode_tokens_per_second': rate_percentiles(decode_tps),
+        'end_to_end': percentiles(end_to_end_ms),
+        'draft_tokens': {
+            **drafts,
+            'acceptance': round(drafts['accepted'] / drafts['proposed'], 4) if drafts['proposed'] else None
+        },
+        'outputs': outputs
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark prompt-lookup / draft-model speculative decoding against plain decoding',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (default: data/router_examples_smart_v3)')
+    parser.add_argument('--documents-dir', type=str, default=None, help='Source documents directory (default: DOCUMENTS_DIR)')
+    parser.add_argument('--questions', type=int, default=20, help='Questions in the fixed set (default: 20)')
+    parser.add_argument('--set', type=str, help='Load the question set from this JSON instead of sampling')
+    parser.add_argument('--save-set', type=str, help='Save the sampled question set to this JSON')
+    parser.add_argument('--draft-model', type=str, help='Also benchmark prompt lookup with this draft GGUF as fallback')
+    parser.add_argument('--max-tokens', type=int, default=256, help='Max completion tokens (default: 256)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    from app.core.config import settings
+
+    if args.set:
+        with open(args.set, 'r', encoding='utf-8') as f:
+            question_set = json.load(f)
+    else:
+        documents_dir = Path(args.documents_dir) if args.documents_dir else settings.documents_path
+        question_set = build_question_set(Path(args.router_dir), documents_dir, args.questions, args.seed)
+    if not question_set:
+        logger.error("❌ No questions with source documents found")
+        return 1
+    if args.save_set:
+        Path(args.save_set).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save_set, 'w', encoding='utf-8') as f:
+            json.dump(question_set, f, ensure_ascii=False, indent=2)
+    logger.info(f"📚 {len(question_set)} questions, context p50 {rate_percentiles([len(q['context']) for q in question_set])['p50']} chars")
+
+    runs = [("off", None), ("prompt_lookup", None)]
+    if args.draft_model:
+        runs.append(("prompt_lookup", args.draft_model))
+
+    results = []
+    for mode, draft_model in runs:
+        logger.info(f"⏱️ Mode {mode}{' + ' + draft_model if draft_model else ''}...")
+        results.append(run_mode(mode, draft_model, question_set, args.max_tokens))
+
+    baseline = results[0]
+    logger.info("📊 SPECULATIVE DECODING")
+    for result in results:
+        identical = sum(a == b for a, b in zip(result['outputs'], baseline['outputs']))
+        result['identical_to_baseline'] = round(identical / len(question_set), 4)
+        decode, drafts = result['decode_tokens_per_second'], result['draft_tokens']
+        label = result['mode'] + (' + draft' if result['draft_model'] else '')
+        speedup = f" (x{decode['p50'] / baseline['decode_tokens_per_second']['p50']:.2f})" \
+            if decode and baseline['decode_tokens_per_second'] else ""
+        acceptance = f"{drafts['acceptance']:.2%}" if drafts['acceptance'] is not None else "-"
+        logger.info(
+            f"   {label:<22} decode p50 {decode.get('p50')} tok/s{speedup} | end-to-end p50 {result['end_to_end'].get('p50_ms')}ms | "
+            f"drafts accepted {drafts['accepted']}/{drafts['proposed']} ({acceptance}) | identical {result['identical_to_baseline']:.0%}"
+        )
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'questions': len(question_set), 'max_tokens': args.max_tokens,
+                  'modes': results}
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
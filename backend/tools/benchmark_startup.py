@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for LegalRAG
+==============================
+
+Đo thời gian startup của server (mỗi run là 1 process mới để không dính module/model cache):
+- import time (app modules, không kéo theo heavy imports)
+- thời gian load từng component của StartupOrchestrator
+- tổng thời gian đến khi ready
+
+So sánh parallel vs sequential (max_workers=1), lưu kết quả và so với baseline để theo dõi regression.
+
+Usage:
+    cd backend
+    python tools/benchmark_startup.py --runs 3
+    python tools/benchmark_startup.py --mode both --output data/benchmarks/startup.json
+    python tools/benchmark_startup.py --baseline data/benchmarks/startup.json --max-regression 20
+"""
+
+import sys
+import json
+import logging
+import argparse
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Any
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Script chạy trong child process: đo import + orchestrator, in ra 1 dòng JSON
+CHILD_SCRIPT = r"""
+import json, logging, sys, time
+start = time.perf_counter()
+logging.disable(logging.CRITICAL)
+sys.path.insert(0, {backend_dir!r})
+from main import create_startup_orchestrator
+import_seconds = time.perf_counter() - start
+heavy_after_import = [m for m in ('chromadb', 'sentence_transformers', 'sklearn', 'llama_cpp', 'torch') if m in sys.modules]
+orchestrator = create_startup_orchestrator(max_workers={max_workers})
+ready = orchestrator.run(timeout={timeout})
+print("BENCHMARK_RESULT " + json.dumps({{
+    'ready': ready,
+    'import_seconds': import_seconds,
+    'startup_seconds': orchestrator.total_seconds,
+    'total_seconds': time.perf_counter() - start,
+    'components': orchestrator.get_timings(),
+    'errors': {{n: c['error'] for n, c in orchestrator.get_status()['components'].items() if c['error']}},
+    'heavy_modules_after_import': heavy_after_import
+}}))
+"""
+
+
+def run_once(max_workers: int, timeout: float) -> Dict[str, Any]:
+    """Chạy 1 lần startup trong process mới"""
+    script = CHILD_SCRIPT.format(backend_dir=str(backend_dir), max_workers=max_workers, timeout=timeout)
+    process = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=str(backend_dir),
+        capture_output=True,
+        text=True,
+        timeout=timeout + 60
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("BENCHMARK_RESULT "):
+            return json.loads(line[len("BENCHMARK_RESULT "):])
+    raise RuntimeError(f"Startup run failed (exit {process.returncode}): {process.stderr.strip()[-2000:]}")
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {}
+    return {
+        'mean': round(statistics.mean(values), 3),
+        'median': round(statistics.median(values), 3),
+        'min': round(min(values), 3),
+        'max': round(max(values), 3)
+    }
+
+
+def benchmark_mode(mode: str, runs: int, max_workers: int, timeout: float) -> Dict[str, Any]:
+    workers = 1 if mode == "sequential" else max_workers
+    logger.info(f"⏱️ Benchmarking {mode} startup (workers={workers}, runs={runs})")
+
+    results = []
+    for i in range(runs):
+        result = run_once(workers, timeout)
+        results.append(result)
+        status = "ready" if result['ready'] else f"NOT ready {result['errors']}"
+        logger.info(f"   Run {i + 1}: {result['total_seconds']:.2f}s total "
+                    f"(import {result['import_seconds']:.2f}s, startup {result['startup_seconds']:.2f}s) - {status}")
+
+    component_names = results[0]['components'].keys()
+    return {
+        'mode': mode,
+        'max_workers': workers,
+        'runs': runs,
+        'ready_runs': sum(1 for r in results if r['ready']),
+        'import_seconds': summarize([r['import_seconds'] for r in results]),
+        'startup_seconds': summarize([r['startup_seconds'] for r in results]),
+        'total_seconds': summarize([r['total_seconds'] for r in results]),
+        'components': {name: summarize([r['components'].get(name) for r in results]) for name in component_names},
+        'heavy_modules_after_import': results[0]['heavy_modules_after_import']
+    }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline_path: Path, max_regression: float) -> bool:
+    """So sánh median total_seconds với baseline - False nếu chậm hơn quá max_regression %"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ok = True
+    for mode, current in report['modes'].items():
+        previous = baseline.get('modes', {}).get(mode)
+        if not previous or not previous['total_seconds'] or not current['total_seconds']:
+            continue
+        before = previous['total_seconds']['median']
+        after = current['total_seconds']['median']
+        change = (after - before) / before * 100 if before else 0.0
+        marker = "✅" if change <= max_regression else "❌"
+        logger.info(f"{marker} {mode}: {before:.2f}s -> {after:.2f}s ({change:+.1f}%)")
+        if change > max_regression:
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark LegalRAG server startup time',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--runs', type=int, default=3, help='Runs per mode (default: 3)')
+    parser.add_argument('--mode', choices=['parallel', 'sequential', 'both'], default='both',
+                        help='Startup mode to measure (default: both)')
+    parser.add_argument('--workers', type=int, default=None, help='Workers for parallel mode (default: STARTUP_WORKERS)')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-run startup timeout in seconds')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    parser.add_argument('--baseline', type=str, help='Compare with a previously saved report')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Allowed slowdown vs baseline in percent (default: 20)')
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    max_workers = args.workers or settings.startup_workers
+    modes = ['parallel', 'sequential'] if args.mode == 'both' else [args.mode]
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'modes': {mode: benchmark_mode(mode, args.runs, max_workers, args.timeout) for mode in modes}
+    }
+
+    logger.info("📊 STARTUP BENCHMARK SUMMARY")
+    logger.info("=" * 60)
+    for mode, result in report['modes'].items():
+        logger.info(f"{mode}: median total {result['total_seconds'].get('median')}s, "
+                    f"import {result['import_seconds'].get('median')}s, "
+                    f"ready {result['ready_runs']}/{result['runs']}")
+        for name, timing in result['components'].items():
+            logger.info(f"   - {name}: median {timing.get('median')}s")
+        if result['heavy_modules_after_import']:
+            logger.warning(f"   ⚠️ Heavy modules imported eagerly: {result['heavy_modules_after_import']}")
+
+    if 'parallel' in report['modes'] and 'sequential' in report['modes']:
+        par = report['modes']['parallel']['startup_seconds'].get('median')
+        seq = report['modes']['sequential']['startup_seconds'].get('median')
+        if par and seq:
+            logger.info(f"⚡ Parallel speedup: {seq / par:.2f}x ({seq:.2f}s -> {par:.2f}s)")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    if args.baseline:
+        if not compare_with_baseline(report, Path(args.baseline), args.max_regression):
+            logger.error("❌ Startup regression vs baseline")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Structured Answer Coverage Benchmark for LegalRAG
+=================================================
+
+Đo phần câu hỏi trả lời được từ structured metadata (app/services/structured_answers.py) thay vì LLM,
+trên example questions của router (mỗi câu đã gắn nhãn document nguồn):
+
+- Metadata lấy từ document JSON gốc (DOCUMENTS_DIR, cùng đường dẫn tương đối với router example file)
+- Confidence giả định = --confidence (mặc định 1.0: document đúng) - chỉ đo intent / compound / missing field
+- Report theo intent: answered, compound, missing_field; tỷ lệ câu hỏi không cần LLM; latency render template
+- --audit-sample N: N câu trả lời template ngẫu nhiên (kèm giá trị trường metadata) để review chất lượng
+
+Latency gap structured vs LLM trên traffic thật: /api/v1/metrics -> structured_answers.
+
+Usage:
+    cd backend
+    python tools/benchmark_structured_answers.py
+    python tools/benchmark_structured_answers.py --audit-sample 30 --output data/benchmarks/structured_answers.json
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class DocumentMetadata:
+    """Metadata của document gốc theo router example file (cache theo đường dẫn)"""
+
+    def __init__(self, documents_dir: Path):
+        self.documents_dir = documents_dir
+        self._by_name = {path.name: path for path in documents_dir.rglob("*.json")} if documents_dir.exists() else {}
+        self._cache: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def get(self, router_file: str) -> Optional[Dict[str, Any]]:
+        if router_file not in self._cache:
+            path = self.documents_dir / router_file
+            if not path.exists():
+                path = self._by_name.get(Path(router_file).name)
+            metadata = None
+            if path is not None:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        metadata = json.load(f).get('metadata', {})
+                except Exception as e:
+                    logger.warning(f"⚠️ Cannot read {path}: {e}")
+            self._cache[router_file] = metadata
+        return self._cache[router_file]
+
+
+def run(samples: List[Dict[str, Any]], documents: DocumentMetadata, confidence: float, audit_sample: int, rng: random.Random) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.services.structured_answers import StructuredAnswerEngine
+
+    mode, audit_rate = settings.structured_answer_mode, settings.structured_answer_audit_rate
+    settings.structured_answer_mode, settings.structured_answer_audit_rate = "on", 0.0
+    engine = StructuredAnswerEngine()  # Engine riêng: không lẫn vào stats của service đang chạy
+
+    by_intent: Dict[str, Dict[str, int]] = {}
+    render_ms, answered, missing_documents = [], [], 0
+    try:
+        for sample in samples:
+            metadata = documents.get(sample['router_file'])
+            if metadata is None:
+                missing_documents += 1
+                continue
+            start = time.perf_counter()
+            decision = engine.evaluate(sample['query'], metadata, metadata.get('title') or sample['expected_title'], confidence)
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+            intent = decision['intent'] or 'none'
+            outcomes = by_intent.setdefault(intent, {})
+            outcomes[decision['outcome']] = outcomes.get(decision['outcome'], 0) + 1
+            if decision['serve']:
+                render_ms.append(elapsed_ms)
+                answered.append({
+                    'query': sample['query'],
+                    'document': sample['expected_title'],
+                    'intent': decision['intent'],
+                    'answer': decision['answer']
+                })
+    finally:
+        settings.structured_answer_mode, settings.structured_answer_audit_rate = mode, audit_rate
+
+    evaluated = len(samples) - missing_documents
+    return {
+        'questions': evaluated,
+        'missing_documents': missing_documents,
+        'answered_without_llm': len(answered),
+        'structured_share': round(len(answered) / evaluated, 4) if evaluated else 0.0,
+        'by_intent': by_intent,
+        'render_latency': percentiles(render_ms),
+        'audit_sample': rng.sample(answered, min(audit_sample, len(answered)))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure how many router example questions are answered from structured metadata without the LLM',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (default: data/router_examples_smart_v3)')
+    parser.add_argument('--documents-dir', type=str, default=None, help='Source documents directory (default: DOCUMENTS_DIR)')
+    parser.add_argument('--collections', nargs='*', help='Only these collections')
+    parser.add_argument('--confidence', type=float, default=1.0,
+                        help='Router + reranker confidence assumed for every question (default: 1.0)')
+    parser.add_argument('--audit-sample', type=int, default=20, help='Structured answers sampled for review (default: 20)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    from app.core.config import settings
+
+    samples = load_dataset(Path(args.router_dir), args.collections)
+    if not samples:
+        logger.error(f"❌ No router examples found in {args.router_dir}")
+        return 1
+    documents = DocumentMetadata(Path(args.documents_dir) if args.documents_dir else settings.documents_path)
+    logger.info(f"📚 {len(samples)} questions, documents from {documents.documents_dir}")
+
+    report = run(samples, documents, args.confidence, args.audit_sample, random.Random(args.seed))
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'confidence': args.confidence, **report}
+
+    logger.info("📊 STRUCTURED ANSWERS")
+    logger.info(f"   answered without LLM: {report['answered_without_llm']}/{report['questions']} "
+                f"({report['structured_share']:.2%}), missing documents: {report['missing_documents']}")
+    for intent, outcomes in sorted(report['by_intent'].items()):
+        logger.info(f"   {intent:<20} " + ", ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items())))
+    if report['render_latency']:
+        logger.info(f"   render p50 {report['render_latency']['p50_ms']}ms, p99 {report['render_latency']['p99_ms']}ms")
+    for sample in report['audit_sample'][:5]:
+        logger.info(f"   🔎 {sample['query']} -> {sample['answer']}")
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
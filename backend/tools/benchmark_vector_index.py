@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Quantized Vector Index Benchmark for LegalRAG
+=============================================
+
+So sánh các dạng lưu vectors của QuantizedVectorIndex (app/services/vector_index.py):
+float32 / float16 / int8 (scale từng dimension) / binary (sign bit + Hamming pre-filter),
+dạng nén đều rescore exact shortlist bằng float32 memmap.
+
+Dữ liệu thật:
+- router: vectors example questions trong data/cache/router_embeddings.pkl (Tool 4).
+  Leave-one-out: mỗi query là 1 example question, ground truth = top-k exact float32 của các câu còn lại
+- chunks (--chunk-collections): vectors chunk trong ChromaDB, query = vectors router questions
+
+--scale 1,4,16 nhân corpus router lên (thêm nhiễu nhỏ) để xem memory / latency khi số example questions tăng.
+
+Report mỗi dạng: recall@1, recall@10 (so với exact float32), latency 1 query (p50/p95/p99), RAM của index.
+
+Usage:
+    cd backend
+    python tools/benchmark_vector_index.py
+    python tools/benchmark_vector_index.py --scale 1,4,16 --rescore-k 32 --output data/benchmarks/vector_index.json
+    python tools/benchmark_vector_index.py --chunk-collections ho_tich_cap_xa chung_thuc
+"""
+
+import sys
+import os
+import json
+import pickle
+import logging
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import percentiles
+from app.services.vector_index import QuantizedVectorIndex, VECTOR_INDEX_MODES, normalize_rows
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_router_vectors(cache_file: Path) -> np.ndarray:
+    with open(cache_file, 'rb') as f:
+        cache_data = pickle.load(f)
+    matrices = [np.asarray(vectors, dtype=np.float32) for vectors in cache_data['embeddings'].values() if len(vectors)]
+    return normalize_rows(np.concatenate(matrices))
+
+
+def load_chunk_vectors(collections: List[str]) -> np.ndarray:
+    from app.services.vector import VectorDBService
+
+    vectordb = VectorDBService(load_embedding=False)
+    matrices = []
+    for collection_name in collections:
+        result = vectordb.get_collection(collection_name).get(include=['embeddings'])
+        embeddings = result.get('embeddings')
+        if embeddings is not None and len(embeddings):
+            matrices.append(np.asarray(embeddings, dtype=np.float32))
+            logger.info(f"   📦 {collection_name}: {len(embeddings)} chunk vectors")
+    return normalize_rows(np.concatenate(matrices))
+
+
+def scale_corpus(vectors: np.ndarray, factor: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """Corpus lớn hơn: mỗi vector thêm (factor - 1) bản sao có nhiễu Gaussian (giống paraphrase)"""
+    if factor <= 1:
+        return vectors
+    copies = [vectors] + [vectors + rng.normal(0, noise, vectors.shape).astype(np.float32) for _ in range(factor - 1)]
+    return normalize_rows(np.concatenate(copies))
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, self_rows: Optional[np.ndarray]) -> np.ndarray:
+    scores = queries @ corpus.T
+    if self_rows is not None:
+        scores[np.arange(len(queries)), self_rows] = -np.inf
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def evaluate(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    self_rows: Optional[np.ndarray],
+    modes: List[str],
+    rescore_k: int,
+    k: int = 10
+) -> Dict[str, Any]:
+    truth = exact_top_k(corpus, queries, k, self_rows)
+    truth_scores = np.einsum('ij,ij->i', corpus[truth[:, 0]], queries)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vectors_file = Path(tmp_dir) / "vectors.npy"
+        np.save(vectors_file, corpus)
+
+        results = {}
+        for mode in modes:
+            start = time.perf_counter()
+            index = QuantizedVectorIndex.from_npy(vectors_file, mode=mode, rescore_k=rescore_k, mmap=mode != "float32")
+            build_seconds = time.perf_counter() - start
+
+            # Warm up (page cache của memmap, lazy allocations)
+            for query in queries[:5]:
+                index.search(query, top_k=k + 1)
+
+            hits_at_1, overlap_at_k, latencies = 0, 0.0, []
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                rows, _ = index.search(query, top_k=k + 1)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+                if self_rows is not None:
+                    rows = rows[rows != self_rows[i]]
+                rows = rows[:k]
+                # Hit nếu row top-1 có cosine bằng top-1 exact (nhiều câu trùng nhau -> tie)
+                hits_at_1 += int(len(rows) > 0 and corpus[rows[0]] @ query >= truth_scores[i] - 1e-6)
+                overlap_at_k += len(set(rows.tolist()) & set(truth[i].tolist())) / k
+
+            results[mode] = {
+                'recall_at_1': round(hits_at_1 / len(queries), 4),
+                f'recall_at_{k}': round(overlap_at_k / len(queries), 4),
+                'latency': percentiles(latencies),
+                'build_seconds': round(build_seconds, 3),
+                'memory': index.memory_usage()
+            }
+            del index
+    return results
+
+
+def log_results(title: str, results: Dict[str, Any]):
+    logger.info(f"📊 {title}")
+    base = results.get('float32')
+    for mode, result in results.items():
+        latency, memory = result['latency'], result['memory']
+        speedup = f" (x{base['latency']['p50_ms'] / latency['p50_ms']:.1f})" if base and latency['p50_ms'] else ""
+        logger.info(
+            f"   {mode:<8} recall@1 {result['recall_at_1']:.3f} | recall@10 {result['recall_at_10']:.3f} | "
+            f"p50 {latency['p50_ms']}ms{speedup}, p95 {latency['p95_ms']}ms | RAM {memory['heap_mb']}MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark recall and latency of quantized vector index representations on router / chunk vectors',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-cache', type=str, default='data/cache/router_embeddings.pkl',
+                        help='Router embeddings cache (default: data/cache/router_embeddings.pkl)')
+    parser.add_argument('--modes', nargs='+', default=list(VECTOR_INDEX_MODES), choices=VECTOR_INDEX_MODES,
+                        help='Representations to compare')
+    parser.add_argument('--rescore-k', type=int, default=32, help='Shortlist rescored with float32 (default: 32)')
+    parser.add_argument('--queries', type=int, default=500, help='Queries sampled per run (default: 500)')
+    parser.add_argument('--scale', type=str, default='1', help='Router corpus scale factors, e.g. 1,4,16 (default: 1)')
+    parser.add_argument('--scale-noise', type=float, default=0.01, help='Per-dimension noise for scaled copies (default: 0.01)')
+    parser.add_argument('--chunk-collections', nargs='*', help='Also benchmark chunk vectors of these Chroma collections')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed (default: 42)')
+    parser.add_argument('--output', type=str, help='Save report JSON to this path')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    rng = np.random.default_rng(args.seed)
+
+    cache_file = Path(args.router_cache)
+    if not cache_file.exists():
+        logger.error(f"❌ Router cache not found: {cache_file} (run tools/4_build_router_cache.py)")
+        return 1
+    router_vectors = load_router_vectors(cache_file)
+    logger.info(f"📚 Router vectors: {router_vectors.shape[0]} x {router_vectors.shape[1]}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'router_cache': str(cache_file),
+        'rescore_k': args.rescore_k,
+        'router': {},
+        'chunks': None
+    }
+
+    for factor in [int(value) for value in args.scale.split(',') if value.strip()]:
+        corpus = scale_corpus(router_vectors, factor, args.scale_noise, rng)
+        self_rows = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+        logger.info(f"⏱️ Router corpus x{factor}: {len(corpus)} vectors, {len(self_rows)} leave-one-out queries...")
+        results = evaluate(corpus, corpus[self_rows], self_rows, args.modes, args.rescore_k)
+        report['router'][f'x{factor}'] = {'rows': len(corpus), 'modes': results}
+        log_results(f"ROUTER x{factor} ({len(corpus)} vectors)", results)
+
+    if args.chunk_collections:
+        logger.info(f"📥 Loading chunk vectors from Chroma: {', '.join(args.chunk_collections)}")
+        chunk_vectors = load_chunk_vectors(args.chunk_collections)
+        query_rows = rng.choice(len(router_vectors), size=min(args.queries, len(router_vectors)), replace=False)
+        results = evaluate(chunk_vectors, router_vectors[query_rows], None, args.modes, args.rescore_k)
+        report['chunks'] = {'rows': len(chunk_vectors), 'collections': args.chunk_collections, 'modes': results}
+        log_results(f"CHUNKS ({len(chunk_vectors)} vectors, router questions as queries)", results)
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Embedding ONNX Export for LegalRAG
+==================================
+
+Export Vietnamese_Embedding_v2 (sentence-transformers, PyTorch) sang ONNX Runtime cho
+EMBEDDING_BACKEND=onnx / onnx-int8:
+
+1. torch.onnx.export transformer (input_ids, attention_mask -> last_hidden_state), dynamic batch + sequence
+2. Graph optimization offline (onnxruntime.transformers optimizer: attention / LayerNorm / GELU fusion)
+   -> model_optimized.onnx   (backend "onnx")
+3. Dynamic int8 quantization của model đã optimize (weights int8, activations quantize lúc chạy)
+   -> model_int8.onnx        (backend "onnx-int8")
+4. Tokenizer + embedding_export.json (pooling, normalize, max_seq_length, dimension)
+
+Model float > 2GB nên ONNX weights được lưu external data (*.onnx.data) cạnh file .onnx.
+Kiểm tra parity + latency sau khi export: python tools/benchmark_embedding_backends.py
+
+Usage:
+    cd backend
+    python tools/export_embedding_onnx.py
+    python tools/export_embedding_onnx.py --output data/models/onnx/Vietnamese_Embedding_v2 --opset 17
+    python tools/export_embedding_onnx.py --skip-int8 --keep-raw
+"""
+
+import sys
+import os
+import json
+import shutil
+import logging
+import argparse
+import time
+from pathlib import Path
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def describe_sentence_transformer(model) -> dict:
+    """Pooling + normalize từ các module của SentenceTransformer (Transformer -> Pooling -> [Normalize])"""
+    pooling = 'mean'
+    normalize = False
+    for module in model:
+        name = type(module).__name__
+        if name == 'Pooling':
+            pooling = module.get_pooling_mode_str()
+        elif name == 'Normalize':
+            normalize = True
+
+    if pooling not in ('cls', 'mean', 'lasttoken'):
+        raise ValueError(f"Unsupported pooling mode for ONNX backend: {pooling}")
+
+    return {
+        'pooling': pooling,
+        'normalize': normalize,
+        'max_seq_length': int(model.max_seq_length),
+        'dimension': int(model.get_sentence_embedding_dimension())
+    }
+
+
+def export_transformer(model, raw_path: Path, opset: int) -> list:
+    """torch.onnx.export phần transformer, trả về input names"""
+    import torch
+
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    input_names = [name for name in tokenizer.model_input_names if name in ('input_ids', 'attention_mask', 'token_type_ids')]
+
+    class HiddenStates(torch.nn.Module):
+        """Forward theo thứ tự input_names, chỉ trả last_hidden_state (pooling làm ở numpy)"""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    sample = tokenizer(["Thủ tục đăng ký khai sinh cần giấy tờ gì?", "Lệ phí"], padding=True, return_tensors="pt")
+    args = tuple(sample[name] for name in input_names)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    raw_path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer),
+            args,
+            str(raw_path),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    return input_names
+
+
+def optimize_graph(model, raw_path: Path, optimized_path: Path):
+    """Fusion cho transformer encoder; không có onnxruntime.transformers thì dùng ORT offline optimization"""
+    config = model[0].auto_model.config
+    try:
+        from onnxruntime.transformers.optimizer import optimize_model
+
+        optimized = optimize_model(
+            str(raw_path),
+            model_type='bert',
+            num_heads=config.num_attention_heads,
+            hidden_size=config.hidden_size,
+            opt_level=1
+        )
+        fused = {op: count for op, count in optimized.get_fused_operator_statistics().items() if count}
+        logger.info(f"   🔧 Fused operators: {fused}")
+        optimized.save_model_to_file(str(optimized_path), use_external_data_format=True)
+    except ImportError:
+        import onnxruntime as ort
+
+        logger.warning("⚠️ onnxruntime.transformers not available, using ORT offline graph optimization")
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        session_options.optimized_model_filepath = str(optimized_path)
+        session_options.add_session_config_entry(
+            "session.optimized_model_external_initializers_file_name", optimized_path.name + ".data"
+        )
+        ort.InferenceSession(str(raw_path), session_options, providers=["CPUExecutionProvider"])
+
+
+def quantize_int8(optimized_path: Path, int8_path: Path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(
+        str(optimized_path),
+        str(int8_path),
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        op_types_to_quantize=['MatMul', 'Gemm']
+    )
+
+
+def _size_mb(path: Path) -> float:
+    files = [path] + list(path.parent.glob(path.name + '.data'))
+    return round(sum(f.stat().st_size for f in files if f.exists()) / 1024 / 1024, 1)
+
+
+def main():
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(
+        description='Export the embedding model to ONNX Runtime (optimized fp32 + dynamic int8)',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--model', type=str, default=settings.embedding_model_name,
+                        help=f'Model name or local path (default: {settings.embedding_model_name})')
+    parser.add_argument('--output', type=str, default=settings.embedding_onnx_dir,
+                        help=f'Export directory (default: {settings.embedding_onnx_dir})')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset (default: 17)')
+    parser.add_argument('--skip-int8', action='store_true', help='Only export the optimized fp32 model')
+    parser.add_argument('--keep-raw', action='store_true', help='Keep the unoptimized export (raw/model.onnx)')
+    args = parser.parse_args()
+
+    os.chdir(backend_dir)
+    settings.setup_environment()
+
+    from app.services.embedding_backends import load_torch_embedding_model, ONNX_MODEL_FILES, EXPORT_CONFIG_FILE
+
+    output_dir = Path(args.output)
+    raw_path = output_dir / "raw" / "model.onnx"
+    optimized_path = output_dir / ONNX_MODEL_FILES["onnx"]
+    int8_path = output_dir / ONNX_MODEL_FILES["onnx-int8"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    logger.info(f"📥 Loading PyTorch model: {args.model}")
+    model = load_torch_embedding_model(args.model)
+    description = describe_sentence_transformer(model)
+    logger.info(f"   ℹ️ pooling={description['pooling']}, normalize={description['normalize']}, "
+                f"max_seq_length={description['max_seq_length']}, dimension={description['dimension']}")
+
+    timings = {}
+    start = time.perf_counter()
+    logger.info(f"📤 Exporting transformer to ONNX (opset {args.opset})...")
+    input_names = export_transformer(model, raw_path, args.opset)
+    timings['export_s'] = round(time.perf_counter() - start, 1)
+
+    start = time.perf_counter()
+    logger.info("🔧 Optimizing graph...")
+    optimize_graph(model, raw_path, optimized_path)
+    timings['optimize_s'] = round(time.perf_counter() - start, 1)
+    files = {"onnx": optimized_path.name}
+
+    if not args.skip_int8:
+        start = time.perf_counter()
+        logger.info("🗜️ Quantizing to int8 (dynamic)...")
+        quantize_int8(optimized_path, int8_path)
+        timings['quantize_s'] = round(time.perf_counter() - start, 1)
+        files["onnx-int8"] = int8_path.name
+
+    if not args.keep_raw:
+        shutil.rmtree(raw_path.parent, ignore_errors=True)
+
+    model.tokenizer.save_pretrained(str(output_dir))
+    export_config = {
+        'model_name': args.model,
+        **description,
+        'input_names': input_names,
+        'opset': args.opset,
+        'files': files,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(output_dir / EXPORT_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(export_config, f, ensure_ascii=False, indent=2)
+
+    logger.info("📊 EXPORT SUMMARY")
+    logger.info("=" * 60)
+    for backend, file_name in files.items():
+        logger.info(f"   - {backend}: {output_dir / file_name} ({_size_mb(output_dir / file_name)} MB)")
+    logger.info(f"   ⏱️ {timings}")
+    logger.info("🎉 Done! Verify parity: python tools/benchmark_embedding_backends.py")
+    logger.info("   Enable: EMBEDDING_BACKEND=onnx-int8 (or onnx) in .env")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
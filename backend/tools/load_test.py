@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+End-to-end Load Test for LegalRAG
+=================================
+
+Boot FastAPI app (uvicorn, process riêng) với stub LLM / reranker / embedding có latency cấu hình được,
+rồi replay traffic mix qua HTTP ở target RPS cho từng mức concurrency:
+- new: câu hỏi mới (question variants từ router examples), không có session
+- followup: 2 câu hỏi cùng document trong cùng session
+- clarify: câu hỏi mơ hồ -> /clarify theo options trả về (tối đa 3 vòng) đến khi có câu trả lời
+
+Report mỗi mức concurrency: latency p50/p95/p99 (tổng + theo loại request), achieved RPS,
+error / 429 rate, queue depth (requests client đang chờ + legalrag_inflight_requests scrape từ server).
+
+Server chạy trong workspace riêng (--workspace): router cache và (khi stub embedding) vector DB,
+chunk manifest nằm trong workspace -> không ghi đè cache / index của models thật.
+Stub embedding không khớp vector của index thật - lần đầu chạy với --build-index để build lại
+index từ data/documents bằng stub embedding.
+
+Usage:
+    cd backend
+    python tools/load_test.py --build-index --concurrency 1,2,4 --rps 2 --duration 30
+    python tools/load_test.py --stub-llm-latency 2.0 --stub-llm-tps 15 --concurrency 1,4,8 --output data/benchmarks/load.json
+    python tools/load_test.py --real llm,reranker        # chỉ stub embedding
+    python tools/load_test.py --url http://localhost:8000 --concurrency 1,2   # server đang chạy sẵn
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import asyncio
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # 1 dòng log mỗi request làm nhiễu report
+
+API_PREFIX = "/api/v1"
+MODEL_NAMES = ("embedding", "llm", "reranker")
+
+# Câu hỏi thiếu ngữ cảnh -> router trả về clarification_needed
+VAGUE_QUERIES = [
+    "thủ tục như thế nào",
+    "cần giấy tờ gì",
+    "mất bao lâu",
+    "lệ phí bao nhiêu",
+    "nộp hồ sơ ở đâu",
+    "tôi muốn làm thủ tục",
+    "cần chuẩn bị những gì",
+    "có mất phí không",
+]
+
+
+# ---------------------------------------------------------------
+# Server (child process)
+# ---------------------------------------------------------------
+def workspace_env(workspace: Path) -> Dict[str, str]:
+    """Env overrides để index / manifests của stub embedding nằm trong workspace"""
+    return {
+        'VECTORDB_DIR': str(workspace / "vectordb"),
+        'CHUNK_MANIFEST_DIR': str(workspace / "cache" / "chunk_manifest"),
+        'INDEX_MANIFEST_FILE': str(workspace / "cache" / "vectordb_manifest.json"),
+        'INDEX_CHECKPOINT_FILE': str(workspace / "cache" / "vectordb_build_checkpoint.json"),
+        'SEARCH_K_STATS_FILE': str(workspace / "cache" / "search_k_stats.json"),
+        'ANSWER_CACHE_FILE': str(workspace / "cache" / "answer_cache.jsonl"),
+    }
+
+
+def prepare_workspace(workspace: Path):
+    """Router đọc data/router_examples_smart_v3 và ghi data/cache theo cwd -> link examples vào workspace"""
+    (workspace / "data" / "cache").mkdir(parents=True, exist_ok=True)
+    (workspace / "vectordb").mkdir(parents=True, exist_ok=True)
+    (workspace / "cache").mkdir(parents=True, exist_ok=True)
+    for name in ("router_examples", "router_examples_smart_v3"):
+        source = backend_dir / "data" / name
+        target = workspace / "data" / name
+        if source.exists() and not target.exists():
+            target.symlink_to(source.resolve(), target_is_directory=True)
+
+
+def build_stub_index(args):
+    """Build vector DB trong workspace từ data/documents bằng stub embedding"""
+    from app.core.config import settings
+    from app.services.vector import VectorDBService
+    from app.services.indexing import StreamingIndexPipeline
+    from app.services.stubs import StubEmbeddingModel
+
+    logger.info(f"🏗️ Building stub-embedding index at {settings.vectordb_path}")
+    vectordb = VectorDBService(load_embedding=False)
+    vectordb.embedding_model = StubEmbeddingModel(dimension=args.embedding_dim)
+    pipeline = StreamingIndexPipeline(
+        vectordb_service=vectordb,
+        documents_dir=settings.base_dir / "data" / "documents",
+        checkpoint_path=settings.index_checkpoint_path,
+        chunk_manifest_dir=settings.chunk_manifest_path
+    )
+    stats = pipeline.run(resume=False)
+    logger.info(f"✅ Stub index built: {stats}")
+
+
+def serve(args):
+    """Chạy trong child process: gắn stubs vào startup graph rồi chạy uvicorn"""
+    import uvicorn
+
+    os.chdir(backend_dir)  # .env được đọc theo cwd lúc import settings
+    import main
+    from app.services.stubs import StubEmbeddingModel, StubLLMService, StubRerankerService
+
+    real = set(args.real)
+    if "embedding" not in real:
+        main.model_overrides["embedding"] = lambda: StubEmbeddingModel(
+            dimension=args.embedding_dim,
+            latency_seconds=args.stub_embedding_latency
+        )
+    if "llm" not in real:
+        main.model_overrides["llm"] = lambda: StubLLMService(
+            latency_seconds=args.stub_llm_latency,
+            tokens_per_second=args.stub_llm_tps,
+            load_seconds=args.stub_llm_load
+        )
+    if "reranker" not in real:
+        main.model_overrides["reranker"] = lambda: StubRerankerService(
+            load_seconds=args.stub_reranker_load,
+            latency_seconds=args.stub_reranker_latency,
+            latency_per_pair_seconds=args.stub_reranker_per_pair
+        )
+
+    if args.build_index:
+        build_stub_index(args)
+
+    # Router cache (data/cache theo cwd) của stub embedding nằm trong workspace
+    if "embedding" not in real:
+        os.chdir(args.workspace)
+    logger.info(f"🚀 Serving with stubs {sorted(main.model_overrides)} on port {args.port}")
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_server(args) -> subprocess.Popen:
+    workspace = Path(args.workspace)
+    if not workspace.is_absolute():
+        workspace = backend_dir / workspace
+    workspace = workspace.resolve()
+    prepare_workspace(workspace)
+
+    env = dict(os.environ)
+    if "embedding" not in args.real:
+        env.update(workspace_env(workspace))
+    command = [sys.executable, str(Path(__file__).resolve())] + sys.argv[1:]
+    command += ["--serve", "--workspace", str(workspace)]
+    logger.info(f"🚀 Starting server (workspace: {workspace})")
+    return subprocess.Popen(command, env=env, cwd=str(backend_dir))
+
+
+def wait_until_ready(base_url: str, process: Optional[subprocess.Popen], timeout: float) -> bool:
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            logger.error(f"❌ Server exited with code {process.returncode}")
+            return False
+        try:
+            response = httpx.get(f"{base_url}{API_PREFIX}/ready", timeout=2.0)
+            if response.status_code == 200:
+                return True
+            status = response.json()
+            if status.get('phase') == 'failed':
+                logger.error(f"❌ Startup failed: {status.get('components')}")
+                return False
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.5)
+    logger.error(f"❌ Server not ready after {timeout}s")
+    return False
+
+
+# ---------------------------------------------------------------
+# Traffic generator
+# ---------------------------------------------------------------
+class Pacer:
+    """Giãn đều requests theo target RPS (0 = không giới hạn) - dùng chung cho mọi workers"""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self.next_slot = time.perf_counter()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        # Server chậm hơn target -> không dồn burst để bù
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        'mean': round(statistics.mean(ordered), 2),
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'max': ordered[-1]
+    }
+
+
+def parse_inflight(text: str) -> float:
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith("legalrag_inflight_requests{") or line.startswith("legalrag_inflight_requests "):
+            total += float(line.rsplit(" ", 1)[-1])
+    return total
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, samples: List[Dict[str, Any]], mix: Dict[str, float], timeout: float, seed: int):
+        self.base_url = base_url
+        self.samples = samples
+        self.mix = mix
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+
+        by_file: Dict[str, List[str]] = {}
+        for sample in samples:
+            by_file.setdefault(sample['router_file'], []).append(sample['query'])
+        self.followup_groups = [questions for questions in by_file.values() if len(questions) >= 2]
+
+        self.scenarios = {
+            'new': self._new_question,
+            'followup': self._followup,
+            'clarify': self._clarification_round_trip,
+        }
+
+    # ---------------------------------------------------------------
+    # Single request
+    # ---------------------------------------------------------------
+    async def _call(self, client, kind: str, endpoint: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        import httpx
+
+        await self._pacer.wait()
+        self._outstanding += 1
+        start = time.perf_counter()
+        status: Any
+        body = None
+        try:
+            response = await client.post(f"{self.base_url}{API_PREFIX}{endpoint}", json=payload, timeout=self.timeout)
+            status = response.status_code
+            if status == 200:
+                body = response.json()
+        except httpx.TimeoutException:
+            status = 'timeout'
+        except httpx.HTTPError:
+            status = 'connection_error'
+        finally:
+            self._outstanding -= 1
+
+        self._records.append({
+            'kind': kind,
+            'status': status,
+            'latency_ms': (time.perf_counter() - start) * 1000.0,
+            'outcome': body.get('type') if body else None
+        })
+        return body
+
+    # ---------------------------------------------------------------
+    # Scenarios
+    # ---------------------------------------------------------------
+    async def _new_question(self, client):
+        sample = self.rng.choice(self.samples)
+        await self._call(client, 'new', '/query', {'query': sample['query']})
+
+    async def _followup(self, client):
+        first, second = self.rng.sample(self.rng.choice(self.followup_groups), 2)
+        result = await self._call(client, 'followup_first', '/query', {'query': first})
+        if result and result.get('session_id'):
+            await self._call(client, 'followup', '/query', {'query': second, 'session_id': result['session_id']})
+
+    async def _clarification_round_trip(self, client):
+        query = self.rng.choice(VAGUE_QUERIES)
+        self._round_trips['started'] += 1
+        result = await self._call(client, 'clarify_query', '/query', {'query': query})
+
+        for _ in range(3):
+            if not result or result.get('type') != 'clarification_needed':
+                break
+            options = [
+                option for option in (result.get('clarification') or {}).get('options', [])
+                if option.get('action') != 'manual_input'
+            ]
+            if not options:
+                break
+            result = await self._call(client, 'clarify', '/clarify', {
+                'session_id': result['session_id'],
+                'selected_option': self.rng.choice(options),
+                'original_query': query
+            })
+
+        if result and result.get('type') == 'answer':
+            self._round_trips['completed'] += 1
+
+    # ---------------------------------------------------------------
+    # Level runner
+    # ---------------------------------------------------------------
+    async def _worker(self, client, deadline: float):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            scenario = self.rng.choices(names, weights=weights)[0]
+            if scenario == 'followup' and not self.followup_groups:
+                scenario = 'new'
+            self._scenario_counts[scenario] += 1
+            await self.scenarios[scenario](client)
+
+    async def _sample_queue_depth(self, client, stop: asyncio.Event, interval: float):
+        while not stop.is_set():
+            self._outstanding_samples.append(self._outstanding)
+            try:
+                response = await client.get(f"{self.base_url}{API_PREFIX}/metrics/openmetrics", timeout=interval * 4)
+                if response.status_code == 200:
+                    self._inflight_samples.append(parse_inflight(response.text))
+            except Exception:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_level(self, concurrency: int, rps: float, duration: float, sample_interval: float) -> Dict[str, Any]:
+        import httpx
+
+        self._pacer = Pacer(rps)
+        self._records: List[Dict[str, Any]] = []
+        self._outstanding = 0
+        self._outstanding_samples: List[int] = []
+        self._inflight_samples: List[float] = []
+        self._scenario_counts: Counter = Counter()
+        self._round_trips = Counter(started=0, completed=0)
+
+        limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+        async with httpx.AsyncClient(limits=limits) as client, httpx.AsyncClient() as metrics_client:
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self._sample_queue_depth(metrics_client, stop, sample_interval))
+            start = time.perf_counter()
+            deadline = start + duration
+            await asyncio.gather(*(self._worker(client, deadline) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await sampler
+
+        return self._level_report(concurrency, rps, elapsed)
+
+    def _level_report(self, concurrency: int, rps: float, elapsed: float) -> Dict[str, Any]:
+        records = self._records
+        total = len(records)
+        statuses = Counter(str(record['status']) for record in records)
+        rate_limited = statuses.get('429', 0)
+        errors = sum(count for status, count in statuses.items() if status not in ('200', '429'))
+        app_errors = sum(1 for record in records if record['outcome'] == 'error')
+
+        ok_latencies = [record['latency_ms'] for record in records if record['status'] == 200]
+        by_kind: Dict[str, List[float]] = {}
+        for record in records:
+            if record['status'] == 200:
+                by_kind.setdefault(record['kind'], []).append(record['latency_ms'])
+
+        return {
+            'concurrency': concurrency,
+            'target_rps': rps,
+            'duration_seconds': round(elapsed, 2),
+            'requests': total,
+            'achieved_rps': round(total / elapsed, 3) if elapsed > 0 else 0.0,
+            'latency': percentiles(ok_latencies),
+            'latency_by_kind': {kind: percentiles(values) for kind, values in sorted(by_kind.items())},
+            'status_counts': dict(statuses),
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'rate_limited_rate': round(rate_limited / total, 4) if total else 0.0,
+            'app_error_rate': round(app_errors / total, 4) if total else 0.0,
+            'outcomes': dict(Counter(record['outcome'] for record in records if record['outcome'])),
+            'scenarios': dict(self._scenario_counts),
+            'clarification_round_trips': dict(self._round_trips),
+            'queue_depth': {
+                'client_outstanding': _summary(self._outstanding_samples),
+                'server_inflight': _summary(self._inflight_samples)
+            }
+        }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ('new', 'followup', 'clarify'):
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}' (new, followup, clarify)")
+        mix[name] = float(weight or 1.0)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("Mix needs at least one positive weight")
+    return mix
+
+
+def log_level_report(report: Dict[str, Any]):
+    latency = report['latency']
+    queue = report['queue_depth']
+    logger.info(f"📊 concurrency={report['concurrency']} target_rps={report['target_rps']} "
+                f"achieved_rps={report['achieved_rps']} requests={report['requests']}")
+    if latency:
+        logger.info(f"   latency p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms "
+                    f"p99={latency['p99_ms']}ms max={latency['max_ms']}ms")
+    for kind, stats in report['latency_by_kind'].items():
+        logger.info(f"   - {kind}: n={stats['count']} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms")
+    logger.info(f"   errors={report['error_rate']:.2%} 429={report['rate_limited_rate']:.2%} "
+                f"app_errors={report['app_error_rate']:.2%} statuses={report['status_counts']}")
+    logger.info(f"   queue depth: client={queue['client_outstanding']} server={queue['server_inflight']}")
+    logger.info(f"   clarification round trips: {report['clarification_round_trips']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='End-to-end load test with stub models and a realistic traffic mix',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--url', type=str, help='Target an already running server instead of booting one')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the booted server (default: 8765)')
+    parser.add_argument('--workspace', type=str, default='data/loadtest',
+                        help='Scratch dir for router cache / stub index (default: data/loadtest)')
+    parser.add_argument('--build-index', action='store_true',
+                        help='Build the stub-embedding vector DB in the workspace before serving')
+    parser.add_argument('--startup-timeout', type=float, default=600.0, help='Seconds to wait for /ready')
+    parser.add_argument('--real', type=lambda v: [m for m in v.split(',') if m], default=[],
+                        help=f'Comma-separated models to keep real ({", ".join(MODEL_NAMES)})')
+
+    stubs = parser.add_argument_group('stub models')
+    stubs.add_argument('--embedding-dim', type=int, default=1024, help='Stub embedding dimension (default: 1024)')
+    stubs.add_argument('--stub-embedding-latency', type=float, default=0.01, help='Seconds per encode() call')
+    stubs.add_argument('--stub-reranker-load', type=float, default=0.0, help='Seconds to "load" the reranker')
+    stubs.add_argument('--stub-reranker-latency', type=float, default=0.02, help='Seconds per predict() call')
+    stubs.add_argument('--stub-reranker-per-pair', type=float, default=0.01, help='Extra seconds per (query, doc) pair')
+    stubs.add_argument('--stub-llm-load', type=float, default=0.0, help='Seconds to "load" the LLM')
+    stubs.add_argument('--stub-llm-latency', type=float, default=0.5, help='Fixed seconds per generation')
+    stubs.add_argument('--stub-llm-tps', type=float, default=0.0, help='Simulated tokens/second (0 = only fixed latency)')
+
+    traffic = parser.add_argument_group('traffic')
+    traffic.add_argument('--concurrency', type=str, default='1,2,4', help='Concurrency levels (default: 1,2,4)')
+    traffic.add_argument('--rps', type=float, default=2.0, help='Target requests/second per level (0 = unlimited)')
+    traffic.add_argument('--duration', type=float, default=30.0, help='Seconds per concurrency level (default: 30)')
+    traffic.add_argument('--warmup-requests', type=int, default=3, help='Sequential requests before measuring')
+    traffic.add_argument('--mix', type=parse_mix, default=parse_mix('new=0.6,followup=0.25,clarify=0.15'),
+                         help='Scenario weights (default: new=0.6,followup=0.25,clarify=0.15)')
+    traffic.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                         help='Router example files used as question pool')
+    traffic.add_argument('--timeout', type=float, default=300.0, help='Per-request timeout in seconds')
+    traffic.add_argument('--sample-interval', type=float, default=0.5, help='Queue depth sampling interval (s)')
+    traffic.add_argument('--seed', type=int, default=42, help='Random seed for the traffic mix')
+    traffic.add_argument('--output', type=str, help='Save report JSON to this path')
+
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown_models = set(args.real) - set(MODEL_NAMES)
+    if unknown_models:
+        parser.error(f"Unknown models in --real: {', '.join(sorted(unknown_models))}")
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    router_dir = Path(args.router_dir)
+    if not router_dir.is_absolute():
+        router_dir = backend_dir / router_dir
+    samples = load_dataset(router_dir)
+    if not samples:
+        logger.error(f"❌ No questions found in {router_dir}")
+        return 1
+    logger.info(f"📚 Loaded {len(samples)} questions from {router_dir}")
+
+    import httpx
+
+    process = None
+    base_url = args.url.rstrip('/') if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        process = start_server(args)
+
+    try:
+        if not wait_until_ready(base_url, process, args.startup_timeout):
+            return 1
+        logger.info(f"✅ Server ready at {base_url}")
+
+        # Warm up (lazy imports, collection handles, model load lần đầu)
+        for sample in samples[:args.warmup_requests]:
+            httpx.post(f"{base_url}{API_PREFIX}/query", json={'query': sample['query']}, timeout=args.timeout)
+
+        generator = LoadGenerator(base_url, samples, args.mix, args.timeout, args.seed)
+
+        reports = []
+        for concurrency in levels:
+            logger.info(f"🔥 Level concurrency={concurrency} rps={args.rps} for {args.duration}s")
+            report = asyncio.run(generator.run_level(concurrency, args.rps, args.duration, args.sample_interval))
+            log_level_report(report)
+            reports.append(report)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    result = {
+        'base_url': base_url,
+        'stubbed_models': [m for m in MODEL_NAMES if m not in args.real] if not args.url else None,
+        'stub_config': {
+            key: value for key, value in vars(args).items()
+            if key.startswith('stub_') or key == 'embedding_dim'
+        },
+        'mix': args.mix,
+        'levels': reports
+    }
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Bulk Answer Precomputation for LegalRAG
+=======================================
+
+Warm persistent answer cache (ANSWER_CACHE_FILE, app/services/answer_cache.py) từ main_question +
+question_variants của router examples - những câu traffic tập trung nhiều nhất - để sau redeploy production
+trả lời các câu phổ biến từ cache thay vì generate lại.
+
+Chạy theo batch (--batch-size câu hỏi), mỗi batch 3 phase qua pipeline thật (RAGService.process_query):
+1. Embeddings: encode 1 lần cho cả batch (query_embedding_cache.prefill, batch --embedding-batch-size) -
+   router + vector search của từng câu hit cache
+2. Retrieval: route -> search -> rerank -> context expansion từng câu, reranker giữ trong VRAM suốt phase
+   (không unload / load lại mỗi query); generation được hoãn (answer_cache.deferred_generation())
+3. Generation: các prompt đã hoãn chạy song song trên --workers generation slots (mặc định LLM_SLOTS),
+   mỗi câu trả lời append vào cache file ngay khi xong
+
+Câu trả lời key theo câu hỏi + context hash -> resume sau khi bị ngắt: câu đã có trong cache với cùng
+context được bỏ qua ở phase 2 (chỉ tốn retrieval); document đổi sau redeploy -> context đổi -> generate lại.
+Câu hỏi được route sang clarification / structured answer (không gọi LLM) không cần cache.
+
+Report: throughput từng phase (questions/s, answers/s) + outcomes. --stub-models chạy với stub embedding /
+reranker / LLM trong workspace (giống tools/load_test.py, lần đầu thêm --build-index).
+
+Usage:
+    cd backend
+    python tools/precompute_answers.py --output data/benchmarks/precompute.json
+    python tools/precompute_answers.py --collections ho_tich_cap_xa --limit 200
+    python tools/precompute_answers.py --stub-models --build-index --stub-llm-tps 50 --llm-slots 2
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+# Add backend to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_routing import load_dataset, percentiles
+from load_test import workspace_env, prepare_workspace, build_stub_index
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def build_service(args):
+    from app.core.config import settings
+    from app.services.vector import VectorDBService
+    from app.services.rag_engine import RAGService
+
+    if args.stub_models:
+        from app.services.stubs import StubEmbeddingModel, StubLLMService, StubRerankerService
+        vectordb = VectorDBService(load_embedding=False)
+        vectordb.embedding_model = StubEmbeddingModel(dimension=args.embedding_dim)
+        llm = StubLLMService(
+            latency_seconds=args.stub_llm_latency,
+            tokens_per_second=args.stub_llm_tps,
+            slots=args.llm_slots
+        )
+        reranker = StubRerankerService()
+    else:
+        from app.services.language_model import LLMService
+        from app.services.reranker import RerankerService
+        vectordb = VectorDBService()
+        llm = LLMService(slots=args.llm_slots) if args.llm_slots else LLMService()
+        reranker = RerankerService()
+    return RAGService(
+        documents_dir=str(settings.documents_path),
+        vectordb_service=vectordb,
+        llm_service=llm,
+        reranker_service=reranker
+    )
+
+
+def load_questions(router_dir: Path, collections: List[str] = None) -> List[str]:
+    """main_question + question_variants, bỏ câu trùng (sau normalize) giữa các router files"""
+    from app.services.embedding_cache import normalize_query_text
+
+    questions, seen = [], set()
+    for sample in load_dataset(router_dir, collections, include_main=True):
+        key = normalize_query_text(sample['query']).lower()
+        if key and key not in seen:
+            seen.add(key)
+            questions.append(sample['query'])
+    return questions
+
+
+def retrieve(rag_service, questions: List[str], outcomes: Counter) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """Phase 2: pipeline đầy đủ trừ generation - trả về generations đã hoãn + latency từng câu (ms)"""
+    from app.services.answer_cache import deferred_generation
+
+    pending, latencies = [], []
+    with rag_service.reranker_service.keep_loaded():
+        for query in questions:
+            start = time.perf_counter()
+            with deferred_generation() as deferred:
+                # Không latency budget: context đầy đủ như request không bị degrade
+                result = rag_service.process_query(query=query, deadline_ms=0)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            # Mỗi câu 1 session mới (prompt không có chat history, giống lượt đầu của user)
+            rag_service.chat_sessions.pop(result.get('session_id'), None)
+
+            if deferred:
+                pending.extend(deferred)
+                outcomes['generate'] += 1
+            elif result.get('type') == 'answer':
+                outcomes[result.get('answer_source') or 'llm'] += 1  # cache (đã precompute) / structured
+            else:
+                outcomes[result.get('type', 'unknown')] += 1
+    # Generation phase cần VRAM cho LLM
+    rag_service.reranker_service.unload_model()
+    return pending, latencies
+
+
+def generate(rag_service, pending: List[Dict[str, Any]], workers: int) -> Tuple[int, List[float]]:
+    """Phase 3: generations đã hoãn trên `workers` slots - trả về số câu trả lời lưu vào cache + latency (ms)"""
+    from app.services.answer_cache import answer_cache
+    from app.services.generation_scheduler import GenerationQueueFull
+
+    def one(item: Dict[str, Any]) -> float:
+        start = time.perf_counter()
+        try:
+            rag_service.generate_deferred_answer(item)
+        except GenerationQueueFull:
+            # Không lưu gì - lần chạy sau sẽ generate lại câu này
+            logger.warning(f"⚠️ LLM queue full, skipped: {item['query'][:80]}")
+        return (time.perf_counter() - start) * 1000.0
+
+    entries_before = len(answer_cache)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, pending))
+    return len(answer_cache) - entries_before, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Precompute answers for router example questions into the persistent answer cache',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--router-dir', type=str, default='data/router_examples_smart_v3',
+                        help='Router examples directory (main_question + question_variants)')
+    parser.add_argument('--collections', nargs='+', help='Only questions routed to these collections')
+    parser.add_argument('--limit', type=int, default=None, help='Only the first N unique questions')
+    parser.add_argument('--batch-size', type=int, default=64, help='Questions per embed -> retrieve -> generate round (default: 64)')
+    parser.add_argument('--embedding-batch-size', type=int, default=32, help='Embedding encode batch size (default: 32)')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent generations (default: LLM slots)')
+    parser.add_argument('--llm-slots', type=int, default=None, help='Override LLM_SLOTS for this run')
+    parser.add_argument('--compact', action='store_true', help='Rewrite the cache file without stale / duplicate lines at the end')
+    parser.add_argument('--output', type=str, help='Save throughput report JSON to this path')
+
+    stubs = parser.add_argument_group('stub models')
+    stubs.add_argument('--stub-models', action='store_true', help='Stub embedding + reranker + LLM with an index in --workspace')
+    stubs.add_argument('--workspace', type=str, default='data/loadtest',
+                       help='Scratch dir for router cache / stub index / answer cache (default: data/loadtest)')
+    stubs.add_argument('--build-index', action='store_true', help='Build the stub-embedding vector DB in the workspace first')
+    stubs.add_argument('--embedding-dim', type=int, default=1024, help='Stub embedding dimension (default: 1024)')
+    stubs.add_argument('--stub-llm-latency', type=float, default=0.0, help='Stub LLM fixed latency per answer (seconds)')
+    stubs.add_argument('--stub-llm-tps', type=float, default=0.0, help='Stub LLM tokens per second (0 = instant)')
+    args = parser.parse_args()
+
+    workspace = None
+    if args.stub_models:
+        workspace = Path(args.workspace)
+        if not workspace.is_absolute():
+            workspace = backend_dir / workspace
+        workspace = workspace.resolve()
+        prepare_workspace(workspace)
+        os.environ.update(workspace_env(workspace))  # Trước khi import settings
+    os.chdir(backend_dir)
+
+    router_dir = Path(args.router_dir)
+    questions = load_questions(router_dir, args.collections)
+    if args.limit:
+        questions = questions[:args.limit]
+    if not questions:
+        logger.error(f"❌ No router example questions found in {router_dir}")
+        return 1
+
+    if args.stub_models and args.build_index:
+        build_stub_index(args)
+    logging.getLogger('app').setLevel(logging.WARNING)
+    if workspace is not None:
+        os.chdir(workspace)  # Router cache (data/cache theo cwd) của stub embedding nằm trong workspace
+
+    from app.services.answer_cache import answer_cache
+    from app.services.embedding_cache import query_embedding_cache
+
+    rag_service = build_service(args)
+    if not answer_cache.enabled:
+        logger.error("❌ Answer cache is disabled (ANSWER_CACHE=false)")
+        return 1
+    workers = max(1, args.workers or getattr(rag_service.llm_service, 'num_slots', 1))
+    cached_before = len(answer_cache)
+    logger.info(f"🧮 Precomputing answers for {len(questions)} questions -> {answer_cache.path} "
+                f"({cached_before} cached, {workers} generation workers)")
+
+    outcomes = Counter()
+    seconds = {'embedding': 0.0, 'retrieval': 0.0, 'generation': 0.0}
+    retrieval_ms, generation_ms = [], []
+    encoded = stored = 0
+    run_start = time.perf_counter()
+    for batch_start in range(0, len(questions), args.batch_size):
+        batch = questions[batch_start:batch_start + args.batch_size]
+
+        phase_start = time.perf_counter()
+        encoded += query_embedding_cache.prefill(
+            rag_service.vectordb_service.embedding_model, batch, batch_size=args.embedding_batch_size
+        )
+        seconds['embedding'] += time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        pending, latencies = retrieve(rag_service, batch, outcomes)
+        seconds['retrieval'] += time.perf_counter() - phase_start
+        retrieval_ms.extend(latencies)
+
+        if pending:
+            phase_start = time.perf_counter()
+            batch_stored, latencies = generate(rag_service, pending, workers)
+            seconds['generation'] += time.perf_counter() - phase_start
+            generation_ms.extend(latencies)
+            stored += batch_stored
+            outcomes['generation_failed'] += len(pending) - batch_stored
+
+        done = batch_start + len(batch)
+        elapsed = time.perf_counter() - run_start
+        logger.info(f"   {done}/{len(questions)} questions | {stored} answers stored | "
+                    f"{done / elapsed:.2f} q/s overall")
+    total_seconds = time.perf_counter() - run_start
+
+    if args.compact:
+        logger.info(f"🧹 Compacted answer cache: {answer_cache.compact()} entries")
+
+    def rate(count: int, phase_seconds: float) -> float:
+        return round(count / phase_seconds, 3) if phase_seconds > 0 else 0.0
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'router_dir': str(router_dir),
+        'stub_models': args.stub_models,
+        'questions': len(questions),
+        'batch_size': args.batch_size,
+        'workers': workers,
+        'outcomes': dict(outcomes),
+        'embeddings_encoded': encoded,
+        'answers_stored': stored,
+        'cache_entries': {'before': cached_before, 'after': len(answer_cache)},
+        'seconds': {phase: round(value, 3) for phase, value in seconds.items()},
+        'total_seconds': round(total_seconds, 3),
+        'throughput': {
+            'questions_per_second': rate(len(questions), total_seconds),
+            'retrieval_per_second': rate(len(retrieval_ms), seconds['retrieval']),
+            'answers_per_second': rate(len(generation_ms), seconds['generation'])
+        },
+        'retrieval_latency': percentiles(retrieval_ms),
+        'generation_latency': percentiles(generation_ms),
+        'answer_cache': answer_cache.get_stats()
+    }
+
+    logger.info("📊 ANSWER PRECOMPUTE SUMMARY")
+    logger.info("=" * 60)
+    logger.info(f"Questions: {len(questions)} in {total_seconds:.1f}s ({report['throughput']['questions_per_second']} q/s)")
+    logger.info(f"Outcomes: {dict(outcomes)}")
+    logger.info(f"Embedding:  {encoded} encoded in {seconds['embedding']:.1f}s (rest already cached)")
+    logger.info(f"Retrieval:  {report['throughput']['retrieval_per_second']} q/s | "
+                f"p50 {report['retrieval_latency'].get('p50_ms')}ms")
+    logger.info(f"Generation: {stored} stored, {report['throughput']['answers_per_second']} answers/s on {workers} workers | "
+                f"p50 {report['generation_latency'].get('p50_ms')}ms")
+    logger.info(f"Answer cache: {cached_before} -> {len(answer_cache)} entries ({answer_cache.path})")
+
+    if args.output:
+        output_path = Path(args.output)
+        if not output_path.is_absolute():
+            output_path = backend_dir / output_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Report saved: {output_path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())